@@ -0,0 +1,76 @@
+"""
+Microbenchmark de la decodificación de mensajes (mensajes/segundo).
+
+Compara el camino anterior de decodificar_correos (email.message_from_bytes,
+recorrido de todas las partes y cuerpo en latin1) con MensajeCorreo, que solo
+parsea las cabeceras y, si se pide el cuerpo, elige la parte de texto sin
+decodificar los adjuntos. El corpus es sintético o un fixture mbox.
+
+Uso:
+    python -m benchmarks.bench_decodificar [numero_mensajes] [--mbox ruta]
+"""
+import sys
+import time
+import email
+import mailbox
+import argparse
+from email.header import decode_header
+
+from classes.mensajes import MensajeCorreo
+from benchmarks.sinteticos import generar_mensajes
+
+
+def decodificar_anterior(datos: bytes) -> dict:
+    """
+    Reproduce el algoritmo anterior: parseo completo, primer fragmento del
+    asunto y primera parte de texto decodificada en latin1.
+    """
+    msg = email.message_from_bytes(datos)
+    asunto, codificacion = decode_header(msg["Subject"] or "")[0]
+    if isinstance(asunto, bytes):
+        asunto = asunto.decode(codificacion or "latin1", errors="replace")
+    cuerpo = "Cuerpo no disponible"
+    for parte in msg.walk():
+        if parte.get_content_type() in ("text/html", "text/plain"):
+            cuerpo = (parte.get_payload(decode=True) or b"").decode("latin1", errors="replace")
+            break
+    return {"asunto": asunto, "remitente": msg.get("From"), "fecha": msg.get("Date"), "cuerpo": cuerpo}
+
+
+def solo_cabeceras(datos: bytes) -> tuple:
+    correo = MensajeCorreo(datos)
+    return correo.asunto, correo.remitente, correo.fecha
+
+
+def con_cuerpo(datos: bytes) -> tuple:
+    correo = MensajeCorreo(datos)
+    return correo.asunto, correo.remitente, correo.fecha, correo.cuerpo
+
+
+def medir(nombre: str, corpus: list, funcion) -> None:
+    inicio = time.perf_counter()
+    for datos in corpus:
+        funcion(datos)
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<36} {len(corpus) / duracion:>12,.0f} mensajes/s  ({duracion:.3f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark de decodificación de mensajes")
+    parser.add_argument("numero_mensajes", type=int, nargs="?", default=20000)
+    parser.add_argument("--mbox", help="Fixture mbox a usar como corpus")
+    argumentos = parser.parse_args()
+
+    if argumentos.mbox:
+        corpus = [mensaje.as_bytes() for mensaje in mailbox.mbox(argumentos.mbox, create=False)]
+    else:
+        corpus = [datos for datos, _ in generar_mensajes(argumentos.numero_mensajes)]
+    print(f"Corpus: {len(corpus)} mensajes, {sum(map(len, corpus)) / 2 ** 20:.1f} MB")
+
+    medir("anterior (email + walk, latin1)", corpus, decodificar_anterior)
+    medir("MensajeCorreo (solo cabeceras)", corpus, solo_cabeceras)
+    medir("MensajeCorreo (cabeceras + cuerpo)", corpus, con_cuerpo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Benchmark de Correo.mover_correos contra el servidor IMAP falso local.
+
+Compara el camino anterior (un COPY y un STORE por mensaje) con el movimiento
+en bloque (UID MOVE, o UID COPY + UID STORE + UID EXPUNGE sin MOVE) y muestra
+los round trips y el tiempo de cada uno.
+
+Uso:
+    python -m benchmarks.bench_mover_correos [numero_mensajes]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from classes.correo import Correo
+from classes.servidor_imap_falso import ServidorImapFalso
+
+
+def crear_servidor(numero_mensajes: int, capacidades: tuple) -> ServidorImapFalso:
+    """
+    Crea un servidor falso con la INBOX llena de mensajes sintéticos.
+    """
+    servidor = ServidorImapFalso(capacidades=capacidades)
+    servidor.agregar_buzon("banco/openbank")
+    for i in range(numero_mensajes):
+        servidor.agregar_mensaje(
+            "INBOX",
+            f"From: avisos@openbank.es\r\nSubject: Movimiento {i}\r\n\r\nCuerpo {i}\r\n".encode(),
+        )
+    return servidor
+
+
+def crear_correo(puerto: int, carpeta: str) -> Correo:
+    """
+    Crea un Correo configurado contra el servidor falso.
+    """
+    ruta = os.path.join(carpeta, "config.ini")
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.write(
+            "[login]\n"
+            "username = usuario\n"
+            "password = password\n"
+            "imap_server = 127.0.0.1\n"
+            f"imap_port = {puerto}\n"
+            "imap_ssl = no\n"
+        )
+    return Correo(ruta)
+
+
+def mover_uno_a_uno(correo: Correo, origen: str, destino: str, id_mensajes: list) -> None:
+    """
+    Reproduce el algoritmo anterior: un COPY y un STORE por mensaje y un EXPUNGE.
+    """
+    correo.listar_etiquetas()
+    correo.imap.select(origen)
+    for mensaje_id in id_mensajes:
+        correo.imap.copy(mensaje_id, destino)
+    for mensaje_id in id_mensajes:
+        correo.imap.store(mensaje_id, "+FLAGS", "\\Deleted")
+    correo.imap.expunge()
+
+
+def medir(nombre: str, numero_mensajes: int, capacidades: tuple, funcion) -> None:
+    with crear_servidor(numero_mensajes, capacidades) as servidor, tempfile.TemporaryDirectory() as carpeta:
+        correo = crear_correo(servidor.puerto, carpeta)
+        correo.seleccionar_bandeja("INBOX")
+        id_mensajes = correo.filtrar_correo("ALL")
+        servidor.reiniciar_estadisticas()
+
+        inicio = time.perf_counter()
+        funcion(correo, "INBOX", "banco/openbank", id_mensajes)
+        duracion = time.perf_counter() - inicio
+
+        estadisticas = servidor.estadisticas
+        restantes = len(servidor.obtener_buzon("INBOX").mensajes)
+        movidos = len(servidor.obtener_buzon("banco/openbank").mensajes)
+        correo.desconectar_del_correo()
+
+    print(f"{nombre:<32} round trips: {estadisticas['round_trips']:>7}  "
+          f"tiempo: {duracion:8.3f}s  movidos: {movidos}  restantes: {restantes}")
+
+
+def main() -> None:
+    numero_mensajes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"Moviendo {numero_mensajes} mensajes de INBOX a banco/openbank")
+    medir("uno a uno (anterior)", numero_mensajes, ("IMAP4rev1",), mover_uno_a_uno)
+    medir("bloque UID MOVE", numero_mensajes, ("IMAP4rev1", "MOVE", "UIDPLUS"), Correo.mover_correos)
+    medir("bloque UID COPY + UIDPLUS", numero_mensajes, ("IMAP4rev1", "UIDPLUS"), Correo.mover_correos)
+    medir("bloque UID COPY + EXPUNGE", numero_mensajes, ("IMAP4rev1",), Correo.mover_correos)
+
+
+if __name__ == "__main__":
+    main()
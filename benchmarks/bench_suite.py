@@ -0,0 +1,216 @@
+"""
+Suite de benchmarks de Correo contra el servidor IMAP falso local.
+
+Para cada tamaño de buzón y cada escenario se arranca un servidor falso con
+la INBOX llena (mensajes sintéticos o un fixture mbox/Maildir) y se ejecuta
+el escenario en un proceso hijo, de modo que el pico de memoria medido es el
+del cliente y no el del servidor. Se informa de round trips, bytes
+transferidos, tiempo y pico de RSS.
+
+Uso:
+    python -m benchmarks.bench_suite [--tamanos 1000 10000 100000]
+                                     [--escenarios organizar_correo organizar_local ...]
+                                     [--mbox ruta | --maildir ruta]
+                                     [--latencia ms] [--json resultados.json]
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import subprocess
+import tempfile
+
+from classes.servidor_imap_falso import ServidorImapFalso
+from benchmarks.sinteticos import generar_mensajes
+
+try:
+    import resource
+except ImportError:  # Windows: no se puede medir el pico de RSS
+    resource = None
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARCA_RESULTADO = "RESULTADO_BENCHMARK "
+
+
+def _correo():
+    from classes.correo import Correo
+    return Correo("config.ini")
+
+
+def _organizar_correo():
+    runpy.run_path(os.path.join(RAIZ, "scripts", "organizar_correo.py"), run_name="__main__")
+
+
+def _organizar(modo_local: bool):
+    def escenario():
+        correo = _correo()
+        correo.modo_local = modo_local
+        try:
+            correo.organizar_bandeja("INBOX")
+        finally:
+            correo.desconectar_del_correo()
+    return escenario
+
+
+def _obtener_noleidos(proyeccion: str):
+    def escenario():
+        correo = _correo()
+        try:
+            correo.seleccionar_bandeja("INBOX")
+            for _ in correo.iterar_correos(correo.filtrar_correo("UNSEEN"), proyeccion):
+                pass
+        finally:
+            correo.desconectar_del_correo()
+    return escenario
+
+
+def _filtrar_todo():
+    correo = _correo()
+    try:
+        correo.seleccionar_bandeja("INBOX")
+        correo.filtrar_correo("ALL")
+    finally:
+        correo.desconectar_del_correo()
+
+
+ESCENARIOS = {
+    "organizar_correo": _organizar_correo,
+    "organizar_local": _organizar(True),
+    "filtrar_todo": _filtrar_todo,
+    "noleidos_cabeceras": _obtener_noleidos("cabeceras"),
+    "noleidos_completo": _obtener_noleidos("completo"),
+}
+
+
+def ejecutar_hijo(escenario: str) -> None:
+    """
+    Ejecuta un escenario en el proceso actual e imprime el tiempo y el pico de RSS.
+    """
+    inicio = time.perf_counter()
+    ESCENARIOS[escenario]()
+    duracion = time.perf_counter() - inicio
+    print(MARCA_RESULTADO + json.dumps({"tiempo": duracion, "rss_pico": rss_pico()}), flush=True)
+
+
+def rss_pico():
+    """
+    Devuelve el pico de memoria residente del proceso en bytes (None si no se puede medir).
+    En Linux se lee VmHWM, porque ru_maxrss hereda el pico del proceso padre.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def crear_servidor(argumentos, numero_mensajes: int) -> ServidorImapFalso:
+    """
+    Crea el servidor falso con las carpetas de las reglas y la INBOX llena.
+    """
+    servidor = ServidorImapFalso(latencia=argumentos.latencia / 1000)
+    with open(os.path.join(RAIZ, "classes", "etiquetas.json"), "r", encoding="utf-8") as archivo:
+        arbol = json.load(archivo)["arbol_etiquetas"]
+    for padre, hijas in arbol.items():
+        servidor.agregar_buzon(padre)
+        for hija in hijas:
+            servidor.agregar_buzon(f"{padre}/{hija}")
+
+    if argumentos.mbox:
+        servidor.cargar_mbox(argumentos.mbox)
+    elif argumentos.maildir:
+        servidor.cargar_maildir(argumentos.maildir)
+    else:
+        ruta_etiquetas = os.path.join(RAIZ, "classes", "etiquetas.json")
+        for datos, flags in generar_mensajes(numero_mensajes, ruta_etiquetas=ruta_etiquetas):
+            servidor.agregar_mensaje("INBOX", datos, flags)
+    return servidor
+
+
+def medir(argumentos, escenario: str, numero_mensajes: int) -> dict:
+    """
+    Ejecuta un escenario contra un servidor recién creado y devuelve sus métricas.
+    """
+    with crear_servidor(argumentos, numero_mensajes) as servidor, tempfile.TemporaryDirectory() as carpeta:
+        total = len(servidor.obtener_buzon("INBOX").mensajes)
+        with open(os.path.join(carpeta, "config.ini"), "w", encoding="utf-8") as archivo:
+            archivo.write(
+                "[login]\n"
+                "username = usuario\n"
+                "password = password\n"
+                "imap_server = 127.0.0.1\n"
+                f"imap_port = {servidor.puerto}\n"
+                "imap_ssl = no\n"
+                f"etiquetas = {os.path.join(RAIZ, 'classes', 'etiquetas.json')}\n"
+                "[opciones]\n"
+                f"carpeta_estado = {os.path.join(carpeta, 'estado')}\n"
+            )
+        servidor.reiniciar_estadisticas()
+
+        entorno = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proceso = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_suite", "--hijo", escenario],
+            cwd=carpeta, env=entorno, capture_output=True, text=True, encoding="utf-8", errors="replace",
+        )
+        lineas = [l for l in proceso.stdout.splitlines() if l.startswith(MARCA_RESULTADO)]
+        if proceso.returncode != 0 or not lineas:
+            raise RuntimeError(f"El escenario '{escenario}' falló:\n{proceso.stderr[-2000:]}")
+
+        resultado = json.loads(lineas[-1][len(MARCA_RESULTADO):])
+        estadisticas = servidor.estadisticas
+        resultado.update({
+            "escenario": escenario,
+            "mensajes": total,
+            "round_trips": estadisticas["round_trips"],
+            "bytes_entrada": estadisticas["bytes_entrada"],
+            "bytes_salida": estadisticas["bytes_salida"],
+            "comandos": dict(estadisticas["comandos"]),
+        })
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks de Correo contra un servidor IMAP falso")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--mbox", help="Fixture mbox a cargar en la INBOX en lugar de mensajes sintéticos")
+    parser.add_argument("--maildir", help="Fixture Maildir a cargar en lugar de mensajes sintéticos")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latencia simulada por comando (ms)")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    argumentos = parser.parse_args()
+
+    if argumentos.hijo:
+        ejecutar_hijo(argumentos.hijo)
+        return
+
+    # Con un fixture el tamaño lo fija el propio archivo
+    tamanos = [0] if argumentos.mbox or argumentos.maildir else argumentos.tamanos
+    resultados = []
+    print(f"{'escenario':<20} {'mensajes':>9} {'round trips':>12} {'KB enviados':>12} "
+          f"{'KB recibidos':>13} {'tiempo':>9} {'RSS pico':>10}")
+    for numero_mensajes in tamanos:
+        for escenario in argumentos.escenarios:
+            r = medir(argumentos, escenario, numero_mensajes)
+            resultados.append(r)
+            rss = f"{r['rss_pico'] / 2 ** 20:8.1f}MB" if r["rss_pico"] else "       n/d"
+            print(f"{r['escenario']:<20} {r['mensajes']:>9} {r['round_trips']:>12} "
+                  f"{r['bytes_entrada'] / 1024:>12.1f} {r['bytes_salida'] / 1024:>13.1f} "
+                  f"{r['tiempo']:>8.2f}s {rss}", flush=True)
+
+    if argumentos.json:
+        with open(argumentos.json, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Generación de buzones sintéticos para los benchmarks.
+
+Los remitentes se toman de las reglas de classes/etiquetas.json, de modo que
+una parte de los mensajes coincide con alguna etiqueta y el resto se queda en
+la INBOX. Hay mensajes de texto plano, quoted-printable, asuntos codificados
+(RFC 2047) y multipart con adjunto, para que el coste de decodificación se
+parezca al de un buzón real.
+
+Uso (para guardar un fixture reutilizable):
+    python -m benchmarks.sinteticos numero_mensajes ruta.mbox
+"""
+import sys
+import json
+import base64
+import random
+import mailbox
+from typing import Iterator, List, Tuple
+
+RUTA_ETIQUETAS = "classes/etiquetas.json"
+DESCONOCIDOS = ["amigo@ejemplo.org", "boletin@tienda.net", "noreply@servicio.io", "ana@correo.es"]
+
+
+def remitentes_de_reglas(ruta_etiquetas: str = RUTA_ETIQUETAS) -> List[str]:
+    """
+    Construye una dirección de remitente por cada regla que filtra por remitente.
+
+    :param ruta_etiquetas: Ruta del archivo de reglas.
+    :return: Lista de direcciones.
+    """
+    with open(ruta_etiquetas, "r", encoding="utf-8") as archivo:
+        filtros = json.load(archivo)["filtro_etiquetas"]
+    return [f"avisos@{f['remitente']}.com" for f in filtros.values() if f.get("remitente")]
+
+
+def generar_mensajes(numero_mensajes: int, semilla: int = 1234,
+                     ruta_etiquetas: str = RUTA_ETIQUETAS) -> Iterator[Tuple[bytes, list]]:
+    """
+    Genera mensajes RFC 822 sintéticos con CRLF.
+
+    :param numero_mensajes: Número de mensajes a generar.
+    :param semilla: Semilla del generador aleatorio (resultados reproducibles).
+    :param ruta_etiquetas: Archivo de reglas del que se toman los remitentes.
+    :return: Iterador de tuplas (datos, flags).
+    """
+    aleatorio = random.Random(semilla)
+    conocidos = remitentes_de_reglas(ruta_etiquetas)
+    for i in range(numero_mensajes):
+        remitente = aleatorio.choice(conocidos if aleatorio.random() < 0.7 else DESCONOCIDOS)
+        cabeceras = [
+            f"From: {remitente}",
+            "To: usuario@gmail.com",
+            f"Date: Mon, {1 + i % 28:02d} Jan 2024 10:{i % 60:02d}:00 +0100",
+            f"Message-ID: <{i}@sintetico>",
+        ]
+        tipo = aleatorio.random()
+        if tipo < 0.15:
+            asunto = base64.b64encode(f"Notificación nº {i}".encode("utf-8")).decode("ascii")
+            cabeceras.append(f"Subject: =?utf-8?b?{asunto}?=")
+        else:
+            cabeceras.append(f"Subject: Aviso {i}")
+
+        texto = " ".join(aleatorio.choice(("cuenta", "pedido", "factura", "envio", "oferta", "hola"))
+                         for _ in range(aleatorio.randint(20, 80)))
+        if tipo < 0.6:
+            cabeceras += ["MIME-Version: 1.0", "Content-Type: text/plain; charset=us-ascii"]
+            cuerpo = texto
+        elif tipo < 0.9:
+            cabeceras += ["MIME-Version: 1.0", "Content-Type: text/plain; charset=utf-8",
+                          "Content-Transfer-Encoding: quoted-printable"]
+            cuerpo = texto.replace("envio", "env=C3=ADo")
+        else:
+            adjunto = base64.encodebytes(bytes(aleatorio.getrandbits(8) for _ in range(2048))).decode("ascii")
+            cabeceras += ["MIME-Version: 1.0", 'Content-Type: multipart/mixed; boundary="limite"']
+            cuerpo = "\r\n".join([
+                "--limite", "Content-Type: text/plain; charset=utf-8", "", texto,
+                "--limite", "Content-Type: application/pdf; name=\"factura.pdf\"",
+                "Content-Disposition: attachment; filename=\"factura.pdf\"",
+                "Content-Transfer-Encoding: base64", "", adjunto.replace("\n", "\r\n").rstrip(),
+                "--limite--",
+            ])
+        flags = ["\\Seen"] if aleatorio.random() < 0.5 else []
+        yield ("\r\n".join(cabeceras) + "\r\n\r\n" + cuerpo + "\r\n").encode("utf-8"), flags
+
+
+def guardar_mbox(ruta: str, numero_mensajes: int, semilla: int = 1234) -> None:
+    """
+    Guarda un buzón sintético como archivo mbox para usarlo como fixture.
+
+    :param ruta: Ruta del archivo mbox a crear.
+    :param numero_mensajes: Número de mensajes.
+    :param semilla: Semilla del generador aleatorio.
+    """
+    destino = mailbox.mbox(ruta)
+    destino.lock()
+    try:
+        for datos, flags in generar_mensajes(numero_mensajes, semilla):
+            mensaje = mailbox.mboxMessage(datos)
+            if "\\Seen" in flags:
+                mensaje.set_flags("RO")
+            destino.add(mensaje)
+        destino.flush()
+    finally:
+        destino.unlock()
+        destino.close()
+
+
+if __name__ == "__main__":
+    guardar_mbox(sys.argv[2], int(sys.argv[1]))
@@ -0,0 +1,148 @@
+import re
+import base64
+import threading
+from typing import Dict, Iterable, Optional
+
+_PATRON_LIST = re.compile(rb'^\((?P<flags>[^)]*)\) (?P<delimitador>"(?:\\.|[^"])*"|NIL) ?(?P<nombre>.*)$', re.IGNORECASE)
+_PATRON_LITERAL = re.compile(rb"\{(\d+)\}$")
+
+
+def codificar_utf7_imap(texto: str) -> str:
+    """
+    Codifica un nombre de carpeta en UTF-7 modificado (RFC 3501, 5.1.3).
+
+    Ejemplo: "Facturación" -> "Facturaci&APM-n"
+
+    :param texto: Nombre de la carpeta en Unicode.
+    :return: Nombre codificado para enviar al servidor.
+    """
+    resultado, pendiente = [], []
+
+    def vaciar():
+        if pendiente:
+            codificado = base64.b64encode("".join(pendiente).encode("utf-16-be")).decode("ascii")
+            resultado.append("&" + codificado.rstrip("=").replace("/", ",") + "-")
+            pendiente.clear()
+
+    for caracter in texto:
+        if 0x20 <= ord(caracter) <= 0x7E:
+            vaciar()
+            resultado.append("&-" if caracter == "&" else caracter)
+        else:
+            pendiente.append(caracter)
+    vaciar()
+    return "".join(resultado)
+
+
+def decodificar_utf7_imap(texto: str) -> str:
+    """
+    Decodifica un nombre de carpeta en UTF-7 modificado.
+
+    :param texto: Nombre tal y como lo devuelve el servidor.
+    :return: Nombre en Unicode.
+    """
+    def decodificar(coincidencia):
+        contenido = coincidencia.group(1)
+        if not contenido:
+            return "&"
+        contenido = contenido.replace(",", "/") + "=" * (-len(contenido) % 4)
+        return base64.b64decode(contenido).decode("utf-16-be")
+
+    return re.sub(r"&([^-]*)-", decodificar, texto)
+
+
+def nombre_para_comando(nombre: str) -> str:
+    """
+    Prepara un nombre de carpeta para un comando IMAP: lo codifica en UTF-7
+    modificado y lo entrecomilla si contiene espacios o caracteres especiales
+    (imaplib no lo hace por sí mismo).
+
+    :param nombre: Nombre de la carpeta en Unicode.
+    :return: Nombre listo para SELECT, COPY, MOVE, CREATE...
+    """
+    codificado = codificar_utf7_imap(nombre)
+    if codificado and not re.search(r'[\s()"{}\\%*\]]', codificado):
+        return codificado
+    return '"' + codificado.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _valor(texto: bytes) -> Optional[str]:
+    """
+    Devuelve el valor de un átomo o cadena entre comillas de una respuesta LIST.
+    """
+    texto = texto.strip()
+    if texto.upper() == b"NIL":
+        return None
+    if texto.startswith(b'"') and texto.endswith(b'"'):
+        texto = re.sub(rb"\\(.)", rb"\1", texto[1:-1])
+    return texto.decode("utf-8", errors="replace")
+
+
+def parsear_respuesta_list(datos: Iterable) -> Dict[str, dict]:
+    """
+    Parsea la respuesta de imap.list(), incluidos los nombres entre comillas
+    con espacios, los enviados como literal y cualquier delimitador.
+
+    :param datos: Lista devuelta por imap.list().
+    :return: Diccionario {"padre/hija" decodificado: {"flags", "delimitador", "nombre_servidor"}}.
+    """
+    carpetas = {}
+    for entrada in datos:
+        if entrada is None:
+            continue
+        literal = None
+        if isinstance(entrada, tuple):
+            entrada, literal = entrada
+        coincidencia = _PATRON_LIST.match(entrada.strip())
+        if not coincidencia:
+            continue
+
+        if literal is not None and _PATRON_LITERAL.search(coincidencia.group("nombre")):
+            nombre_servidor = literal.decode("utf-8", errors="replace")
+        else:
+            nombre_servidor = _valor(coincidencia.group("nombre"))
+        if nombre_servidor is None:
+            continue
+
+        # Las etiquetas usan siempre "/" como separador, sea cual sea el del servidor
+        delimitador = _valor(coincidencia.group("delimitador"))
+        nombre = decodificar_utf7_imap(nombre_servidor)
+        if delimitador and delimitador != "/":
+            nombre = nombre.replace(delimitador, "/")
+
+        carpetas[nombre] = {
+            "flags": coincidencia.group("flags").decode("ascii", errors="replace").split(),
+            "delimitador": delimitador,
+            "nombre_servidor": nombre_servidor,
+        }
+    return carpetas
+
+
+class CacheCarpetas:
+    """
+    Caché de carpetas por cuenta, compartida por todas las instancias de
+    Correo del proceso. Se construye con un único LIST por sesión y solo se
+    refresca cuando una carpeta no aparece en ella o el servidor indica que
+    no existe (TRYCREATE).
+    """
+    _carpetas: Dict[tuple, dict] = {}
+    _bloqueo = threading.Lock()
+
+    @classmethod
+    def obtener(cls, cuenta: tuple) -> Optional[dict]:
+        """
+        :param cuenta: Clave de la cuenta (servidor, usuario).
+        :return: Carpetas en caché o None si aún no se han listado.
+        """
+        with cls._bloqueo:
+            return cls._carpetas.get(cuenta)
+
+    @classmethod
+    def guardar(cls, cuenta: tuple, carpetas: dict) -> None:
+        with cls._bloqueo:
+            cls._carpetas[cuenta] = carpetas
+
+    @classmethod
+    def invalidar(cls, cuenta: tuple) -> None:
+        with cls._bloqueo:
+            cls._carpetas.pop(cuenta, None)
@@ -0,0 +1,640 @@
+import re
+import time
+import itertools
+import socket
+import ssl
+import select
+import imaplib
+import threading
+import configparser
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from classes.logger import Logger
+from classes.metricas import METRICAS, Metricas
+
+# Comandos que no se repiten tras una reconexión: podrían duplicar mensajes
+COMANDOS_NO_REINTENTABLES = {"APPEND", "COPY"}
+# Métodos de imaplib que no envían ningún comando al servidor
+METODOS_LOCALES = {"response", "send", "read", "readline", "shutdown", "socket", "print_log"}
+# Respuestas NO/BAD con las que el servidor indica que se le está enviando demasiado
+SATURACION = re.compile(rb"THROTTL|\[LIMIT\]|\[UNAVAILABLE\]|TOO MANY|RATE LIMIT", re.IGNORECASE)
+
+
+def instrumentar(imap: imaplib.IMAP4) -> imaplib.IMAP4:
+    """
+    Cuenta los bytes enviados y recibidos por una conexión imaplib en
+    imap.bytes_enviados e imap.bytes_recibidos. imaplib hace toda su E/S con
+    send, read y readline, así que basta con envolver esos tres métodos.
+    """
+    send, read, readline = imap.send, imap.read, imap.readline
+    imap.bytes_enviados = imap.bytes_recibidos = 0
+
+    def enviar(datos):
+        imap.bytes_enviados += len(datos)
+        return send(datos)
+
+    def leer(tamano):
+        datos = read(tamano)
+        imap.bytes_recibidos += len(datos)
+        return datos
+
+    def leer_linea():
+        linea = readline()
+        imap.bytes_recibidos += len(linea)
+        return linea
+
+    imap.send, imap.read, imap.readline = enviar, leer, leer_linea
+    return imap
+
+
+def nombre_comando(nombre: str, args: tuple) -> str:
+    """
+    Tipo de comando para las métricas: "SELECT", "UID FETCH", "UID MOVE"...
+    """
+    comando = nombre.upper()
+    if comando == "UID" and args:
+        comando = f"UID {str(args[0]).upper()}"
+    return comando
+
+
+class SesionImap:
+    """
+    Sesión IMAP autenticada entregada por GestorConexiones.
+
+    Reenvía cualquier método o atributo a la conexión imaplib subyacente. Si
+    la conexión se cae (imaplib.IMAP4.abort o error de socket), se reconecta
+    con espera exponencial, vuelve a seleccionar la bandeja que estaba
+    seleccionada y repite el comando, salvo los que podrían duplicar mensajes
+    (COPY, APPEND), que propagan el error.
+
+    En saturaciones cuenta las caídas (BYE) y las respuestas de limitación
+    del servidor ([THROTTLED], [LIMIT]...), para que quien la usa pueda
+    reducir el ritmo.
+    """
+    def __init__(self, gestor: "GestorConexiones"):
+        self._gestor = gestor
+        self.imap = gestor._conectar_con_reintentos()
+        self.bandeja = None
+        self.solo_lectura = False
+        self.ultimo_uso = time.monotonic()
+        self.saturaciones = 0
+        self.en_flujo = False
+
+    def __getattr__(self, nombre: str):
+        atributo = getattr(self.imap, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def llamada(*args, **kwargs):
+            if self.en_flujo and nombre not in METODOS_LOCALES:
+                # Las respuestas de los FETCH en vuelo se tomarían por las de este comando
+                raise RuntimeError(f"No se puede enviar '{nombre}' mientras hay un fetch_en_flujo sin terminar")
+            try:
+                resultado = self._medir(nombre, args, kwargs)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if nombre in ("logout", "shutdown"):
+                    raise
+                self._gestor.logger.warning(f"Conexion IMAP perdida durante '{nombre}': {e}. Reconectando.")
+                self.saturaciones += 1
+                self.reconectar()
+                if not self._reintentable(nombre, args):
+                    raise
+                resultado = self._medir(nombre, args, kwargs)
+
+            if isinstance(resultado, tuple) and resultado and resultado[0] in ("NO", "BAD") and \
+                    SATURACION.search(b" ".join(d for d in resultado[1] or [] if isinstance(d, bytes))):
+                self.saturaciones += 1
+
+            if nombre == "select" and resultado[0] == "OK":
+                self.bandeja = args[0] if args else "INBOX"
+                self.solo_lectura = kwargs.get("readonly", args[1] if len(args) > 1 else False)
+            elif nombre in ("close", "unselect", "logout"):
+                self.bandeja = None
+            self.ultimo_uso = time.monotonic()
+            return resultado
+
+        return llamada
+
+    def _medir(self, nombre: str, args: tuple, kwargs: dict):
+        """
+        Ejecuta un método de imaplib y, si envía un comando, registra su
+        latencia, bytes y estado en las métricas del gestor.
+        """
+        metodo = getattr(self.imap, nombre)
+        if nombre in METODOS_LOCALES or nombre.startswith("_"):
+            return metodo(*args, **kwargs)
+
+        imap = self.imap
+        enviados, recibidos = getattr(imap, "bytes_enviados", 0), getattr(imap, "bytes_recibidos", 0)
+        inicio = time.perf_counter()
+        estado = "ERROR"
+        try:
+            resultado = metodo(*args, **kwargs)
+            if isinstance(resultado, tuple) and resultado and isinstance(resultado[0], str):
+                estado = resultado[0]
+            else:
+                estado = "OK"
+            return resultado
+        finally:
+            self._gestor.metricas.observar_comando(
+                self._gestor.usuario, nombre_comando(nombre, args), time.perf_counter() - inicio, estado,
+                getattr(imap, "bytes_enviados", 0) - enviados, getattr(imap, "bytes_recibidos", 0) - recibidos,
+            )
+
+    @staticmethod
+    def _reintentable(nombre: str, args: tuple) -> bool:
+        """
+        Indica si un comando puede repetirse sin efectos duplicados.
+        """
+        return nombre_comando(nombre, args).split()[-1] not in COMANDOS_NO_REINTENTABLES
+
+    def reconectar(self) -> None:
+        """
+        Abre una conexión nueva y restaura la bandeja seleccionada.
+        """
+        try:
+            self.imap.shutdown()
+        except Exception:
+            pass
+        self.imap = self._gestor._conectar_con_reintentos()
+        if self.bandeja is not None:
+            self.imap.select(self.bandeja, self.solo_lectura)
+
+    def idle(self, timeout: float) -> List[bytes]:
+        """
+        Entra en IMAP IDLE (RFC 2177) sobre la bandeja seleccionada y espera
+        hasta que el servidor notifique un cambio (EXISTS, EXPUNGE) o venza el
+        timeout. Después envía DONE y recoge la respuesta.
+
+        imaplib no implementa IDLE, así que se habla directamente con el socket.
+        Si la conexión se cae, se reconecta y se devuelve una lista vacía.
+
+        :param timeout: Segundos máximos de espera (el RFC recomienda < 29 min).
+        :return: Respuestas no etiquetadas recibidas (p. ej. b'* 12 EXISTS').
+        """
+        imap = self.imap
+        etiqueta = f"IDLE{int(time.monotonic() * 1000)}".encode()
+        respuestas = []
+        inicio = time.perf_counter()
+        enviados, recibidos = imap.bytes_enviados, imap.bytes_recibidos
+        try:
+            imap.send(etiqueta + b" IDLE\r\n")
+            linea = imap.readline()
+            if not linea.startswith(b"+"):
+                self._gestor.logger.warning(f"El servidor rechazó IDLE: {linea!r}")
+                return respuestas
+
+            limite = time.monotonic() + timeout
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                if not self._datos_pendientes(imap):
+                    legibles, _, _ = select.select([imap.sock], [], [], restante)
+                    if not legibles:
+                        break
+                linea = imap.readline()
+                if not linea:
+                    raise imaplib.IMAP4.abort("el servidor cerró la conexión durante IDLE")
+                linea = linea.rstrip(b"\r\n")
+                respuestas.append(linea)
+                if linea.startswith(b"* BYE"):
+                    raise imaplib.IMAP4.abort(linea.decode(errors="replace"))
+                if re.match(rb"^\* \d+ (EXISTS|EXPUNGE)", linea):
+                    break
+
+            imap.send(b"DONE\r\n")
+            while True:
+                linea = imap.readline().rstrip(b"\r\n")
+                if linea.startswith(etiqueta):
+                    break
+                respuestas.append(linea)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            self._gestor.metricas.observar_comando(self._gestor.usuario, "IDLE", time.perf_counter() - inicio, "ERROR")
+            self._gestor.logger.warning(f"Conexion IMAP perdida durante IDLE: {e}. Reconectando.")
+            self.reconectar()
+            return []
+
+        self._gestor.metricas.observar_comando(
+            self._gestor.usuario, "IDLE", time.perf_counter() - inicio, "OK",
+            imap.bytes_enviados - enviados, imap.bytes_recibidos - recibidos,
+        )
+        self.ultimo_uso = time.monotonic()
+        return respuestas
+
+    @staticmethod
+    def _datos_pendientes(imap: imaplib.IMAP4) -> bool:
+        """
+        Indica si ya hay datos recibidos sin consumir que select() no ve: en
+        el búfer de lectura de imaplib o descifrados en la capa TLS. Se mira
+        el búfer con el socket en modo no bloqueante para no quedarse esperando.
+        """
+        sock = imap.sock
+        if isinstance(sock, ssl.SSLSocket) and sock.pending():
+            return True
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            return bool(imap.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def fetch_en_flujo(self, conjuntos: List[str], elementos: str, ventana: int = 2) -> Iterator[list]:
+        """
+        Envía un UID FETCH por conjunto manteniendo hasta `ventana` comandos en
+        vuelo (pipelining) y entrega cada respuesta "* n FETCH" en cuanto se
+        lee del socket, sin esperar a que termine el comando. Así la memoria
+        depende del tamaño de un mensaje y no del número de mensajes por bloque.
+
+        Cada elemento entregado tiene el mismo formato que los datos de
+        imaplib (tuplas prefijo/literal y bytes), listo para
+        agrupar_respuesta_fetch. Si la conexión se cae, se reconecta y se
+        reenvían los conjuntos pendientes sin repetir mensajes ya entregados.
+
+        Mientras el iterador no se agote no se puede enviar ningún otro comando
+        por esta sesión (se lanza RuntimeError): las respuestas de los FETCH en
+        vuelo se confundirían con las suyas. Si se abandona antes (break,
+        close() o una excepción), se leen y descartan las respuestas pendientes
+        y, si eso falla, se reconecta.
+
+        :param conjuntos: Conjuntos de UIDs, uno por comando.
+        :param elementos: Elementos FETCH, p. ej. "(BODY.PEEK[HEADER])".
+        :param ventana: Número máximo de comandos enviados sin respuesta.
+        :return: Iterador de respuestas por mensaje.
+        """
+        pendientes = list(conjuntos)
+        entregados = set()
+        while pendientes:
+            imap = self.imap
+            enviados, recibidos = imap.bytes_enviados, imap.bytes_recibidos
+            flujo = self._fetch_pipeline(pendientes, elementos, ventana)
+            self.en_flujo = True
+            try:
+                for respuesta, uid in flujo:
+                    if uid is not None and uid in entregados:
+                        continue
+                    entregados.add(uid)
+                    yield respuesta
+            except (imaplib.IMAP4.abort, OSError) as e:
+                self._gestor.logger.warning(f"Conexion IMAP perdida durante FETCH: {e}. Reconectando.")
+                self.reconectar()
+            finally:
+                # Si se abandona el iterador, close() drena los comandos que siguen en vuelo
+                flujo.close()
+                self.en_flujo = False
+                # Los bytes de comandos solapados no se pueden repartir: se suman al total
+                self._gestor.metricas.sumar_bytes(self._gestor.usuario, "UID FETCH",
+                                                  imap.bytes_enviados - enviados, imap.bytes_recibidos - recibidos)
+        self.ultimo_uso = time.monotonic()
+
+    def _fetch_pipeline(self, pendientes: List[str], elementos: str, ventana: int) -> Iterator[tuple]:
+        """
+        Implementación de fetch_en_flujo sobre una conexión. Va sacando de
+        `pendientes` los conjuntos cuya respuesta etiquetada ya llegó. Si se
+        cierra el generador con comandos en vuelo, los drena antes de salir.
+        """
+        imap = self.imap
+        metricas, usuario = self._gestor.metricas, self._gestor.usuario
+        en_vuelo = {}
+        siguiente = 0
+        base = f"F{int(time.monotonic() * 1000)}_"
+        contador = itertools.count()
+
+        try:
+            while siguiente < len(pendientes) or en_vuelo:
+                while siguiente < len(pendientes) and len(en_vuelo) < ventana:
+                    etiqueta = f"{base}{next(contador)}".encode()
+                    imap.send(etiqueta + b" UID FETCH " + pendientes[siguiente].encode() + b" " +
+                              elementos.encode() + b"\r\n")
+                    en_vuelo[etiqueta] = (pendientes[siguiente], time.perf_counter())
+                    siguiente += 1
+
+                linea = imap.readline()
+                if not linea:
+                    raise imaplib.IMAP4.abort("el servidor cerró la conexión durante FETCH")
+                if linea.startswith(b"* "):
+                    respuesta = []
+                    contenido = linea[2:]
+                    # Leer los literales {n} que forman parte de la misma respuesta
+                    while True:
+                        literal = re.search(rb"\{(\d+)\}\r\n$", contenido)
+                        if not literal:
+                            respuesta.append(contenido.rstrip(b"\r\n"))
+                            break
+                        datos = imap.read(int(literal.group(1)))
+                        respuesta.append((contenido.rstrip(b"\r\n"), datos))
+                        contenido = imap.readline()
+                    primera = respuesta[0][0] if isinstance(respuesta[0], tuple) else respuesta[0]
+                    if re.match(rb"^\d+ FETCH ", primera):
+                        # Mismo formato que imaplib: "n (UID ..." sin la palabra FETCH
+                        primera = re.sub(rb"^(\d+) FETCH ", rb"\1 ", primera)
+                        respuesta[0] = (primera, respuesta[0][1]) if isinstance(respuesta[0], tuple) else primera
+                        prefijos = b" ".join(r[0] if isinstance(r, tuple) else r for r in respuesta)
+                        uid = re.search(rb"\bUID (\d+)", prefijos)
+                        yield respuesta, int(uid.group(1)) if uid else None
+                    elif primera.startswith(b"BYE"):
+                        raise imaplib.IMAP4.abort(respuesta[0].decode(errors="replace"))
+                    else:
+                        self._conservar_no_etiquetada(imap, primera)
+                    continue
+
+                etiqueta = linea.split(b" ", 1)[0]
+                if etiqueta in en_vuelo:
+                    conjunto, enviado = en_vuelo.pop(etiqueta)
+                    # Todos los conjuntos en vuelo están antes de `siguiente`
+                    pendientes.remove(conjunto)
+                    siguiente -= 1
+                    estado = (linea.split(b" ", 2)[1:2] or [b"BAD"])[0].decode(errors="replace")
+                    metricas.observar_comando(usuario, "UID FETCH", time.perf_counter() - enviado, estado)
+                    if estado != "OK":
+                        self._gestor.logger.error(f"Error en UID FETCH {conjunto}: {linea.strip()!r}")
+        except GeneratorExit:
+            # Abandonado con comandos en vuelo: sus respuestas se descartan
+            if en_vuelo:
+                self._drenar(en_vuelo)
+            raise
+
+    def _drenar(self, en_vuelo: dict) -> None:
+        """
+        Lee y descarta las respuestas de los FETCH que siguen en vuelo hasta
+        recibir la respuesta etiquetada de cada uno, para que la sesión quede
+        sincronizada. Si la conexión falla mientras tanto, se reconecta.
+
+        :param en_vuelo: Diccionario {etiqueta: (conjunto, instante de envío)}.
+        """
+        imap = self.imap
+        try:
+            while en_vuelo:
+                linea = imap.readline()
+                if not linea:
+                    raise imaplib.IMAP4.abort("el servidor cerró la conexión durante FETCH")
+                # Una respuesta con literales continúa tras cada {n}
+                literal = re.search(rb"\{(\d+)\}\r\n$", linea)
+                while literal:
+                    imap.read(int(literal.group(1)))
+                    linea = imap.readline()
+                    literal = re.search(rb"\{(\d+)\}\r\n$", linea)
+                if linea.startswith(b"* "):
+                    self._conservar_no_etiquetada(imap, linea[2:].rstrip(b"\r\n"))
+                en_vuelo.pop(linea.split(b" ", 1)[0], None)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            self._gestor.logger.warning(f"Conexion IMAP perdida al descartar un FETCH: {e}. Reconectando.")
+            en_vuelo.clear()
+            self.reconectar()
+
+    @staticmethod
+    def _conservar_no_etiquetada(imap: imaplib.IMAP4, respuesta: bytes) -> None:
+        """
+        Guarda en imaplib una respuesta no etiquetada numérica ("12 EXISTS",
+        "3 EXPUNGE") leída durante un FETCH en flujo, como haría imaplib, para
+        que response() la devuelva después (p. ej. el aviso de correo nuevo).
+        """
+        numerica = re.match(rb"^(\d+) ([A-Z-]+)$", respuesta)
+        if numerica and numerica.group(2) != b"FETCH":
+            imap._append_untagged(numerica.group(2).decode(), numerica.group(1))
+
+    def activa(self) -> bool:
+        """
+        Comprueba con un NOOP que la conexión sigue viva.
+        """
+        try:
+            status, _ = self.imap.noop()
+            self.ultimo_uso = time.monotonic()
+            return status == "OK"
+        except Exception:
+            return False
+
+
+class GestorConexiones:
+    """
+    Pool de sesiones IMAP autenticadas para una cuenta.
+
+    Las sesiones se reutilizan entre ejecuciones dentro de un proceso de larga
+    duración, se mantienen vivas con NOOP periódicos y se reconectan de forma
+    transparente. Un fallo de autenticación no se reintenta: se lanza de inmediato.
+    """
+    def __init__(self, servidor: str, usuario: str, password: str, puerto: int = 993, ssl: bool = True,
+                 logger: Optional[Logger] = None, tamano: int = 1, intervalo_keepalive: float = 300,
+                 reintentos: int = 5, espera_inicial: float = 1.0, espera_maxima: float = 60.0,
+                 timeout: Optional[float] = 60, metricas: Optional[Metricas] = None):
+        """
+        :param servidor: Servidor IMAP.
+        :param usuario: Usuario de la cuenta.
+        :param password: Contraseña de la cuenta.
+        :param puerto: Puerto del servidor.
+        :param ssl: Si es True se usa IMAP4_SSL.
+        :param logger: Logger donde registrar la actividad.
+        :param tamano: Número máximo de sesiones simultáneas.
+        :param intervalo_keepalive: Segundos de inactividad tras los que se envía un NOOP.
+        :param reintentos: Intentos de conexión antes de rendirse.
+        :param espera_inicial: Espera (s) antes del primer reintento; se duplica en cada intento.
+        :param espera_maxima: Espera máxima (s) entre reintentos.
+        :param timeout: Timeout (s) de socket de cada conexión.
+        :param metricas: Registro de métricas (por defecto el compartido del proceso).
+        """
+        self.servidor = servidor
+        self.usuario = usuario
+        self.password = password
+        self.puerto = puerto
+        self.ssl = ssl
+        self.logger = logger or Logger("automatizacion_correo")
+        self.tamano = tamano
+        self.intervalo_keepalive = intervalo_keepalive
+        self.reintentos = reintentos
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.timeout = timeout
+        self.metricas = metricas or METRICAS
+
+        self._libres: List[SesionImap] = []
+        self._abiertas = 0
+        self._condicion = threading.Condition()
+        self._hilo_keepalive = None
+        self._detener = threading.Event()
+
+    @classmethod
+    def desde_configuracion(cls, config: configparser.ConfigParser, logger: Optional[Logger] = None,
+                            seccion: str = "login", **kwargs) -> "GestorConexiones":
+        """
+        Crea un gestor a partir de una sección de config.ini y de [opciones].
+
+        :param config: Configuración cargada.
+        :param logger: Logger donde registrar la actividad.
+        :param seccion: Sección con username, password e imap_server.
+        """
+        ssl = config.getboolean(seccion, "imap_ssl", fallback=True)
+        parametros = {
+            "puerto": config.getint(seccion, "imap_port", fallback=993 if ssl else 143),
+            "intervalo_keepalive": config.getfloat("opciones", "intervalo_keepalive", fallback=300),
+            "reintentos": config.getint("opciones", "reintentos_conexion", fallback=5),
+            "timeout": config.getfloat("opciones", "timeout", fallback=60),
+        }
+        parametros.update(kwargs)
+        return cls(config[seccion]["imap_server"].strip(), config[seccion]["username"].strip(),
+                   config[seccion]["password"].strip(), ssl=ssl, logger=logger, **parametros)
+
+    def _conectar(self) -> imaplib.IMAP4:
+        """
+        Abre una conexión y se autentica.
+
+        :return: Conexión imaplib autenticada.
+        """
+        inicio = time.perf_counter()
+        try:
+            if self.ssl:
+                imap = imaplib.IMAP4_SSL(self.servidor, self.puerto, timeout=self.timeout)
+            else:
+                imap = imaplib.IMAP4(self.servidor, self.puerto, timeout=self.timeout)
+            instrumentar(imap)
+            self.metricas.observar_comando(self.usuario, "CONNECT", time.perf_counter() - inicio, "OK")
+            self.logger.log("Conexion al servidor IMAP establecida.")
+        except socket.gaierror as e:
+            self.logger.error(f"Error al resolver el servidor IMAP: {self.servidor}. Detalles: {e}")
+            raise ValueError(f"Error al resolver el servidor IMAP: {self.servidor}. Detalles: {e}")
+
+        inicio = time.perf_counter()
+        try:
+            imap.login(self.usuario, self.password)
+            self.metricas.observar_comando(self.usuario, "LOGIN", time.perf_counter() - inicio, "OK",
+                                           imap.bytes_enviados, imap.bytes_recibidos)
+        except imaplib.IMAP4.abort:
+            raise
+        except imaplib.IMAP4.error as e:
+            self.metricas.observar_comando(self.usuario, "LOGIN", time.perf_counter() - inicio, "NO")
+            self.logger.error(f"Error de autenticacion: {e}")
+            try:
+                imap.shutdown()
+            except Exception:
+                pass
+            raise ValueError(f"Error de autenticacion: {e}")
+
+        self.logger.log("Autenticacion exitosa.")
+        return imap
+
+    def _conectar_con_reintentos(self) -> imaplib.IMAP4:
+        """
+        Conecta reintentando con espera exponencial ante errores de red.
+        Los errores de autenticación y de resolución DNS no se reintentan.
+        """
+        espera = self.espera_inicial
+        for intento in range(1, self.reintentos + 1):
+            try:
+                return self._conectar()
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if intento == self.reintentos:
+                    self.logger.error(f"Error al inicializar la conexion IMAP: {e}")
+                    raise ValueError(f"Error al inicializar la conexion IMAP: {e}")
+                self.logger.warning(f"Error de conexion IMAP (intento {intento}/{self.reintentos}): {e}. "
+                                    f"Reintentando en {espera:.1f}s")
+                time.sleep(espera)
+                espera = min(espera * 2, self.espera_maxima)
+
+    def adquirir(self, timeout: Optional[float] = None) -> SesionImap:
+        """
+        Entrega una sesión autenticada, reutilizando una libre si la hay.
+
+        :param timeout: Segundos máximos de espera si el pool está lleno.
+        :return: Sesión IMAP.
+        """
+        with self._condicion:
+            while not self._libres and self._abiertas >= self.tamano:
+                if not self._condicion.wait(timeout):
+                    raise TimeoutError("No hay sesiones IMAP libres en el pool.")
+            if self._libres:
+                sesion = self._libres.pop()
+            else:
+                self._abiertas += 1
+                sesion = None
+
+        if sesion is None:
+            try:
+                return SesionImap(self)
+            except Exception:
+                with self._condicion:
+                    self._abiertas -= 1
+                    self._condicion.notify()
+                raise
+
+        # Una sesión que lleva tiempo parada se comprueba antes de entregarla
+        if time.monotonic() - sesion.ultimo_uso >= self.intervalo_keepalive and not sesion.activa():
+            self.logger.warning("Sesion IMAP inactiva caducada. Reconectando.")
+            try:
+                sesion.reconectar()
+            except Exception:
+                # La sesión se pierde: su hueco en el pool queda libre para otra
+                with self._condicion:
+                    self._abiertas -= 1
+                    self._condicion.notify()
+                raise
+        return sesion
+
+    def liberar(self, sesion: SesionImap) -> None:
+        """
+        Devuelve una sesión al pool para reutilizarla.
+        """
+        with self._condicion:
+            self._libres.append(sesion)
+            self._condicion.notify()
+
+    def descartar(self, sesion: SesionImap) -> None:
+        """
+        Cierra una sesión en lugar de devolverla al pool.
+        """
+        try:
+            sesion.imap.logout()
+        except Exception:
+            pass
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+    @contextmanager
+    def sesion(self):
+        """
+        Context manager que adquiere una sesión y la devuelve al terminar.
+        """
+        sesion = self.adquirir()
+        try:
+            yield sesion
+        finally:
+            self.liberar(sesion)
+
+    def iniciar_keepalive(self) -> None:
+        """
+        Arranca un hilo que envía NOOP a las sesiones libres inactivas
+        para que el servidor no las cierre.
+        """
+        if self._hilo_keepalive is not None or self.intervalo_keepalive <= 0:
+            return
+        self._detener.clear()
+        self._hilo_keepalive = threading.Thread(target=self._bucle_keepalive, daemon=True)
+        self._hilo_keepalive.start()
+
+    def _bucle_keepalive(self) -> None:
+        while not self._detener.wait(self.intervalo_keepalive / 2):
+            with self._condicion:
+                libres, self._libres = self._libres, []
+            for sesion in libres:
+                if time.monotonic() - sesion.ultimo_uso >= self.intervalo_keepalive / 2 and not sesion.activa():
+                    try:
+                        sesion.reconectar()
+                    except Exception as e:
+                        self.logger.error(f"No se pudo reconectar la sesion IMAP: {e}")
+                        self.descartar(sesion)
+                        continue
+                self.liberar(sesion)
+
+    def cerrar(self) -> None:
+        """
+        Detiene el keepalive y cierra todas las sesiones libres.
+        """
+        self._detener.set()
+        if self._hilo_keepalive is not None:
+            self._hilo_keepalive.join()
+            self._hilo_keepalive = None
+        with self._condicion:
+            libres, self._libres = self._libres, []
+        for sesion in libres:
+            self.descartar(sesion)
@@ -0,0 +1,120 @@
+from typing import Iterable, List, Tuple
+
+
+def normalizar_ids(ids: Iterable) -> List[int]:
+    """
+    Convierte una colección de IDs (bytes, str o int) en una lista
+    ordenada de enteros sin duplicados.
+
+    :param ids: IDs de mensajes tal y como los devuelve imaplib (b'5') o como enteros.
+    :return: Lista ordenada de IDs enteros.
+    """
+    normalizados = set()
+    for id_mensaje in ids:
+        if isinstance(id_mensaje, bytes):
+            id_mensaje = id_mensaje.decode("ascii")
+        normalizados.add(int(id_mensaje))
+    return sorted(normalizados)
+
+
+def _rangos(ids: List[int]) -> List[str]:
+    """
+    Agrupa una lista ordenada de IDs en rangos IMAP ("1:50", "73").
+
+    :param ids: Lista ordenada de IDs enteros.
+    :return: Lista de rangos en formato IMAP.
+    """
+    rangos = []
+    inicio = anterior = None
+    for id_mensaje in ids:
+        if inicio is None:
+            inicio = anterior = id_mensaje
+        elif id_mensaje == anterior + 1:
+            anterior = id_mensaje
+        else:
+            rangos.append((inicio, anterior))
+            inicio = anterior = id_mensaje
+    if inicio is not None:
+        rangos.append((inicio, anterior))
+
+    return [f"{a}" if a == b else f"{a}:{b}" for a, b in rangos]
+
+
+def comprimir_ids(ids: Iterable) -> str:
+    """
+    Colapsa una lista de IDs en un conjunto de secuencia IMAP comprimido.
+
+    Ejemplo: [1, 2, 3, 73, 90, 91] -> "1:3,73,90:91"
+
+    :param ids: IDs de mensajes.
+    :return: Conjunto de secuencia IMAP.
+    """
+    return ",".join(_rangos(normalizar_ids(ids)))
+
+
+def resumir_ids(ids: Iterable, longitud_maxima: int = 200) -> str:
+    """
+    Conjunto comprimido para el log, recortado a longitud_maxima caracteres.
+
+    :param ids: IDs de mensajes.
+    :param longitud_maxima: Longitud máxima del texto.
+    :return: Conjunto de secuencia IMAP, con "... (n IDs)" si se recorta.
+    """
+    ids = normalizar_ids(ids)
+    conjunto = ",".join(_rangos(ids))
+    if len(conjunto) <= longitud_maxima:
+        return conjunto
+    return f"{conjunto[:longitud_maxima].rsplit(',', 1)[0]}... ({len(ids)} IDs)"
+
+
+def expandir_conjunto(conjunto: str) -> List[int]:
+    """
+    Expande un conjunto de secuencia IMAP sin '*' ("1:3,7") en la lista de IDs.
+
+    :param conjunto: Conjunto de secuencia IMAP.
+    :return: Lista ordenada de IDs enteros.
+    """
+    ids = set()
+    for parte in conjunto.split(","):
+        if not parte:
+            continue
+        if ":" in parte:
+            inicio, fin = (int(x) for x in parte.split(":", 1))
+            if inicio > fin:
+                inicio, fin = fin, inicio
+            ids.update(range(inicio, fin + 1))
+        else:
+            ids.add(int(parte))
+    return sorted(ids)
+
+
+def dividir_en_bloques(ids: Iterable, longitud_maxima: int = 1000) -> List[Tuple[str, List[int]]]:
+    """
+    Divide los IDs en bloques cuyo conjunto de secuencia comprimido no supera
+    la longitud indicada, para que cada comando IMAP quede por debajo del
+    límite de longitud de línea del servidor.
+
+    :param ids: IDs de mensajes.
+    :param longitud_maxima: Longitud máxima (en caracteres) del conjunto de cada bloque.
+    :return: Lista de tuplas (conjunto, ids_del_bloque).
+    """
+    normalizados = normalizar_ids(ids)
+    bloques = []
+    rangos_bloque, ids_bloque, longitud = [], [], 0
+
+    for rango in _rangos(normalizados):
+        ids_rango = expandir_conjunto(rango)
+        # +1 por la coma separadora
+        extra = len(rango) + (1 if rangos_bloque else 0)
+        if rangos_bloque and longitud + extra > longitud_maxima:
+            bloques.append((",".join(rangos_bloque), ids_bloque))
+            rangos_bloque, ids_bloque, longitud = [], [], 0
+            extra = len(rango)
+        rangos_bloque.append(rango)
+        ids_bloque.extend(ids_rango)
+        longitud += extra
+
+    if rangos_bloque:
+        bloques.append((",".join(rangos_bloque), ids_bloque))
+
+    return bloques
@@ -1,41 +1,117 @@
+import os
+import re
 import json
-import socket  # Importación necesaria para manejar socket.gaierror
+import time
+import hashlib
 import configparser
-import imaplib
-import email
-from email.header import decode_header
-from typing import Tuple, List
+from typing import Dict, Iterable, Iterator, Optional, Tuple, List
 from classes.logger import Logger
+from classes.estado import EstadoBuzones
+from classes.diario import DiarioMovimientos
+from classes.conexiones import GestorConexiones
+from classes.notificaciones import Notificador
+from classes.indice import IndiceCorreo
+from classes.reglas import MotorReglas, motor_desde_etiquetas
+from classes.rutas import ruta_carpeta_estado, ruta_configuracion, ruta_etiquetas
+from classes.mensajes import DecodificadorIncremental, MensajeCorreo, decodificar_cabecera, decodificar_contenido
+from classes.respuestas_imap import (agrupar_respuesta_fetch, extraer_copyuid, parte_de_texto,
+                                    partes_bodystructure)
+from classes.carpetas import CacheCarpetas, nombre_para_comando, parsear_respuesta_list
+from classes.conjuntos_imap import comprimir_ids, dividir_en_bloques, expandir_conjunto, normalizar_ids, resumir_ids
+
+# Message-ID de una respuesta BODY[HEADER.FIELDS (MESSAGE-ID)] (admite cabecera plegada)
+_PATRON_MESSAGE_ID = re.compile(rb"^Message-ID:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
 
 
 class Correo:
     """
     Clase para interactuar con un servidor de correo IMAP.
+
+    Al crearla se cargan y validan la configuración y las reglas (sin red);
+    la conexión IMAP se abre con el primer comando que la necesita.
     """
-    def __init__(self):
+    def __init__(self, ruta_config: str = "config.ini", gestor: Optional[GestorConexiones] = None,
+                 seccion: str = "login", notificador: Optional[Notificador] = None):
+        """
+        :param ruta_config: Ruta del archivo de configuración (si no existe en el
+                            directorio actual, se busca en la raíz del proyecto).
+        :param gestor: Pool de conexiones compartido (p. ej. en un proceso de larga
+                       duración). Si no se indica, se crea uno propio de una sesión.
+        :param seccion: Sección de config.ini con los datos de la cuenta
+                        ("login" o "cuenta:<nombre>").
+        :param notificador: Notificador SMTP compartido. Si no se indica, se crea
+                            uno propio si config.ini tiene sección [notificaciones].
+        """
         self.logger = Logger("automatizacion_correo")
-        self.config = self.cargar_configuracion("config.ini")
-        self.username = self.config["login"]["username"].strip()
-        self.password = self.config["login"]["password"].strip()
-        self.imap_server = self.config["login"]["imap_server"].strip()
-        self.imap = self.conectar_al_correo()
-        
-        # Cargar etiquetas desde un archivo JSON
-        etiquetas = self.cargar_etiquetas("./classes/etiquetas.json")
+        self.seccion = seccion
+        self.ruta_config = ruta_configuracion(ruta_config)
+        self.config = self.cargar_configuracion(self.ruta_config, seccion)
+        self.logger.configurar(self.config)
+        self.username = self.config[seccion]["username"].strip()
+        self.password = self.config[seccion]["password"].strip()
+        self.imap_server = self.config[seccion]["imap_server"].strip()
+        # Longitud máxima del conjunto de IDs enviado en cada comando IMAP
+        self.longitud_maxima_comando = self.config.getint("opciones", "longitud_maxima_comando", fallback=1000)
+        # Bytes de cada mensaje que se descargan como máximo (0: sin límite) y tamaño de
+        # cada FETCH parcial al guardar adjuntos
+        self.presupuesto_mensaje = int(self.config.getfloat("opciones", "presupuesto_mensaje_kb", fallback=1024) * 1024)
+        self.bloque_adjuntos = int(self.config.getfloat("opciones", "bloque_adjuntos_kb", fallback=1024) * 1024) or 1
+        self._capacidades = None
+        # Estado por buzón (UIDVALIDITY y último UID procesado)
+        self.estado = EstadoBuzones(ruta_carpeta_estado(self.config, self.ruta_config))
+        # Diario de movimientos para reanudar sin duplicar ni perder mensajes tras una caída
+        self.diario = None
+        if self.config.getboolean("opciones", "diario_movimientos", fallback=True):
+            self.diario = DiarioMovimientos(self.estado.carpeta)
+        self.bandeja_actual = None
+        self.uidvalidity = None
+        # UIDNEXT y HIGHESTMODSEQ (CONDSTORE) del último SELECT
+        self.uidnext = None
+        self.highestmodseq = None
+        # UIDs que el último clasificar_y_mover no pudo mover
+        self.no_movidos: List[int] = []
+        self._qresync = False
+        # Clasificación local: una descarga de cabeceras en lugar de un SEARCH por etiqueta
+        self.modo_local = self.config.getboolean("opciones", "modo_local", fallback=False)
+        self._motor_reglas = None
+        # Crear las carpetas de arbol_etiquetas que falten en lugar de fallar al mover
+        self.crear_carpetas = self.config.getboolean("opciones", "crear_carpetas", fallback=False)
+        # Índice local de metadatos (opcional) para búsquedas y simulación de reglas
+        ruta_indice = self.config.get("opciones", "indice", fallback="").strip()
+        self.indice = IndiceCorreo(ruta_indice) if ruta_indice else None
+        self.indice_cuerpo = self.config.getboolean("opciones", "indice_cuerpo", fallback=False)
+        self._gestor_propio = gestor is None
+        self.gestor = gestor or GestorConexiones.desde_configuracion(self.config, self.logger, seccion=seccion)
+        # Latencia y bytes por comando IMAP y contadores de mensajes por etiqueta
+        self.metricas = self.gestor.metricas
+        # La sesión IMAP se abre con el primer comando (véase la propiedad imap)
+        self._imap = None
+        # Resumen y digests por SMTP, enviados en segundo plano (opcional)
+        self._notificador_propio = notificador is None
+        self.notificador = notificador or Notificador.desde_configuracion(self.config, self.logger, self.ruta_config)
+
+        # Cargar etiquetas desde un archivo JSON (cada cuenta puede tener el suyo)
+        self._huella_etiquetas = None
+        self.ruta_etiquetas = ruta_etiquetas(self.config, seccion, self.ruta_config)
+        etiquetas = self.cargar_etiquetas(self.ruta_etiquetas)
         self.arbol_etiquetas = etiquetas["arbol_etiquetas"]
         self.filtro_etiquetas = etiquetas["filtro_etiquetas"]
-        
-    def cargar_configuracion(self, ruta: str) -> configparser.ConfigParser:
+        # Las reglas se compilan (o se cargan de la caché) ya, para fallar antes de conectar
+        self.cache_reglas = self.config.getboolean("opciones", "cache_reglas", fallback=True)
+        self._motor_reglas = self.crear_motor_reglas()
+
+    def cargar_configuracion(self, ruta: str, seccion: str = "login") -> configparser.ConfigParser:
         """
         Carga y valida el archivo de configuración.
         
         :param ruta: Ruta del archivo de configuración.
+        :param seccion: Sección de la cuenta que debe estar completa.
         """
         config = configparser.ConfigParser()
         config.read(ruta)
 
-        if not config.has_section("login") or \
-           not all(key in config["login"] for key in ["username", "password", "imap_server"]):
+        if not config.has_section(seccion) or \
+           not all(key in config[seccion] for key in ["username", "password", "imap_server"]):
             self.logger.error("Archivo de configuracion incompleto o inexistente.")
             raise ValueError("Archivo de configuracion incompleto o inexistente.")
 
@@ -47,48 +123,69 @@ class Correo:
         :return: Diccionario con las etiquetas
         """
         try:
-            with open(ruta, "r", encoding="utf-8") as archivo:
-                etiquetas = json.load(archivo)
+            with open(ruta, "rb") as archivo:
+                datos = archivo.read()
+            etiquetas = json.loads(datos.decode("utf-8"))
+            # Identifica las reglas compiladas en la caché
+            self._huella_etiquetas = hashlib.sha256(datos).hexdigest()
             self.logger.log("Etiquetas cargadas correctamente desde el archivo JSON.")
             return etiquetas
         except Exception as e:
             self.logger.error(f"Error al cargar las etiquetas desde el archivo JSON: {e}")
             raise ValueError(f"Error al cargar las etiquetas desde el archivo JSON: {e}")
 
+    @property
+    def imap(self):
+        """
+        Sesión IMAP de la cuenta. Se obtiene del gestor la primera vez que se
+        usa, de modo que validar la configuración o simular no se conecta.
+        """
+        if self._imap is None:
+            self._imap = self.conectar_al_correo()
+        return self._imap
+
+    @property
+    def conectado(self) -> bool:
+        """
+        Indica si ya se ha abierto la sesión IMAP.
+        """
+        return self._imap is not None
+
     def conectar_al_correo(self) -> object:
         """
-        Conecta al servidor de correo IMAP y se autentica
-        con las credenciales proporcionadas.
+        Obtiene una sesión autenticada del gestor de conexiones. La sesión se
+        reconecta sola si el servidor la cierra; un error de autenticación
+        lanza ValueError en lugar de devolver una conexión sin autenticar.
         
         :return: Objeto de conexión IMAP.
         """
-        #Conectar al servidor IMAP
-        try:
-            imap = imaplib.IMAP4_SSL(self.imap_server)
-            self.logger.log("Conexion al servidor IMAP establecida.")
-        except socket.gaierror as e:
-            self.logger.error(f"Error al resolver el servidor IMAP: {self.imap_server}. Detalles: {e}")
-            raise ValueError(f"Error al resolver el servidor IMAP: {self.imap_server}. Detalles: {e}")
-        except Exception as e:
-            self.logger.error(f"Error al inicializar la conexion IMAP: {e}")
-            raise ValueError(f"Error al inicializar la conexion IMAP: {e}")
-
-        #Autenticacion al correo
-        try:
-            imap.login(self.username, self.password)
-            self.logger.log("Autenticacion exitosa.")               
-        except imaplib.IMAP4.error as e:
-            self.logger.error(f"Error de autenticacion o conexion: {e}")
-        except Exception as e:
-            self.logger.error(f"Error inesperado: {e}")
-
+        imap = self.gestor.adquirir()
+        # Muchos servidores envían las capacidades en la respuesta al LOGIN ([CAPABILITY ...]):
+        # se guardan antes de que un SELECT las descarte y se ahorra el comando CAPABILITY
+        _, datos = imap.response("CAPABILITY")
+        if datos and datos[-1]:
+            self._capacidades = tuple(datos[-1].decode().upper().split())
         return imap
 
     def desconectar_del_correo(self) -> None:
         """
-        Cierra la conexión al servidor de correo de forma segura.
+        Cierra la conexión al servidor de correo de forma segura. Si la sesión
+        pertenece a un gestor compartido, se devuelve al pool para reutilizarla.
 
         """
+        if self._notificador_propio and self.notificador is not None:
+            # Se espera a que salgan las notificaciones pendientes
+            self.notificador.cerrar()
+            self.notificador = None
+        if self._imap is None:
+            # Nunca se llegó a conectar
+            return
+        if not self._gestor_propio:
+            self.logger.log("Devolviendo la sesion IMAP al pool de conexiones.")
+            self.gestor.liberar(self.imap)
+            self._imap = None
+            return
+
         self.logger.log("Desconectando del servidor de correo.")
         try:
             if self.imap is not None:
@@ -100,309 +197,1382 @@ class Correo:
         except Exception as e:
             self.logger.error(f"Error al intentar desconectar: {e}")
 
+    def exportar_metricas(self) -> None:
+        """
+        Escribe las métricas del proceso en los archivos de 'metricas_json' y
+        'metricas_prometheus' ([opciones]) y las resume en el log.
+        """
+        self.metricas.exportar(self.config, self.logger)
+
+    def capacidades(self) -> Tuple[str, ...]:
+        """
+        Obtiene las capacidades del servidor tras la autenticación.
+        El resultado se guarda para no repetir el comando CAPABILITY.
+
+        :return: Tupla con las capacidades en mayúsculas (p. ej. 'MOVE', 'UIDPLUS').
+        """
+        if self._capacidades is None:
+            try:
+                status, datos = self.imap.capability()
+                if status == "OK" and datos and datos[-1]:
+                    self._capacidades = tuple(datos[-1].decode().upper().split())
+                else:
+                    self._capacidades = tuple(self.imap.capabilities)
+            except Exception as e:
+                self.logger.warning(f"No se pudieron obtener las capacidades del servidor: {e}")
+                self._capacidades = tuple(self.imap.capabilities)
+
+        return self._capacidades
+
     def seleccionar_bandeja(self, bandeja: str) -> object:
         """
         Selecciona una bandeja de correo.
         
         :param bandeja: Nombre de la bandeja de correo a seleccionar.
         """
-        status, mensajes = self.imap.select(bandeja)
+        status, mensajes = self.imap.select(self._nombre_servidor(bandeja))
         if status != "OK":
             self.logger.error(f"Error al seleccionar la bandeja de correo: {bandeja}. Detalles: {mensajes}")
         else:
             self.logger.log(f"Bandeja de correo seleccionada: {bandeja}")
+            self._registrar_seleccion(bandeja)
 
         return self.imap
 
-    def filtrar_correo(self, filtro: str) -> list:
+    def _registrar_seleccion(self, bandeja: str) -> None:
+        """
+        Guarda la bandeja seleccionada y su UIDVALIDITY a partir de la
+        respuesta del último SELECT.
+
+        :param bandeja: Nombre de la bandeja seleccionada.
+        """
+        self.bandeja_actual = bandeja
+        _, datos = self.imap.response("UIDVALIDITY")
+        self.uidvalidity = int(datos[-1]) if datos and datos[-1] else None
+        _, datos = self.imap.response("UIDNEXT")
+        self.uidnext = int(datos[-1]) if datos and datos[-1] else None
+        _, datos = self.imap.response("HIGHESTMODSEQ")
+        self.highestmodseq = int(datos[-1]) if datos and datos[-1] else None
+        # El EXISTS del SELECT ya está contado: uno posterior indica correo nuevo (véase esperar_correo_nuevo)
+        self.imap.response("EXISTS")
+
+    def estado_bandeja(self, bandeja: str) -> Dict[str, int]:
+        """
+        Consulta con un único STATUS el número de mensajes, UIDNEXT, UIDVALIDITY
+        y, si el servidor anuncia CONDSTORE, HIGHESTMODSEQ de una bandeja, sin
+        seleccionarla.
+
+        :param bandeja: Nombre de la bandeja.
+        :return: Diccionario {"messages", "uidnext", "uidvalidity", "highestmodseq"}
+                 (vacío si el servidor no respondió).
+        """
+        elementos = ["MESSAGES", "UIDNEXT", "UIDVALIDITY"]
+        if "CONDSTORE" in self.capacidades():
+            elementos.append("HIGHESTMODSEQ")
+        try:
+            status, datos = self.imap.status(self._nombre_servidor(bandeja), f"({' '.join(elementos)})")
+        except Exception as e:
+            self.logger.warning(f"Error al consultar el estado de '{bandeja}'. Detalles: {e}")
+            return {}
+        if status != "OK" or not datos or not isinstance(datos[-1], bytes):
+            self.logger.warning(f"No se pudo consultar el estado de '{bandeja}'. Detalles: {datos}")
+            return {}
+        contenido = datos[-1].rsplit(b"(", 1)[-1]
+        return {clave.decode().lower(): int(valor) for clave, valor in re.findall(rb"([A-Z]+) (\d+)", contenido)}
+
+    def sin_cambios(self, bandeja: str) -> bool:
+        """
+        Indica, con un STATUS y sin seleccionar la bandeja, que no ha llegado
+        correo desde la última ejecución: el UIDVALIDITY coincide con el
+        guardado y el HIGHESTMODSEQ (CONDSTORE) o el UIDNEXT no han cambiado.
+        Si la bandeja ya está seleccionada (modo demonio) no se comprueba:
+        STATUS no debe usarse sobre la bandeja seleccionada.
+
+        :param bandeja: Nombre de la bandeja.
+        :return: True si se puede omitir la ejecución.
+        """
+        if self.bandeja_actual == bandeja or (self.diario and self.diario.pendientes(self.username, bandeja)):
+            return False
+        guardado = self.estado.cargar(self.username, bandeja)
+        if not guardado:
+            return False
+
+        actual = self.estado_bandeja(bandeja)
+        if not actual or actual.get("uidvalidity") != guardado.get("uidvalidity"):
+            return False
+        if actual.get("highestmodseq") is not None:
+            if actual["highestmodseq"] == guardado.get("highestmodseq"):
+                return True
+            # Con índice, un cambio de flags también hay que sincronizarlo
+            if self.indice is not None:
+                return False
+        return actual.get("uidnext") is not None and actual["uidnext"] == guardado.get("uidnext")
+
+    def _activar_qresync(self) -> None:
+        """
+        Activa QRESYNC (ENABLE) si hay índice local y el servidor lo anuncia,
+        para recibir los UIDs expurgados (VANISHED) en sincronizar_cambios.
+        ENABLE solo se admite antes de seleccionar una bandeja.
+        """
+        if self._qresync or self.indice is None or "QRESYNC" not in self.capacidades() or self.imap.state != "AUTH":
+            return
+        try:
+            self._qresync = self.imap.enable("QRESYNC")[0] == "OK"
+        except Exception as e:
+            self.logger.warning(f"No se pudo activar QRESYNC: {e}")
+
+    def sincronizar_cambios(self, bandeja: str, desde_modseq: int) -> int:
+        """
+        Actualiza en el índice local los flags de los mensajes de la bandeja
+        seleccionada que han cambiado desde desde_modseq (UID FETCH ...
+        (CHANGEDSINCE)). Con QRESYNC también se borran del índice los mensajes
+        expurgados desde entonces (VANISHED).
+
+        :param bandeja: Bandeja seleccionada.
+        :param desde_modseq: HIGHESTMODSEQ guardado en la ejecución anterior.
+        :return: Número de mensajes actualizados o borrados.
+        """
+        if self.indice is None or "CONDSTORE" not in self.capacidades():
+            return 0
+
+        modificador = f"(CHANGEDSINCE {desde_modseq} VANISHED)" if self._qresync else f"(CHANGEDSINCE {desde_modseq})"
+        status, datos = self.imap.uid("FETCH", "1:*", "(FLAGS)", modificador)
+        if status != "OK" and self._qresync:
+            # Tras una reconexión QRESYNC ya no está activo: se piden solo los flags
+            self._qresync = False
+            status, datos = self.imap.uid("FETCH", "1:*", "(FLAGS)", f"(CHANGEDSINCE {desde_modseq})")
+        if status != "OK":
+            self.logger.warning(f"No se pudieron obtener los cambios de '{bandeja}'. Detalles: {datos}")
+            return 0
+
+        flags = {uid: partes.get("FLAGS", []) for uid, partes in agrupar_respuesta_fetch(datos).items()}
+        _, vanished = self.imap.response("VANISHED")
+        expurgados = [
+            uid for linea in vanished or [] if isinstance(linea, bytes)
+            for uid in expandir_conjunto(linea.rsplit(b" ", 1)[-1].decode())
+        ]
+        self.indice.actualizar_flags(self.username, bandeja, flags)
+        self.indice.borrar(self.username, bandeja, expurgados)
+        self.logger.log(f"Cambios en '{bandeja}' desde MODSEQ {desde_modseq}: {len(flags)} mensajes con flags "
+                        f"nuevos, {len(expurgados)} expurgados")
+        return len(flags) + len(expurgados)
+
+    def ultimo_uid_procesado(self, bandeja: str) -> int:
+        """
+        Devuelve el último UID procesado de la bandeja según el estado en disco.
+        Si el UIDVALIDITY del servidor ha cambiado, los UIDs guardados ya no
+        son válidos y se vuelve a empezar desde 0.
+
+        La bandeja debe estar seleccionada.
+
+        :param bandeja: Nombre de la bandeja.
+        :return: Último UID procesado (0 si no hay estado válido).
+        """
+        estado = self.estado.cargar(self.username, bandeja)
+        if not estado:
+            return 0
+
+        if estado.get("uidvalidity") != self.uidvalidity:
+            self.logger.warning(f"El UIDVALIDITY de '{bandeja}' ha cambiado "
+                                f"({estado.get('uidvalidity')} -> {self.uidvalidity}), se procesará de nuevo.")
+            return 0
+
+        return int(estado.get("ultimo_uid", 0))
+
+    def guardar_progreso(self, bandeja: str, ultimo_uid: int, uidnext: Optional[int] = None,
+                         highestmodseq: Optional[int] = None) -> None:
+        """
+        Guarda en disco el último UID procesado de la bandeja seleccionada.
+
+        :param bandeja: Nombre de la bandeja.
+        :param ultimo_uid: Mayor UID procesado.
+        :param uidnext: UIDNEXT de la bandeja al empezar a procesarla.
+        :param highestmodseq: HIGHESTMODSEQ de la bandeja al empezar a procesarla (CONDSTORE).
+        """
+        self.estado.guardar(self.username, bandeja, uidvalidity=self.uidvalidity, ultimo_uid=int(ultimo_uid),
+                            uidnext=uidnext, highestmodseq=highestmodseq)
+        self.logger.log(f"Progreso guardado para '{bandeja}': UIDVALIDITY {self.uidvalidity}, último UID {ultimo_uid}")
+
+    def filtrar_correo(self, filtro: str, desde_uid: int = 0, hasta_uid: Optional[int] = None) -> Optional[list]:
         """
         Filtra correos según la etiqueta proporcionada.
         
         :param filtro: Filtro de búsqueda de correos.
-        :return: Lista de IDs de mensajes que cumplen con el filtro en bytes (b'5').
+        :param desde_uid: Si se indica, solo se buscan mensajes con UID >= desde_uid.
+        :param hasta_uid: Si se indica, solo se buscan mensajes con UID <= hasta_uid.
+        :return: Lista de UIDs de mensajes que cumplen con el filtro en bytes (b'5'), o None si
+                 la búsqueda falló (distinto de una lista vacía: no se sabe qué mensajes cumplen).
         """
+        if hasta_uid is not None:
+            criterio = f"UID {max(desde_uid, 1)}:{hasta_uid} {filtro}"
+        else:
+            criterio = f"UID {desde_uid}:* {filtro}" if desde_uid else filtro
         try:
-            status, mensajes = self.imap.search(None, filtro)
+            if criterio.isascii():
+                status, mensajes = self.imap.uid("SEARCH", None, criterio)
+            else:
+                # Los valores con caracteres no ASCII se envían en UTF-8 declarándolo
+                status, mensajes = self.imap.uid("SEARCH", "CHARSET", "UTF-8", criterio.encode("utf-8"))
             if status != "OK":
                 self.logger.error(f"Error al buscar correos con la etiqueta '{filtro}'.")
-                return []
+                return None
         except Exception as e:
             self.logger.error(f"Error al buscar correos con la etiqueta '{filtro}'. Detalles: {e}")
-            return []
+            return None
 
-        self.logger.log(f"Total de correos {filtro}: {len(mensajes[0].split())}")
         list_idmensajes = mensajes[0].split()
+        if desde_uid and hasta_uid is None:
+            # "n:*" siempre incluye el último mensaje aunque su UID sea menor que n
+            list_idmensajes = [uid for uid in list_idmensajes if int(uid) >= desde_uid]
+
+        self.logger.log(f"Total de correos {filtro}: {len(list_idmensajes)}")
 
         return list_idmensajes
     
-    def decodificar_correos(self, mensaje: Tuple) -> Tuple[str, str, str]:
+    def decodificar_correos(self, mensaje: Tuple) -> Optional[MensajeCorreo]:
         """
-        Decodifica el mensaje y extrae el asunto y el cuerpo del correo en latin1.
-        Si el correo es multipart/alternative, solo devuelve el HTML.
-        
-        :param mensaje: Tupla con el mensaje decodificado.
-        :return: Tupla con el asunto, remitente y cuerpo del correo.
+        Construye el correo a partir de la respuesta de un FETCH. Las cabeceras
+        y el cuerpo se decodifican bajo demanda con el charset declarado de cada
+        parte; si el correo es multipart/alternative, el cuerpo es el HTML.
+
+        :param mensaje: Tupla (prefijo, bytes del mensaje) de la respuesta FETCH.
+        :return: MensajeCorreo con asunto, remitente, fecha y cuerpo.
         """
         if isinstance(mensaje, tuple):
-            # Decodificar el mensaje
-            msg = email.message_from_bytes(mensaje[1])
+            return MensajeCorreo(mensaje[1])
+        return None
 
-            # Obtener el asunto
-            subject, encoding = decode_header(msg["Subject"])[0]
+    def _decodificar_parte(self, datos: bytes, codificacion: str, charset: Optional[str]) -> str:
+        """
+        Decodifica el contenido de una parte MIME descargada por separado.
 
-            # Verificar si el asunto es de tipo bytes y decodificarlo
-            if isinstance(subject, bytes):
-                try:
-                    subject = subject.decode(encoding or "latin1")
-                except Exception as e:
-                    self.logger.warning(f"Error al decodificar el asunto: {e}")
-                    subject = "Error al decodificar el asunto"
-            elif isinstance(subject, str):
-                # Si el asunto ya es de tipo string, no necesitamos decodificarlo
-                pass
-            else:
-                self.logger.warning("El asunto tiene un formato inesperado.")
-                subject = "Asunto no disponible"
+        :param datos: Contenido de la parte tal y como lo envía el servidor.
+        :param codificacion: Content-Transfer-Encoding (BASE64, QUOTED-PRINTABLE...).
+        :param charset: Charset declarado de la parte.
+        :return: Texto decodificado.
+        """
+        try:
+            return decodificar_contenido(datos, codificacion, charset)
+        except Exception as e:
+            self.logger.warning(f"Error al decodificar una parte {codificacion}. Detalles: {e}")
+            return datos.decode("latin1", errors="replace")
 
-            # Obtener el remitente y decodificarlo si es necesario
-            from_ = msg.get("From")
-            if isinstance(from_, bytes):
-                try:
-                    from_ = from_.decode(encoding or "latin1")
-                except Exception as e:
-                    self.logger.error(f"Error al decodificar el remitente: {e}")
-                    from_ = "Error al decodificar el remitente"
-
-            # Inicializamos 'body' como None para manejarlo más adelante
-            body = "Cuerpo no disponible"
-
-            if msg.is_multipart():
-
-                # Si el correo es multipart/alternative, primero buscamos el HTML
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-
-                    # Si encontramos una parte HTML, la priorizamos
-                    if content_type == "text/html":
-                        try:
-                            body = part.get_payload(decode=True).decode("latin1", errors="replace")
-                            break  # Salimos del bucle al encontrar el HTML
-                        except Exception as e:
-                            self.logger.warning(f"Error al decodificar el cuerpo HTML. Detalles: {e}")
-
-                    # Si encontramos texto plano solo después de no haber encontrado HTML, lo procesamos
-                    elif content_type == "text/plain":
-                        try:
-                            body = part.get_payload(decode=True).decode("latin1", errors="replace")
-                            break
-                        except Exception as e:
-                            self.logger.warning(f"Error al decodificar el cuerpo de texto. Detalles: {e}")
+    def iterar_correos(self, mensajes: list, proyeccion: str = "completo", max_bytes: int = 4096,
+                       tamano_bloque: int = 500, ventana: int = 2) -> Iterator[Tuple[str, dict]]:
+        """
+        Obtiene los correos en flujo, sin marcarlos como leídos: un UID FETCH por
+        bloque, varios bloques en vuelo a la vez, y cada mensaje se entrega
+        decodificado en cuanto llega, de modo que la memoria no crece con el
+        número de mensajes.
 
-            else:
-                # Si no es multipart, simplemente decodificamos el cuerpo
-                try:
-                    body = msg.get_payload(decode=True).decode("latin1", errors="replace")
-                    
-                except Exception as e:
-                    self.logger.error(f"Error al decodificar el cuerpo del mensaje. Detalles: {e}")
-            
-            # Crear un diccionario con los datos del correo
-            correo = {
-                "asunto": subject,
-                "remitente": from_,
-                "cuerpo": body
-            }
-            
-            return correo
+        Proyecciones disponibles:
+            - "completo": el mensaje entero (adjuntos incluidos) si RFC822.SIZE no
+              supera presupuesto_mensaje; de los mayores, solo las cabeceras y la
+              parte text/html o text/plain, truncada al presupuesto.
+            - "cabeceras": BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)], sin cuerpo.
+            - "texto": BODYSTRUCTURE y después solo la parte text/html o text/plain
+              (truncada a presupuesto_mensaje).
+            - "parcial": cabeceras y los primeros max_bytes de BODY.PEEK[TEXT].
+
+        :param mensajes: Lista de UIDs de mensajes a obtener.
+        :param proyeccion: Qué parte de cada mensaje descargar.
+        :param max_bytes: Bytes de cuerpo a descargar en la proyección "parcial".
+        :param tamano_bloque: Número máximo de mensajes por FETCH.
+        :param ventana: Número de FETCH en vuelo a la vez.
+        :return: Iterador de tuplas (uid, diccionario del correo).
+        """
+        elementos = {
+            "completo": "(BODY.PEEK[])",
+            "cabeceras": "(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])",
+            "texto": "(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])",
+            "parcial": f"(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MIME-VERSION CONTENT-TYPE "
+                       f"CONTENT-TRANSFER-ENCODING)] BODY.PEEK[TEXT]<0.{max_bytes}>)",
+        }
+        if proyeccion not in elementos:
+            raise ValueError(f"Proyeccion desconocida: {proyeccion}")
+
+        uids = normalizar_ids(mensajes)
+        conjuntos = [
+            conjunto
+            for inicio in range(0, len(uids), tamano_bloque)
+            for conjunto, _ in dividir_en_bloques(uids[inicio:inicio + tamano_bloque], self.longitud_maxima_comando)
+        ]
+
+        if proyeccion == "texto":
+            yield from self._iterar_texto(conjuntos, elementos["texto"], ventana)
+            return
+        if proyeccion == "completo" and self.presupuesto_mensaje:
+            yield from self._iterar_completo(conjuntos, ventana)
+            return
+
+        for respuesta in self.imap.fetch_en_flujo(conjuntos, elementos[proyeccion], ventana):
+            for uid, partes in agrupar_respuesta_fetch(respuesta).items():
+                if proyeccion == "completo":
+                    correo = MensajeCorreo(partes.get("BODY[]", b""), uid)
+                elif proyeccion == "parcial":
+                    cabecera = next((v for k, v in partes.items() if k.startswith("BODY[HEADER")), b"")
+                    texto = next((v for k, v in partes.items() if k.startswith("BODY[TEXT]")), b"")
+                    correo = MensajeCorreo(cabecera + texto, uid)
+                else:
+                    correo = self._correo_desde_cabeceras(partes)
+                yield str(uid), correo
+
+    def _correo_desde_cabeceras(self, partes: dict) -> MensajeCorreo:
+        """
+        Construye el correo (sin cuerpo) a partir de BODY[HEADER.FIELDS ...].
+        """
+        cabecera = next((v for k, v in partes.items() if k.startswith("BODY[HEADER")), b"")
+        return MensajeCorreo(cabecera, partes.get("UID"), cuerpo="")
+
+    def _iterar_texto(self, conjuntos: List[str], elementos: str, ventana: int) -> Iterator[Tuple[str, dict]]:
+        """
+        Proyección "texto": por cada bloque se piden BODYSTRUCTURE y cabeceras,
+        y después un único FETCH por especificador de parte (1, 1.2, TEXT...)
+        que descarga solo la parte de texto elegida de cada mensaje.
+        """
+        for conjunto in conjuntos:
+            pendientes = {}
+            for respuesta in self.imap.fetch_en_flujo([conjunto], elementos, ventana):
+                for uid, partes in agrupar_respuesta_fetch(respuesta).items():
+                    correo = self._correo_desde_cabeceras(partes)
+                    parte = parte_de_texto(partes.get("BODYSTRUCTURE"))
+                    if parte is None:
+                        yield str(uid), correo
+                        continue
+                    pendientes[uid] = (correo, parte)
+            yield from self._descargar_partes_de_texto(pendientes, ventana)
+
+    def _iterar_completo(self, conjuntos: List[str], ventana: int) -> Iterator[Tuple[str, dict]]:
+        """
+        Proyección "completo" con presupuesto por mensaje: por cada bloque se
+        piden primero RFC822.SIZE, BODYSTRUCTURE y las cabeceras. De los
+        mensajes que caben en el presupuesto se descarga después BODY[TEXT]
+        (cabeceras y texto forman el mensaje entero); de los demás, solo la
+        parte de texto, nunca los adjuntos.
+        """
+        for conjunto in conjuntos:
+            cabeceras, pequenos, grandes = {}, [], {}
+            for respuesta in self.imap.fetch_en_flujo([conjunto], "(RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])",
+                                                      ventana):
+                for uid, partes in agrupar_respuesta_fetch(respuesta).items():
+                    cabeceras[uid] = partes.get("BODY[HEADER]", b"")
+                    if (partes.get("RFC822.SIZE") or 0) <= self.presupuesto_mensaje:
+                        pequenos.append(uid)
+                        continue
+                    correo = MensajeCorreo(cabeceras.pop(uid), uid, cuerpo="")
+                    parte = parte_de_texto(partes.get("BODYSTRUCTURE"))
+                    if parte is None:
+                        yield str(uid), correo
+                    else:
+                        grandes[uid] = (correo, parte)
+
+            subconjuntos = [c for c, _ in dividir_en_bloques(pequenos, self.longitud_maxima_comando)]
+            for respuesta in self.imap.fetch_en_flujo(subconjuntos, "(BODY.PEEK[TEXT])", ventana):
+                for uid, partes in agrupar_respuesta_fetch(respuesta).items():
+                    if uid in cabeceras:
+                        yield str(uid), MensajeCorreo(cabeceras.pop(uid) + partes.get("BODY[TEXT]", b""), uid)
+            # Mensajes cuyo texto no se pudo descargar
+            for uid, cabecera in cabeceras.items():
+                yield str(uid), MensajeCorreo(cabecera, uid, cuerpo="")
+
+            yield from self._descargar_partes_de_texto(grandes, ventana)
 
-    def obtener_correos(self, mensajes: list) -> List[dict]:
+    def _descargar_partes_de_texto(self, pendientes: Dict[int, tuple], ventana: int) -> Iterator[Tuple[str, dict]]:
+        """
+        Descarga la parte de texto elegida de cada mensaje, con un FETCH por
+        especificador de parte, y la asigna como cuerpo. Con presupuesto por
+        mensaje solo se piden sus primeros presupuesto_mensaje bytes.
+
+        :param pendientes: Diccionario {uid: (MensajeCorreo, parte de partes_bodystructure)}.
+        """
+        grupos = {}
+        for uid, (_, parte) in pendientes.items():
+            grupos.setdefault(parte["parte"], []).append(uid)
+
+        # La respuesta a BODY[n]<0.longitud> lleva la clave BODY[n]<0>
+        rango, origen = (f"<0.{self.presupuesto_mensaje}>", "<0>") if self.presupuesto_mensaje else ("", "")
+        for seccion, uids_seccion in grupos.items():
+            subconjuntos = [c for c, _ in dividir_en_bloques(uids_seccion, self.longitud_maxima_comando)]
+            for respuesta in self.imap.fetch_en_flujo(subconjuntos, f"(BODY.PEEK[{seccion}]{rango})", ventana):
+                for uid, partes in agrupar_respuesta_fetch(respuesta).items():
+                    if uid not in pendientes:
+                        continue
+                    correo, parte = pendientes.pop(uid)
+                    datos = partes.get(f"BODY[{seccion}]{origen}", b"")
+                    correo.cuerpo = self._decodificar_parte(datos, parte["codificacion"], parte["charset"])
+                    yield str(uid), correo
+
+        # Mensajes cuya parte de texto no se pudo descargar
+        for uid, (correo, _) in pendientes.items():
+            yield str(uid), correo
+
+    def obtener_correos(self, mensajes: list, proyeccion: str = "completo") -> List[dict]:
         """
         Obtiene los correos y los deja sin leer.
         
-        :param mensajes: Lista de IDs de mensajes a obtener.
+        :param mensajes: Lista de UIDs de mensajes a obtener.
+        :param proyeccion: Parte de cada mensaje a descargar (ver iterar_correos).
         :return: Lista de diccionarios con los correos decodificados.
         """
         todos_los_mensajes = {}
 
-        for num in mensajes:
-            status, mensaje_data = self.imap.fetch(num, "(BODY.PEEK[])")
-            if status == "OK":
-                dict_correo = self.decodificar_correos(mensaje_data[0])
-                # Agregar el correo decodificado al diccionario
-                todos_los_mensajes[num.decode('utf-8')] = dict_correo
-            else:
-                self.logger.error(f"Error al obtener el correo sin leer. Detalles: {mensaje_data}")
+        for uid, dict_correo in self.iterar_correos(mensajes, proyeccion):
+            # Agregar el correo decodificado al diccionario
+            todos_los_mensajes[uid] = dict_correo
 
         return todos_los_mensajes
             
-    def obtener_todos_noleidos(self) -> List[dict]:
+    def obtener_todos_noleidos(self, proyeccion: str = "completo") -> List[dict]:
         """
         Obtiene todos los correos no enviados.
         
+        :param proyeccion: Parte de cada mensaje a descargar (ver iterar_correos).
         :return: Lista de diccionarios con los correos no leidos.
         """
         # Seleccionar la bandeja de entrada
         self.seleccionar_bandeja("inbox")
 
         # Obtener los correos sin leer
-        mensajes = self.filtrar_correo("UNSEEN")
+        mensajes = self.filtrar_correo("UNSEEN") or []
 
-        no_leidos = self.obtener_correos(mensajes)
+        no_leidos = self.obtener_correos(mensajes, proyeccion)
         return no_leidos
     
-    def listar_etiquetas(self) -> List[str]:
+    def listar_adjuntos(self, uid: int) -> List[dict]:
         """
-        Lista todas las etiquetas (carpetas) disponibles en la cuenta IMAP.
+        Devuelve los adjuntos de un mensaje de la bandeja seleccionada a partir
+        de su BODYSTRUCTURE, sin descargar su contenido.
 
-        :param imap: Objeto de conexión IMAP.
-        :return: Lista de etiquetas con sus nombres y detalles.
+        :param uid: UID del mensaje.
+        :return: Lista de partes (ver partes_bodystructure) marcadas como adjunto.
         """
-        try:
-            status, folders = self.imap.list()
+        status, datos = self.imap.uid("FETCH", str(uid), "(BODYSTRUCTURE)")
+        if status != "OK":
+            self.logger.error(f"Error al obtener la estructura del mensaje {uid}. Detalles: {datos}")
+            return []
+        partes = agrupar_respuesta_fetch(datos).get(int(uid), {})
+        return [parte for parte in partes_bodystructure(partes.get("BODYSTRUCTURE")) if parte["adjunto"]]
+
+    def descargar_adjunto(self, uid: int, parte: dict, ruta: str) -> Optional[int]:
+        """
+        Guarda decodificada en un archivo una parte de un mensaje (normalmente
+        un adjunto de listar_adjuntos). Se descarga en trozos de
+        bloque_adjuntos bytes con FETCH parciales (BODY.PEEK[n]<inicio.longitud>)
+        que se escriben según llegan, así que la memoria usada no depende del
+        tamaño del adjunto. El archivo solo aparece en ruta si la descarga termina.
+
+        :param uid: UID del mensaje.
+        :param parte: Parte a descargar (al menos "parte" y "codificacion").
+        :param ruta: Archivo de destino.
+        :return: Bytes escritos, o None si el servidor rechazó algún FETCH.
+        """
+        seccion = parte["parte"]
+        decodificador = DecodificadorIncremental(parte.get("codificacion"))
+        temporal = f"{ruta}.parcial"
+        inicio = escritos = 0
+        with open(temporal, "wb") as archivo:
+            while True:
+                status, datos = self.imap.uid(
+                    "FETCH", str(uid), f"(BODY.PEEK[{seccion}]<{inicio}.{self.bloque_adjuntos}>)")
+                if status != "OK":
+                    self.logger.error(f"Error al descargar la parte {seccion} del mensaje {uid}. Detalles: {datos}")
+                    break
+                trozo = agrupar_respuesta_fetch(datos).get(int(uid), {}).get(f"BODY[{seccion}]<{inicio}>", b"")
+                contenido = decodificador.decodificar(trozo)
+                archivo.write(contenido)
+                escritos += len(contenido)
+                inicio += len(trozo)
+                if len(trozo) < self.bloque_adjuntos:
+                    contenido = decodificador.terminar()
+                    archivo.write(contenido)
+                    escritos += len(contenido)
+                    break
+        if status != "OK":
+            os.remove(temporal)
+            return None
+        os.replace(temporal, ruta)
+        self.logger.debug(f"Parte {seccion} del mensaje {uid} guardada en '{ruta}' ({escritos} bytes)")
+        return escritos
+
+    def guardar_adjuntos(self, uid: int, carpeta: str) -> List[str]:
+        """
+        Guarda en una carpeta todos los adjuntos de un mensaje (ver descargar_adjunto).
+        Los archivos se nombran "<uid>_<parte>_<nombre del adjunto>".
+
+        :param uid: UID del mensaje.
+        :param carpeta: Carpeta de destino (se crea si no existe).
+        :return: Rutas de los archivos guardados.
+        """
+        os.makedirs(carpeta, exist_ok=True)
+        rutas = []
+        for parte in self.listar_adjuntos(uid):
+            nombre = re.sub(r"[^\w.@-]", "_", os.path.basename(parte["nombre"] or "adjunto"))
+            ruta = os.path.join(carpeta, f"{uid}_{parte['parte']}_{nombre}")
+            if self.descargar_adjunto(uid, parte, ruta) is not None:
+                rutas.append(ruta)
+        return rutas
+
+    def _carpetas(self, refrescar: bool = False) -> dict:
+        """
+        Devuelve las carpetas de la cuenta desde la caché compartida, lanzando
+        un LIST solo la primera vez en la sesión o si se pide refrescar.
+
+        :param refrescar: Si es True se vuelve a lanzar LIST.
+        :return: Diccionario {nombre: {"flags", "delimitador", "nombre_servidor"}}.
+        """
+        cuenta = (self.imap_server, self.username)
+        carpetas = None if refrescar else CacheCarpetas.obtener(cuenta)
+        if carpetas is None:
+            status, datos = self.imap.list()
             if status != "OK":
                 self.logger.warning("No se pudieron obtener las etiquetas.")
-                return []
+                return {}
+            carpetas = parsear_respuesta_list(datos)
+            CacheCarpetas.guardar(cuenta, carpetas)
+            self.logger.debug(f"Caché de carpetas actualizada: {len(carpetas)} carpetas")
+        return carpetas
 
-            etiquetas = []
-            for folder in folders:
-                # Decodificar la respuesta
-                parts = folder.decode().split(' "/" ')
-                if len(parts) == 2:
-                    etiquetas.append(parts[1].strip('"'))  # Nombre de la etiqueta
+    def listar_etiquetas(self, refrescar: bool = False) -> List[str]:
+        """
+        Lista todas las etiquetas (carpetas) disponibles en la cuenta IMAP.
 
-            return etiquetas
-    
+        :param refrescar: Si es True se ignora la caché y se vuelve a lanzar LIST.
+        :return: Lista de nombres de etiquetas decodificados.
+        """
+        try:
+            return list(self._carpetas(refrescar))
         except Exception as e:
-            print(f"Error al listar etiquetas: {e}")
+            self.logger.error(f"Error al listar etiquetas: {e}")
             return []
-    
+
+    def _nombre_servidor(self, carpeta: str) -> str:
+        """
+        Traduce una etiqueta "padre/hija" al nombre que espera el servidor:
+        delimitador propio del servidor, UTF-7 modificado y comillas si hacen falta.
+
+        :param carpeta: Nombre de la carpeta con "/" como separador.
+        :return: Nombre listo para usar en un comando IMAP.
+        """
+        if carpeta.upper() == "INBOX":
+            # INBOX no tiene jerarquía: no hace falta pedir LIST para conocer el delimitador
+            return "INBOX"
+        delimitador = next((c["delimitador"] for c in self._carpetas().values() if c["delimitador"]), "/")
+        if delimitador != "/":
+            carpeta = carpeta.replace("/", delimitador)
+        return nombre_para_comando(carpeta)
+
+    def crear_carpetas_faltantes(self) -> List[str]:
+        """
+        Crea en un solo paso todas las carpetas de arbol_etiquetas (padres e
+        hijas) que no existan en el servidor.
+
+        :return: Lista de carpetas creadas.
+        """
+        existentes = self._carpetas()
+        creadas = []
+        for etiqueta_padre, etiquetas_hijas in self.arbol_etiquetas.items():
+            for carpeta in [etiqueta_padre] + [f"{etiqueta_padre}/{hija}" for hija in etiquetas_hijas]:
+                if carpeta in existentes or carpeta in creadas:
+                    continue
+                status, respuesta = self.imap.create(self._nombre_servidor(carpeta))
+                if status == "OK":
+                    creadas.append(carpeta)
+                else:
+                    self.logger.warning(f"No se pudo crear la carpeta '{carpeta}'. Detalles: {respuesta}")
+
+        if creadas:
+            self.logger.log(f"Carpetas creadas: {creadas}")
+            self._carpetas(refrescar=True)
+        return creadas
+
+    def _copiar_bloque(self, comando: str, conjunto: str, destino: str) -> tuple:
+        """
+        Envía un UID MOVE o UID COPY. Si el servidor responde TRYCREATE, la
+        caché de carpetas está desactualizada: se refresca y, si está activada
+        la creación de carpetas, se crea el destino y se repite el comando.
+
+        :return: Tupla (status, respuesta, copyuid); copyuid es (uidvalidity,
+                 {uid origen: uid destino}) si el servidor anuncia UIDPLUS, o None.
+        """
+        status, respuesta, copyuid = self._enviar_copia(comando, conjunto, destino)
+        if status == "NO" and b"TRYCREATE" in b" ".join(r for r in respuesta if isinstance(r, bytes)).upper():
+            self.logger.warning(f"El servidor indica que '{destino}' no existe (TRYCREATE).")
+            self._carpetas(refrescar=True)
+            if self.crear_carpetas and self.imap.create(self._nombre_servidor(destino))[0] == "OK":
+                self._carpetas(refrescar=True)
+                status, respuesta, copyuid = self._enviar_copia(comando, conjunto, destino)
+        return status, respuesta, copyuid
+
+    def _enviar_copia(self, comando: str, conjunto: str, destino: str) -> tuple:
+        """
+        Envía un único UID MOVE/UID COPY y lee su COPYUID: en la respuesta
+        etiquetada (COPY) o en una no etiquetada "* OK [COPYUID ...]" (MOVE).
+
+        imaplib acumula los códigos COPYUID hasta que se leen con response():
+        se vacían antes y después del comando para no atribuirle el de otro, y
+        solo se acepta el que corresponde a los UIDs enviados.
+
+        :return: Tupla (status, respuesta, copyuid).
+        """
+        self.imap.response("COPYUID")
+        try:
+            status, respuesta = self.imap.uid(comando, conjunto, self._nombre_servidor(destino))
+        finally:
+            _, datos = self.imap.response("COPYUID")
+        # response() devuelve solo los argumentos del código, sin la palabra COPYUID
+        codigos = [b"COPYUID " + d for d in datos or [] if isinstance(d, bytes)]
+        uids = expandir_conjunto(conjunto)
+        return status, respuesta, extraer_copyuid(codigos, uids) or extraer_copyuid(respuesta, uids)
+
+    def actualizar_flags(self, ids: list, add: Iterable[str] = (), remove: Iterable[str] = ()) -> List[int]:
+        """
+        Añade y/o quita flags a los mensajes con un UID STORE .SILENT por bloque
+        de conjunto comprimido, sin que el servidor devuelva un FETCH por mensaje.
+
+        :param ids: Lista de UIDs de mensajes.
+        :param add: Flags a añadir (p. ej. ["\\Deleted"]).
+        :param remove: Flags a quitar (p. ej. ["\\Seen"]).
+        :return: Lista de UIDs cuyo bloque falló (vacía si todo fue bien).
+        """
+        fallidos = []
+        operaciones = [(op, " ".join(flags)) for op, flags in (("+FLAGS.SILENT", add), ("-FLAGS.SILENT", remove)) if flags]
+
+        for conjunto, ids_bloque in dividir_en_bloques(ids, self.longitud_maxima_comando):
+            for operacion, flags in operaciones:
+                try:
+                    status, respuesta = self.imap.uid("STORE", conjunto, operacion, f"({flags})")
+                except Exception as e:
+                    status, respuesta = "NO", str(e)
+                if status != "OK":
+                    self.logger.error(f"No se pudo aplicar {operacion} ({flags}) a {len(ids_bloque)} mensajes. "
+                                      f"Detalles: {respuesta}")
+                    fallidos.extend(ids_bloque)
+                    break
+
+        return fallidos
+
     def eliminar_correos(self, mensajes: list) -> bool:
         """
-        Elimina los correos proporcionados.
+        Elimina los correos proporcionados: los marca como \\Deleted en bloque y
+        expurga solo esos UIDs si el servidor soporta UIDPLUS (EXPUNGE si no).
         
-        :param mensajes: Lista de IDs de mensajes a eliminar
+        :param mensajes: Lista de UIDs de mensajes a eliminar
         :return: True si los mensajes se eliminaron correctamente.
         """
-        for num in mensajes:
-            status, _ = self.imap.store(num, '+FLAGS', '\\Deleted')
-            if status != "OK":
-                self.logger.error(f"No se pudo eliminar el mensaje {num}")
+        fallidos = set(self.actualizar_flags(mensajes, add=["\\Deleted"]))
+        marcados = [uid for uid in normalizar_ids(mensajes) if uid not in fallidos]
 
         # Expurgar (eliminar físicamente) los mensajes marcados como eliminados
-        self.imap.expunge()
-        return True
-    
-    
-    def mover_correos(self, origen: str, destino: str, id_mensajes: list) -> None:
+        if marcados:
+            if "UIDPLUS" in self.capacidades():
+                for conjunto, _ in dividir_en_bloques(marcados, self.longitud_maxima_comando):
+                    self.imap.uid("EXPUNGE", conjunto)
+            else:
+                self.imap.expunge()
+
+        if fallidos:
+            self.logger.error(f"No se pudieron eliminar {len(fallidos)} mensajes: {resumir_ids(fallidos)}")
+        return not fallidos
+
+    def mover_correos(self, origen: str, destino: str, id_mensajes: list) -> List[dict]:
         """
-        Mueve correos de una etiqueta a otra.
+        Mueve correos de una etiqueta a otra en bloque.
+
+        Los IDs se agrupan en conjuntos de secuencia comprimidos (1:50,73,90:120)
+        divididos para no superar la longitud máxima de comando. Si el servidor
+        anuncia MOVE (RFC 6851) se envía un UID MOVE por bloque; si no, un UID COPY
+        por bloque, seguido de un UID STORE y un UID EXPUNGE (o EXPUNGE si no hay
+        UIDPLUS) solo sobre los mensajes copiados.
 
         :param origen: Nombre de la etiqueta (carpeta) origen.
         :param destino: Nombre de la etiqueta (carpeta) destino.
-        :param id_mensajes: Lista de IDs de mensajes a mover.
+        :param id_mensajes: Lista de UIDs de mensajes a mover.
+        :return: Lista con el resultado de cada bloque ({"conjunto", "ids", "estado",
+                 "respuesta", "copyuid"}); copyuid es (uidvalidity, {uid origen: uid destino})
+                 si el servidor anuncia UIDPLUS, o None.
         """
+        resultados = []
         try:
-            # Obtener etiquetas
-            etiquetas = self.listar_etiquetas()
-
-            # Verificar que la etiqueta destino existe
-            destino_utf7 = destino.encode('utf-7').decode('ascii')
-            if destino_utf7 not in etiquetas:
-                self.logger.error(f"La carpeta destino '{destino}' no existe.")
-                return
+            # Verificar que la etiqueta destino existe (según la caché de carpetas; si no
+            # aparece, pudo crearse después de llenarla y se vuelve a pedir LIST)
+            if destino not in self._carpetas() and destino not in self._carpetas(refrescar=True):
+                if not self.crear_carpetas or destino not in self.crear_carpetas_faltantes():
+                    self.logger.error(f"La carpeta destino '{destino}' no existe.")
+                    return resultados
 
             # Seleccionar la carpeta origen
-            status, _ = self.imap.select(origen)
+            status, _ = self.imap.select(self._nombre_servidor(origen))
             if status != "OK":
                 self.logger.error(f"No se pudo seleccionar la carpeta '{origen}'")
-                return
+                return resultados
 
             self.logger.log(f"Se seleccionó la carpeta '{origen}'")
-            
-            # Mover los mensajes a la carpeta destino
-            for mensaje_id in id_mensajes:
-                self.logger.debug(f"Intentando copiar mensaje {mensaje_id} a '{destino_utf7}'")
-
-                status, response = self.imap.copy(mensaje_id, destino)
-                if status != "OK":
-                    self.logger.warning(f"No se pudo copiar el mensaje {mensaje_id} a '{destino}'")
-                    continue
+            self._registrar_seleccion(origen)
 
-                self.logger.debug(f"Se copió el mensaje {mensaje_id} a '{destino}'")
+            uids = normalizar_ids(id_mensajes)
+            bloques = dividir_en_bloques(uids, self.longitud_maxima_comando)
+            capacidades = self.capacidades()
 
-            # Eliminar los mensajes de la carpeta origen
-            if self.eliminar_correos(id_mensajes):
-                # Eliminar el mensaje de la carpeta origen
-                self.logger.log(f"Se eliminó los mensajes {id_mensajes} de '{origen}'")
+            if "MOVE" in capacidades:
+                for conjunto, ids in bloques:
+                    bloque = self._planificar(origen, "MOVE", destino, conjunto)
+                    status, respuesta, copyuid = self._copiar_bloque("MOVE", conjunto, destino)
+                    resultados.append({"conjunto": conjunto, "ids": ids, "estado": status, "respuesta": respuesta,
+                                       "copyuid": copyuid})
+                    self._anotar(origen, bloque, "hecho" if status == "OK" else "fallido")
+                    if status != "OK":
+                        self.logger.warning(f"No se pudo mover el bloque {conjunto} a '{destino}'. Detalles: {respuesta}")
             else:
-                self.logger.warning(f"No se pudieron eliminar los mensajes {id_mensajes} de '{origen}'")
+                copiados, bloques_copiados = [], []
+                for conjunto, ids in bloques:
+                    bloque = self._planificar(origen, "COPY", destino, conjunto)
+                    status, respuesta, copyuid = self._copiar_bloque("COPY", conjunto, destino)
+                    resultados.append({"conjunto": conjunto, "ids": ids, "estado": status, "respuesta": respuesta,
+                                       "copyuid": copyuid})
+                    if status != "OK":
+                        self._anotar(origen, bloque, "fallido")
+                        self.logger.warning(f"No se pudo copiar el bloque {conjunto} a '{destino}'. Detalles: {respuesta}")
+                        continue
+                    self._anotar(origen, bloque, "copiado")
+                    copiados.extend(ids)
+                    bloques_copiados.append(bloque)
+
+                # Solo se eliminan de origen los mensajes copiados correctamente; si falla,
+                # los bloques quedan como "copiado" en el diario y se eliminan al reanudar
+                if copiados and self.eliminar_correos(copiados):
+                    for bloque in bloques_copiados:
+                        self._anotar(origen, bloque, "hecho")
+
+            if self.indice is not None:
+                for r in resultados:
+                    if r["estado"] == "OK":
+                        uidvalidity, nuevos_uids = r["copyuid"] or (None, None)
+                        self.indice.mover(self.username, origen, destino, r["ids"], nuevos_uids, uidvalidity)
+
+            movidos = sum(len(r["ids"]) for r in resultados if r["estado"] == "OK")
+            self.logger.log(f"Se movieron {movidos} de {len(uids)} mensajes de '{origen}' a '{destino}' "
+                            f"en {len(bloques)} bloque(s)")
+            if self.logger.muestrear():
+                self.logger.debug(f"UIDs movidos a '{destino}': {resumir_ids(uids)}")
 
         except Exception as e:
             self.logger.warning(f"Error al mover correos: {e}")
-                
-    def marcar_como_no_leidos(self, id_mensajes: list) -> None:
+        finally:
+            movidos = sum(len(r["ids"]) for r in resultados if r["estado"] == "OK")
+            self.metricas.incrementar("mensajes_movidos", self.username, destino, movidos)
+            self.metricas.incrementar("mensajes_fallidos", self.username, destino,
+                                      len(normalizar_ids(id_mensajes)) - movidos)
+            if self.diario is not None:
+                self.diario.compactar(self.username, origen)
+
+        return resultados
+
+    def _planificar(self, origen: str, comando: str, destino: str, conjunto: str) -> Optional[str]:
+        """
+        Anota en el diario un bloque antes de enviar su UID MOVE/UID COPY. Con
+        COPY se guarda también el UIDNEXT del destino, que permite saber al
+        reanudar si la copia llegó a hacerse (COPY es atómico).
+
+        :return: Identificador del bloque en el diario (None si no hay diario).
+        """
+        if self.diario is None:
+            return None
+        valores = {"comando": comando, "destino": destino, "uids": conjunto, "uidvalidity": self.uidvalidity}
+        if comando == "COPY":
+            valores["uidnext"] = self._uidnext(destino)
+        return self.diario.planificar(self.username, origen, **valores)
+
+    def _anotar(self, origen: str, bloque: Optional[str], paso: str) -> None:
+        """
+        Anota en el diario el resultado de un bloque planificado.
+        """
+        if bloque is not None:
+            self.diario.anotar(self.username, origen, bloque, paso)
+
+    def _uidnext(self, carpeta: str) -> Optional[int]:
+        """
+        Obtiene el UIDNEXT de una carpeta con STATUS.
+
+        :return: Siguiente UID que asignará el servidor o None si no se pudo obtener.
+        """
+        try:
+            status, datos = self.imap.status(self._nombre_servidor(carpeta), "(UIDNEXT)")
+        except Exception as e:
+            self.logger.warning(f"No se pudo obtener el UIDNEXT de '{carpeta}'. Detalles: {e}")
+            return None
+        coincidencia = re.search(rb"UIDNEXT (\d+)", b" ".join(d for d in datos if isinstance(d, bytes)))
+        return int(coincidencia.group(1)) if status == "OK" and coincidencia else None
+
+    def reanudar_movimientos(self, bandeja: str) -> int:
         """
-        Marca los mensajes como no leídos.
+        Completa los bloques que el diario dejó a medias en una ejecución
+        interrumpida. La bandeja debe estar seleccionada.
 
-        :param id_mensajes: Lista de IDs de mensajes a marcar como no leidos.
+        - UID MOVE: se repite (los UIDs ya movidos no existen en el origen).
+        - UID COPY confirmado: solo falta marcar y expurgar esos UIDs.
+        - UID COPY sin confirmar: se buscan por Message-ID en el destino los
+          mensajes del bloque entre los UIDs asignados desde la copia y se
+          copian de nuevo los que no aparezcan. Si la copia falla, el bloque
+          queda en el origen sin expurgar.
+
+        Si el UIDVALIDITY de la bandeja ha cambiado, los bloques se descartan.
+
+        :param bandeja: Bandeja de origen de los movimientos.
+        :return: Número de mensajes cuyo movimiento se completó.
         """
-        for mensaje_id in id_mensajes:
-            # Marcar el mensaje como no leído quitando la bandera '\Seen'
-            status, _ = self.imap.store(mensaje_id, '-FLAGS', '\\Seen')
+        if self.diario is None:
+            return 0
+
+        pendientes = self.diario.pendientes(self.username, bandeja)
+        reanudados = 0
+        for plan in pendientes:
+            bloque, conjunto, destino = plan["bloque"], plan["uids"], plan["destino"]
+            if plan.get("uidvalidity") != self.uidvalidity:
+                self.logger.warning(f"Se descarta el movimiento pendiente de {conjunto} a '{destino}': "
+                                    f"el UIDVALIDITY de '{bandeja}' ha cambiado.")
+                self.diario.anotar(self.username, bandeja, bloque, "fallido")
+                continue
+
+            try:
+                if plan["comando"] == "MOVE":
+                    status, respuesta, copyuid = self._copiar_bloque("MOVE", conjunto, destino)
+                elif plan["paso"] == "copiado":
+                    status, respuesta, copyuid = "OK", [], None
+                else:
+                    status, respuesta, copyuid = self._reanudar_copia(bandeja, conjunto, destino, plan.get("uidnext"))
+            except Exception as e:
+                self.logger.error(f"Error al reanudar el movimiento de {conjunto} a '{destino}': {e}")
+                continue
+
             if status != "OK":
-                self.logger.error(f"No se pudo marcar como no leído el mensaje {mensaje_id}")
-            else:
-                self.logger.debug(f"Se marcó como no leído el mensaje {mensaje_id}")
-                
-            
-        
-            
+                self.logger.warning(f"No se pudo reanudar el movimiento de {conjunto} a '{destino}'. "
+                                    f"Detalles: {respuesta}")
+                self.diario.anotar(self.username, bandeja, bloque, "fallido")
+                continue
+
+            uids = expandir_conjunto(conjunto)
+            if plan["comando"] == "COPY":
+                self.diario.anotar(self.username, bandeja, bloque, "copiado")
+                if not self.eliminar_correos(uids):
+                    continue
+            self.diario.anotar(self.username, bandeja, bloque, "hecho")
+            if self.indice is not None:
+                uidvalidity, nuevos_uids = copyuid or (None, None)
+                self.indice.mover(self.username, bandeja, destino, uids, nuevos_uids, uidvalidity)
+            reanudados += len(uids)
+
+        if pendientes:
+            self.logger.log(f"Diario de '{bandeja}': {len(pendientes)} bloque(s) pendientes, "
+                            f"{reanudados} mensajes movidos al reanudar")
+            self.diario.compactar(self.username, bandeja)
+        return reanudados
+
+    def _reanudar_copia(self, bandeja: str, conjunto: str, destino: str, uidnext: Optional[int]) -> tuple:
+        """
+        Decide qué mensajes de un UID COPY interrumpido llegaron al destino y
+        copia de nuevo el resto. Un mensaje solo se da por copiado si su
+        Message-ID aparece en el destino entre los UIDs asignados desde la
+        copia (UID SEARCH ... HEADER Message-ID); ante la duda se copia otra
+        vez, porque un duplicado es preferible a perder el mensaje.
+
+        :param bandeja: Bandeja de origen (seleccionada).
+        :param conjunto: Conjunto de UIDs del bloque.
+        :param destino: Carpeta destino del bloque.
+        :param uidnext: UIDNEXT del destino anotado antes de la copia.
+        :return: Tupla (status, respuesta, copyuid) como _copiar_bloque; "OK" si
+                 todos los mensajes están en el destino.
+        """
+        actual = self._uidnext(destino)
+        if uidnext is None or actual is None or actual <= uidnext:
+            return self._copiar_bloque("COPY", conjunto, destino)
+
+        status, datos = self.imap.uid("FETCH", conjunto, "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])")
+        if status != "OK":
+            return status, datos, None
+        identificadores = {}
+        for uid, partes in agrupar_respuesta_fetch(datos).items():
+            coincidencia = _PATRON_MESSAGE_ID.search(partes.get("BODY[HEADER.FIELDS (MESSAGE-ID)]", b""))
+            identificadores[uid] = coincidencia.group(1).decode(errors="replace") if coincidencia else None
+
+        copiados = set()
+        try:
+            status, _ = self.imap.select(self._nombre_servidor(destino), readonly=True)
+            if status != "OK":
+                return "NO", [f"no se pudo examinar '{destino}'"], None
+            encontrados = {}
+            for identificador in set(filter(None, identificadores.values())):
+                cita = '"' + identificador.replace("\\", "\\\\").replace('"', '\\"') + '"'
+                status, datos = self.imap.uid("SEARCH", "UID", f"{uidnext}:*", "HEADER", "Message-ID", cita)
+                # "n:*" incluye siempre el último UID aunque sea menor que n
+                encontrados[identificador] = [int(u) for u in (datos[0] or b"").split()
+                                              if status == "OK" and int(u) >= uidnext]
+            for uid in sorted(identificadores):
+                if encontrados.get(identificadores[uid]):
+                    encontrados[identificadores[uid]].pop()
+                    copiados.add(uid)
+        finally:
+            self.imap.select(self._nombre_servidor(bandeja))
+            self._registrar_seleccion(bandeja)
+
+        faltantes = [uid for uid in identificadores if uid not in copiados]
+        if not faltantes:
+            return "OK", [], None
+        self.logger.warning(f"{len(faltantes)} de {len(identificadores)} mensajes del bloque {conjunto} no están "
+                            f"en '{destino}': se copian de nuevo.")
+        return self._copiar_bloque("COPY", comprimir_ids(faltantes), destino)
+
+    def marcar_como_no_leidos(self, id_mensajes: list) -> List[int]:
+        """
+        Marca los mensajes como no leídos quitando la bandera '\\Seen' en bloque.
+
+        :param id_mensajes: Lista de UIDs de mensajes a marcar como no leidos.
+        :return: Lista de UIDs que no se pudieron marcar.
+        """
+        fallidos = self.actualizar_flags(id_mensajes, remove=["\\Seen"])
+        if fallidos:
+            self.logger.error(f"No se pudieron marcar como no leídos {len(fallidos)} mensajes: "
+                              f"{resumir_ids(fallidos)}")
+        elif self.logger.muestrear():
+            self.logger.debug(f"Se marcaron como no leídos {len(id_mensajes)} mensajes")
+        return fallidos
+
     def crear_diccionario_filtros(self) -> dict:
         """
-        Crea un diccionario con el filtro de cada etiqueta hija.
+        Crea un diccionario con el criterio SEARCH de cada etiqueta hija, en
+        orden de precedencia (prioridad y después orden de arbol_etiquetas).
+        Las reglas sin condiciones se omiten.
 
-        :param arbol_etiquetas: Diccionario del árbol de etiquetas.
-        :param filtro_etiquetas: Diccionario de filtros para las etiquetas.
-        :return: Diccionario con los filtros de cada etiqueta hija.
+        :return: Diccionario {"padre/hija": criterio SEARCH}.
         """
-        diccionario_filtros = {}
+        return {regla.etiqueta: regla.criterio for regla in self.motor_reglas().reglas if regla.criterio}
 
-        for etiqueta_padre, etiquetas_hijas in self.arbol_etiquetas.items():
+    def crear_motor_reglas(self) -> MotorReglas:
+        """
+        Compila todas las reglas de filtro_etiquetas en un MotorReglas (o lo
+        carga de la caché en carpeta_estado si el archivo de reglas no ha
+        cambiado, opción cache_reglas) y avisa de las etiquetas sin filtro y
+        de las reglas solapadas o inalcanzables.
+
+        :return: Motor de reglas para la clasificación local y el modo servidor.
+        """
+        for etiquetas_hijas in self.arbol_etiquetas.values():
             for etiqueta_hija in etiquetas_hijas:
-                
-                filtro = ""
                 if etiqueta_hija not in self.filtro_etiquetas:
                     self.logger.warning(f"No se encontró el filtro para la etiqueta '{etiqueta_hija}'")
-                else:
-                    self.logger.debug(f"Filtro encontrado para la etiqueta '{etiqueta_hija}'")
-                    filtros_etiqueta = self.filtro_etiquetas[etiqueta_hija]
-                    
-                    # Crear el filtro para la etiqueta hija
-                    if filtros_etiqueta["remitente"]:
-                        filtro += f"FROM {filtros_etiqueta['remitente']} "
-                    
-                    if filtros_etiqueta["asunto"]:
-                        filtro += f"SUBJECT {filtros_etiqueta['asunto']} "
-                    
-                    if filtros_etiqueta["cuerpo"]:
-                        filtro += f"BODY {filtros_etiqueta['cuerpo']} "
-                
-                if etiqueta_hija in self.filtro_etiquetas:
-                    diccionario_filtros[f"{etiqueta_padre}/{etiqueta_hija}"] = filtro.strip()
-                    
-        return diccionario_filtros
-    
-    def total_mensajes(self) -> int:
+
+        etiquetas = {"arbol_etiquetas": self.arbol_etiquetas, "filtro_etiquetas": self.filtro_etiquetas}
+        carpeta_cache = self.estado.carpeta if self.cache_reglas and self._huella_etiquetas else None
+        try:
+            motor, avisos = motor_desde_etiquetas(etiquetas, self._huella_etiquetas or "", carpeta_cache,
+                                                  self.ruta_etiquetas)
+        except ValueError as e:
+            self.logger.error(f"Error en las reglas de etiquetas: {e}")
+            raise
+
+        for aviso in avisos:
+            self.logger.warning(aviso)
+        return motor
+
+    def motor_reglas(self) -> MotorReglas:
+        """
+        Devuelve el motor de reglas, compilándolo la primera vez.
+        """
+        if self._motor_reglas is None:
+            self._motor_reglas = self.crear_motor_reglas()
+        return self._motor_reglas
+
+    def _decodificar_cabecera(self, valor) -> str:
+        """
+        Decodifica una cabecera RFC 2047 completa (todos sus fragmentos).
+
+        :param valor: Valor de la cabecera tal y como aparece en el mensaje.
+        :return: Cabecera decodificada o cadena vacía.
+        """
+        return decodificar_cabecera(valor)
+
+    def obtener_cabeceras(self, uids: list, con_cuerpo: bool = False, con_tamano: bool = False) -> Dict[int, dict]:
+        """
+        Obtiene remitente y asunto (y opcionalmente el texto del cuerpo) de los
+        mensajes con un único UID FETCH por bloque, sin marcarlos como leídos.
+
+        :param uids: Lista de UIDs.
+        :param con_cuerpo: Si es True también descarga el texto de las partes text/*
+                           (ver _textos_con_presupuesto) y lo decodifica.
+        :param con_tamano: Si es True también pide RFC822.SIZE.
+        :return: Diccionario {uid: {"remitente", "asunto", "fecha", "tamano", "flags", "cuerpo"}}
+                 (flags solo si hay índice local; tamaño si hay índice, con_tamano o con_cuerpo).
+        """
+        # Con índice se aprovecha el mismo FETCH para guardar sus metadatos
+        indexar = self.indice is not None and self.bandeja_actual is not None
+        con_cuerpo = con_cuerpo or (indexar and self.indice_cuerpo)
+        # Con presupuesto por mensaje, el texto se pide después según RFC822.SIZE y BODYSTRUCTURE
+        por_partes = con_cuerpo and self.presupuesto_mensaje > 0
+        if con_cuerpo:
+            elementos = ("BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MIME-VERSION CONTENT-TYPE "
+                         "CONTENT-TRANSFER-ENCODING)]")
+            elementos = f"BODYSTRUCTURE {elementos}" if por_partes else f"{elementos} BODY.PEEK[TEXT]"
+        else:
+            elementos = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]"
+        if indexar or con_tamano or por_partes:
+            elementos = f"RFC822.SIZE {elementos}"
+        if indexar:
+            elementos = f"FLAGS {elementos}"
+        elementos = f"({elementos})"
+
+        cabeceras = {}
+        for conjunto, _ in dividir_en_bloques(uids, self.longitud_maxima_comando):
+            status, datos = self.imap.uid("FETCH", conjunto, elementos)
+            if status != "OK":
+                self.logger.error(f"Error al obtener las cabeceras de {conjunto}. Detalles: {datos}")
+                continue
+
+            respuestas = agrupar_respuesta_fetch(datos)
+            textos = self._textos_con_presupuesto(respuestas) if por_partes else {}
+            for uid, partes in respuestas.items():
+                cabecera = next((v for k, v in partes.items() if k.startswith("BODY[HEADER")), b"")
+                correo = MensajeCorreo(cabecera + partes.get("BODY[TEXT]", b""), uid)
+                cabeceras[uid] = {
+                    "remitente": correo.remitente,
+                    "asunto": correo.asunto,
+                    "fecha": correo.fecha,
+                    "tamano": partes.get("RFC822.SIZE"),
+                    "flags": partes.get("FLAGS"),
+                    "cuerpo": textos.get(uid, "") if por_partes else correo.textos() if con_cuerpo else "",
+                }
+
+        if indexar:
+            self._guardar_en_indice(cabeceras, con_cuerpo)
+        return cabeceras
+
+    def _textos_con_presupuesto(self, respuestas: Dict[int, dict]) -> Dict[int, str]:
+        """
+        Obtiene el texto de las partes text/* de cada mensaje (como
+        MensajeCorreo.textos) sin descargar más de presupuesto_mensaje bytes
+        por mensaje. De los que caben en el presupuesto se pide BODY[TEXT] en
+        un solo FETCH; de los mayores, solo sus partes text/*, cada una
+        truncada a su parte del presupuesto, con un FETCH por combinación de
+        partes. Los adjuntos de los mensajes grandes no se descargan.
+
+        :param respuestas: Respuesta agrupada de un FETCH con RFC822.SIZE,
+                           BODYSTRUCTURE y las cabeceras MIME de cada mensaje.
+        :return: Diccionario {uid: texto}.
+        """
+        textos = {}
+        grupos = {}
+        estructuras = {}
+        for uid, partes in respuestas.items():
+            if (partes.get("RFC822.SIZE") or 0) <= self.presupuesto_mensaje:
+                grupos.setdefault(None, []).append(uid)
+                continue
+            estructuras[uid] = [parte for parte in partes_bodystructure(partes.get("BODYSTRUCTURE"))
+                                if parte["tipo"].startswith("text/")]
+            if estructuras[uid]:
+                grupos.setdefault(tuple(parte["parte"] for parte in estructuras[uid]), []).append(uid)
+            else:
+                textos[uid] = ""
+
+        for secciones, uids_grupo in grupos.items():
+            if secciones is None:
+                elementos = "(BODY.PEEK[TEXT])"
+            else:
+                longitud = max(self.presupuesto_mensaje // len(secciones), 1)
+                elementos = "(" + " ".join(f"BODY.PEEK[{seccion}]<0.{longitud}>" for seccion in secciones) + ")"
+            for conjunto, _ in dividir_en_bloques(uids_grupo, self.longitud_maxima_comando):
+                status, datos = self.imap.uid("FETCH", conjunto, elementos)
+                if status != "OK":
+                    self.logger.error(f"Error al obtener el texto de {conjunto}. Detalles: {datos}")
+                    continue
+                for uid, partes in agrupar_respuesta_fetch(datos).items():
+                    if uid not in respuestas:
+                        continue
+                    if secciones is None:
+                        cabecera = next((v for k, v in respuestas[uid].items() if k.startswith("BODY[HEADER")), b"")
+                        textos[uid] = MensajeCorreo(cabecera + partes.get("BODY[TEXT]", b""), uid).textos()
+                    else:
+                        textos[uid] = "\n".join(
+                            self._decodificar_parte(partes.get(f"BODY[{parte['parte']}]<0>", b""),
+                                                    parte["codificacion"], parte["charset"])
+                            for parte in estructuras[uid]
+                        )
+        return textos
+
+    def _guardar_en_indice(self, cabeceras: Dict[int, dict], con_cuerpo: bool) -> None:
+        """
+        Guarda en el índice local los metadatos de la bandeja seleccionada.
+        """
+        self.indice.sincronizar_uidvalidity(self.username, self.bandeja_actual, self.uidvalidity)
+        self.indice.guardar(self.username, self.bandeja_actual, (
+            dict(datos, uid=uid, cuerpo=datos["cuerpo"] if con_cuerpo and self.indice_cuerpo else None)
+            for uid, datos in cabeceras.items()
+        ))
+
+    def indexar_bandeja(self, bandeja: str, uids: Optional[list] = None) -> int:
+        """
+        Añade al índice local los mensajes de una bandeja que aún no estén
+        indexados (o los UIDs indicados). Si el UIDVALIDITY ha cambiado, se
+        descarta el índice anterior de la bandeja.
+
+        :param bandeja: Bandeja a indexar.
+        :param uids: UIDs a indexar; por defecto, los posteriores al último indexado.
+        :return: Número de mensajes indexados.
+        """
+        if self.indice is None:
+            self.logger.warning("No hay índice local configurado (opción 'indice').")
+            return 0
+
+        if self.bandeja_actual != bandeja:
+            self.seleccionar_bandeja(bandeja)
+        self.indice.sincronizar_uidvalidity(self.username, bandeja, self.uidvalidity)
+        recorrido = uids is None
+        if recorrido:
+            uids = self.filtrar_correo("ALL", desde_uid=self.indice.ultimo_uid(self.username, bandeja) + 1)
+            if uids is None:
+                return 0
+
+        uids = normalizar_ids(uids)
+        total = 0
+        for inicio in range(0, len(uids), 1000):
+            total += len(self.obtener_cabeceras(uids[inicio:inicio + 1000]))
+        if recorrido and uids:
+            self.indice.marcar_indexado(self.username, bandeja, uids[-1])
+        self.logger.log(f"Indexados {total} mensajes de '{bandeja}'")
+        return total
+
+    def clasificar_localmente(self, uids: list) -> Dict[str, list]:
+        """
+        Clasifica los mensajes evaluando todas las reglas localmente en una sola
+        pasada, en lugar de enviar un SEARCH por etiqueta. El cuerpo solo se
+        descarga si alguna regla filtra por él.
+
+        :param uids: Lista de UIDs a clasificar.
+        :return: Diccionario {"padre/hija": [UIDs en bytes]} en orden de precedencia.
+        """
+        motor = self.motor_reglas()
+        cabeceras = self.obtener_cabeceras(uids, con_cuerpo=motor.necesita_cuerpo, con_tamano=motor.necesita_tamano)
+
+        clasificacion = {etiqueta: [] for etiqueta in motor.etiquetas}
+        for uid, datos in sorted(cabeceras.items()):
+            etiqueta = motor.clasificar(datos["remitente"], datos["asunto"], datos["cuerpo"],
+                                        datos["fecha"], datos["tamano"])
+            if etiqueta is not None:
+                clasificacion[etiqueta].append(str(uid).encode())
+
+        clasificados = sum(len(ids) for ids in clasificacion.values())
+        self.logger.log(f"Clasificación local: {clasificados} de {len(uids)} mensajes con etiqueta")
+        return clasificacion
+
+    def verificar_regla(self, regla, uids: list) -> list:
+        """
+        Confirma en local los candidatos de un SEARCH que no equivale
+        exactamente a la regla (regex, dominios o exclusiones no traducibles).
+
+        :param regla: Regla compilada (classes.reglas.Regla).
+        :param uids: UIDs devueltos por el SEARCH.
+        :return: UIDs (en bytes) que cumplen la regla.
+        """
+        motor = self.motor_reglas()
+        cabeceras = self.obtener_cabeceras(uids, con_cuerpo=regla.necesita_cuerpo, con_tamano=regla.necesita_tamano)
+        return [
+            str(uid).encode() for uid, datos in sorted(cabeceras.items())
+            if motor.coincide(regla, datos["remitente"], datos["asunto"], datos["cuerpo"],
+                              datos["fecha"], datos["tamano"])
+        ]
+
+    def organizar_bandeja(self, bandeja: str = "INBOX") -> dict:
+        """
+        Clasifica y mueve a su etiqueta los mensajes llegados a la bandeja desde
+        la última ejecución y guarda el progreso. Según modo_local, usa un SEARCH
+        por etiqueta o la clasificación local en una sola pasada.
+
+        :param bandeja: Bandeja a organizar.
+        :return: Diccionario {"total": mensajes nuevos, "movidos": {etiqueta: n}}.
+        """
+        resultado = {"total": 0, "movidos": {}}
+        # Un STATUS basta para saber que no ha llegado nada desde la última ejecución
+        if self.sin_cambios(bandeja):
+            self.logger.log(f"No hay cambios en '{bandeja}' desde la última ejecución")
+            return resultado
+
+        self._activar_qresync()
+        self.seleccionar_bandeja(bandeja)
+        # Se guardan los valores de antes de procesar: lo que llegue después se verá en la siguiente
+        uidnext, highestmodseq = self.uidnext, self.highestmodseq
+
+        # Completar primero los movimientos que una ejecución interrumpida dejó a medias
+        self.reanudar_movimientos(bandeja)
+
+        # Con índice y CONDSTORE, traer solo los flags que cambiaron desde la última ejecución
+        anterior = self.estado.cargar(self.username, bandeja)
+        if anterior.get("highestmodseq") and anterior.get("uidvalidity") == self.uidvalidity:
+            self.sincronizar_cambios(bandeja, anterior["highestmodseq"])
+
+        # Solo se procesan los mensajes llegados desde la última ejecución
+        ultimo_uid = self.ultimo_uid_procesado(bandeja)
+        desde_uid = ultimo_uid + 1
+        uids_nuevos = self.filtrar_correo("ALL", desde_uid=desde_uid)
+        if uids_nuevos is None:
+            # Sin saber qué ha llegado no se guarda progreso: se repite en la siguiente ejecución
+            self.logger.error(f"No se pudieron buscar los mensajes nuevos de '{bandeja}'")
+            return resultado
+        resultado["total"] = len(uids_nuevos)
+        self.metricas.incrementar("mensajes_nuevos", self.username, bandeja, len(uids_nuevos))
+
+        if not uids_nuevos:
+            self.logger.log(f"No hay mensajes nuevos en '{bandeja}'")
+            self.guardar_progreso(bandeja, ultimo_uid, uidnext, highestmodseq)
+            return resultado
+
+        # Crear de una vez las carpetas de arbol_etiquetas que falten
+        if self.crear_carpetas:
+            self.crear_carpetas_faltantes()
+
+        resultado["movidos"] = self.clasificar_y_mover(bandeja, uids_nuevos, desde_uid)
+        if self.no_movidos:
+            # El progreso se detiene antes del primer mensaje sin mover para reintentarlo en la
+            # siguiente ejecución; sin UIDNEXT ni HIGHESTMODSEQ, STATUS no la omite
+            self.logger.warning(f"No se pudieron mover {len(self.no_movidos)} mensajes de '{bandeja}': "
+                                f"{resumir_ids(self.no_movidos)}. Se reintentarán en la siguiente ejecución.")
+            self.guardar_progreso(bandeja, self.no_movidos[0] - 1)
+        else:
+            # Los UIDs no cambian al mover otros mensajes: se guarda el mayor procesado
+            self.guardar_progreso(bandeja, max(int(uid) for uid in uids_nuevos), uidnext, highestmodseq)
+        if self.notificador is not None:
+            # Solo se encola: el envío no retrasa la siguiente pasada
+            self.notificador.terminar_pasada(self.username, bandeja, resultado)
+        return resultado
+
+    def clasificar_y_mover(self, bandeja: str, uids: list, desde_uid: int,
+                           hasta_uid: Optional[int] = None) -> Dict[str, int]:
+        """
+        Clasifica los mensajes indicados de la bandeja seleccionada y mueve
+        cada uno a la etiqueta de mayor precedencia que cumple. En modo
+        servidor los SEARCH se limitan a los UIDs desde_uid:hasta_uid.
+
+        :param bandeja: Bandeja seleccionada.
+        :param uids: UIDs a procesar (en bytes, como los devuelve filtrar_correo).
+        :param desde_uid: Primer UID del rango.
+        :param hasta_uid: Último UID del rango (None = hasta el final).
+        :return: Diccionario {etiqueta: mensajes movidos}. Los UIDs clasificados que
+                 no se pudieron mover quedan en no_movidos; si falla el SEARCH de una
+                 regla, también los que aún no tenían etiqueta.
+        """
+        movidos = {}
+        self.no_movidos = []
+        motor = self.motor_reglas()
+        # En modo local se descargan las cabeceras una vez y se evalúan todas las reglas
+        # (y, si hay índice, ese mismo FETCH lo alimenta)
+        clasificacion = self.clasificar_localmente(uids) if self.modo_local else None
+        if self.indice is not None and not self.modo_local:
+            self.indexar_bandeja(bandeja, uids)
+
+        mensajes_movidos = clasificados = 0
+        # Un mensaje que cumple varias reglas solo se mueve con la de mayor precedencia
+        asignados = set()
+        for regla in motor.reglas:
+            etiqueta, filtro = regla.etiqueta, regla.criterio
+            if filtro is None:
+                continue
+            self.logger.log(f"Etiqueta: {etiqueta} - Filtro: {filtro}")
+
+            # Obtener los mensajes con su filtro correspondiente
+            if clasificacion is not None:
+                id_mensajes = clasificacion.get(etiqueta, [])
+            else:
+                encontrados = self.filtrar_correo(filtro, desde_uid=desde_uid, hasta_uid=hasta_uid)
+                if encontrados is None:
+                    # Sin el resultado de esta regla, las siguientes podrían llevarse sus mensajes:
+                    # la pasada se detiene y los que quedan sin etiqueta cuentan como no movidos
+                    self.logger.error(f"Se interrumpe la clasificación de '{bandeja}' por el error en el "
+                                      f"filtro de '{etiqueta}'")
+                    self.no_movidos.extend(int(uid) for uid in uids if uid not in asignados)
+                    break
+                id_mensajes = [uid for uid in encontrados if uid not in asignados]
+                if id_mensajes and not regla.exacto:
+                    id_mensajes = self.verificar_regla(regla, id_mensajes)
+                asignados.update(id_mensajes)
+            # Si no hay mensajes con el filtro, se continua con el siguiente filtro
+            if len(id_mensajes) == 0:
+                self.logger.log(f"No hay mensajes con el filtro {filtro}")
+                continue
+            # Marcar los mensajes como no leidos (los flags se conservan al moverlos)
+            self.marcar_como_no_leidos(id_mensajes)
+            # Las cabeceras del digest se leen antes de mover: en el destino cambian los UIDs
+            digest = None
+            if self.notificador is not None and self.notificador.quiere_digest(etiqueta):
+                digest = self.obtener_cabeceras(id_mensajes)
+            # Mover los mensajes a la carpeta correspondiente
+            bloques = self.mover_correos(bandeja, etiqueta, id_mensajes)
+            movidos[etiqueta] = sum(len(b["ids"]) for b in bloques if b["estado"] == "OK")
+            correctos = {int(uid) for b in bloques if b["estado"] == "OK" for uid in b["ids"]}
+            self.no_movidos.extend(int(uid) for uid in id_mensajes if int(uid) not in correctos)
+            if digest:
+                self.notificador.registrar(self.username, etiqueta, [
+                    digest[int(uid)] for b in bloques if b["estado"] == "OK" for uid in b["ids"] if int(uid) in digest
+                ])
+            mensajes_movidos += movidos[etiqueta]
+            clasificados += len(id_mensajes)
+            self.metricas.incrementar("mensajes_clasificados", self.username, etiqueta, len(id_mensajes))
+
+            self.logger.log(f"Total de mensajes movidos: {mensajes_movidos} de {len(uids)}")
+
+        self.metricas.incrementar("mensajes_sin_etiqueta", self.username, bandeja, len(uids) - clasificados)
+        self.no_movidos.sort()
+        return movidos
+
+    def esperar_correo_nuevo(self, bandeja: str = "INBOX", timeout: float = 1500,
+                             intervalo_sondeo: float = 60) -> bool:
         """
-        Obtiene el total de mensajes en la bandeja de entrada.
+        Bloquea hasta que llegue correo nuevo a la bandeja. Usa IMAP IDLE si el
+        servidor lo anuncia; si no, espera intervalo_sondeo segundos (sondeo).
+
+        :param bandeja: Bandeja a vigilar.
+        :param timeout: Segundos máximos en IDLE antes de renovarlo.
+        :param intervalo_sondeo: Espera entre sondeos si no hay IDLE.
+        :return: True si el servidor notificó cambios o si se está sondeando.
+        """
+        if "IDLE" not in self.capacidades():
+            time.sleep(intervalo_sondeo)
+            return True
+
+        if self.bandeja_actual != bandeja or self.imap.state != "SELECTED":
+            self.seleccionar_bandeja(bandeja)
+            # Lo llegado mientras no estaba seleccionada no se notificará en IDLE
+            if self.uidnext is not None and self.uidnext > self.ultimo_uid_procesado(bandeja) + 1:
+                self.logger.debug(f"Hay mensajes sin procesar en '{bandeja}' (UIDNEXT {self.uidnext})")
+                return True
+        else:
+            # Un EXISTS recibido durante la pasada anterior, en la respuesta de otro comando, ya
+            # lo leyó imaplib: IDLE no lo volverá a notificar
+            _, existentes = self.imap.response("EXISTS")
+            if existentes and existentes[-1] is not None:
+                self.logger.debug(f"Cambios notificados en '{bandeja}' durante la pasada: {existentes[-1]} EXISTS")
+                return True
+
+        respuestas = self.imap.idle(timeout)
+        cambios = any(re.match(rb"^\* \d+ (EXISTS|EXPUNGE)", r) for r in respuestas)
+        if cambios:
+            self.logger.debug(f"Cambios notificados en '{bandeja}': {respuestas}")
+        return cambios
+
+    def total_mensajes(self, bandeja: str = "INBOX") -> int:
+        """
+        Obtiene el total de mensajes de una bandeja con STATUS (MESSAGES), sin
+        descargar la lista de IDs de un SEARCH ALL.
         
-        :return: Número total de mensajes en la bandeja de entrada.
+        :param bandeja: Nombre de la bandeja (por defecto la de entrada).
+        :return: Número total de mensajes en la bandeja.
         """
-        status, mensajes = self.imap.search(None, "ALL")
-        if status != "OK":
+        if self.bandeja_actual != bandeja:
+            total_mensajes = self.estado_bandeja(bandeja).get("messages")
+        else:
+            # STATUS no debe usarse sobre la bandeja seleccionada: se usa EXISTS del SELECT
+            status, datos = self.imap.select(self._nombre_servidor(bandeja))
+            total_mensajes = int(datos[-1]) if status == "OK" and datos and datos[-1] else None
+            if status == "OK":
+                self._registrar_seleccion(bandeja)
+        if total_mensajes is None:
             self.logger.error("Error al obtener el total de mensajes.")
             return 0
 
-        total_mensajes = len(mensajes[0].split())
-        self.logger.log(f"Total de mensajes en la bandeja de entrada: {total_mensajes}")
+        self.logger.log(f"Total de mensajes en '{bandeja}': {total_mensajes}")
         return total_mensajes
\ No newline at end of file
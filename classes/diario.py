@@ -0,0 +1,103 @@
+import os
+import re
+import json
+import uuid
+import threading
+from typing import List
+from classes.rutas import CARPETA_ESTADO
+
+# Varias sesiones del mismo proceso (relleno en paralelo) escriben en el mismo diario
+_BLOQUEO = threading.Lock()
+
+
+class DiarioMovimientos:
+    """
+    Diario de escritura anticipada (write-ahead) de los movimientos de
+    mensajes, por cuenta y buzón de origen.
+
+    Antes de enviar cada bloque de UID MOVE/UID COPY se anota el plan
+    (destino, UIDs y UIDVALIDITY) y después cada paso confirmado: "copiado"
+    cuando el COPY ha terminado, "hecho" cuando los mensajes ya no están en
+    el origen y "fallido" si el servidor rechazó el bloque. Cada anotación
+    es una línea JSON añadida al final y sincronizada con el disco, de modo
+    que tras una caída se sabe qué bloques quedaron a medias.
+    """
+    def __init__(self, carpeta: str = CARPETA_ESTADO):
+        """
+        :param carpeta: Carpeta donde se guardan los diarios.
+        """
+        self.carpeta = carpeta
+
+    def ruta(self, cuenta: str, buzon: str) -> str:
+        """
+        Devuelve la ruta del diario de un buzón.
+
+        :param cuenta: Usuario de la cuenta IMAP.
+        :param buzon: Nombre del buzón de origen.
+        """
+        nombre = re.sub(r"[^\w.@-]", "_", f"{cuenta}_{buzon}")
+        return os.path.join(self.carpeta, f"{nombre}.diario.jsonl")
+
+    def planificar(self, cuenta: str, buzon: str, **valores) -> str:
+        """
+        Anota un bloque antes de enviarlo al servidor.
+
+        :param valores: Datos del bloque: comando ("MOVE"/"COPY"), destino,
+                        uids (conjunto IMAP), uidvalidity y, con COPY, uidnext
+                        del destino antes de copiar.
+        :return: Identificador del bloque para las anotaciones siguientes.
+        """
+        bloque = uuid.uuid4().hex
+        self.anotar(cuenta, buzon, bloque, "plan", **valores)
+        return bloque
+
+    def anotar(self, cuenta: str, buzon: str, bloque: str, paso: str, **valores) -> None:
+        """
+        Añade una anotación al diario y la sincroniza con el disco.
+
+        :param bloque: Identificador devuelto por planificar.
+        :param paso: "plan", "copiado", "hecho" o "fallido".
+        """
+        os.makedirs(self.carpeta, exist_ok=True)
+        linea = json.dumps(dict(valores, bloque=bloque, paso=paso), ensure_ascii=False)
+        with _BLOQUEO, open(self.ruta(cuenta, buzon), "a+b") as archivo:
+            # Una caída a mitad de escritura deja la última línea sin "\n": se
+            # cierra antes de añadir para que la anotación nueva no se pierda con ella
+            if archivo.seek(0, os.SEEK_END) > 0:
+                archivo.seek(-1, os.SEEK_END)
+                if archivo.read(1) != b"\n":
+                    archivo.write(b"\n")
+            archivo.write(linea.encode("utf-8") + b"\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    def pendientes(self, cuenta: str, buzon: str) -> List[dict]:
+        """
+        Bloques cuyo último paso es "plan" o "copiado", en orden de planificación.
+        Una última línea incompleta (caída durante la escritura) se ignora.
+
+        :return: Lista de diccionarios con los datos del plan y el último "paso".
+        """
+        bloques = {}
+        try:
+            with open(self.ruta(cuenta, buzon), "r", encoding="utf-8", errors="replace") as archivo:
+                for linea in archivo:
+                    try:
+                        anotacion = json.loads(linea)
+                    except ValueError:
+                        continue
+                    bloques.setdefault(anotacion["bloque"], {}).update(anotacion)
+        except FileNotFoundError:
+            return []
+        return [bloque for bloque in bloques.values() if bloque["paso"] in ("plan", "copiado")]
+
+    def compactar(self, cuenta: str, buzon: str) -> None:
+        """
+        Borra el diario si todos sus bloques han terminado.
+        """
+        with _BLOQUEO:
+            if not self.pendientes(cuenta, buzon):
+                try:
+                    os.remove(self.ruta(cuenta, buzon))
+                except FileNotFoundError:
+                    pass
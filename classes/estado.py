@@ -0,0 +1,55 @@
+import os
+import re
+import json
+from classes.rutas import CARPETA_ESTADO
+
+
+class EstadoBuzones:
+    """
+    Guarda en disco, por cuenta y buzón, el UIDVALIDITY y el último UID
+    procesado para que cada ejecución solo trate el correo nuevo.
+    """
+    def __init__(self, carpeta: str = CARPETA_ESTADO):
+        """
+        :param carpeta: Carpeta donde se guardan los archivos de estado.
+        """
+        self.carpeta = carpeta
+
+    def ruta(self, cuenta: str, buzon: str) -> str:
+        """
+        Devuelve la ruta del archivo de estado de un buzón.
+
+        :param cuenta: Usuario de la cuenta IMAP.
+        :param buzon: Nombre del buzón.
+        """
+        nombre = re.sub(r"[^\w.@-]", "_", f"{cuenta}_{buzon}")
+        return os.path.join(self.carpeta, f"{nombre}.json")
+
+    def cargar(self, cuenta: str, buzon: str) -> dict:
+        """
+        Carga el estado de un buzón.
+
+        :return: Diccionario con 'uidvalidity' y 'ultimo_uid' (vacío si no hay estado).
+        """
+        try:
+            with open(self.ruta(cuenta, buzon), "r", encoding="utf-8") as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            return {}
+
+    def guardar(self, cuenta: str, buzon: str, **valores) -> None:
+        """
+        Actualiza el estado de un buzón de forma atómica (escritura en un
+        archivo temporal y reemplazo), conservando las claves no indicadas.
+
+        :param valores: Claves a actualizar, p. ej. uidvalidity=..., ultimo_uid=...
+        """
+        os.makedirs(self.carpeta, exist_ok=True)
+        estado = self.cargar(cuenta, buzon)
+        estado.update(valores)
+
+        ruta = self.ruta(cuenta, buzon)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(estado, archivo, indent=4)
+        os.replace(temporal, ruta)
@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS buzones (
+    cuenta TEXT NOT NULL,
+    buzon TEXT NOT NULL,
+    uidvalidity INTEGER,
+    ultimo_uid INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (cuenta, buzon)
+);
+CREATE TABLE IF NOT EXISTS mensajes (
+    id INTEGER PRIMARY KEY,
+    cuenta TEXT NOT NULL,
+    buzon TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    remitente TEXT NOT NULL DEFAULT '',
+    asunto TEXT NOT NULL DEFAULT '',
+    fecha TEXT,
+    tamano INTEGER,
+    flags TEXT NOT NULL DEFAULT '',
+    carpeta TEXT NOT NULL,
+    cuerpo TEXT,
+    UNIQUE (cuenta, buzon, uid)
+);
+CREATE INDEX IF NOT EXISTS mensajes_carpeta ON mensajes (cuenta, carpeta);
+"""
+
+# Índice de texto completo (solo si SQLite está compilado con FTS5)
+_ESQUEMA_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS mensajes_fts USING fts5(
+    remitente, asunto, cuerpo, content='mensajes', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS mensajes_fts_alta AFTER INSERT ON mensajes BEGIN
+    INSERT INTO mensajes_fts(rowid, remitente, asunto, cuerpo)
+    VALUES (new.id, new.remitente, new.asunto, coalesce(new.cuerpo, ''));
+END;
+CREATE TRIGGER IF NOT EXISTS mensajes_fts_baja AFTER DELETE ON mensajes BEGIN
+    INSERT INTO mensajes_fts(mensajes_fts, rowid, remitente, asunto, cuerpo)
+    VALUES ('delete', old.id, old.remitente, old.asunto, coalesce(old.cuerpo, ''));
+END;
+CREATE TRIGGER IF NOT EXISTS mensajes_fts_cambio AFTER UPDATE OF remitente, asunto, cuerpo ON mensajes BEGIN
+    INSERT INTO mensajes_fts(mensajes_fts, rowid, remitente, asunto, cuerpo)
+    VALUES ('delete', old.id, old.remitente, old.asunto, coalesce(old.cuerpo, ''));
+    INSERT INTO mensajes_fts(rowid, remitente, asunto, cuerpo)
+    VALUES (new.id, new.remitente, new.asunto, coalesce(new.cuerpo, ''));
+END;
+"""
+
+
+class IndiceCorreo:
+    """
+    Índice local (SQLite) de los metadatos de cada mensaje por cuenta, buzón
+    y UID: remitente, asunto, fecha, tamaño, flags, carpeta actual y,
+    opcionalmente, el texto del cuerpo. Permite evaluar reglas y hacer
+    búsquedas sin consultar al servidor IMAP.
+    """
+    def __init__(self, ruta: str):
+        """
+        :param ruta: Ruta del archivo SQLite (se crea si no existe).
+        """
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self.ruta = ruta
+        self._bloqueo = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+        # WAL permite que varias cuentas escriban en paralelo sin bloquear lecturas
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(_ESQUEMA)
+        try:
+            self.conexion.executescript(_ESQUEMA_FTS)
+            self.texto_completo = True
+        except sqlite3.OperationalError:
+            self.texto_completo = False
+        self.conexion.commit()
+
+    def sincronizar_uidvalidity(self, cuenta: str, buzon: str, uidvalidity: Optional[int]) -> bool:
+        """
+        Comprueba el UIDVALIDITY guardado del buzón. Si ha cambiado, los UIDs
+        indexados ya no son válidos y se borran.
+
+        :return: True si el índice del buzón seguía siendo válido.
+        """
+        with self._bloqueo, self.conexion:
+            fila = self.conexion.execute(
+                "SELECT uidvalidity FROM buzones WHERE cuenta = ? AND buzon = ?", (cuenta, buzon)
+            ).fetchone()
+            if fila is not None and fila[0] == uidvalidity:
+                return True
+            if fila is not None:
+                self.conexion.execute("DELETE FROM mensajes WHERE cuenta = ? AND buzon = ?", (cuenta, buzon))
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO buzones (cuenta, buzon, uidvalidity) VALUES (?, ?, ?)",
+                (cuenta, buzon, uidvalidity),
+            )
+            return fila is None
+
+    def ultimo_uid(self, cuenta: str, buzon: str) -> int:
+        """
+        :return: UID hasta el que se ha recorrido el buzón completo (0 si nunca).
+                 Los mensajes movidos al buzón no cuentan: pueden tener UIDs
+                 mayores que otros aún sin indexar.
+        """
+        fila = self.conexion.execute(
+            "SELECT ultimo_uid FROM buzones WHERE cuenta = ? AND buzon = ?", (cuenta, buzon)
+        ).fetchone()
+        return fila[0] if fila else 0
+
+    def marcar_indexado(self, cuenta: str, buzon: str, ultimo_uid: int) -> None:
+        """
+        Registra que el buzón está indexado hasta ultimo_uid.
+        """
+        with self._bloqueo, self.conexion:
+            self.conexion.execute(
+                "UPDATE buzones SET ultimo_uid = max(ultimo_uid, ?) WHERE cuenta = ? AND buzon = ?",
+                (int(ultimo_uid), cuenta, buzon),
+            )
+
+    def guardar(self, cuenta: str, buzon: str, mensajes: Iterable[dict]) -> int:
+        """
+        Inserta o actualiza los metadatos de varios mensajes en una transacción.
+
+        :param mensajes: Diccionarios {"uid", "remitente", "asunto", "fecha",
+                         "tamano", "flags", "cuerpo"}; las claves ausentes
+                         conservan el valor ya indexado.
+        :return: Número de mensajes guardados.
+        """
+        filas = [
+            (cuenta, buzon, int(m["uid"]), m.get("remitente"), m.get("asunto"), m.get("fecha"),
+             m.get("tamano"), " ".join(m["flags"]) if m.get("flags") is not None else None, m.get("cuerpo"))
+            for m in mensajes
+        ]
+        with self._bloqueo, self.conexion:
+            self.conexion.executemany(
+                """
+                INSERT INTO mensajes (cuenta, buzon, uid, remitente, asunto, fecha, tamano, flags, carpeta, cuerpo)
+                VALUES (?1, ?2, ?3, coalesce(?4, ''), coalesce(?5, ''), ?6, ?7, coalesce(?8, ''), ?2, ?9)
+                ON CONFLICT (cuenta, buzon, uid) DO UPDATE SET
+                    remitente = coalesce(?4, remitente),
+                    asunto = coalesce(?5, asunto),
+                    fecha = coalesce(?6, fecha),
+                    tamano = coalesce(?7, tamano),
+                    flags = coalesce(?8, flags),
+                    cuerpo = coalesce(?9, cuerpo)
+                """,
+                filas,
+            )
+        return len(filas)
+
+    def mover(self, cuenta: str, origen: str, destino: str, uids: Iterable[int],
+              nuevos_uids: Optional[Dict[int, int]] = None, uidvalidity_destino: Optional[int] = None) -> None:
+        """
+        Refleja en el índice un movimiento de mensajes. Si se conocen los UIDs
+        en destino (COPYUID) los metadatos se conservan con su nueva ubicación;
+        si no, se borran y se indexarán de nuevo al recorrer el destino.
+
+        :param nuevos_uids: Diccionario {uid origen: uid destino}.
+        :param uidvalidity_destino: UIDVALIDITY del destino según COPYUID.
+        """
+        nuevos_uids = nuevos_uids or {}
+        if nuevos_uids and uidvalidity_destino is not None:
+            self.sincronizar_uidvalidity(cuenta, destino, uidvalidity_destino)
+        uids = [int(uid) for uid in uids]
+        with self._bloqueo, self.conexion:
+            # Una fila antigua con el mismo UID en destino se borra antes (y con ella su
+            # entrada de texto completo): UPDATE OR REPLACE no dispara el trigger de borrado
+            self.conexion.executemany(
+                "DELETE FROM mensajes WHERE cuenta = ? AND buzon = ? AND uid = ?",
+                [(cuenta, destino, nuevos_uids[uid]) for uid in uids if uid in nuevos_uids],
+            )
+            self.conexion.executemany(
+                "UPDATE mensajes SET buzon = ?, uid = ?, carpeta = ? "
+                "WHERE cuenta = ? AND buzon = ? AND uid = ?",
+                [(destino, nuevos_uids[uid], destino, cuenta, origen, uid) for uid in uids if uid in nuevos_uids],
+            )
+            self.conexion.executemany(
+                "DELETE FROM mensajes WHERE cuenta = ? AND buzon = ? AND uid = ?",
+                [(cuenta, origen, uid) for uid in uids if uid not in nuevos_uids],
+            )
+
+    def actualizar_flags(self, cuenta: str, buzon: str, flags: Dict[int, List[str]]) -> None:
+        """
+        Actualiza los flags de los mensajes ya indexados (los no indexados se ignoran).
+
+        :param flags: Diccionario {uid: [flags]}.
+        """
+        with self._bloqueo, self.conexion:
+            self.conexion.executemany(
+                "UPDATE mensajes SET flags = ? WHERE cuenta = ? AND buzon = ? AND uid = ?",
+                [(" ".join(valor), cuenta, buzon, int(uid)) for uid, valor in flags.items()],
+            )
+
+    def borrar(self, cuenta: str, buzon: str, uids: Iterable[int]) -> None:
+        """
+        Borra del índice mensajes que ya no existen en el buzón.
+        """
+        with self._bloqueo, self.conexion:
+            self.conexion.executemany(
+                "DELETE FROM mensajes WHERE cuenta = ? AND buzon = ? AND uid = ?",
+                [(cuenta, buzon, int(uid)) for uid in uids],
+            )
+
+    def mensajes(self, cuenta: str, buzon: Optional[str] = None) -> Iterator[dict]:
+        """
+        Recorre los mensajes indexados de una cuenta (y opcionalmente de un buzón).
+
+        :return: Iterador de diccionarios con las columnas de la tabla mensajes.
+        """
+        consulta = ("SELECT buzon, uid, remitente, asunto, fecha, tamano, flags, carpeta, cuerpo "
+                    "FROM mensajes WHERE cuenta = ?")
+        parametros = [cuenta]
+        if buzon is not None:
+            consulta += " AND buzon = ?"
+            parametros.append(buzon)
+        cursor = self.conexion.execute(consulta + " ORDER BY buzon, uid", parametros)
+        columnas = [c[0] for c in cursor.description]
+        for fila in cursor:
+            yield dict(zip(columnas, fila))
+
+    def buscar(self, cuenta: str, texto: str, limite: int = 100) -> List[dict]:
+        """
+        Busca mensajes por texto en remitente, asunto y cuerpo. Usa FTS5 si
+        está disponible; si no, una búsqueda por subcadena.
+
+        :param texto: Consulta FTS5 (o subcadena sin FTS5).
+        :param limite: Número máximo de resultados.
+        :return: Lista de diccionarios {"buzon", "uid", "remitente", "asunto", "carpeta"}.
+        """
+        if self.texto_completo:
+            cursor = self.conexion.execute(
+                "SELECT m.buzon, m.uid, m.remitente, m.asunto, m.carpeta FROM mensajes_fts "
+                "JOIN mensajes m ON m.id = mensajes_fts.rowid "
+                "WHERE mensajes_fts MATCH ? AND m.cuenta = ? ORDER BY rank LIMIT ?",
+                (texto, cuenta, limite),
+            )
+        else:
+            patron = f"%{texto}%"
+            cursor = self.conexion.execute(
+                "SELECT buzon, uid, remitente, asunto, carpeta FROM mensajes WHERE cuenta = ? AND "
+                "(remitente LIKE ? OR asunto LIKE ? OR cuerpo LIKE ?) LIMIT ?",
+                (cuenta, patron, patron, patron, limite),
+            )
+        columnas = [c[0] for c in cursor.description]
+        return [dict(zip(columnas, fila)) for fila in cursor]
+
+    def contar(self, cuenta: str) -> Dict[str, int]:
+        """
+        :return: Número de mensajes indexados por carpeta actual.
+        """
+        return dict(self.conexion.execute(
+            "SELECT carpeta, count(*) FROM mensajes WHERE cuenta = ? GROUP BY carpeta", (cuenta,)
+        ).fetchall())
+
+    def cerrar(self) -> None:
+        self.conexion.close()
@@ -1,55 +1,210 @@
 import os
+import gzip
+import json
+import time
+import queue
+import random
+import atexit
+import shutil
 import logging
+import threading
+import configparser
+import logging.handlers
 from datetime import datetime
 import sys  # Import necesario para manejar codificación
+from classes.rutas import CARPETA_LOGS
+
+# Un único escritor en segundo plano por programa, compartido por todos los Logger
+_ESCRITORES = {}
+_BLOQUEO = threading.Lock()
+
+
+class FormateadorJson(logging.Formatter):
+    """
+    Formato JSON lines: un objeto por línea con fecha, nivel, programa y mensaje.
+    """
+    def format(self, record) -> str:
+        return json.dumps({
+            "fecha": self.formatTime(record, self.datefmt),
+            "nivel": record.levelname,
+            "programa": getattr(record, "programa", record.name),
+            "mensaje": record.getMessage(),
+        }, ensure_ascii=False)
+
+
+class ArchivoRotativo(logging.handlers.RotatingFileHandler):
+    """
+    Archivo de log diario (`<programa>_<fecha>.log`) que además rota por
+    tamaño. Los archivos rotados se comprimen con gzip y los de más de
+    dias_retencion días se borran. Solo lo usa el hilo del escritor, así que
+    la rotación y la compresión nunca bloquean a quien escribe en el log.
+    """
+    def __init__(self, carpeta: str, programa: str, tamano_maximo: int = 10 * 1024 * 1024,
+                 copias: int = 5, dias_retencion: int = 30):
+        """
+        :param carpeta: Carpeta de los logs.
+        :param programa: Nombre del programa (prefijo de los archivos).
+        :param tamano_maximo: Bytes a partir de los que se rota el archivo del día (0 = sin límite).
+        :param copias: Archivos rotados por tamaño que se conservan de cada día.
+        :param dias_retencion: Días que se conservan los logs (0 = sin límite).
+        """
+        self.carpeta = carpeta
+        self.programa = programa
+        self.dias_retencion = dias_retencion
+        self.fecha = datetime.now().strftime("%Y-%m-%d")
+        super().__init__(self._ruta(self.fecha), maxBytes=tamano_maximo, backupCount=copias,
+                         encoding="utf-8", delay=True)
+        self.namer = lambda nombre: f"{nombre}.gz"
+        self.rotator = _comprimir
+        self.purgar()
+
+    def _ruta(self, fecha: str) -> str:
+        return os.path.abspath(os.path.join(self.carpeta, f"{self.programa}_{fecha}.log"))
+
+    def shouldRollover(self, record) -> bool:
+        if datetime.now().strftime("%Y-%m-%d") != self.fecha:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        fecha = datetime.now().strftime("%Y-%m-%d")
+        if fecha == self.fecha:
+            super().doRollover()
+        else:
+            # Cambio de día: se comprime el archivo del día anterior y se abre el nuevo
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            if os.path.exists(self.baseFilename):
+                _comprimir(self.baseFilename, f"{self.baseFilename}.gz")
+            self.fecha = fecha
+            self.baseFilename = self._ruta(fecha)
+        self.purgar()
+
+    def purgar(self) -> None:
+        """
+        Borra los logs del programa (comprimidos o no) con más de dias_retencion días.
+        """
+        if self.dias_retencion <= 0 or not os.path.isdir(self.carpeta):
+            return
+        limite = time.time() - self.dias_retencion * 86400
+        for nombre in os.listdir(self.carpeta):
+            ruta = os.path.join(self.carpeta, nombre)
+            if not nombre.startswith(f"{self.programa}_") or os.path.abspath(ruta) == self.baseFilename:
+                continue
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+
+def _comprimir(origen: str, destino: str) -> None:
+    """
+    Rotador de ArchivoRotativo: comprime el archivo rotado y borra el original.
+    """
+    if os.path.exists(destino):
+        os.remove(destino)
+    with open(origen, "rb") as entrada, gzip.open(destino, "wb") as salida:
+        shutil.copyfileobj(entrada, salida)
+    os.remove(origen)
+
+
+def _formato_texto() -> logging.Formatter:
+    return logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+
+class _Escritor:
+    """
+    Cola y hilo (QueueListener) que escriben en el archivo y en la consola
+    los registros de un programa.
+    """
+    def __init__(self, programa: str, carpeta_logs: str):
+        formato = _formato_texto()
+
+        # Handler para el archivo de log del día (rotado y comprimido)
+        self.archivo = ArchivoRotativo(carpeta_logs, programa)
+        self.archivo.setFormatter(formato)
+
+        # Handler para la consola
+        consola = logging.StreamHandler(sys.stdout)
+        consola.setFormatter(formato)
+
+        self.cola = queue.SimpleQueue()
+        self.escucha = logging.handlers.QueueListener(self.cola, self.archivo, consola)
+        self.escucha.start()
+        # Vaciar la cola antes de salir para no perder las últimas líneas
+        atexit.register(self.escucha.stop)
+
 
 class Logger:
     def __init__(self, programa: str):
         """
-        Inicializa el Logger para crear el archivo de log en la carpeta `logs`.
-        
+        Inicializa el Logger para crear el archivo de log en la carpeta `logs` del proyecto.
+
+        Todos los Logger de un mismo programa comparten un único escritor en
+        segundo plano: cada llamada solo encola el registro, y el archivo y la
+        consola se escriben desde otro hilo.
+
         :param programa: Nombre del programa que se usará en el archivo de log.
         """
         self.programa = programa
-        self.carpeta_logs = "logs"
+        self.carpeta_logs = CARPETA_LOGS
+        # Fracción (0-1) de los mensajes DEBUG por lote que se escriben (véase muestrear)
+        self.muestreo = 1.0
 
         # Crear la carpeta logs si no existe
         if not os.path.exists(self.carpeta_logs):
             os.makedirs(self.carpeta_logs)
 
-        # Crear el nombre del archivo de log con fecha y hora
-        self.archivo_log = os.path.join(
-            self.carpeta_logs, f"{self.programa}_{datetime.now().strftime('%Y-%m-%d')}.log"
-        )
+        self.logger = logging.getLogger(self.programa)
+        with _BLOQUEO:
+            self._escritor = _ESCRITORES.get(self.programa)
+            if self._escritor is None:
+                # Solo la primera instancia configura el logger: las siguientes no duplican handlers
+                self._escritor = _ESCRITORES[self.programa] = _Escritor(self.programa, self.carpeta_logs)
+                self.logger.setLevel(logging.DEBUG)
+                self.logger.propagate = False
+                self.logger.addHandler(logging.handlers.QueueHandler(self._escritor.cola))
 
-        # Crear un log formatter que incluya el campo 'programa' y 'tipo'
-        formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s',
-                                      datefmt='%Y-%m-%d %H:%M:%S')
+                # Crear un filtro para agregar el programa al log
+                log_filter = logging.Filter()
+                log_filter.filter = self._add_programa
+                self.logger.addFilter(log_filter)
 
-        # Crear un handler para el archivo de log
-        file_handler = logging.FileHandler(self.archivo_log, encoding="utf-8")
-        file_handler.setFormatter(formatter)
+        self.archivo_log = self._escritor.archivo.baseFilename
 
-        # Crear un handler para la consola
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(formatter)
+    def configurar(self, config: configparser.ConfigParser) -> None:
+        """
+        Aplica las opciones de log de [opciones]: log_formato ("texto" o
+        "json"), log_tamano_maximo_mb, log_copias, log_dias_retencion y
+        muestreo_debug. El archivo es compartido, así que afecta a todos los
+        Logger del programa.
 
-        # Configurar el logger 
-        self.logger = logging.getLogger(self.programa)
-        self.logger.setLevel(logging.DEBUG)
-        self.logger.addHandler(file_handler)
-        # No mostrar debug en consola
-        self.logger.addHandler(console_handler)
+        :param config: Configuración cargada.
+        """
+        self.muestreo = config.getfloat("opciones", "muestreo_debug", fallback=1.0)
+
+        archivo = self._escritor.archivo
+        if config.get("opciones", "log_formato", fallback="texto").strip().lower() == "json":
+            formato = FormateadorJson(datefmt='%Y-%m-%dT%H:%M:%S')
+        else:
+            formato = _formato_texto()
 
-        # Crear un filtro para agregar el programa al log
-        log_filter = logging.Filter()
-        log_filter.filter = self._add_programa
-        self.logger.addFilter(log_filter)
+        # El hilo del escritor puede estar usando el handler
+        archivo.acquire()
+        try:
+            archivo.setFormatter(formato)
+            archivo.maxBytes = int(config.getfloat("opciones", "log_tamano_maximo_mb", fallback=10) * 1024 * 1024)
+            archivo.backupCount = config.getint("opciones", "log_copias", fallback=5)
+            archivo.dias_retencion = config.getint("opciones", "log_dias_retencion", fallback=30)
+        finally:
+            archivo.release()
 
     def _add_programa(self, record) -> bool:
         """
         Añade el atributo 'programa' al registro del log.
-        
+
         :param record: Registro del log.
         """
         record.programa = self.programa
@@ -73,6 +228,14 @@ class Logger:
         """
         self.logger.warning(mensaje)
 
+    def muestrear(self) -> bool:
+        """
+        Indica si se debe escribir un mensaje DEBUG de los que se repiten por
+        lote o por mensaje. Se comprueba antes de formatearlo para no pagar
+        el coste en lotes grandes.
+        """
+        return self.muestreo >= 1 or (self.muestreo > 0 and random.random() < self.muestreo)
+
     def debug(self, mensaje: str) -> None:
         """
         Escribe un mensaje de depuración en el archivo de log.
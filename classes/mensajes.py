@@ -0,0 +1,381 @@
+import re
+import codecs
+import binascii
+from email.header import decode_header
+from typing import Dict, List, Optional
+from urllib.parse import unquote_to_bytes
+from classes.respuestas_imap import elegir_parte_de_texto
+
+CUERPO_NO_DISPONIBLE = "Cuerpo no disponible"
+
+_PATRON_PLEGADO = re.compile(rb"\r?\n(?=[ \t])")
+# Nombre de cabecera: ASCII imprimible sin ':' (RFC 5322, 2.2)
+_PATRON_CABECERA = re.compile(rb"^([!-9;-~]+)[ \t]*:[ \t]*(.*?)[ \t\r]*$", re.MULTILINE)
+_PATRON_PARAMETRO = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:\\.|[^"])*"|[^;]*)')
+_PATRON_CONTINUACION = re.compile(r"\*\d+\*?$|\*$")
+# Profundidad máxima de multipart anidados que se recorre
+_PROFUNDIDAD_MAXIMA = 20
+
+
+def _a_texto(datos: bytes, charset: Optional[str] = None) -> str:
+    """
+    Convierte bytes a texto con el charset declarado. Si no hay charset o el
+    servidor declara uno desconocido, se prueba UTF-8 y después latin1.
+    """
+    if charset:
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            charset = None
+    if charset:
+        return datos.decode(charset, errors="replace")
+    try:
+        return datos.decode("utf-8")
+    except UnicodeDecodeError:
+        return datos.decode("latin1")
+
+
+def decodificar_cabecera(valor) -> str:
+    """
+    Decodifica una cabecera RFC 2047 completa, con todos sus fragmentos
+    (=?utf-8?b?...?= =?iso-8859-1?q?...?= texto), cada uno con su charset.
+
+    :param valor: Valor de la cabecera (str o bytes) tal y como aparece en el mensaje.
+    :return: Cabecera decodificada o cadena vacía.
+    """
+    if valor is None:
+        return ""
+    if isinstance(valor, bytes):
+        valor = _a_texto(valor)
+    if "=?" not in valor:
+        return valor
+    try:
+        fragmentos = decode_header(valor)
+    except Exception:
+        return valor
+    # Los fragmentos sin codificar vuelven como bytes raw-unicode-escape
+    return "".join(
+        fragmento if isinstance(fragmento, str)
+        else _a_texto(fragmento, charset) if charset
+        else fragmento.decode("raw-unicode-escape")
+        for fragmento, charset in fragmentos
+    )
+
+
+def decodificar_contenido(datos: bytes, codificacion: Optional[str], charset: Optional[str]) -> str:
+    """
+    Decodifica el contenido de una parte MIME (Content-Transfer-Encoding y charset).
+
+    :param datos: Contenido de la parte tal y como viaja en el mensaje.
+    :param codificacion: Content-Transfer-Encoding (BASE64, QUOTED-PRINTABLE...).
+    :param charset: Charset declarado de la parte.
+    :return: Texto decodificado.
+    """
+    codificacion = (codificacion or "").upper()
+    if codificacion == "BASE64":
+        try:
+            datos = binascii.a2b_base64(datos)
+        except binascii.Error:
+            # Base64 sin relleno o truncado (FETCH parcial): se completa el último bloque
+            limpio = re.sub(rb"[^A-Za-z0-9+/]", b"", datos)
+            limpio = limpio[:-1] if len(limpio) % 4 == 1 else limpio + b"=" * (-len(limpio) % 4)
+            datos = binascii.a2b_base64(limpio)
+    elif codificacion == "QUOTED-PRINTABLE":
+        datos = binascii.a2b_qp(datos)
+    return _a_texto(datos, charset)
+
+
+class DecodificadorIncremental:
+    """
+    Decodifica el Content-Transfer-Encoding de una parte que llega en trozos
+    (FETCH parciales) sin juntarla entera en memoria: en BASE64 se guarda
+    para el trozo siguiente lo que no completa un bloque de 4 caracteres y
+    en QUOTED-PRINTABLE la última línea incompleta.
+    """
+    def __init__(self, codificacion: Optional[str]):
+        """
+        :param codificacion: Content-Transfer-Encoding de la parte.
+        """
+        self.codificacion = (codificacion or "").upper()
+        self._resto = b""
+
+    def decodificar(self, datos: bytes) -> bytes:
+        """
+        Decodifica un trozo y devuelve los bytes que ya se pueden escribir.
+        """
+        if self.codificacion == "BASE64":
+            datos = self._resto + re.sub(rb"[^A-Za-z0-9+/=]", b"", datos)
+            corte = len(datos) - len(datos) % 4
+            self._resto = datos[corte:]
+            return binascii.a2b_base64(datos[:corte]) if corte else b""
+        if self.codificacion == "QUOTED-PRINTABLE":
+            # Un "=" al final puede ser un salto de línea suave o un "=XX" partido
+            datos = self._resto + datos
+            corte = datos.rfind(b"\n") + 1
+            self._resto = datos[corte:]
+            return binascii.a2b_qp(datos[:corte])
+        return datos
+
+    def terminar(self) -> bytes:
+        """
+        Decodifica lo que quede pendiente al llegar el último trozo.
+        """
+        resto, self._resto = self._resto, b""
+        if not resto:
+            return b""
+        if self.codificacion == "BASE64":
+            # Base64 truncado: se descarta el carácter suelto y se completa el relleno
+            resto = resto.rstrip(b"=")
+            resto = resto[:-1] if len(resto) % 4 == 1 else resto + b"=" * (-len(resto) % 4)
+            return binascii.a2b_base64(resto) if resto else b""
+        return binascii.a2b_qp(resto)
+
+
+def separar_cabecera(datos: bytes) -> tuple:
+    """
+    Separa el bloque de cabeceras del cuerpo de un mensaje o parte MIME.
+
+    :return: Tupla (cabeceras, cuerpo) en bytes.
+    """
+    if datos.startswith(b"\r\n") or datos.startswith(b"\n"):
+        return b"", datos[2 if datos.startswith(b"\r\n") else 1:]
+    # Se busca primero la línea en blanco con CRLF y solo antes de ella una con LF
+    crlf = datos.find(b"\n\r\n")
+    lf = datos.find(b"\n\n", 0, crlf if crlf >= 0 else len(datos))
+    if lf >= 0:
+        return datos[:lf].rstrip(b"\r"), datos[lf + 2:]
+    if crlf >= 0:
+        return datos[:crlf].rstrip(b"\r"), datos[crlf + 3:]
+    return datos, b""
+
+
+def parsear_cabeceras(bloque: bytes) -> Dict[str, bytes]:
+    """
+    Parsea un bloque de cabeceras sin construir un email.message.Message.
+    Solo se conserva la primera aparición de cada cabecera.
+
+    :param bloque: Cabeceras en bytes.
+    :return: Diccionario {nombre en minúsculas: valor desplegado en bytes}.
+    """
+    cabeceras = {}
+    for nombre, valor in _PATRON_CABECERA.findall(_PATRON_PLEGADO.sub(b"", bloque)):
+        cabeceras.setdefault(nombre.lower().decode("ascii"), valor)
+    return cabeceras
+
+
+def _tipo_y_parametros(valor: bytes) -> tuple:
+    """
+    Parsea Content-Type o Content-Disposition: "text/plain; charset=utf-8".
+    Admite parámetros RFC 2231 (filename*=utf-8''...) y sus continuaciones.
+
+    :return: Tupla (valor principal en minúsculas, {parámetro: valor}).
+    """
+    texto = _a_texto(valor)
+    principal = texto.split(";", 1)[0].strip().lower()
+    parametros = {}
+    for nombre, contenido in _PATRON_PARAMETRO.findall(texto):
+        contenido = contenido.strip()
+        if contenido.startswith('"') and contenido.endswith('"'):
+            contenido = re.sub(r"\\(.)", r"\1", contenido[1:-1])
+        nombre = nombre.lower()
+        if "*" in nombre:
+            extendido = nombre.endswith("*")
+            nombre = _PATRON_CONTINUACION.sub("", nombre)
+            if extendido:
+                charset, _, contenido = contenido.split("'", 2) if contenido.count("'") >= 2 else ("", "", contenido)
+                contenido = _a_texto(unquote_to_bytes(contenido), charset or None)
+            parametros[nombre] = parametros.get(nombre, "") + contenido
+        else:
+            parametros.setdefault(nombre, contenido)
+    return principal, parametros
+
+
+def _dividir_multipart(cuerpo: bytes, limite: str) -> List[bytes]:
+    """
+    Divide el cuerpo de un multipart por su boundary sin decodificar las partes.
+    Si el mensaje está truncado, la última parte llega hasta el final.
+    """
+    delimitador = re.compile(rb"^--" + re.escape(limite.encode("latin1")) + rb"(--)?[ \t]*\r?$", re.MULTILINE)
+    partes = []
+    inicio = None
+    for coincidencia in delimitador.finditer(cuerpo):
+        if inicio is not None:
+            fin = coincidencia.start()
+            # El salto de línea anterior al delimitador pertenece al delimitador
+            if cuerpo[fin - 1:fin] == b"\n":
+                fin -= 1
+            if cuerpo[fin - 1:fin] == b"\r":
+                fin -= 1
+            partes.append(cuerpo[inicio:fin])
+        if coincidencia.group(1):
+            return partes
+        inicio = coincidencia.end() + 1
+    if inicio is not None:
+        partes.append(cuerpo[inicio:])
+    return partes
+
+
+def estructura_mime(datos: bytes, cabeceras: Optional[Dict[str, bytes]] = None) -> List[dict]:
+    """
+    Construye localmente el equivalente a BODYSTRUCTURE de un mensaje: solo se
+    leen las cabeceras de cada parte y los delimitadores, nunca se decodifica
+    el contenido (adjuntos incluidos).
+
+    :param datos: Mensaje RFC 822 en bytes.
+    :param cabeceras: Cabeceras del mensaje ya parseadas, para no repetir el trabajo.
+    :return: Lista de partes hoja con el formato de partes_bodystructure y,
+             además, "contenido" con los bytes sin decodificar de la parte.
+    """
+    partes = []
+    _recorrer(datos, "", partes, 0, cabeceras)
+    return partes
+
+
+def _recorrer(datos: bytes, prefijo: str, partes: list, profundidad: int,
+              cabeceras: Optional[Dict[str, bytes]] = None) -> None:
+    bloque, cuerpo = separar_cabecera(datos)
+    if cabeceras is None:
+        cabeceras = parsear_cabeceras(bloque)
+    tipo, parametros = _tipo_y_parametros(cabeceras.get("content-type", b""))
+    tipo = tipo or "text/plain"
+
+    if tipo.startswith("multipart/") and parametros.get("boundary") and profundidad < _PROFUNDIDAD_MAXIMA:
+        for numero, hija in enumerate(_dividir_multipart(cuerpo, parametros["boundary"]), start=1):
+            _recorrer(hija, f"{prefijo}{numero}.", partes, profundidad + 1)
+        return
+
+    disposicion, parametros_disposicion = _tipo_y_parametros(cabeceras.get("content-disposition", b""))
+    nombre = parametros.get("name") or parametros_disposicion.get("filename")
+    partes.append({
+        "parte": prefijo.rstrip(".") or "TEXT",
+        "tipo": tipo,
+        "charset": parametros.get("charset"),
+        "codificacion": _a_texto(cabeceras.get("content-transfer-encoding", b"7BIT")).strip().upper(),
+        "tamano": len(cuerpo),
+        "nombre": decodificar_cabecera(nombre) if nombre else None,
+        # Un mensaje reenviado es un adjunto, como en partes_bodystructure
+        "adjunto": tipo == "message/rfc822" or bool(nombre) or disposicion == "attachment",
+        "contenido": cuerpo,
+    })
+
+
+class MensajeCorreo:
+    """
+    Correo decodificado bajo demanda. Al crearlo solo se guarda una referencia
+    a los bytes recibidos: las cabeceras se parsean la primera vez que se
+    consultan y el cuerpo solo si se pide, eligiendo la parte text/html o
+    text/plain sin decodificar los adjuntos.
+
+    Admite el acceso por clave del diccionario que devolvía antes
+    decodificar_correos (correo["asunto"], correo["cuerpo"]...).
+    """
+    __slots__ = ("uid", "_datos", "_cabeceras", "_partes", "_cuerpo")
+
+    CLAVES = ("asunto", "remitente", "fecha", "cuerpo")
+
+    def __init__(self, datos: bytes, uid: Optional[int] = None, cuerpo: Optional[str] = None):
+        """
+        :param datos: Mensaje completo, o solo sus cabeceras, en bytes.
+        :param uid: UID del mensaje, si se conoce.
+        :param cuerpo: Cuerpo ya decodificado (por ejemplo, descargado por separado).
+        """
+        self.uid = uid
+        self._datos = datos
+        self._cabeceras = None
+        self._partes = None
+        self._cuerpo = cuerpo
+
+    @property
+    def cabeceras(self) -> Dict[str, bytes]:
+        """
+        Cabeceras del mensaje sin decodificar ({nombre en minúsculas: bytes}).
+        """
+        if self._cabeceras is None:
+            self._cabeceras = parsear_cabeceras(separar_cabecera(self._datos)[0])
+        return self._cabeceras
+
+    def cabecera(self, nombre: str) -> str:
+        """
+        Devuelve una cabecera decodificada (RFC 2047).
+
+        :param nombre: Nombre de la cabecera.
+        :return: Valor decodificado o cadena vacía.
+        """
+        return decodificar_cabecera(self.cabeceras.get(nombre.lower()))
+
+    @property
+    def asunto(self) -> str:
+        return self.cabecera("Subject")
+
+    @property
+    def remitente(self) -> str:
+        return self.cabecera("From")
+
+    @property
+    def fecha(self) -> Optional[str]:
+        valor = self.cabeceras.get("date")
+        return _a_texto(valor) if valor is not None else None
+
+    @property
+    def partes(self) -> List[dict]:
+        """
+        Partes hoja del mensaje (ver estructura_mime), calculadas la primera vez.
+        """
+        if self._partes is None:
+            self._partes = estructura_mime(self._datos, self.cabeceras)
+        return self._partes
+
+    @property
+    def cuerpo(self) -> str:
+        """
+        Texto de la parte text/html (o text/plain) con su charset declarado.
+        """
+        if self._cuerpo is None:
+            parte = elegir_parte_de_texto(self.partes)
+            if parte is None:
+                self._cuerpo = CUERPO_NO_DISPONIBLE
+            else:
+                self._cuerpo = decodificar_contenido(parte["contenido"], parte["codificacion"], parte["charset"])
+        return self._cuerpo
+
+    @cuerpo.setter
+    def cuerpo(self, valor: str) -> None:
+        self._cuerpo = valor
+
+    def textos(self) -> str:
+        """
+        Devuelve el texto de todas las partes text/*, unidas por saltos de línea,
+        como lo vería un SEARCH BODY del servidor.
+        """
+        return "\n".join(
+            decodificar_contenido(parte["contenido"], parte["codificacion"], parte["charset"])
+            for parte in self.partes if parte["tipo"].startswith("text/")
+        )
+
+    def como_diccionario(self) -> dict:
+        """
+        :return: Diccionario {"asunto", "remitente", "fecha", "cuerpo"}.
+        """
+        return {clave: getattr(self, clave) for clave in self.CLAVES}
+
+    def keys(self) -> tuple:
+        return self.CLAVES
+
+    def items(self) -> list:
+        return [(clave, getattr(self, clave)) for clave in self.CLAVES]
+
+    def get(self, clave: str, defecto=None):
+        return getattr(self, clave) if clave in self.CLAVES else defecto
+
+    def __getitem__(self, clave: str):
+        if clave not in self.CLAVES:
+            raise KeyError(clave)
+        return getattr(self, clave)
+
+    def __setitem__(self, clave: str, valor) -> None:
+        if clave != "cuerpo":
+            raise KeyError(clave)
+        self.cuerpo = valor
+
+    def __repr__(self) -> str:
+        return f"MensajeCorreo(uid={self.uid!r}, asunto={self.asunto!r}, remitente={self.remitente!r})"
@@ -0,0 +1,240 @@
+import os
+import json
+import bisect
+import threading
+import configparser
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+# Límites superiores (segundos) de las cubetas del histograma de latencia
+CUBETAS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Comando:
+    """
+    Estadísticas acumuladas de un tipo de comando IMAP de una cuenta.
+    """
+    __slots__ = ("total", "estados", "enviados", "recibidos", "suma", "minimo", "maximo", "cubetas")
+
+    def __init__(self):
+        self.total = 0
+        self.estados = Counter()
+        self.enviados = 0
+        self.recibidos = 0
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = 0.0
+        # Una cubeta por límite más la de +Inf (no acumulativas)
+        self.cubetas = [0] * (len(CUBETAS_LATENCIA) + 1)
+
+    def percentil(self, p: float) -> Optional[float]:
+        """
+        Estima un percentil con el límite superior de su cubeta (el máximo
+        observado si cae en la última).
+        """
+        if not self.total:
+            return None
+        objetivo = p * self.total
+        acumulado = 0
+        for indice, cantidad in enumerate(self.cubetas):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                limite = CUBETAS_LATENCIA[indice] if indice < len(CUBETAS_LATENCIA) else self.maximo
+                return min(limite, self.maximo)
+        return self.maximo
+
+
+class Metricas:
+    """
+    Registro de métricas en memoria, seguro entre hilos: latencia, bytes y
+    estado de cada comando IMAP, y contadores de mensajes por cuenta y
+    etiqueta (clasificados, movidos, fallidos...). Se exporta como resumen
+    JSON o en el formato de texto de Prometheus.
+    """
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self.comandos: Dict[Tuple[str, str], _Comando] = {}
+        self.contadores: Dict[Tuple[str, str, str], int] = Counter()
+
+    def observar_comando(self, cuenta: str, comando: str, duracion: float, estado: str,
+                         enviados: int = 0, recibidos: int = 0) -> None:
+        """
+        Registra la ejecución de un comando IMAP.
+
+        :param cuenta: Usuario de la cuenta.
+        :param comando: Tipo de comando ("SELECT", "UID FETCH"...).
+        :param duracion: Segundos desde el envío hasta la respuesta etiquetada.
+        :param estado: "OK", "NO", "BAD" o "ERROR" (excepción).
+        :param enviados: Bytes enviados al servidor.
+        :param recibidos: Bytes recibidos del servidor.
+        """
+        with self._bloqueo:
+            datos = self.comandos.get((cuenta, comando))
+            if datos is None:
+                datos = self.comandos[(cuenta, comando)] = _Comando()
+            datos.total += 1
+            datos.estados[estado] += 1
+            datos.enviados += enviados
+            datos.recibidos += recibidos
+            datos.suma += duracion
+            datos.minimo = duracion if datos.minimo is None else min(datos.minimo, duracion)
+            datos.maximo = max(datos.maximo, duracion)
+            datos.cubetas[bisect.bisect_left(CUBETAS_LATENCIA, duracion)] += 1
+
+    def sumar_bytes(self, cuenta: str, comando: str, enviados: int, recibidos: int) -> None:
+        """
+        Suma bytes a un comando sin contar una ejecución (p. ej. el total de
+        un FETCH en pipeline, cuyos bytes no se pueden repartir por comando).
+        """
+        with self._bloqueo:
+            datos = self.comandos.get((cuenta, comando))
+            if datos is None:
+                datos = self.comandos[(cuenta, comando)] = _Comando()
+            datos.enviados += enviados
+            datos.recibidos += recibidos
+
+    def incrementar(self, nombre: str, cuenta: str, etiqueta: str = "", valor: int = 1) -> None:
+        """
+        Incrementa un contador de mensajes.
+
+        :param nombre: Nombre del contador ("mensajes_movidos"...).
+        :param cuenta: Usuario de la cuenta.
+        :param etiqueta: Etiqueta "padre/hija" (vacía si no aplica).
+        :param valor: Cantidad a sumar.
+        """
+        if valor:
+            with self._bloqueo:
+                self.contadores[(nombre, cuenta, etiqueta)] += valor
+
+    def reiniciar(self) -> None:
+        """
+        Descarta todas las métricas acumuladas.
+        """
+        with self._bloqueo:
+            self.comandos.clear()
+            self.contadores.clear()
+
+    def resumen(self) -> dict:
+        """
+        :return: Diccionario serializable a JSON con las métricas por cuenta.
+        """
+        resultado = {}
+        with self._bloqueo:
+            for (cuenta, comando), datos in sorted(self.comandos.items()):
+                comandos = resultado.setdefault(cuenta, {"comandos": {}, "contadores": {}})["comandos"]
+                comandos[comando] = {
+                    "total": datos.total,
+                    "estados": dict(datos.estados),
+                    "bytes_enviados": datos.enviados,
+                    "bytes_recibidos": datos.recibidos,
+                    "segundos": round(datos.suma, 6),
+                    "minimo": datos.minimo,
+                    "maximo": datos.maximo if datos.total else None,
+                    "p50": datos.percentil(0.5),
+                    "p90": datos.percentil(0.9),
+                    "p99": datos.percentil(0.99),
+                }
+            for (nombre, cuenta, etiqueta), valor in sorted(self.contadores.items()):
+                contadores = resultado.setdefault(cuenta, {"comandos": {}, "contadores": {}})["contadores"]
+                if etiqueta:
+                    contadores.setdefault(nombre, {})[etiqueta] = valor
+                else:
+                    contadores[nombre] = valor
+        return resultado
+
+    def prometheus(self) -> str:
+        """
+        :return: Métricas en el formato de texto de Prometheus (exposition format 0.0.4).
+        """
+        lineas = []
+        with self._bloqueo:
+            comandos = sorted(self.comandos.items())
+            contadores = sorted(self.contadores.items())
+
+        lineas += ["# HELP correo_imap_comando_segundos Latencia de los comandos IMAP.",
+                   "# TYPE correo_imap_comando_segundos histogram"]
+        for (cuenta, comando), datos in comandos:
+            etiquetas = f'cuenta="{_escapar(cuenta)}",comando="{_escapar(comando)}"'
+            acumulado = 0
+            for limite, cantidad in zip(CUBETAS_LATENCIA + ("+Inf",), datos.cubetas):
+                acumulado += cantidad
+                lineas.append(f'correo_imap_comando_segundos_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+            lineas.append(f"correo_imap_comando_segundos_sum{{{etiquetas}}} {datos.suma:.6f}")
+            lineas.append(f"correo_imap_comando_segundos_count{{{etiquetas}}} {datos.total}")
+
+        lineas += ["# HELP correo_imap_comandos_total Comandos IMAP por estado de la respuesta.",
+                   "# TYPE correo_imap_comandos_total counter"]
+        for (cuenta, comando), datos in comandos:
+            for estado, cantidad in sorted(datos.estados.items()):
+                lineas.append(f'correo_imap_comandos_total{{cuenta="{_escapar(cuenta)}",'
+                              f'comando="{_escapar(comando)}",estado="{_escapar(estado)}"}} {cantidad}')
+
+        for sentido in ("enviados", "recibidos"):
+            lineas += [f"# HELP correo_imap_bytes_{sentido}_total Bytes {sentido} por tipo de comando.",
+                       f"# TYPE correo_imap_bytes_{sentido}_total counter"]
+            for (cuenta, comando), datos in comandos:
+                lineas.append(f'correo_imap_bytes_{sentido}_total{{cuenta="{_escapar(cuenta)}",'
+                              f'comando="{_escapar(comando)}"}} {getattr(datos, sentido)}')
+
+        nombres = sorted({nombre for (nombre, _, _), _ in contadores})
+        for nombre in nombres:
+            lineas += [f"# TYPE correo_{nombre}_total counter"]
+            for (otro, cuenta, etiqueta), valor in contadores:
+                if otro == nombre:
+                    lineas.append(f'correo_{nombre}_total{{cuenta="{_escapar(cuenta)}",'
+                                  f'etiqueta="{_escapar(etiqueta)}"}} {valor}')
+        return "\n".join(lineas) + "\n"
+
+    def guardar_json(self, ruta: str) -> None:
+        _escribir(ruta, json.dumps(self.resumen(), indent=4, ensure_ascii=False))
+
+    def guardar_prometheus(self, ruta: str) -> None:
+        _escribir(ruta, self.prometheus())
+
+    def exportar(self, config: configparser.ConfigParser, logger=None) -> None:
+        """
+        Escribe las métricas en los archivos de las opciones 'metricas_json'
+        y 'metricas_prometheus' de [opciones] (si están indicadas) y resume
+        en el log los comandos y los mensajes movidos.
+        """
+        ruta_json = config.get("opciones", "metricas_json", fallback="").strip()
+        ruta_prometheus = config.get("opciones", "metricas_prometheus", fallback="").strip()
+        try:
+            if ruta_json:
+                self.guardar_json(ruta_json)
+            if ruta_prometheus:
+                self.guardar_prometheus(ruta_prometheus)
+        except OSError as e:
+            if logger is not None:
+                logger.error(f"Error al exportar las métricas: {e}")
+            return
+
+        if logger is not None:
+            for cuenta, datos in self.resumen().items():
+                total = sum(c["total"] for c in datos["comandos"].values())
+                segundos = sum(c["segundos"] for c in datos["comandos"].values())
+                movidos = sum(datos["contadores"].get("mensajes_movidos", {}).values())
+                fallidos = sum(datos["contadores"].get("mensajes_fallidos", {}).values())
+                logger.log(f"Métricas de '{cuenta}': {total} comandos IMAP en {segundos:.2f}s, "
+                           f"{movidos} mensajes movidos, {fallidos} fallidos")
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escribir(ruta: str, contenido: str) -> None:
+    """
+    Escritura atómica: el colector de Prometheus nunca lee un archivo a medias.
+    """
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+
+
+# Registro compartido por todas las cuentas y sesiones del proceso
+METRICAS = Metricas()
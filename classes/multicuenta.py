@@ -0,0 +1,104 @@
+import time
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+from classes.correo import Correo
+from classes.logger import Logger
+from classes.metricas import METRICAS
+from classes.notificaciones import Notificador
+from classes.rutas import ruta_configuracion
+
+
+class OrganizadorCuentas:
+    """
+    Organiza varias cuentas de correo en paralelo, una sesión Correo por
+    cuenta en un pool de hilos. Cada cuenta usa sus propias reglas y su
+    propio estado, y el número de conexiones simultáneas contra un mismo
+    servidor está limitado globalmente.
+    """
+    def __init__(self, ruta_config: str = "config.ini"):
+        """
+        :param ruta_config: Ruta del archivo de configuración con las cuentas.
+        """
+        self.logger = Logger("automatizacion_correo")
+        self.ruta_config = ruta_configuracion(ruta_config)
+        self.config = configparser.ConfigParser()
+        self.config.read(self.ruta_config)
+        self.logger.configurar(self.config)
+        self.cuentas = self.listar_cuentas()
+        self.max_por_servidor = self.config.getint("opciones", "max_conexiones_por_servidor", fallback=2)
+        self.max_hilos = self.config.getint("opciones", "max_hilos", fallback=max(len(self.cuentas), 1))
+        self._semaforos = {}
+        self._bloqueo = threading.Lock()
+        # Un único notificador (y una sesión SMTP) para todas las cuentas
+        self.notificador = Notificador.desde_configuracion(self.config, self.logger, self.ruta_config)
+
+    def listar_cuentas(self) -> List[str]:
+        """
+        Devuelve las secciones de cuenta del archivo de configuración:
+        [login] y cualquier sección [cuenta:<nombre>].
+
+        :return: Lista de nombres de sección.
+        """
+        cuentas = [s for s in self.config.sections() if s == "login" or s.startswith("cuenta:")]
+        if not cuentas:
+            self.logger.error("No hay ninguna cuenta en el archivo de configuracion.")
+            raise ValueError("No hay ninguna cuenta en el archivo de configuracion.")
+        return cuentas
+
+    def _semaforo(self, servidor: tuple) -> threading.BoundedSemaphore:
+        """
+        Devuelve el semáforo que limita las conexiones simultáneas a un servidor.
+
+        :param servidor: Tupla (host, puerto).
+        """
+        with self._bloqueo:
+            if servidor not in self._semaforos:
+                self._semaforos[servidor] = threading.BoundedSemaphore(self.max_por_servidor)
+            return self._semaforos[servidor]
+
+    def organizar_cuenta(self, seccion: str) -> dict:
+        """
+        Conecta a una cuenta, organiza su INBOX y se desconecta.
+
+        :param seccion: Sección de config.ini de la cuenta.
+        :return: Resultado de Correo.organizar_bandeja.
+        """
+        # Misma clave para "Imap.Example.com" sin puerto y "imap.example.com:993"
+        ssl = self.config.getboolean(seccion, "imap_ssl", fallback=True)
+        puerto = self.config.get(seccion, "imap_port", fallback="").strip()
+        servidor = (self.config[seccion]["imap_server"].strip().lower(), int(puerto or (993 if ssl else 143)))
+        with self._semaforo(servidor):
+            correo = Correo(self.ruta_config, seccion=seccion, notificador=self.notificador)
+            try:
+                return correo.organizar_bandeja("INBOX")
+            finally:
+                correo.desconectar_del_correo()
+
+    def organizar(self) -> Dict[str, dict]:
+        """
+        Organiza todas las cuentas en paralelo. El fallo de una cuenta no
+        detiene a las demás.
+
+        :return: Diccionario {seccion: resultado} (o {"error": mensaje} si falló).
+        """
+        inicio = time.perf_counter()
+        resultados = {}
+        with ThreadPoolExecutor(max_workers=self.max_hilos) as ejecutor:
+            futuros = {ejecutor.submit(self.organizar_cuenta, seccion): seccion for seccion in self.cuentas}
+            for futuro in as_completed(futuros):
+                seccion = futuros[futuro]
+                try:
+                    resultados[seccion] = futuro.result()
+                    self.logger.log(f"Cuenta '{seccion}': {sum(resultados[seccion]['movidos'].values())} "
+                                    f"de {resultados[seccion]['total']} mensajes movidos")
+                except Exception as e:
+                    self.logger.error(f"Error al organizar la cuenta '{seccion}': {e}")
+                    resultados[seccion] = {"error": str(e)}
+
+        self.logger.log(f"{len(self.cuentas)} cuentas organizadas en {time.perf_counter() - inicio:.2f}s")
+        if self.notificador is not None:
+            self.notificador.cerrar()
+        METRICAS.exportar(self.config, self.logger)
+        return resultados
@@ -0,0 +1,379 @@
+import os
+import ssl
+import time
+import queue
+import smtplib
+import threading
+import configparser
+from datetime import datetime
+from string import Template
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from typing import Dict, List, Optional
+from classes.logger import Logger
+from classes.metricas import METRICAS
+from classes.rutas import ruta_relativa
+
+# Plantillas por defecto (string.Template); se pueden sustituir desde [notificaciones]
+ASUNTO_RESUMEN = "[Correo] $cuenta: $movidos de $total mensajes organizados"
+CUERPO_RESUMEN = """Resumen de la ejecución del $fecha en $cuenta ($bandeja):
+
+$etiquetas
+
+Mensajes nuevos: $total
+Mensajes movidos: $movidos
+Sin etiqueta o no movidos: $pendientes
+"""
+ASUNTO_DIGEST = "[Correo] $total mensajes nuevos en $etiqueta"
+CUERPO_DIGEST = """Mensajes nuevos de $cuenta archivados en $etiqueta:
+
+$mensajes
+$resto"""
+LINEA_DIGEST = "- $fecha | $remitente | $asunto"
+
+
+class Notificador:
+    """
+    Envía por SMTP, al terminar cada pasada, un resumen con los mensajes
+    movidos por etiqueta y un digest por etiqueta con los mensajes nuevos
+    archivados en ella (todos en un único correo).
+
+    Correo solo encola eventos (registrar y terminar_pasada) sin esperar:
+    un hilo en segundo plano acumula los digests, renderiza las plantillas
+    y envía los correos por una única sesión SMTP, que se abre con el
+    primer envío y se cierra cuando la cola queda vacía. Cada envío se
+    reintenta con espera exponencial si el error es transitorio, y los
+    envíos se espacian para no superar envios_por_minuto.
+    """
+    def __init__(self, servidor: str, puerto: int, destinatarios: List[str], remitente: str,
+                 usuario: str = "", password: str = "", ssl: bool = False, starttls: bool = True,
+                 logger: Optional[Logger] = None, resumen: bool = True, digest: tuple = (),
+                 max_mensajes_digest: int = 200, envios_por_minuto: float = 20, reintentos: int = 3,
+                 espera_inicial: float = 1.0, espera_maxima: float = 60.0, timeout: float = 60,
+                 cola_maxima: int = 10000, espera_cierre: float = 30,
+                 plantillas: Optional[Dict[str, str]] = None):
+        """
+        :param servidor: Servidor SMTP.
+        :param puerto: Puerto del servidor SMTP.
+        :param destinatarios: Direcciones a las que se envían las notificaciones.
+        :param remitente: Dirección From de las notificaciones.
+        :param usuario: Usuario SMTP (vacío: sin autenticación, p. ej. un servidor local de pruebas).
+        :param ssl: Si es True se usa SMTP sobre TLS (puerto 465).
+        :param starttls: Si es True (y no ssl) se negocia STARTTLS tras conectar.
+        :param resumen: Si es True se envía el resumen de cada pasada con mensajes nuevos.
+        :param digest: Etiquetas con digest ("*" para todas).
+        :param max_mensajes_digest: Mensajes listados como máximo en cada digest.
+        :param envios_por_minuto: Correos por minuto como máximo (0 = sin límite).
+        :param reintentos: Intentos por correo ante errores transitorios.
+        :param cola_maxima: Eventos pendientes como máximo; si se llena, se descartan.
+        :param espera_cierre: Segundos que cerrar() espera a que salga lo pendiente.
+        :param plantillas: Plantillas que sustituyen a las de por defecto
+                           ({"asunto_resumen", "resumen", "asunto_digest", "digest", "linea_digest"}).
+        """
+        self.servidor = servidor
+        self.puerto = puerto
+        self.destinatarios = destinatarios
+        self.remitente = remitente
+        self.usuario = usuario
+        self.password = password
+        self.ssl = ssl
+        self.starttls = starttls
+        self.logger = logger or Logger("automatizacion_correo")
+        self.resumen = resumen
+        self.digest = set(digest)
+        self.max_mensajes_digest = max_mensajes_digest
+        self.intervalo = 60 / envios_por_minuto if envios_por_minuto else 0.0
+        self.reintentos = max(reintentos, 1)
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.timeout = timeout
+        self.espera_cierre = espera_cierre
+        self.metricas = METRICAS
+        plantillas = plantillas or {}
+        self.plantillas = {
+            "asunto_resumen": Template(plantillas.get("asunto_resumen") or ASUNTO_RESUMEN),
+            "resumen": Template(plantillas.get("resumen") or CUERPO_RESUMEN),
+            "asunto_digest": Template(plantillas.get("asunto_digest") or ASUNTO_DIGEST),
+            "digest": Template(plantillas.get("digest") or CUERPO_DIGEST),
+            "linea_digest": Template(plantillas.get("linea_digest") or LINEA_DIGEST),
+        }
+
+        # {(cuenta, etiqueta): {"total": n, "mensajes": [...]}}; solo lo usa el hilo de envío
+        self._digests = {}
+        self._smtp = None
+        self._ultimo_envio = 0.0
+        self._cola = queue.Queue(maxsize=cola_maxima)
+        self._hilo = threading.Thread(target=self._trabajar, name="notificaciones", daemon=True)
+        self._hilo.start()
+
+    @classmethod
+    def desde_configuracion(cls, config: configparser.ConfigParser, logger: Optional[Logger] = None,
+                            ruta_config: str = "config.ini") -> Optional["Notificador"]:
+        """
+        Crea un notificador a partir de la sección [notificaciones] de config.ini.
+
+        :param config: Configuración cargada.
+        :param logger: Logger donde registrar la actividad.
+        :param ruta_config: Ruta de config.ini (las plantillas se resuelven respecto a su carpeta).
+        :return: Notificador, o None si la sección no existe o activar = no.
+        """
+        seccion = "notificaciones"
+        if not config.has_section(seccion) or not config.getboolean(seccion, "activar", fallback=True):
+            return None
+        destinatarios = [d.strip() for d in config.get(seccion, "destinatarios", fallback="").split(",") if d.strip()]
+        error = None
+        if not config.get(seccion, "smtp_server", fallback="").strip():
+            error = "La sección [notificaciones] necesita un 'smtp_server'."
+        elif not destinatarios:
+            error = "La sección [notificaciones] necesita al menos un destinatario en 'destinatarios'."
+        if error:
+            (logger or Logger("automatizacion_correo")).error(error)
+            raise ValueError(error)
+
+        plantillas = {}
+        for clave in ("asunto_resumen", "asunto_digest", "linea_digest"):
+            plantillas[clave] = config.get(seccion, clave, fallback="", raw=True)
+        for clave in ("resumen", "digest"):
+            ruta = config.get(seccion, f"plantilla_{clave}", fallback="").strip()
+            if ruta:
+                ruta = ruta_relativa(ruta, os.path.dirname(os.path.abspath(ruta_config)))
+                with open(ruta, "r", encoding="utf-8") as archivo:
+                    plantillas[clave] = archivo.read()
+
+        ssl_directo = config.getboolean(seccion, "smtp_ssl", fallback=False)
+        usuario = config.get(seccion, "username", fallback="").strip()
+        return cls(
+            config[seccion]["smtp_server"].strip(),
+            config.getint(seccion, "smtp_port", fallback=465 if ssl_directo else 587),
+            destinatarios,
+            config.get(seccion, "remitente", fallback="").strip() or usuario or destinatarios[0],
+            usuario=usuario,
+            password=config.get(seccion, "password", fallback="").strip(),
+            ssl=ssl_directo,
+            starttls=config.getboolean(seccion, "smtp_starttls", fallback=not ssl_directo),
+            logger=logger,
+            resumen=config.getboolean(seccion, "resumen", fallback=True),
+            digest=tuple(e.strip() for e in config.get(seccion, "digest", fallback="").split(",") if e.strip()),
+            max_mensajes_digest=config.getint(seccion, "max_mensajes_digest", fallback=200),
+            envios_por_minuto=config.getfloat(seccion, "envios_por_minuto", fallback=20),
+            reintentos=config.getint(seccion, "reintentos", fallback=3),
+            timeout=config.getfloat("opciones", "timeout", fallback=60),
+            cola_maxima=config.getint(seccion, "cola_maxima", fallback=10000),
+            espera_cierre=config.getfloat(seccion, "espera_cierre", fallback=30),
+            plantillas=plantillas,
+        )
+
+    def quiere_digest(self, etiqueta: str) -> bool:
+        """
+        Indica si la etiqueta tiene digest (para no leer cabeceras que no se van a usar).
+        """
+        return "*" in self.digest or etiqueta in self.digest
+
+    def registrar(self, cuenta: str, etiqueta: str, mensajes: List[dict]) -> None:
+        """
+        Encola los mensajes movidos a una etiqueta para su digest. No espera:
+        si la cola está llena, los mensajes se descartan con un aviso.
+
+        :param cuenta: Usuario de la cuenta.
+        :param etiqueta: Etiqueta "padre/hija" de destino.
+        :param mensajes: Lista de {"remitente", "asunto", "fecha"}.
+        """
+        if mensajes and self.quiere_digest(etiqueta):
+            self._encolar(("movidos", cuenta, etiqueta, mensajes))
+
+    def terminar_pasada(self, cuenta: str, bandeja: str, resultado: dict) -> None:
+        """
+        Encola el fin de una pasada: se envían los digests acumulados de la
+        cuenta y el resumen. No espera a que se envíen.
+
+        :param cuenta: Usuario de la cuenta.
+        :param bandeja: Bandeja organizada.
+        :param resultado: Diccionario {"total", "movidos": {etiqueta: n}} de organizar_bandeja.
+        """
+        self._encolar(("pasada", cuenta, bandeja, resultado))
+
+    def _encolar(self, evento: tuple) -> None:
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            self.logger.warning(f"Cola de notificaciones llena: se descarta el evento '{evento[0]}' de {evento[1]}")
+            self.metricas.incrementar("notificaciones_descartadas", evento[1])
+
+    def cerrar(self, timeout: Optional[float] = None) -> None:
+        """
+        Espera a que se envíe lo pendiente (como mucho timeout segundos, por
+        defecto espera_cierre), detiene el hilo y cierra la sesión SMTP.
+        """
+        if not self._hilo.is_alive():
+            return
+        timeout = self.espera_cierre if timeout is None else timeout
+        try:
+            self._cola.put(None, timeout=timeout)
+        except queue.Full:
+            self.logger.warning("No se pudieron enviar todas las notificaciones pendientes antes de cerrar")
+            return
+        self._hilo.join(timeout)
+        if self._hilo.is_alive():
+            self.logger.warning("No se pudieron enviar todas las notificaciones pendientes antes de cerrar")
+
+    def _trabajar(self) -> None:
+        """
+        Bucle del hilo de envío.
+        """
+        while True:
+            evento = self._cola.get()
+            if evento is None:
+                self._cerrar_sesion()
+                return
+            try:
+                if evento[0] == "movidos":
+                    self._acumular(*evento[1:])
+                else:
+                    self._enviar_pasada(*evento[1:])
+            except Exception as e:
+                self.logger.error(f"Error al procesar la notificación '{evento[0]}' de {evento[1]}: {e}")
+            # Una sesión SMTP por pasada: se cierra en cuanto no queda nada por enviar
+            if self._cola.empty():
+                self._cerrar_sesion()
+
+    def _acumular(self, cuenta: str, etiqueta: str, mensajes: List[dict]) -> None:
+        """
+        Añade mensajes al digest de la etiqueta; solo se guardan los que se van a listar.
+        """
+        digest = self._digests.setdefault((cuenta, etiqueta), {"total": 0, "mensajes": []})
+        digest["total"] += len(mensajes)
+        digest["mensajes"].extend(mensajes[:self.max_mensajes_digest - len(digest["mensajes"])])
+
+    def _enviar_pasada(self, cuenta: str, bandeja: str, resultado: dict) -> None:
+        """
+        Envía los digests acumulados de la cuenta y el resumen de la pasada.
+        """
+        for clave in [clave for clave in self._digests if clave[0] == cuenta]:
+            self._enviar(cuenta, "digest", *self._renderizar_digest(cuenta, clave[1], self._digests.pop(clave)))
+        if self.resumen and resultado.get("total"):
+            self._enviar(cuenta, "resumen", *self._renderizar_resumen(cuenta, bandeja, resultado))
+
+    def _renderizar_resumen(self, cuenta: str, bandeja: str, resultado: dict) -> tuple:
+        """
+        :return: Tupla (asunto, cuerpo) del resumen.
+        """
+        movidos = sum(resultado["movidos"].values())
+        etiquetas = "\n".join(
+            f"  {etiqueta}: {n}"
+            for etiqueta, n in sorted(resultado["movidos"].items()) if n
+        ) or "  (ningún mensaje movido)"
+        valores = {"cuenta": cuenta, "bandeja": bandeja, "total": resultado["total"], "movidos": movidos,
+                   "pendientes": resultado["total"] - movidos, "etiquetas": etiquetas,
+                   "fecha": datetime.now().strftime("%Y-%m-%d %H:%M")}
+        return (self.plantillas["asunto_resumen"].safe_substitute(valores),
+                self.plantillas["resumen"].safe_substitute(valores))
+
+    def _renderizar_digest(self, cuenta: str, etiqueta: str, digest: dict) -> tuple:
+        """
+        :return: Tupla (asunto, cuerpo) del digest de una etiqueta.
+        """
+        lineas = "\n".join(
+            self.plantillas["linea_digest"].safe_substitute(
+                remitente=mensaje.get("remitente") or "", asunto=mensaje.get("asunto") or "",
+                fecha=mensaje.get("fecha") or "")
+            for mensaje in digest["mensajes"]
+        )
+        restantes = digest["total"] - len(digest["mensajes"])
+        valores = {"cuenta": cuenta, "etiqueta": etiqueta, "total": digest["total"], "mensajes": lineas,
+                   "resto": f"... y {restantes} más\n" if restantes else ""}
+        return (self.plantillas["asunto_digest"].safe_substitute(valores),
+                self.plantillas["digest"].safe_substitute(valores))
+
+    def _sesion(self) -> smtplib.SMTP:
+        """
+        Devuelve la sesión SMTP abierta o abre y autentica una nueva.
+        """
+        if self._smtp is None:
+            if self.ssl:
+                smtp = smtplib.SMTP_SSL(self.servidor, self.puerto, timeout=self.timeout,
+                                        context=ssl.create_default_context())
+            else:
+                smtp = smtplib.SMTP(self.servidor, self.puerto, timeout=self.timeout)
+                if self.starttls:
+                    smtp.starttls(context=ssl.create_default_context())
+            try:
+                if self.usuario:
+                    smtp.login(self.usuario, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self.logger.debug(f"Sesión SMTP abierta con {self.servidor}:{self.puerto}")
+        return self._smtp
+
+    def _cerrar_sesion(self, ordenado: bool = True) -> None:
+        """
+        Cierra la sesión SMTP (con QUIT si ordenado es True).
+        """
+        if self._smtp is None:
+            return
+        smtp, self._smtp = self._smtp, None
+        try:
+            if ordenado:
+                smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        finally:
+            smtp.close()
+
+    def _esperar_turno(self) -> None:
+        """
+        Espacia los envíos según envios_por_minuto.
+        """
+        espera = self._ultimo_envio + self.intervalo - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        self._ultimo_envio = time.monotonic()
+
+    def _enviar(self, cuenta: str, tipo: str, asunto: str, cuerpo: str) -> bool:
+        """
+        Envía un correo por la sesión compartida. Los errores transitorios
+        (4xx, desconexión, red) se reintentan con espera exponencial, en una
+        sesión nueva si la anterior se cortó; los permanentes (5xx,
+        destinatarios rechazados) no.
+
+        :param cuenta: Cuenta a la que se refiere la notificación (para métricas y log).
+        :param tipo: "resumen" o "digest".
+        :return: True si el servidor aceptó el correo.
+        """
+        mensaje = EmailMessage()
+        mensaje["From"] = self.remitente
+        mensaje["To"] = ", ".join(self.destinatarios)
+        mensaje["Subject"] = asunto
+        mensaje["Date"] = formatdate(localtime=True)
+        mensaje["Message-ID"] = make_msgid(domain=self.remitente.rpartition("@")[2] or None)
+        mensaje.set_content(cuerpo)
+
+        espera = self.espera_inicial
+        for intento in range(1, self.reintentos + 1):
+            self._esperar_turno()
+            try:
+                self._sesion().send_message(mensaje)
+                self.metricas.incrementar("notificaciones_enviadas", cuenta, tipo)
+                self.logger.log(f"Notificación enviada: {asunto}")
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                error, permanente = e, True
+            except smtplib.SMTPResponseException as e:
+                error, permanente = e, e.smtp_code >= 500
+            except (smtplib.SMTPException, OSError) as e:
+                error, permanente = e, False
+            # Tras un rechazo la sesión sigue siendo válida; tras un corte o un 421 se abre otra
+            if (not isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+                    or getattr(error, "smtp_code", None) == 421):
+                self._cerrar_sesion(ordenado=False)
+            if permanente or intento == self.reintentos:
+                break
+            self.logger.warning(f"Error al enviar la notificación '{asunto}': {error}. "
+                                f"Reintento {intento}/{self.reintentos - 1} en {espera:.1f}s")
+            time.sleep(espera)
+            espera = min(espera * 2, self.espera_maxima)
+
+        self.logger.error(f"No se pudo enviar la notificación '{asunto}'. Detalles: {error}")
+        self.metricas.incrementar("notificaciones_fallidas", cuenta, tipo)
+        return False
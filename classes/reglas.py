@@ -0,0 +1,639 @@
+import os
+import re
+import json
+import hashlib
+import datetime
+import functools
+from collections import deque
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Pattern, Set, Tuple
+
+# Campos de filtro_etiquetas y su correspondencia con las claves SEARCH de IMAP
+CAMPOS = ("remitente", "asunto", "cuerpo")
+CLAVES_SEARCH = {"remitente": "FROM", "asunto": "SUBJECT", "cuerpo": "BODY"}
+# Claves admitidas en cada regla (y en su bloque "excluir", salvo prioridad y excluir)
+CLAVES_REGLA = CAMPOS + ("dominio", "regex", "excluir", "desde", "antes",
+                         "tamano_mayor", "tamano_menor", "prioridad")
+# SEARCH usa los meses en inglés, independientemente del locale
+_MESES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def reglas_desde_etiquetas(arbol_etiquetas: dict, filtro_etiquetas: dict) -> Dict[str, dict]:
+    """
+    Construye las reglas {"padre/hija": filtros} en el orden de arbol_etiquetas.
+
+    :param arbol_etiquetas: Árbol de etiquetas de etiquetas.json.
+    :param filtro_etiquetas: Filtros por etiqueta hija de etiquetas.json.
+    :return: Diccionario ordenado de reglas.
+    """
+    reglas = {}
+    for etiqueta_padre, etiquetas_hijas in arbol_etiquetas.items():
+        for etiqueta_hija in etiquetas_hijas:
+            if etiqueta_hija in filtro_etiquetas:
+                reglas[f"{etiqueta_padre}/{etiqueta_hija}"] = filtro_etiquetas[etiqueta_hija]
+    return reglas
+
+
+class AhoCorasick:
+    """
+    Autómata de Aho-Corasick para buscar muchas subcadenas a la vez en una
+    sola pasada sobre el texto. A diferencia de una expresión regular
+    combinada, encuentra también las coincidencias solapadas ("ea" dentro de
+    "steam"), igual que haría un SEARCH independiente por cada patrón.
+    """
+    def __init__(self, patrones: Iterable[str]):
+        """
+        :param patrones: Subcadenas a buscar (se comparan sin distinguir mayúsculas).
+        """
+        self.transiciones: List[Dict[str, int]] = [{}]
+        self.fallos: List[int] = [0]
+        self.salidas: List[Set[int]] = [set()]
+        self.patrones = [p.casefold() for p in patrones]
+
+        for indice, patron in enumerate(self.patrones):
+            estado = 0
+            for caracter in patron:
+                siguiente = self.transiciones[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self.transiciones)
+                    self.transiciones.append({})
+                    self.fallos.append(0)
+                    self.salidas.append(set())
+                    self.transiciones[estado][caracter] = siguiente
+                estado = siguiente
+            self.salidas[estado].add(indice)
+
+        # Construir los enlaces de fallo por anchura
+        cola = deque(self.transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for caracter, siguiente in self.transiciones[estado].items():
+                cola.append(siguiente)
+                fallo = self.fallos[estado]
+                while fallo and caracter not in self.transiciones[fallo]:
+                    fallo = self.fallos[fallo]
+                destino = self.transiciones[fallo].get(caracter, 0)
+                self.fallos[siguiente] = destino if destino != siguiente else 0
+                self.salidas[siguiente] |= self.salidas[self.fallos[siguiente]]
+
+    def buscar(self, texto: str) -> Set[int]:
+        """
+        Devuelve los índices de los patrones contenidos en el texto.
+
+        :param texto: Texto donde buscar.
+        :return: Conjunto de índices de patrones encontrados.
+        """
+        encontrados = set()
+        estado = 0
+        transiciones, fallos, salidas = self.transiciones, self.fallos, self.salidas
+        for caracter in texto.casefold():
+            while estado and caracter not in transiciones[estado]:
+                estado = fallos[estado]
+            estado = transiciones[estado].get(caracter, 0)
+            if salidas[estado]:
+                encontrados |= salidas[estado]
+        return encontrados
+
+    def como_diccionario(self) -> dict:
+        """
+        Tablas del autómata serializables a JSON (para la caché de reglas).
+        """
+        return {"patrones": self.patrones, "transiciones": self.transiciones, "fallos": self.fallos,
+                "salidas": [sorted(salida) for salida in self.salidas]}
+
+    @classmethod
+    def desde_diccionario(cls, datos: dict) -> "AhoCorasick":
+        """
+        Reconstruye un autómata guardado con como_diccionario sin volver a
+        construir sus tablas.
+
+        :raises ValueError: Si las tablas no son coherentes.
+        """
+        automata = cls.__new__(cls)
+        try:
+            automata.patrones = [str(p) for p in datos["patrones"]]
+            automata.transiciones = [{str(c): int(e) for c, e in t.items()} for t in datos["transiciones"]]
+            automata.fallos = [int(e) for e in datos["fallos"]]
+            automata.salidas = [{int(i) for i in salida} for salida in datos["salidas"]]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Autómata no válido: {e}")
+        # Un estado o un patrón fuera de rango rompería buscar() al clasificar
+        estados = len(automata.transiciones)
+        if not estados or len(automata.fallos) != estados or len(automata.salidas) != estados \
+                or any(not 0 <= e < estados for t in automata.transiciones for e in t.values()) \
+                or any(not 0 <= e < estados for e in automata.fallos) \
+                or any(not 0 <= i < len(automata.patrones) for salida in automata.salidas for i in salida):
+            raise ValueError("Autómata no válido: estados o patrones fuera de rango")
+        return automata
+
+
+def _lista(valor) -> List[str]:
+    """
+    Normaliza el valor de un campo (cadena o lista de alternativas) a una
+    lista sin cadenas vacías.
+    """
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        valor = [valor]
+    return [v.strip() for v in valor if isinstance(v, str) and v.strip()]
+
+
+def _fecha(valor, etiqueta: str, clave: str) -> Optional[datetime.date]:
+    if not valor:
+        return None
+    try:
+        return datetime.date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Regla '{etiqueta}': '{clave}' debe ser una fecha AAAA-MM-DD ({valor!r})")
+
+
+def _entero(valor, etiqueta: str, clave: str) -> Optional[int]:
+    if valor in (None, ""):
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, int) or valor < 0:
+        raise ValueError(f"Regla '{etiqueta}': '{clave}' debe ser un número de bytes ({valor!r})")
+    return valor
+
+
+def citar_imap(valor: str) -> str:
+    """
+    Devuelve una cadena entre comillas para un SEARCH de IMAP, escapando
+    comillas y barras invertidas.
+    """
+    return '"' + valor.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _o_imap(claves: List[str]) -> str:
+    """
+    Une varias claves SEARCH con OR (operador binario y prefijo).
+    """
+    if len(claves) == 1:
+        return claves[0]
+    return f"OR {claves[0]} {_o_imap(claves[1:])}"
+
+
+def _fecha_imap(fecha: datetime.date) -> str:
+    return f"{fecha.day}-{_MESES[fecha.month - 1]}-{fecha.year}"
+
+
+def fecha_de_cabecera(valor: Optional[str]) -> Optional[datetime.date]:
+    """
+    Fecha (en la zona horaria del propio mensaje, como SENTSINCE) de una cabecera Date.
+    """
+    if not valor:
+        return None
+    try:
+        return parsedate_to_datetime(valor).date()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def dominio_remitente(remitente: Optional[str]) -> str:
+    """
+    Dominio de la dirección de una cabecera From, en minúsculas.
+    """
+    return parseaddr(remitente or "")[1].rpartition("@")[2].strip().lower().rstrip(".")
+
+
+class Condiciones:
+    """
+    Condiciones de una regla (o de su bloque "excluir"). Todas se combinan
+    con AND; las listas de valores de un mismo campo son alternativas (OR).
+    """
+    def __init__(self, filtros: dict, etiqueta: str):
+        """
+        :param filtros: Filtros de la etiqueta en etiquetas.json.
+        :param etiqueta: Etiqueta "padre/hija" (para los mensajes de error).
+        """
+        self.patrones = {campo: _lista(filtros.get(campo)) for campo in CAMPOS}
+        self.patrones = {campo: lista for campo, lista in self.patrones.items() if lista}
+        self.dominios = [d.lower().lstrip("@.") for d in _lista(filtros.get("dominio"))]
+
+        regex = filtros.get("regex") or {}
+        if not isinstance(regex, dict) or set(regex) - set(CAMPOS):
+            raise ValueError(f"Regla '{etiqueta}': 'regex' debe ser un objeto con claves {', '.join(CAMPOS)}")
+        self.regex: Dict[str, List[Pattern]] = {}
+        for campo, valores in regex.items():
+            try:
+                compiladas = [re.compile(v, re.IGNORECASE) for v in _lista(valores)]
+            except re.error as e:
+                raise ValueError(f"Regla '{etiqueta}': expresión regular no válida en '{campo}': {e}")
+            if compiladas:
+                self.regex[campo] = compiladas
+
+        self.desde = _fecha(filtros.get("desde"), etiqueta, "desde")
+        self.antes = _fecha(filtros.get("antes"), etiqueta, "antes")
+        self.tamano_mayor = _entero(filtros.get("tamano_mayor"), etiqueta, "tamano_mayor")
+        self.tamano_menor = _entero(filtros.get("tamano_menor"), etiqueta, "tamano_menor")
+        # Índices de patrón (por campo, más "dominio") asignados por MotorReglas
+        self.indices: Dict[str, frozenset] = {}
+
+    @property
+    def vacia(self) -> bool:
+        """
+        Indica si no hay ninguna condición (una regla así nunca coincide).
+        """
+        return not (self.patrones or self.dominios or self.regex or self.desde or self.antes
+                    or self.tamano_mayor is not None or self.tamano_menor is not None)
+
+    @property
+    def solo_subcadenas(self) -> bool:
+        """
+        Indica si solo hay condiciones de subcadena (remitente, asunto, cuerpo).
+        """
+        return bool(self.patrones) and not (self.dominios or self.regex or self.desde or self.antes
+                                            or self.tamano_mayor is not None or self.tamano_menor is not None)
+
+    def criterio_imap(self) -> Tuple[str, bool]:
+        """
+        Traduce las condiciones a claves SEARCH de IMAP con los valores entre comillas.
+
+        :return: Tupla (criterio, exacto). Si exacto es False el SEARCH devuelve
+                 un superconjunto (regex, dominios) y hay que verificar en local.
+        """
+        claves, exacto = [], True
+        for campo, patrones in self.patrones.items():
+            claves.append(_o_imap([f"{CLAVES_SEARCH[campo]} {citar_imap(p)}" for p in patrones]))
+        if self.dominios:
+            # FROM "@dominio" también encuentra "@dominio.otro": se confirma en local
+            claves.append(_o_imap([f"FROM {citar_imap('@' + d)}" for d in self.dominios]
+                                  + [f"FROM {citar_imap('.' + d)}" for d in self.dominios]))
+            exacto = False
+        if self.regex:
+            exacto = False
+        if self.desde:
+            claves.append(f"SENTSINCE {_fecha_imap(self.desde)}")
+        if self.antes:
+            claves.append(f"SENTBEFORE {_fecha_imap(self.antes)}")
+        if self.tamano_mayor is not None:
+            claves.append(f"LARGER {self.tamano_mayor}")
+        if self.tamano_menor is not None:
+            claves.append(f"SMALLER {self.tamano_menor}")
+        return " ".join(claves), exacto
+
+
+class Regla:
+    """
+    Regla compilada de filtro_etiquetas: condiciones, exclusión, prioridad y
+    su criterio SEARCH equivalente para el modo servidor.
+    """
+    def __init__(self, etiqueta: str, filtros: dict, orden: int):
+        """
+        :param etiqueta: Etiqueta "padre/hija" destino.
+        :param filtros: Filtros de la etiqueta en etiquetas.json.
+        :param orden: Posición en arbol_etiquetas (desempata a igual prioridad).
+        """
+        if not isinstance(filtros, dict):
+            raise ValueError(f"Regla '{etiqueta}': los filtros deben ser un objeto JSON")
+        desconocidas = set(filtros) - set(CLAVES_REGLA)
+        if desconocidas:
+            raise ValueError(f"Regla '{etiqueta}': claves desconocidas {sorted(desconocidas)}")
+
+        self.etiqueta = etiqueta
+        self.orden = orden
+        prioridad = filtros.get("prioridad", 0)
+        if isinstance(prioridad, bool) or not isinstance(prioridad, int):
+            raise ValueError(f"Regla '{etiqueta}': 'prioridad' debe ser un entero ({prioridad!r})")
+        self.prioridad = prioridad
+        self.condiciones = Condiciones(filtros, etiqueta)
+
+        excluir = filtros.get("excluir")
+        self.exclusion = None
+        if excluir:
+            if not isinstance(excluir, dict) or set(excluir) & {"excluir", "prioridad"}:
+                raise ValueError(f"Regla '{etiqueta}': 'excluir' debe ser un objeto sin 'excluir' ni 'prioridad'")
+            desconocidas = set(excluir) - set(CLAVES_REGLA)
+            if desconocidas:
+                raise ValueError(f"Regla '{etiqueta}': claves desconocidas en 'excluir' {sorted(desconocidas)}")
+            exclusion = Condiciones(excluir, etiqueta)
+            self.exclusion = None if exclusion.vacia else exclusion
+
+        # Criterio SEARCH compilado una sola vez (None: la regla nunca coincide)
+        self.criterio, self.exacto = None, False
+        if not self.condiciones.vacia:
+            criterio, exacto = self.condiciones.criterio_imap()
+            if self.exclusion is not None:
+                criterio_exclusion, exacto_exclusion = self.exclusion.criterio_imap()
+                # Un NOT de un superconjunto descartaría mensajes válidos: se excluye en local
+                if exacto_exclusion:
+                    criterio = f"{criterio} NOT ({criterio_exclusion})".strip()
+                else:
+                    exacto = False
+            self.criterio, self.exacto = criterio or "ALL", exacto
+
+    @property
+    def necesita_cuerpo(self) -> bool:
+        return any("cuerpo" in c.patrones or "cuerpo" in c.regex for c in (self.condiciones, self.exclusion) if c)
+
+    @property
+    def necesita_tamano(self) -> bool:
+        return any(c.tamano_mayor is not None or c.tamano_menor is not None
+                   for c in (self.condiciones, self.exclusion) if c)
+
+
+class MotorReglas:
+    """
+    Evalúa todas las reglas de filtro_etiquetas sobre un mensaje en una sola
+    pasada por campo. Las subcadenas (sin distinguir mayúsculas, como el
+    SEARCH de IMAP) se buscan con un autómata por campo y los dominios del
+    remitente con una sola consulta a un diccionario; regex, fechas y
+    tamaños se comprueban después solo para las reglas candidatas. Gana la
+    regla de mayor prioridad y, a igual prioridad, la primera de arbol_etiquetas.
+    """
+    def __init__(self, reglas: Dict[str, dict], automatas: Optional[Dict[str, AhoCorasick]] = None):
+        """
+        :param reglas: Diccionario ordenado {"padre/hija": filtros} (véase reglas_desde_etiquetas).
+        :param automatas: Autómatas por campo ya construidos (de la caché); se
+                          usan solo si buscan exactamente los mismos patrones.
+        """
+        compiladas = [Regla(etiqueta, filtros, orden) for orden, (etiqueta, filtros) in enumerate(reglas.items())]
+        self.reglas: List[Regla] = sorted(compiladas, key=lambda r: (-r.prioridad, r.orden))
+        self.etiquetas = [regla.etiqueta for regla in self.reglas]
+        self.automatas: Dict[str, AhoCorasick] = {}
+        self.dominios: Dict[str, int] = {}
+
+        # Un mismo patrón compartido por varias reglas se busca una sola vez
+        patrones: Dict[str, Dict[str, int]] = {campo: {} for campo in CAMPOS}
+        for regla in self.reglas:
+            for condiciones in (regla.condiciones, regla.exclusion):
+                if condiciones is None:
+                    continue
+                for campo, lista in condiciones.patrones.items():
+                    indices = patrones[campo]
+                    condiciones.indices[campo] = frozenset(
+                        indices.setdefault(p.casefold(), len(indices)) for p in lista
+                    )
+                if condiciones.dominios:
+                    condiciones.indices["dominio"] = frozenset(
+                        self.dominios.setdefault(d, len(self.dominios)) for d in condiciones.dominios
+                    )
+
+        automatas = automatas or {}
+        for campo, indices in patrones.items():
+            if indices:
+                automata = automatas.get(campo)
+                if automata is None or automata.patrones != list(indices):
+                    automata = AhoCorasick(indices)
+                self.automatas[campo] = automata
+
+    @property
+    def necesita_cuerpo(self) -> bool:
+        """
+        Indica si alguna regla filtra por el cuerpo del mensaje.
+        """
+        return any(regla.necesita_cuerpo for regla in self.reglas)
+
+    @property
+    def necesita_tamano(self) -> bool:
+        """
+        Indica si alguna regla filtra por el tamaño del mensaje.
+        """
+        return any(regla.necesita_tamano for regla in self.reglas)
+
+    def _encontrados(self, textos: Dict[str, str]) -> Dict[str, Set[int]]:
+        encontrados = {campo: automata.buscar(textos[campo]) for campo, automata in self.automatas.items()}
+        if self.dominios:
+            # "a.b.ejemplo.com" coincide con "a.b.ejemplo.com", "b.ejemplo.com" y "ejemplo.com"
+            partes = dominio_remitente(textos["remitente"]).split(".")
+            encontrados["dominio"] = {
+                self.dominios[sufijo]
+                for sufijo in (".".join(partes[i:]) for i in range(len(partes)))
+                if sufijo in self.dominios
+            }
+        return encontrados
+
+    @staticmethod
+    def _cumple(condiciones: Condiciones, encontrados: Dict[str, Set[int]], textos: Dict[str, str],
+                fecha: Optional[str], tamano: Optional[int]) -> bool:
+        for campo, indices in condiciones.indices.items():
+            if indices.isdisjoint(encontrados[campo]):
+                return False
+        for campo, expresiones in condiciones.regex.items():
+            if not any(expresion.search(textos[campo]) for expresion in expresiones):
+                return False
+        if condiciones.desde or condiciones.antes:
+            dia = fecha_de_cabecera(fecha)
+            if dia is None or (condiciones.desde and dia < condiciones.desde) \
+                    or (condiciones.antes and dia >= condiciones.antes):
+                return False
+        if condiciones.tamano_mayor is not None and (tamano is None or tamano <= condiciones.tamano_mayor):
+            return False
+        if condiciones.tamano_menor is not None and (tamano is None or tamano >= condiciones.tamano_menor):
+            return False
+        return True
+
+    def coincide(self, regla: Regla, remitente: str, asunto: str, cuerpo: Optional[str] = None,
+                 fecha: Optional[str] = None, tamano: Optional[int] = None) -> bool:
+        """
+        Evalúa una sola regla (p. ej. para verificar en local un SEARCH no exacto).
+        """
+        textos = {"remitente": remitente or "", "asunto": asunto or "", "cuerpo": cuerpo or ""}
+        return self._coincide(regla, self._encontrados(textos), textos, fecha, tamano)
+
+    def _coincide(self, regla: Regla, encontrados: Dict[str, Set[int]], textos: Dict[str, str],
+                  fecha: Optional[str], tamano: Optional[int]) -> bool:
+        # Una regla sin condiciones no genera un SEARCH válido: nunca coincide
+        if regla.condiciones.vacia or not self._cumple(regla.condiciones, encontrados, textos, fecha, tamano):
+            return False
+        return regla.exclusion is None or not self._cumple(regla.exclusion, encontrados, textos, fecha, tamano)
+
+    def clasificar(self, remitente: str, asunto: str, cuerpo: Optional[str] = None,
+                   fecha: Optional[str] = None, tamano: Optional[int] = None) -> Optional[str]:
+        """
+        Devuelve la etiqueta destino de un mensaje.
+
+        :param remitente: Cabecera From decodificada.
+        :param asunto: Cabecera Subject decodificada.
+        :param cuerpo: Texto del cuerpo (solo necesario si alguna regla lo usa).
+        :param fecha: Cabecera Date (solo si alguna regla usa desde/antes).
+        :param tamano: Tamaño RFC822.SIZE en bytes (solo si alguna regla lo usa).
+        :return: Etiqueta "padre/hija" de la regla que gana o None.
+        """
+        textos = {"remitente": remitente or "", "asunto": asunto or "", "cuerpo": cuerpo or ""}
+        encontrados = self._encontrados(textos)
+
+        for regla in self.reglas:
+            if self._coincide(regla, encontrados, textos, fecha, tamano):
+                return regla.etiqueta
+
+        return None
+
+    def conflictos(self) -> List[str]:
+        """
+        Detecta reglas que nunca se aplicarán (sin condiciones o tapadas por
+        otra de mayor precedencia que coincide con todos sus mensajes) y
+        reglas que pueden solaparse porque un valor contiene al otro.
+
+        :return: Lista de avisos legibles.
+        """
+        avisos = []
+        for regla in self.reglas:
+            if regla.condiciones.vacia:
+                avisos.append(f"La regla '{regla.etiqueta}' no tiene condiciones y nunca se aplicará.")
+
+        for i, ganadora in enumerate(self.reglas):
+            if ganadora.condiciones.vacia:
+                continue
+            for perdedora in self.reglas[i + 1:]:
+                if perdedora.condiciones.vacia:
+                    continue
+                if _cubre(ganadora, perdedora):
+                    avisos.append(f"La regla '{perdedora.etiqueta}' nunca se aplicará: '{ganadora.etiqueta}' "
+                                  f"(prioridad {ganadora.prioridad}) coincide con todos sus mensajes.")
+                    continue
+                solape = _solape(ganadora.condiciones, perdedora.condiciones)
+                if solape:
+                    avisos.append(f"Las reglas '{ganadora.etiqueta}' y '{perdedora.etiqueta}' pueden coincidir "
+                                  f"con el mismo mensaje ({solape}); se aplica '{ganadora.etiqueta}'.")
+        return avisos
+
+    def simular(self, mensajes: Iterable[dict]) -> dict:
+        """
+        Evalúa las reglas sobre mensajes ya indexados, sin tocar el servidor.
+
+        :param mensajes: Diccionarios con "remitente", "asunto", "cuerpo" y,
+                         opcionalmente, "fecha", "tamano" y "carpeta" (carpeta
+                         actual del mensaje).
+        :return: Diccionario {"total", "por_etiqueta": {etiqueta: n},
+                 "sin_etiqueta": [mensajes], "cambios": [(mensaje, etiqueta)]}.
+                 Los cambios son los mensajes que acabarían en otra carpeta.
+        """
+        resultado = {"total": 0, "por_etiqueta": {etiqueta: 0 for etiqueta in self.etiquetas},
+                     "sin_etiqueta": [], "cambios": []}
+        for mensaje in mensajes:
+            resultado["total"] += 1
+            etiqueta = self.clasificar(mensaje.get("remitente"), mensaje.get("asunto"), mensaje.get("cuerpo"),
+                                       mensaje.get("fecha"), mensaje.get("tamano"))
+            if etiqueta is None:
+                resultado["sin_etiqueta"].append(mensaje)
+            else:
+                resultado["por_etiqueta"][etiqueta] += 1
+                if mensaje.get("carpeta") is not None and mensaje["carpeta"] != etiqueta:
+                    resultado["cambios"].append((mensaje, etiqueta))
+        return resultado
+
+
+def _cubre(ganadora: Regla, perdedora: Regla) -> bool:
+    """
+    Indica si todo mensaje que cumple la regla perdedora cumple también la
+    ganadora. Solo se decide para reglas ganadoras de subcadenas y dominios
+    sin exclusiones; en el resto de casos se responde False.
+    """
+    a, b = ganadora.condiciones, perdedora.condiciones
+    if ganadora.exclusion is not None or a.regex or a.desde or a.antes \
+            or a.tamano_mayor is not None or a.tamano_menor is not None:
+        return False
+    for campo, patrones in a.patrones.items():
+        # Cada alternativa de la perdedora debe contener alguna de la ganadora
+        if campo not in b.patrones or not all(
+            any(p.casefold() in q.casefold() for p in patrones) for q in b.patrones[campo]
+        ):
+            return False
+    if a.dominios:
+        if not b.dominios or not all(
+            any(q == d or q.endswith("." + d) for d in a.dominios) for q in b.dominios
+        ):
+            return False
+    return True
+
+
+def _solape(a: Condiciones, b: Condiciones) -> Optional[str]:
+    """
+    Describe un posible solape entre dos reglas: un valor de un mismo campo
+    contenido en otro, o un dominio igual o subdominio de otro.
+    """
+    for campo in CAMPOS:
+        for p in a.patrones.get(campo, []):
+            for q in b.patrones.get(campo, []):
+                if p.casefold() in q.casefold() or q.casefold() in p.casefold():
+                    return f"{campo}: '{p}' / '{q}'"
+    for p in a.dominios:
+        for q in b.dominios:
+            if p == q or p.endswith("." + q) or q.endswith("." + p):
+                return f"dominio: '{p}' / '{q}'"
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _huella_compilador() -> bytes:
+    """
+    Hash del código de este módulo: si cambia el compilador, la caché no vale.
+    """
+    with open(__file__, "rb") as archivo:
+        return hashlib.sha256(archivo.read()).digest()
+
+
+def _leer_cache(ruta: str) -> dict:
+    """
+    Lee una caché de reglas. En sistemas POSIX solo se acepta si es del
+    usuario actual y nadie más puede escribirla.
+
+    :raises ValueError: Si el propietario o los permisos no son seguros.
+    """
+    with open(ruta, encoding="utf-8") as archivo:
+        if hasattr(os, "getuid"):
+            informacion = os.fstat(archivo.fileno())
+            if informacion.st_uid != os.getuid() or informacion.st_mode & 0o022:
+                raise ValueError(f"Caché de reglas con propietario o permisos no seguros: {ruta}")
+        return json.load(archivo)
+
+
+def motor_desde_etiquetas(etiquetas: dict, huella: str, carpeta_cache: Optional[str] = None,
+                          origen: str = "") -> Tuple[MotorReglas, List[str]]:
+    """
+    Compila las reglas de etiquetas.json o las carga ya compiladas de la
+    caché en disco. Cada caché se identifica por el archivo de reglas y por
+    el hash de su contenido y del código de este módulo, así que un cambio en
+    cualquiera de los dos la invalida. Al guardar una nueva solo se borran
+    las anteriores del mismo archivo de reglas: la carpeta puede ser
+    compartida por varias cuentas con reglas distintas.
+
+    La caché es JSON (reglas, autómatas y avisos) y nunca ejecuta código al
+    leerla: el motor se reconstruye a partir de las reglas de etiquetas.json,
+    y la caché solo se usa si guarda exactamente esas reglas.
+
+    :param etiquetas: Contenido de etiquetas.json.
+    :param huella: Hash (hexadecimal) del contenido del archivo de reglas.
+    :param carpeta_cache: Carpeta de la caché (None = compilar siempre).
+    :param origen: Ruta del archivo de reglas.
+    :return: Tupla (motor, avisos de reglas solapadas o inalcanzables).
+    """
+    reglas = reglas_desde_etiquetas(etiquetas["arbol_etiquetas"], etiquetas["filtro_etiquetas"])
+    ordenadas = [[etiqueta, filtros] for etiqueta, filtros in reglas.items()]
+    ruta = None
+    if carpeta_cache:
+        prefijo = "reglas_" + hashlib.sha256(os.path.abspath(origen).encode() if origen else b"").hexdigest()[:8]
+        clave = hashlib.sha256(huella.encode() + _huella_compilador()).hexdigest()[:16]
+        ruta = os.path.join(carpeta_cache, f"{prefijo}_{clave}.json")
+        try:
+            cache = _leer_cache(ruta)
+            if cache["reglas"] == ordenadas:
+                automatas = {campo: AhoCorasick.desde_diccionario(datos) for campo, datos in cache["automatas"].items()}
+                return MotorReglas(reglas, automatas), [str(aviso) for aviso in cache["avisos"]]
+        except Exception:
+            # Sin caché, dañada o de otras reglas: se compila de nuevo
+            pass
+
+    motor = MotorReglas(reglas)
+    avisos = motor.conflictos()
+    if ruta is not None:
+        try:
+            os.makedirs(carpeta_cache, exist_ok=True)
+            # Las cachés de versiones anteriores de este archivo de reglas ya no sirven
+            for nombre in os.listdir(carpeta_cache):
+                if nombre.startswith(prefijo + "_") and nombre.endswith((".json", ".pickle")):
+                    os.remove(os.path.join(carpeta_cache, nombre))
+            temporal = f"{ruta}.tmp"
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            # Solo el usuario puede escribirla, sea cual sea su umask (véase _leer_cache)
+            with os.fdopen(os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w",
+                           encoding="utf-8") as archivo:
+                json.dump({"reglas": ordenadas, "avisos": avisos,
+                           "automatas": {campo: a.como_diccionario() for campo, a in motor.automatas.items()}},
+                          archivo, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        except OSError:
+            pass
+    return motor, avisos
@@ -0,0 +1,326 @@
+import math
+import time
+import socket
+import imaplib
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+from classes.correo import Correo
+from classes.logger import Logger
+from classes.conexiones import SATURACION, GestorConexiones
+from classes.notificaciones import Notificador
+from classes.conjuntos_imap import resumir_ids
+from classes.rutas import ruta_configuracion
+
+
+def _duracion(segundos: float) -> str:
+    """
+    Formatea una duración como "1h02m03s", "2m03s" o "3s".
+    """
+    segundos = int(segundos)
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    if horas:
+        return f"{horas}h{minutos:02d}m{segundos:02d}s"
+    return f"{minutos}m{segundos:02d}s" if minutos else f"{segundos}s"
+
+
+def _es_saturacion(error: BaseException) -> bool:
+    """
+    Indica si un error es señal de un servidor saturado: una caída de la
+    conexión o un tiempo de espera agotado (también al abrir la sesión, donde
+    llegan envueltos en un ValueError) o una respuesta de limitación. Un
+    error de autenticación, de DNS o de programación no lo es.
+    """
+    while error is not None:
+        if isinstance(error, socket.gaierror):
+            return False
+        if isinstance(error, (imaplib.IMAP4.abort, OSError)) or SATURACION.search(str(error).encode()):
+            return True
+        error = error.__context__
+    return False
+
+
+class ControlConcurrencia:
+    """
+    Limita cuántos fragmentos se procesan a la vez y adapta el límite al
+    servidor: se reduce a la mitad cuando una sesión recibe un BYE o una
+    respuesta de limitación, y sube de uno en uno tras varios fragmentos
+    seguidos sin incidencias, hasta el máximo configurado.
+    """
+    def __init__(self, maximo: int, exitos_para_subir: int = 3):
+        """
+        :param maximo: Fragmentos simultáneos como máximo.
+        :param exitos_para_subir: Fragmentos sin incidencias antes de subir el límite.
+        """
+        self.maximo = max(maximo, 1)
+        self.limite = self.maximo
+        self.activos = 0
+        self.exitos_para_subir = exitos_para_subir
+        self._exitos = 0
+        self._condicion = threading.Condition()
+
+    def entrar(self) -> None:
+        """
+        Espera hasta que haya hueco bajo el límite actual.
+        """
+        with self._condicion:
+            while self.activos >= self.limite:
+                self._condicion.wait()
+            self.activos += 1
+
+    def salir(self, saturado: bool, exito: bool = True) -> None:
+        """
+        Libera el hueco y ajusta el límite.
+
+        :param saturado: True si el servidor limitó o cerró la sesión durante el fragmento.
+        :param exito: False si el fragmento falló por otro motivo: ni reduce
+                      el límite ni cuenta para subirlo.
+        """
+        with self._condicion:
+            self.activos -= 1
+            if saturado:
+                self.limite = max(self.limite // 2, 1)
+                self._exitos = 0
+            elif exito:
+                self._exitos += 1
+                if self._exitos >= self.exitos_para_subir and self.limite < self.maximo:
+                    self.limite += 1
+                    self._exitos = 0
+            self._condicion.notify_all()
+
+
+class RellenoParalelo:
+    """
+    Organiza de una vez un buzón grande (relleno inicial) repartiendo sus
+    mensajes pendientes en fragmentos de UIDs consecutivos. Cada fragmento
+    se procesa de principio a fin (búsqueda o descarga de cabeceras,
+    clasificación y movimiento en bloque) en una sesión autenticada propia,
+    con varias sesiones en paralelo.
+
+    Cada mensaje se clasifica con las mismas reglas y la misma precedencia
+    que en Correo.organizar_bandeja, así que el resultado es el de una
+    ejecución secuencial. El progreso guardado solo avanza hasta el último
+    fragmento terminado sin huecos, de modo que una ejecución interrumpida
+    se reanuda sin saltarse ningún mensaje.
+    """
+    def __init__(self, ruta_config: str = "config.ini", seccion: str = "login"):
+        """
+        :param ruta_config: Ruta del archivo de configuración.
+        :param seccion: Sección de config.ini con los datos de la cuenta.
+        """
+        self.logger = Logger("automatizacion_correo")
+        self.ruta_config = ruta_configuracion(ruta_config)
+        self.seccion = seccion
+        self.config = configparser.ConfigParser()
+        self.config.read(self.ruta_config)
+        self.logger.configurar(self.config)
+        self.conexiones = self.config.getint("opciones", "relleno_conexiones", fallback=4)
+        # 0: se reparte en unos cuatro fragmentos por conexión (como mínimo 1000 mensajes cada uno)
+        self.tamano_fragmento = self.config.getint("opciones", "relleno_tamano_fragmento", fallback=0)
+        self.reintentos = self.config.getint("opciones", "relleno_reintentos", fallback=5)
+        self.control = ControlConcurrencia(self.conexiones)
+
+        self.gestor = GestorConexiones.desde_configuracion(self.config, self.logger, seccion=seccion,
+                                                           tamano=self.control.maximo)
+        # Todas las sesiones comparten el notificador: un digest por etiqueta para todo el relleno
+        self.notificador = Notificador.desde_configuracion(self.config, self.logger, self.ruta_config)
+        # Sesión propia del relleno: lo prepara y guarda el progreso. No procesa fragmentos, así
+        # que ningún otro hilo la usa (ni la cierra) mientras se guarda
+        self.correo = Correo(self.ruta_config, gestor=self.gestor, seccion=seccion, notificador=self.notificador)
+        self._libres: List[Correo] = []
+        self._abiertas = 0
+        self._bloqueo = threading.Lock()
+
+    def _tomar_correo(self) -> Correo:
+        """
+        Devuelve una sesión Correo libre o abre una nueva.
+        """
+        with self._bloqueo:
+            if self._libres:
+                return self._libres.pop()
+            self._abiertas += 1
+        try:
+            correo = Correo(self.ruta_config, gestor=self.gestor, seccion=self.seccion, notificador=self.notificador)
+        except Exception:
+            with self._bloqueo:
+                self._abiertas -= 1
+            raise
+        return correo
+
+    def _devolver_correo(self, correo: Correo, descartar: bool = False) -> None:
+        """
+        Deja la sesión libre para otro fragmento. Se cierra si falló o si hay
+        más sesiones abiertas que el límite actual de concurrencia, para no
+        mantener conexiones que el servidor está rechazando.
+        """
+        with self._bloqueo:
+            descartar = descartar or self._abiertas > self.control.limite
+            if descartar:
+                self._abiertas -= 1
+            else:
+                self._libres.append(correo)
+        if descartar and correo.conectado:
+            self.gestor.descartar(correo.imap)
+
+    def procesar_fragmento(self, bandeja: str, uids: list) -> Tuple[Dict[str, int], List[int]]:
+        """
+        Clasifica y mueve un fragmento de UIDs consecutivos en la sesión del
+        hilo. Si el servidor limita o cierra la sesión, se reduce la
+        concurrencia, se espera (exponencialmente) y se repite el fragmento:
+        es idempotente, porque los mensajes ya movidos no siguen en la bandeja.
+        Cualquier otro error se propaga sin reintentos: repetir el fragmento
+        no lo arreglaría.
+
+        :param bandeja: Bandeja de origen.
+        :param uids: UIDs ordenados del fragmento (en bytes).
+        :return: Tupla ({etiqueta: mensajes movidos}, UIDs que no se pudieron mover).
+        """
+        movidos, no_movidos = {}, []
+        espera = self.gestor.espera_inicial
+        for intento in range(1, self.reintentos + 1):
+            saturado, error, correo, saturaciones = False, None, None, 0
+            self.control.entrar()
+            try:
+                correo = self._tomar_correo()
+                saturaciones = correo.imap.saturaciones
+                if correo.bandeja_actual != bandeja:
+                    correo.seleccionar_bandeja(bandeja)
+                    if correo.bandeja_actual != bandeja:
+                        raise RuntimeError(f"No se pudo seleccionar la bandeja '{bandeja}'")
+                for etiqueta, n in correo.clasificar_y_mover(bandeja, uids, int(uids[0]), int(uids[-1])).items():
+                    movidos[etiqueta] = movidos.get(etiqueta, 0) + n
+                # Un reintento repite el fragmento entero: cuentan los fallos del último intento
+                no_movidos = list(correo.no_movidos)
+            except Exception as e:
+                error = e
+            finally:
+                # Solo las respuestas de limitación, las reconexiones y las caídas son saturación
+                if correo is not None and correo.conectado:
+                    saturado = correo.imap.saturaciones > saturaciones
+                saturado = saturado or (error is not None and _es_saturacion(error))
+                # Primero se ajusta el límite: con saturación sobran sesiones abiertas
+                self.control.salir(saturado, exito=error is None)
+                if correo is not None:
+                    self._devolver_correo(correo, descartar=error is not None)
+
+            if not saturado:
+                if error is not None:
+                    raise error
+                break
+            if intento == self.reintentos:
+                if error is not None:
+                    raise error
+                break
+            self.logger.warning(f"El servidor limitó el fragmento {resumir_ids(uids)} ({error or 'limitación'}). "
+                                f"Reintento {intento}/{self.reintentos - 1} en {espera:.1f}s con como máximo "
+                                f"{self.control.limite} conexiones")
+            time.sleep(espera)
+            espera = min(espera * 2, self.gestor.espera_maxima)
+        return movidos, no_movidos
+
+    def rellenar(self, bandeja: str = "INBOX") -> dict:
+        """
+        Organiza todos los mensajes de la bandeja posteriores al último UID
+        procesado, por fragmentos en paralelo, mostrando el progreso y el
+        tiempo estimado en el log.
+
+        :param bandeja: Bandeja a organizar.
+        :return: Diccionario {"total": mensajes pendientes, "movidos": {etiqueta: n},
+                 "fallidos": [conjuntos de UIDs de los fragmentos que no se pudieron procesar]}.
+        """
+        resultado = {"total": 0, "movidos": {}, "fallidos": []}
+        correo = self.correo
+        try:
+            correo.seleccionar_bandeja(bandeja)
+            uidnext, highestmodseq = correo.uidnext, correo.highestmodseq
+            correo.reanudar_movimientos(bandeja)
+
+            ultimo_uid = correo.ultimo_uid_procesado(bandeja)
+            uids = correo.filtrar_correo("ALL", desde_uid=ultimo_uid + 1)
+            if uids is None:
+                self.logger.error(f"No se pudieron buscar los mensajes pendientes de '{bandeja}'")
+                return resultado
+            uids = sorted(uids, key=int)
+            resultado["total"] = len(uids)
+            correo.metricas.incrementar("mensajes_nuevos", correo.username, bandeja, len(uids))
+            if not uids:
+                self.logger.log(f"No hay mensajes pendientes en '{bandeja}'")
+                correo.guardar_progreso(bandeja, ultimo_uid, uidnext, highestmodseq)
+                return resultado
+
+            if correo.crear_carpetas:
+                correo.crear_carpetas_faltantes()
+            correo.motor_reglas()
+        finally:
+            # La conexión vuelve al pool para los fragmentos; la sesión sigue siendo del relleno
+            correo.desconectar_del_correo()
+
+        tamano = self.tamano_fragmento or max(math.ceil(len(uids) / (self.control.maximo * 4)), 1000)
+        fragmentos = [uids[i:i + tamano] for i in range(0, len(uids), tamano)]
+        self.logger.log(f"Relleno de '{bandeja}': {len(uids)} mensajes en {len(fragmentos)} fragmentos "
+                        f"con hasta {self.conexiones} conexiones")
+
+        inicio = time.perf_counter()
+        terminados = [False] * len(fragmentos)
+        frontera = procesados = 0
+        with ThreadPoolExecutor(max_workers=self.control.maximo) as ejecutor:
+            futuros = {ejecutor.submit(self.procesar_fragmento, bandeja, f): i for i, f in enumerate(fragmentos)}
+            for futuro in as_completed(futuros):
+                i = futuros[futuro]
+                try:
+                    movidos, no_movidos = futuro.result()
+                    for etiqueta, n in movidos.items():
+                        resultado["movidos"][etiqueta] = resultado["movidos"].get(etiqueta, 0) + n
+                    if no_movidos:
+                        # El fragmento no cuenta como terminado: el progreso no lo salta
+                        self.logger.error(f"No se pudieron mover {len(no_movidos)} mensajes del fragmento "
+                                          f"{resumir_ids(fragmentos[i])}: {resumir_ids(no_movidos)}")
+                        resultado["fallidos"].append(resumir_ids(fragmentos[i]))
+                    else:
+                        terminados[i] = True
+                except Exception as e:
+                    self.logger.error(f"No se pudo procesar el fragmento {resumir_ids(fragmentos[i])}: {e}")
+                    resultado["fallidos"].append(resumir_ids(fragmentos[i]))
+                procesados += len(fragmentos[i])
+
+                # El progreso solo avanza por fragmentos terminados sin huecos desde el primero;
+                # UIDNEXT y HIGHESTMODSEQ se guardan al final para que STATUS no omita lo pendiente
+                if frontera < len(fragmentos) and terminados[frontera]:
+                    while frontera < len(fragmentos) and terminados[frontera]:
+                        frontera += 1
+                    if frontera < len(fragmentos):
+                        correo.guardar_progreso(bandeja, int(fragmentos[frontera - 1][-1]))
+                self._informar(bandeja, procesados, len(uids), inicio)
+
+        if frontera == len(fragmentos):
+            correo.guardar_progreso(bandeja, int(uids[-1]), uidnext, highestmodseq)
+        if self.notificador is not None:
+            self.notificador.terminar_pasada(correo.username, bandeja, resultado)
+        movidos = sum(resultado["movidos"].values())
+        self.logger.log(f"Relleno de '{bandeja}' terminado en {_duracion(time.perf_counter() - inicio)}: "
+                        f"{movidos} de {len(uids)} mensajes movidos, {len(resultado['fallidos'])} fragmentos fallidos")
+        return resultado
+
+    def _informar(self, bandeja: str, procesados: int, total: int, inicio: float) -> None:
+        """
+        Escribe en el log el avance, el ritmo y el tiempo estimado restante.
+        """
+        transcurrido = time.perf_counter() - inicio
+        ritmo = procesados / transcurrido if transcurrido else 0.0
+        restante = (total - procesados) / ritmo if ritmo else 0.0
+        self.logger.log(f"Relleno de '{bandeja}': {procesados}/{total} mensajes ({procesados / total:.1%}), "
+                        f"{ritmo:.0f} msg/s, ETA {_duracion(restante)}, {self.control.limite} conexiones")
+
+    def cerrar(self) -> None:
+        """
+        Cierra todas las sesiones.
+        """
+        with self._bloqueo:
+            libres, self._libres = self._libres, []
+        for correo in libres + [self.correo]:
+            correo.desconectar_del_correo()
+        self.gestor.cerrar()
+        if self.notificador is not None:
+            self.notificador.cerrar()
@@ -0,0 +1,256 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Elemento FETCH que precede a un literal: BODY[HEADER.FIELDS (FROM)]<0> {123}
+_PATRON_LITERAL = re.compile(
+    rb"((?:BODY|BINARY)\[[^\]]*\](?:<\d+>)?|RFC822(?:\.HEADER|\.TEXT)?) \{\d+\}$", re.IGNORECASE
+)
+_PATRON_INICIO = re.compile(rb"^(\d+) \(")
+_PATRON_LONGITUD = re.compile(rb"\{\d+\}$")
+_PATRON_UID = re.compile(rb"\bUID (\d+)")
+_PATRON_TAMANO = re.compile(rb"\bRFC822\.SIZE (\d+)")
+_PATRON_FLAGS = re.compile(rb"\bFLAGS \(([^)]*)\)")
+_PATRON_COPYUID = re.compile(rb"\bCOPYUID (\d+) ([\d:,]+) ([\d:,]+)", re.IGNORECASE)
+
+
+def agrupar_respuesta_fetch(datos: Iterable) -> Dict[int, dict]:
+    """
+    Agrupa la respuesta de imaplib a un UID FETCH en un diccionario por UID.
+
+    imaplib devuelve una mezcla de bytes (líneas sin literal) y tuplas
+    (prefijo terminado en {n}, literal). Un mismo mensaje puede ocupar varias
+    entradas si se pidieron varias secciones o si el BODYSTRUCTURE contiene
+    literales (p. ej. nombres de adjunto no ASCII).
+
+    :param datos: Lista devuelta por imap.uid("FETCH", ...).
+    :return: Diccionario {uid: {"SEQ": n, "UID": uid, "BODY[...]": bytes, "RFC822.SIZE": int,
+             "FLAGS": [..], "BODYSTRUCTURE": listas anidadas}}.
+    """
+    mensajes = []
+    # Respuesta de cada mensaje sin los literales de sus secciones, para el BODYSTRUCTURE
+    textos = []
+    actual = None
+
+    for entrada in datos:
+        if entrada is None:
+            continue
+        prefijo = entrada[0] if isinstance(entrada, tuple) else entrada
+        inicio = _PATRON_INICIO.match(prefijo)
+        if inicio:
+            actual = {"SEQ": int(inicio.group(1))}
+            mensajes.append(actual)
+            textos.append(bytearray())
+        if actual is None:
+            continue
+
+        # El UID y el resto de metadatos pueden ir antes o después de los literales
+        coincidencia = _PATRON_UID.search(prefijo)
+        if coincidencia:
+            actual["UID"] = int(coincidencia.group(1))
+        coincidencia = _PATRON_TAMANO.search(prefijo)
+        if coincidencia:
+            actual["RFC822.SIZE"] = int(coincidencia.group(1))
+        coincidencia = _PATRON_FLAGS.search(prefijo)
+        if coincidencia:
+            actual["FLAGS"] = coincidencia.group(1).decode(errors="replace").split()
+
+        if not isinstance(entrada, tuple):
+            textos[-1] += prefijo
+            continue
+        elemento = _PATRON_LITERAL.search(prefijo)
+        sin_longitud = _PATRON_LONGITUD.sub(b"", prefijo)
+        if elemento:
+            actual[elemento.group(1).decode().upper()] = entrada[1]
+            textos[-1] += sin_longitud + b"NIL"
+        else:
+            # Literal dentro de una lista (BODYSTRUCTURE): se sustituye por la cadena equivalente
+            textos[-1] += sin_longitud + _citar(entrada[1])
+
+    for mensaje, texto in zip(mensajes, textos):
+        estructura = extraer_bodystructure(bytes(texto))
+        if estructura is not None:
+            mensaje["BODYSTRUCTURE"] = estructura
+
+    return {mensaje["UID"]: mensaje for mensaje in mensajes if "UID" in mensaje}
+
+
+def _citar(valor: bytes) -> bytes:
+    """
+    Convierte el contenido de un literal en una cadena IMAP entre comillas.
+    """
+    return b'"' + valor.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _parsear_lista(texto: bytes, i: int = 0) -> tuple:
+    """
+    Parsea una expresión entre paréntesis de IMAP (átomos, cadenas, NIL y
+    listas anidadas) empezando en la posición i, que debe ser '('.
+
+    :return: Tupla (lista, posición siguiente).
+    """
+    resultado = []
+    i += 1
+    while i < len(texto):
+        c = texto[i:i + 1]
+        if c == b" ":
+            i += 1
+        elif c == b"(":
+            sublista, i = _parsear_lista(texto, i)
+            resultado.append(sublista)
+        elif c == b")":
+            return resultado, i + 1
+        elif c == b'"':
+            j = i + 1
+            valor = bytearray()
+            while j < len(texto) and texto[j:j + 1] != b'"':
+                if texto[j:j + 1] == b"\\":
+                    j += 1
+                valor += texto[j:j + 1]
+                j += 1
+            resultado.append(valor.decode("utf-8", errors="replace"))
+            i = j + 1
+        else:
+            j = i
+            while j < len(texto) and texto[j:j + 1] not in (b" ", b"(", b")"):
+                j += 1
+            atomo = texto[i:j].decode("ascii", errors="replace")
+            resultado.append(None if atomo.upper() == "NIL" else int(atomo) if atomo.isdigit() else atomo)
+            i = j
+    return resultado, i
+
+
+def extraer_bodystructure(texto: bytes):
+    """
+    Extrae y parsea el BODYSTRUCTURE de una respuesta FETCH.
+
+    :param texto: Respuesta que contiene "BODYSTRUCTURE (...)", con los literales
+                  ya sustituidos por cadenas (véase agrupar_respuesta_fetch).
+    :return: Estructura como listas anidadas o None si no aparece.
+    """
+    posicion = texto.upper().find(b"BODYSTRUCTURE (")
+    if posicion < 0:
+        return None
+    estructura, _ = _parsear_lista(texto, posicion + len(b"BODYSTRUCTURE "))
+    return estructura
+
+
+def _parametros(lista) -> dict:
+    """
+    Convierte una lista de parámetros IMAP ("CHARSET" "utf-8") en diccionario.
+    """
+    if not isinstance(lista, list):
+        return {}
+    return {str(lista[i]).lower(): lista[i + 1] for i in range(0, len(lista) - 1, 2)}
+
+
+def partes_bodystructure(estructura, prefijo: str = "") -> list:
+    """
+    Recorre un BODYSTRUCTURE y devuelve sus partes hoja.
+
+    :param estructura: Estructura devuelta por extraer_bodystructure.
+    :param prefijo: Número de la parte padre (uso interno).
+    :return: Lista de diccionarios {"parte", "tipo", "charset", "codificacion",
+             "tamano", "nombre", "adjunto"}. La parte es el especificador de
+             sección para BODY[...] ("1", "2.1"; "TEXT" si el mensaje no es multipart).
+             Un message/rfc822 (mensaje reenviado) es una sola parte adjunta: no
+             se recorre su contenido.
+    """
+    if not isinstance(estructura, list) or not estructura:
+        return []
+
+    if isinstance(estructura[0], list):
+        partes = []
+        numero = 1
+        for hija in estructura:
+            if not isinstance(hija, list):
+                break
+            partes.extend(partes_bodystructure(hija, f"{prefijo}{numero}."))
+            numero += 1
+        return partes
+
+    tipo = f"{estructura[0]}/{estructura[1]}".lower()
+    parametros = _parametros(estructura[2])
+    # Extensiones: MD5 y disposición van tras las líneas (text/*), tras el sobre, el
+    # cuerpo y las líneas (message/rfc822) o tras el tamaño
+    mensaje = tipo == "message/rfc822"
+    extension = estructura[8:] if tipo.startswith("text/") else estructura[10:] if mensaje else estructura[7:]
+    disposicion = extension[1] if len(extension) > 1 and isinstance(extension[1], list) else None
+    parametros_disposicion = _parametros(disposicion[1]) if disposicion and len(disposicion) > 1 else {}
+    nombre = parametros.get("name") or parametros_disposicion.get("filename")
+
+    return [{
+        "parte": prefijo.rstrip(".") or "TEXT",
+        "tipo": tipo,
+        "charset": parametros.get("charset"),
+        "codificacion": (estructura[5] or "7BIT").upper(),
+        "tamano": estructura[6] if isinstance(estructura[6], int) else 0,
+        "nombre": nombre,
+        "adjunto": mensaje or bool(nombre) or (bool(disposicion) and str(disposicion[0]).lower() == "attachment"),
+    }]
+
+
+def parte_de_texto(estructura) -> Optional[dict]:
+    """
+    Elige la parte de texto a mostrar sin recorrer partes binarias:
+    text/html si existe y, si no, text/plain. Se ignoran los adjuntos.
+
+    :param estructura: Estructura devuelta por extraer_bodystructure.
+    :return: Diccionario de la parte (ver partes_bodystructure) o None.
+    """
+    return elegir_parte_de_texto(partes_bodystructure(estructura))
+
+
+def elegir_parte_de_texto(partes: list) -> Optional[dict]:
+    """
+    Elige, entre las partes hoja de un mensaje, text/html si existe y, si no,
+    text/plain. Se ignoran los adjuntos.
+
+    :param partes: Lista de partes con el formato de partes_bodystructure.
+    :return: Diccionario de la parte elegida o None.
+    """
+    partes = [p for p in partes if not p["adjunto"]]
+    for tipo in ("text/html", "text/plain"):
+        for parte in partes:
+            if parte["tipo"] == tipo:
+                return parte
+    return None
+
+
+def _expandir_en_orden(conjunto: bytes) -> List[int]:
+    """
+    Expande un conjunto de UIDs respetando el orden en que aparece.
+    """
+    uids = []
+    for parte in conjunto.split(b","):
+        inicio, _, fin = parte.partition(b":")
+        inicio = int(inicio)
+        fin = int(fin) if fin else inicio
+        paso = 1 if fin >= inicio else -1
+        uids.extend(range(inicio, fin + paso, paso))
+    return uids
+
+
+def extraer_copyuid(datos: Iterable, uids: Optional[Iterable[int]] = None) -> Optional[Tuple[int, Dict[int, int]]]:
+    """
+    Interpreta el código COPYUID (UIDPLUS, RFC 4315) de una respuesta a
+    COPY o MOVE: "COPYUID <uidvalidity> <uids origen> <uids destino>".
+
+    :param datos: Respuesta etiquetada o líneas con el código COPYUID completo.
+    :param uids: UIDs enviados en el comando. Si se indican, solo se acepta un
+                 COPYUID cuyos UIDs de origen estén todos entre ellos (el servidor
+                 omite los que ya no existían).
+    :return: Tupla (uidvalidity del destino, {uid origen: uid destino}) o None.
+    """
+    enviados = set(uids) if uids is not None else None
+    for entrada in datos or []:
+        if not isinstance(entrada, bytes):
+            continue
+        for coincidencia in _PATRON_COPYUID.finditer(entrada):
+            origen = _expandir_en_orden(coincidencia.group(2))
+            destino = _expandir_en_orden(coincidencia.group(3))
+            if len(origen) != len(destino):
+                continue
+            if enviados is not None and not set(origen) <= enviados:
+                continue
+            return int(coincidencia.group(1)), dict(zip(origen, destino))
+    return None
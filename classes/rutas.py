@@ -0,0 +1,68 @@
+import os
+import configparser
+
+# Raíz del proyecto (la carpeta que contiene classes/)
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Reglas por defecto, junto al paquete
+ETIQUETAS_POR_DEFECTO = os.path.join(RAIZ, "classes", "etiquetas.json")
+# Carpetas por defecto del estado (progreso, diarios, caché de reglas) y de los logs
+CARPETA_ESTADO = os.path.join(RAIZ, "estado")
+CARPETA_LOGS = os.path.join(RAIZ, "logs")
+
+
+def ruta_configuracion(ruta: str = "config.ini") -> str:
+    """
+    Devuelve la ruta del archivo de configuración: la indicada si existe
+    (absoluta o relativa al directorio actual) y, si no, relativa a la raíz
+    del proyecto, para poder lanzar los scripts desde cualquier directorio.
+
+    :param ruta: Ruta indicada por el usuario.
+    """
+    if os.path.isabs(ruta) or os.path.exists(ruta):
+        return ruta
+    return os.path.join(RAIZ, ruta)
+
+
+def ruta_relativa(ruta: str, base: str) -> str:
+    """
+    Resuelve una ruta de la configuración: si es relativa y existe dentro de
+    base (la carpeta de config.ini) se usa esa; si no, se deja como está.
+
+    :param ruta: Ruta tal y como aparece en config.ini.
+    :param base: Carpeta respecto a la que se resuelve.
+    """
+    if os.path.isabs(ruta):
+        return ruta
+    candidata = os.path.join(base, ruta)
+    return candidata if os.path.exists(candidata) else ruta
+
+
+def ruta_etiquetas(config: configparser.ConfigParser, seccion: str, ruta_config: str) -> str:
+    """
+    Devuelve el archivo de reglas de una cuenta: la opción 'etiquetas' de
+    su sección (relativa a config.ini) o el etiquetas.json del paquete.
+
+    :param config: Configuración cargada.
+    :param seccion: Sección de la cuenta.
+    :param ruta_config: Ruta del archivo de configuración.
+    """
+    ruta = config.get(seccion, "etiquetas", fallback="").strip()
+    if not ruta:
+        return ETIQUETAS_POR_DEFECTO
+    return ruta_relativa(ruta, os.path.dirname(os.path.abspath(ruta_config)))
+
+
+def ruta_carpeta_estado(config: configparser.ConfigParser, ruta_config: str) -> str:
+    """
+    Devuelve la carpeta de estado: la opción 'carpeta_estado' de [opciones]
+    (relativa a la carpeta de config.ini) o estado/ en la raíz del proyecto.
+
+    :param config: Configuración cargada.
+    :param ruta_config: Ruta del archivo de configuración.
+    """
+    ruta = config.get("opciones", "carpeta_estado", fallback="").strip()
+    if not ruta:
+        return CARPETA_ESTADO
+    if os.path.isabs(ruta):
+        return ruta
+    return os.path.join(os.path.dirname(os.path.abspath(ruta_config)), ruta)
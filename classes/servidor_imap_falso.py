@@ -0,0 +1,959 @@
+import os
+import re
+import time
+import bisect
+import socket
+import mailbox
+import select
+import socketserver
+import threading
+import email
+import email.policy
+from collections import Counter
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# Flags de mbox (Status/X-Status) y Maildir (sufijo ":2,") y su flag IMAP
+_FLAGS_MBOX = {"R": "\\Seen", "A": "\\Answered", "F": "\\Flagged", "D": "\\Deleted"}
+_FLAGS_MAILDIR = {"S": "\\Seen", "R": "\\Answered", "F": "\\Flagged", "T": "\\Deleted", "D": "\\Draft"}
+
+
+class MensajeFalso:
+    """
+    Mensaje almacenado en un buzón del servidor IMAP falso.
+    """
+    def __init__(self, uid: int, datos: bytes, flags: Iterable[str] = ()):
+        self.uid = uid
+        self.datos = datos
+        self.flags = set(flags)
+        self.modseq = 0
+        self._cabeceras = None
+
+    def mensaje(self) -> email.message.Message:
+        """
+        Devuelve el mensaje completo parseado (solo cuando se pide una parte).
+        No se guarda para no inflar la memoria con mensajes grandes.
+        """
+        return email.message_from_bytes(self.datos, policy=_POLITICA)
+
+    def cabecera(self, nombre: str) -> str:
+        """
+        Devuelve el valor decodificado de una cabecera del mensaje.
+
+        :param nombre: Nombre de la cabecera.
+        :return: Valor de la cabecera o cadena vacía.
+        """
+        if self._cabeceras is None:
+            self._cabeceras = email.message_from_bytes(self.datos.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n")
+        valor = self._cabeceras.get(nombre)
+        if valor is None:
+            return ""
+        try:
+            return str(make_header(decode_header(valor)))
+        except Exception:
+            return str(valor)
+
+    def texto(self) -> bytes:
+        """
+        Devuelve el cuerpo bruto del mensaje (todo lo que sigue a las cabeceras).
+        """
+        partes = self.datos.split(b"\r\n\r\n", 1)
+        return partes[1] if len(partes) == 2 else b""
+
+
+# Mantiene los saltos de línea CRLF al volver a serializar partes MIME
+_POLITICA = email.policy.compat32.clone(linesep="\r\n")
+
+
+def _separar(datos: bytes) -> tuple:
+    """
+    Separa un bloque MIME en (cabeceras, cuerpo).
+    """
+    cabecera, separador, cuerpo = datos.partition(b"\r\n\r\n")
+    return (cabecera + b"\r\n\r\n", cuerpo) if separador else (datos, b"")
+
+
+def _cadena(valor) -> str:
+    """
+    Codifica un valor como cadena IMAP entre comillas o NIL. Los valores no
+    ASCII se envían como literal {n}, como hacen muchos servidores reales.
+    """
+    if valor is None:
+        return "NIL"
+    valor = str(valor)
+    if not valor.isascii():
+        return f"{{{len(valor.encode())}}}\r\n{valor}"
+    return '"' + valor.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _sobre(mensaje: email.message.Message) -> str:
+    """
+    ENVELOPE simplificado (fecha, asunto y Message-ID; direcciones a NIL).
+    """
+    return (f"({_cadena(mensaje.get('Date'))} {_cadena(mensaje.get('Subject'))} NIL NIL NIL NIL NIL NIL NIL "
+            f"{_cadena(mensaje.get('Message-ID'))})")
+
+
+def _bodystructure(parte: email.message.Message) -> str:
+    """
+    Genera el BODYSTRUCTURE (RFC 3501) de una parte MIME.
+    """
+    es_mensaje = parte.get_content_type() == "message/rfc822"
+    if parte.is_multipart() and not es_mensaje:
+        hijas = "".join(_bodystructure(hija) for hija in parte.get_payload())
+        return f"({hijas} {_cadena(parte.get_content_subtype().upper())})"
+
+    _, cuerpo = _separar(parte.as_bytes(policy=_POLITICA))
+    parametros = parte.get_params()[1:] if parte.get_params() else []
+    lista_parametros = "(" + " ".join(f"{_cadena(k.upper())} {_cadena(v)}" for k, v in parametros) + ")" \
+        if parametros else "NIL"
+    codificacion = (parte.get("Content-Transfer-Encoding") or "7BIT").strip().upper()
+    campos = [
+        _cadena(parte.get_content_maintype().upper()), _cadena(parte.get_content_subtype().upper()),
+        lista_parametros, "NIL", "NIL", _cadena(codificacion), str(len(cuerpo)),
+    ]
+    if es_mensaje:
+        # Sobre y estructura del mensaje reenviado, y sus líneas
+        interno = parte.get_payload(0)
+        campos.extend([_sobre(interno), _bodystructure(interno), str(cuerpo.count(b"\n"))])
+    elif parte.get_content_maintype() == "text":
+        campos.append(str(cuerpo.count(b"\n")))
+
+    disposicion = "NIL"
+    if parte.get("Content-Disposition"):
+        tipo_disposicion = parte.get_content_disposition() or "attachment"
+        nombre = parte.get_filename()
+        parametros_disposicion = f"({_cadena('FILENAME')} {_cadena(nombre)})" if nombre else "NIL"
+        disposicion = f"({_cadena(tipo_disposicion.upper())} {parametros_disposicion})"
+    campos.extend(["NIL", disposicion])
+    return "(" + " ".join(campos) + ")"
+
+
+class BuzonFalso:
+    """
+    Buzón (carpeta/etiqueta) del servidor IMAP falso.
+    """
+    def __init__(self, nombre: str, uidvalidity: int = 1):
+        self.nombre = nombre
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.mensajes: List[MensajeFalso] = []
+        # CONDSTORE/QRESYNC: cada cambio recibe un MODSEQ; los UIDs expurgados se recuerdan con el suyo
+        self.highestmodseq = 1
+        self.expurgados: List[tuple] = []
+
+    def agregar(self, datos: bytes, flags: Iterable[str] = ()) -> MensajeFalso:
+        """
+        Añade un mensaje al buzón asignándole el siguiente UID.
+        """
+        mensaje = MensajeFalso(self.uidnext, datos, flags)
+        self.uidnext += 1
+        self.mensajes.append(mensaje)
+        self.modificado(mensaje)
+        return mensaje
+
+    def modificado(self, mensaje: MensajeFalso) -> None:
+        """
+        Asigna un MODSEQ nuevo a un mensaje que acaba de cambiar.
+        """
+        self.highestmodseq += 1
+        mensaje.modseq = self.highestmodseq
+
+
+def _tokenizar(linea: str) -> list:
+    """
+    Separa una línea de comando IMAP en átomos, cadenas entre comillas y
+    listas entre paréntesis (anidadas). Los corchetes se consideran parte
+    del átomo: BODY.PEEK[HEADER.FIELDS (FROM)] es un único token.
+    """
+    pila = [[]]
+    i = 0
+    while i < len(linea):
+        c = linea[i]
+        if c == " ":
+            i += 1
+        elif c == "(":
+            pila.append([])
+            i += 1
+        elif c == ")":
+            lista = pila.pop()
+            pila[-1].append(lista)
+            i += 1
+        elif c == '"':
+            i += 1
+            valor = []
+            while i < len(linea) and linea[i] != '"':
+                if linea[i] == "\\" and i + 1 < len(linea):
+                    i += 1
+                valor.append(linea[i])
+                i += 1
+            i += 1
+            pila[-1].append("".join(valor))
+        else:
+            inicio = i
+            profundidad = 0
+            while i < len(linea):
+                if linea[i] == "[":
+                    profundidad += 1
+                elif linea[i] == "]":
+                    profundidad -= 1
+                elif profundidad == 0 and linea[i] in " ()":
+                    break
+                i += 1
+            pila[-1].append(linea[inicio:i])
+    return pila[0]
+
+
+_CRITERIOS_FLAGS = {
+    "SEEN": ("\\Seen", True),
+    "UNSEEN": ("\\Seen", False),
+    "DELETED": ("\\Deleted", True),
+    "UNDELETED": ("\\Deleted", False),
+    "FLAGGED": ("\\Flagged", True),
+    "UNFLAGGED": ("\\Flagged", False),
+}
+
+
+def _rangos_conjunto(conjunto: str, maximo: int) -> List[tuple]:
+    """
+    Convierte un conjunto IMAP ("1:3,7,9:*") en rangos (inicio, fin) inclusivos.
+    '*' representa el valor más alto existente.
+    """
+    rangos = []
+    for parte in conjunto.split(","):
+        a, _, b = parte.partition(":")
+        a = maximo if a == "*" else int(a)
+        b = a if not b else (maximo if b == "*" else int(b))
+        rangos.append((min(a, b), max(a, b)))
+    return rangos
+
+
+def _entra_en_conjunto(valor: int, conjunto: str, maximo: int) -> bool:
+    """
+    Indica si un número de secuencia o UID pertenece a un conjunto IMAP.
+    """
+    return any(a <= valor <= b for a, b in _rangos_conjunto(conjunto, maximo))
+
+
+def _literal(etiqueta: str, contenido: bytes) -> bytes:
+    """
+    Codifica un elemento FETCH como literal IMAP: ETIQUETA {n}\\r\\n<contenido>.
+    """
+    return etiqueta.encode() + b" {" + str(len(contenido)).encode() + b"}\r\n" + contenido
+
+
+class _ManejadorImap(socketserver.StreamRequestHandler):
+    """
+    Atiende una conexión de cliente hablando un subconjunto de IMAP4rev1.
+    """
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.servidor: "ServidorImapFalso" = self.server.servidor_falso
+        self.buzon: Optional[BuzonFalso] = None
+        # Número de mensajes que el cliente conoce (último EXISTS enviado)
+        self.conocidos = 0
+        self.autenticado = False
+        self.servidor.clientes.add(self.request)
+
+    def finish(self):
+        self.servidor.clientes.discard(self.request)
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def _enviar(self, datos: bytes) -> None:
+        self.servidor._contar_salida(len(datos))
+        self.wfile.write(datos)
+
+    def _linea(self, texto: str) -> None:
+        self._enviar(texto.encode("utf-8") + b"\r\n")
+
+    def handle(self):
+        if self.servidor.max_conexiones and len(self.servidor.clientes) > self.servidor.max_conexiones:
+            # Como los servidores reales, rechaza las conexiones que superan el límite por cuenta
+            self._linea("* BYE [UNAVAILABLE] Demasiadas conexiones simultaneas")
+            return
+        self._linea(f"* OK [CAPABILITY {' '.join(self.servidor.capacidades)}] Servidor IMAP falso listo")
+        while True:
+            try:
+                linea = self.rfile.readline()
+            except OSError:
+                return
+            if not linea:
+                return
+            self.servidor._contar_entrada(len(linea))
+            linea = linea.decode("utf-8", errors="replace").rstrip("\r\n")
+            if not linea:
+                continue
+            tokens = _tokenizar(linea)
+            if len(tokens) < 2:
+                self._linea("* BAD comando vacio")
+                continue
+            tag, comando, args = tokens[0], tokens[1].upper(), tokens[2:]
+            usar_uid = False
+            if comando == "UID" and args:
+                usar_uid, comando, args = True, args[0].upper(), args[1:]
+
+            nombre = ("UID " if usar_uid else "") + comando
+            self.servidor._registrar(nombre)
+            # La latencia simulada se aplica fuera del bloqueo, como la de una red real
+            espera = self.servidor.latencia_de(comando)
+            if espera:
+                time.sleep(espera)
+            fallo = self.servidor._fallo_pendiente(nombre)
+            if fallo == "desconexion":
+                return
+            if fallo is not None:
+                self._linea(f"{tag} {fallo}")
+                continue
+            metodo = getattr(self, f"_cmd_{comando.lower()}", None)
+            if metodo is None:
+                self._linea(f"{tag} BAD comando desconocido {comando}")
+                continue
+            try:
+                if comando not in ("IDLE", "SELECT", "EXAMINE", "LOGOUT"):
+                    # Como los servidores reales, el correo llegado se anuncia en la respuesta
+                    # de cualquier comando, antes de su resultado
+                    self._anunciar_nuevos()
+                if comando == "IDLE":
+                    # IDLE no retiene el bloqueo: otros clientes siguen trabajando
+                    continuar = metodo(tag, args, usar_uid)
+                else:
+                    with self.servidor.bloqueo:
+                        continuar = metodo(tag, args, usar_uid)
+            except Exception as e:  # pragma: no cover - defensa del servidor de pruebas
+                self._linea(f"{tag} BAD error interno: {e}")
+                continue
+            if continuar is False:
+                return
+
+    def _anunciar_nuevos(self) -> None:
+        """
+        Envía "* n EXISTS" si han llegado mensajes a la bandeja seleccionada
+        desde el último EXISTS enviado.
+        """
+        if self.buzon is None:
+            return
+        with self.servidor.bloqueo:
+            existentes = len(self.buzon.mensajes)
+            if existentes <= self.conocidos:
+                return
+            self.conocidos = existentes
+        self._linea(f"* {existentes} EXISTS")
+
+    # --- Comandos sin estado ---------------------------------------------
+
+    def _cmd_capability(self, tag, args, usar_uid):
+        self._linea(f"* CAPABILITY {' '.join(self.servidor.capacidades)}")
+        self._linea(f"{tag} OK CAPABILITY completado")
+
+    def _cmd_idle(self, tag, args, usar_uid):
+        if "IDLE" not in self.servidor.capacidades or self.buzon is None:
+            self._linea(f"{tag} BAD IDLE no disponible")
+            return
+        with self.servidor.bloqueo:
+            existentes = len(self.buzon.mensajes)
+        if existentes != self.conocidos:
+            # Como muchos servidores reales, los cambios previos van en el mismo paquete que "+ idling"
+            self.conocidos = existentes
+            self._enviar(f"+ idling\r\n* {existentes} EXISTS\r\n".encode())
+        else:
+            self._linea("+ idling")
+        while True:
+            legibles, _, _ = select.select([self.connection], [], [], 0.05)
+            if legibles:
+                linea = self.rfile.readline()
+                self.servidor._contar_entrada(len(linea))
+                if not linea:
+                    return
+                if linea.strip().upper() == b"DONE":
+                    self._linea(f"{tag} OK IDLE terminado")
+                    return
+                self._linea(f"{tag} BAD se esperaba DONE")
+                return
+            with self.servidor.bloqueo:
+                existentes = len(self.buzon.mensajes)
+            if existentes != self.conocidos:
+                self.conocidos = existentes
+                self._linea(f"* {existentes} EXISTS")
+
+    def _cmd_enable(self, tag, args, usar_uid):
+        activadas = [a.upper() for a in args if a.upper() in self.servidor.capacidades]
+        self._linea("* ENABLED" + "".join(f" {a}" for a in activadas))
+        self._linea(f"{tag} OK ENABLE completado")
+
+    def _cmd_noop(self, tag, args, usar_uid):
+        self._linea(f"{tag} OK NOOP completado")
+
+    def _cmd_logout(self, tag, args, usar_uid):
+        self._linea("* BYE cerrando conexion")
+        self._linea(f"{tag} OK LOGOUT completado")
+        return False
+
+    def _cmd_login(self, tag, args, usar_uid):
+        if len(args) == 2 and args[0] == self.servidor.usuario and args[1] == self.servidor.password:
+            self.autenticado = True
+            self._linea(f"{tag} OK [CAPABILITY {' '.join(self.servidor.capacidades)}] LOGIN completado")
+        else:
+            self._linea(f"{tag} NO [AUTHENTICATIONFAILED] credenciales invalidas")
+
+    # --- Buzones ------------------------------------------------------------
+
+    def _cmd_list(self, tag, args, usar_uid):
+        patron = args[1] if len(args) > 1 else "*"
+        regex = re.compile("^" + re.escape(patron).replace(r"\*", ".*").replace("%", "[^/]*") + "$")
+        for nombre in self.servidor.buzones:
+            if regex.match(nombre):
+                self._linea(f'* LIST (\\HasNoChildren) "/" "{nombre}"')
+        self._linea(f"{tag} OK LIST completado")
+
+    def _cmd_create(self, tag, args, usar_uid):
+        nombre = args[0]
+        if self.servidor.obtener_buzon(nombre) is not None:
+            self._linea(f"{tag} NO [ALREADYEXISTS] el buzon ya existe")
+            return
+        self.servidor.agregar_buzon(nombre)
+        self._linea(f"{tag} OK CREATE completado")
+
+    def _cmd_select(self, tag, args, usar_uid):
+        buzon = self.servidor.obtener_buzon(args[0]) if args else None
+        if buzon is None:
+            self.buzon = None
+            self._linea(f"{tag} NO [NONEXISTENT] el buzon no existe")
+            return
+        self.buzon = buzon
+        self.conocidos = len(buzon.mensajes)
+        self._linea(r"* FLAGS (\Answered \Flagged \Deleted \Seen \Draft)")
+        self._linea(f"* {self.conocidos} EXISTS")
+        self._linea("* 0 RECENT")
+        self._linea(f"* OK [UIDVALIDITY {buzon.uidvalidity}] UIDs validos")
+        self._linea(f"* OK [UIDNEXT {buzon.uidnext}] siguiente UID")
+        if "CONDSTORE" in self.servidor.capacidades:
+            self._linea(f"* OK [HIGHESTMODSEQ {buzon.highestmodseq}] MODSEQ actual")
+        self._linea(f"{tag} OK [READ-WRITE] SELECT completado")
+
+    _cmd_examine = _cmd_select
+
+    def _cmd_status(self, tag, args, usar_uid):
+        buzon = self.servidor.obtener_buzon(args[0]) if args else None
+        if buzon is None:
+            self._linea(f"{tag} NO [NONEXISTENT] el buzon no existe")
+            return
+        valores = {"MESSAGES": len(buzon.mensajes), "UIDNEXT": buzon.uidnext, "UIDVALIDITY": buzon.uidvalidity,
+                   "UNSEEN": sum(1 for m in buzon.mensajes if "\\Seen" not in m.flags), "RECENT": 0}
+        if "CONDSTORE" in self.servidor.capacidades:
+            valores["HIGHESTMODSEQ"] = buzon.highestmodseq
+        pedidos = [str(a).upper() for a in (args[1] if len(args) > 1 and isinstance(args[1], list) else args[1:])]
+        elementos = " ".join(f"{nombre} {valores[nombre]}" for nombre in pedidos if nombre in valores)
+        self._linea(f'* STATUS "{buzon.nombre}" ({elementos})')
+        self._linea(f"{tag} OK STATUS completado")
+
+    def _cmd_close(self, tag, args, usar_uid):
+        if self.buzon is not None:
+            self.buzon.mensajes = [m for m in self.buzon.mensajes if "\\Deleted" not in m.flags]
+        self.buzon = None
+        self._linea(f"{tag} OK CLOSE completado")
+
+    # --- Mensajes -----------------------------------------------------------
+
+    def _seleccionar(self, conjunto: str, usar_uid: bool) -> List[tuple]:
+        """
+        Devuelve las tuplas (numero_secuencia, mensaje) que pertenecen al conjunto.
+        """
+        mensajes = self.buzon.mensajes
+        if not mensajes:
+            return []
+        # Los mensajes están ordenados por UID: cada rango se localiza por bisección
+        claves = [m.uid for m in mensajes] if usar_uid else range(1, len(mensajes) + 1)
+        indices = set()
+        for a, b in _rangos_conjunto(conjunto, claves[-1]):
+            indices.update(range(bisect.bisect_left(claves, a), bisect.bisect_right(claves, b)))
+        return [(i + 1, mensajes[i]) for i in sorted(indices)]
+
+    def _cumple(self, num: int, mensaje: MensajeFalso, criterios: list) -> bool:
+        """
+        Evalúa una lista de criterios SEARCH (unidos por AND) sobre un mensaje.
+        """
+        i = 0
+        while i < len(criterios):
+            ok, i = self._criterio(num, mensaje, criterios, i)
+            if not ok:
+                return False
+        return True
+
+    def _criterio(self, num: int, mensaje: MensajeFalso, criterios: list, i: int) -> tuple:
+        clave = criterios[i]
+        if isinstance(clave, list):
+            return self._cumple(num, mensaje, clave), i + 1
+        clave = clave.upper()
+        maximo_uid = self.buzon.mensajes[-1].uid if self.buzon.mensajes else 0
+        if clave == "ALL":
+            return True, i + 1
+        if clave in _CRITERIOS_FLAGS:
+            flag, presente = _CRITERIOS_FLAGS[clave]
+            return (flag in mensaje.flags) == presente, i + 1
+        if clave == "NOT":
+            ok, siguiente = self._criterio(num, mensaje, criterios, i + 1)
+            return not ok, siguiente
+        if clave == "OR":
+            ok1, siguiente = self._criterio(num, mensaje, criterios, i + 1)
+            ok2, siguiente = self._criterio(num, mensaje, criterios, siguiente)
+            return ok1 or ok2, siguiente
+        if clave in ("FROM", "SUBJECT", "TO", "CC"):
+            buscado = criterios[i + 1].lower()
+            cabecera = {"FROM": "From", "SUBJECT": "Subject", "TO": "To", "CC": "Cc"}[clave]
+            return buscado in mensaje.cabecera(cabecera).lower(), i + 2
+        if clave == "HEADER":
+            buscado = criterios[i + 2].lower()
+            return buscado in mensaje.cabecera(criterios[i + 1]).lower(), i + 3
+        if clave in ("BODY", "TEXT"):
+            buscado = criterios[i + 1].lower().encode("utf-8")
+            contenido = mensaje.datos if clave == "TEXT" else mensaje.texto()
+            return buscado in contenido.lower(), i + 2
+        if clave in ("SENTSINCE", "SENTBEFORE", "SENTON"):
+            dia = datetime.strptime(criterios[i + 1], "%d-%b-%Y").date()
+            try:
+                enviado = parsedate_to_datetime(mensaje.cabecera("Date")).date()
+            except (TypeError, ValueError, IndexError):
+                return False, i + 2
+            cumple = {"SENTSINCE": enviado >= dia, "SENTBEFORE": enviado < dia, "SENTON": enviado == dia}[clave]
+            return cumple, i + 2
+        if clave in ("LARGER", "SMALLER"):
+            limite = int(criterios[i + 1])
+            return (len(mensaje.datos) > limite if clave == "LARGER" else len(mensaje.datos) < limite), i + 2
+        if clave == "UID":
+            return _entra_en_conjunto(mensaje.uid, criterios[i + 1], maximo_uid), i + 2
+        if re.match(r"^[\d\*:,]+$", clave):
+            return _entra_en_conjunto(num, clave, len(self.buzon.mensajes)), i + 1
+        raise ValueError(f"criterio SEARCH no soportado: {clave}")
+
+    def _cmd_search(self, tag, args, usar_uid):
+        if self.buzon is None:
+            self._linea(f"{tag} BAD ningun buzon seleccionado")
+            return
+        if args and args[0].upper() == "CHARSET":
+            args = args[2:]
+        resultado = [
+            str(m.uid if usar_uid else num)
+            for num, m in enumerate(self.buzon.mensajes, start=1)
+            if self._cumple(num, m, args)
+        ]
+        self._linea("* SEARCH" + ("".join(" " + r for r in resultado)))
+        self._linea(f"{tag} OK SEARCH completado")
+
+    def _seccion(self, mensaje: MensajeFalso, seccion: str) -> bytes:
+        """
+        Devuelve el contenido de una sección BODY[...] del mensaje:
+        '' (completo), HEADER, TEXT o HEADER.FIELDS (CAMPO ...).
+        """
+        cabecera, _, texto = mensaje.datos.partition(b"\r\n\r\n")
+        seccion_mayus = seccion.upper()
+        if seccion_mayus == "":
+            return mensaje.datos
+        if seccion_mayus == "HEADER":
+            return cabecera + b"\r\n\r\n"
+        if seccion_mayus == "TEXT":
+            return texto
+        if seccion_mayus.startswith("HEADER.FIELDS"):
+            negado = seccion_mayus.startswith("HEADER.FIELDS.NOT")
+            campos = set(seccion_mayus[seccion_mayus.index("(") + 1:seccion_mayus.rindex(")")].split())
+            lineas, incluir = [], False
+            for linea in cabecera.split(b"\r\n"):
+                if linea[:1] not in (b" ", b"\t"):
+                    nombre = linea.split(b":", 1)[0].decode("ascii", errors="replace").upper()
+                    incluir = (nombre in campos) != negado
+                if incluir:
+                    lineas.append(linea)
+            return b"".join(l + b"\r\n" for l in lineas) + b"\r\n"
+        if re.match(r"^\d+(\.\d+)*(\.MIME)?$", seccion_mayus):
+            return self._parte_numerada(mensaje, seccion_mayus)
+        raise ValueError(f"seccion FETCH no soportada: {seccion}")
+
+    def _parte_numerada(self, mensaje: MensajeFalso, seccion: str) -> bytes:
+        """
+        Devuelve el cuerpo (o las cabeceras con .MIME) de una parte "2.1".
+        """
+        mime = seccion.endswith(".MIME")
+        numeros = [int(n) for n in seccion.replace(".MIME", "").split(".")]
+        parte = mensaje.mensaje()
+        for numero in numeros:
+            if parte.is_multipart():
+                parte = parte.get_payload()[numero - 1]
+            elif numero != 1:
+                return b""
+        cabecera, cuerpo = _separar(parte.as_bytes(policy=_POLITICA))
+        return cabecera if mime else cuerpo
+
+    def _item_fetch(self, mensaje: MensajeFalso, item: str) -> bytes:
+        """
+        Construye la respuesta de un elemento FETCH para un mensaje.
+        """
+        nombre = item.upper()
+        if nombre == "UID":
+            return f"UID {mensaje.uid}".encode()
+        if nombre == "FLAGS":
+            return f"FLAGS ({' '.join(sorted(mensaje.flags))})".encode()
+        if nombre == "BODYSTRUCTURE":
+            return f"BODYSTRUCTURE {_bodystructure(mensaje.mensaje())}".encode()
+        if nombre == "RFC822.SIZE":
+            return f"RFC822.SIZE {len(mensaje.datos)}".encode()
+        if nombre == "MODSEQ":
+            return f"MODSEQ ({mensaje.modseq})".encode()
+        if nombre in ("RFC822", "RFC822.HEADER", "RFC822.TEXT"):
+            seccion = {"RFC822": "", "RFC822.HEADER": "HEADER", "RFC822.TEXT": "TEXT"}[nombre]
+            if nombre != "RFC822.HEADER":
+                mensaje.flags.add("\\Seen")
+            return _literal(nombre, self._seccion(mensaje, seccion))
+        coincidencia = re.match(r"^BODY(\.PEEK)?\[(.*)\](?:<(\d+)\.(\d+)>)?$", item, re.IGNORECASE | re.DOTALL)
+        if coincidencia:
+            peek, seccion, inicio, longitud = coincidencia.groups()
+            if not peek:
+                mensaje.flags.add("\\Seen")
+            contenido = self._seccion(mensaje, seccion)
+            etiqueta = f"BODY[{seccion.upper()}]"
+            if inicio is not None:
+                contenido = contenido[int(inicio):int(inicio) + int(longitud)]
+                etiqueta += f"<{inicio}>"
+            return _literal(etiqueta, contenido)
+        raise ValueError(f"elemento FETCH no soportado: {item}")
+
+    def _cmd_fetch(self, tag, args, usar_uid):
+        if self.buzon is None:
+            self._linea(f"{tag} BAD ningun buzon seleccionado")
+            return
+        conjunto, items = args[0], args[1]
+        if isinstance(items, str):
+            items = [items]
+        if usar_uid and not any(isinstance(i, str) and i.upper() == "UID" for i in items):
+            items = ["UID"] + list(items)
+        # Modificadores CONDSTORE/QRESYNC: (CHANGEDSINCE n [VANISHED])
+        modificadores = [str(m).upper() for m in args[2]] if len(args) > 2 and isinstance(args[2], list) else []
+        desde_modseq = None
+        if "CHANGEDSINCE" in modificadores:
+            desde_modseq = int(modificadores[modificadores.index("CHANGEDSINCE") + 1])
+            if "MODSEQ" not in [str(i).upper() for i in items]:
+                items = list(items) + ["MODSEQ"]
+            if usar_uid and "VANISHED" in modificadores:
+                maximo = max(self.buzon.uidnext - 1, 1)
+                vanished = [str(uid) for uid, modseq in self.buzon.expurgados
+                            if modseq > desde_modseq and _entra_en_conjunto(uid, conjunto, maximo)]
+                if vanished:
+                    self._linea(f"* VANISHED (EARLIER) {','.join(vanished)}")
+        # Las respuestas se envían en bloques de ~64 KB en lugar de una escritura por mensaje
+        pendiente, tamano = [], 0
+        for num, mensaje in self._seleccionar(conjunto, usar_uid):
+            if desde_modseq is not None and mensaje.modseq <= desde_modseq:
+                continue
+            partes = [self._item_fetch(mensaje, i) for i in items]
+            pendiente.append(f"* {num} FETCH (".encode() + b" ".join(partes) + b")\r\n")
+            tamano += len(pendiente[-1])
+            if tamano >= 65536:
+                self._enviar(b"".join(pendiente))
+                pendiente, tamano = [], 0
+        self._enviar(b"".join(pendiente) + f"{tag} OK FETCH completado\r\n".encode())
+
+    def _cmd_store(self, tag, args, usar_uid):
+        if self.buzon is None:
+            self._linea(f"{tag} BAD ningun buzon seleccionado")
+            return
+        conjunto, operacion, flags = args[0], args[1].upper(), args[2]
+        flags = set(flags if isinstance(flags, list) else [flags])
+        silencioso = operacion.endswith(".SILENT")
+        operacion = operacion.replace(".SILENT", "")
+        for num, mensaje in self._seleccionar(conjunto, usar_uid):
+            anteriores = set(mensaje.flags)
+            if operacion == "+FLAGS":
+                mensaje.flags |= flags
+            elif operacion == "-FLAGS":
+                mensaje.flags -= flags
+            else:
+                mensaje.flags = set(flags)
+            if mensaje.flags != anteriores:
+                self.buzon.modificado(mensaje)
+            if not silencioso:
+                uid = f"UID {mensaje.uid} " if usar_uid else ""
+                self._linea(f"* {num} FETCH ({uid}FLAGS ({' '.join(sorted(mensaje.flags))}))")
+        self._linea(f"{tag} OK STORE completado")
+
+    def _copiar(self, tag, args, usar_uid) -> Optional[list]:
+        if self.buzon is None:
+            self._linea(f"{tag} BAD ningun buzon seleccionado")
+            return None
+        destino = self.servidor.obtener_buzon(args[1])
+        if destino is None:
+            self._linea(f"{tag} NO [TRYCREATE] el buzon destino no existe")
+            return None
+        seleccion = self._seleccionar(args[0], usar_uid)
+        origen_uids, destino_uids = [], []
+        for _, mensaje in seleccion:
+            nuevo = destino.agregar(mensaje.datos, mensaje.flags - {"\\Deleted"})
+            origen_uids.append(str(mensaje.uid))
+            destino_uids.append(str(nuevo.uid))
+        copyuid = ""
+        if "UIDPLUS" in self.servidor.capacidades and seleccion:
+            copyuid = f"[COPYUID {destino.uidvalidity} {','.join(origen_uids)} {','.join(destino_uids)}] "
+        return [seleccion, copyuid]
+
+    def _cmd_copy(self, tag, args, usar_uid):
+        resultado = self._copiar(tag, args, usar_uid)
+        if resultado is not None:
+            self._linea(f"{tag} OK {resultado[1]}COPY completado")
+
+    def _cmd_move(self, tag, args, usar_uid):
+        if "MOVE" not in self.servidor.capacidades:
+            self._linea(f"{tag} BAD comando desconocido MOVE")
+            return
+        resultado = self._copiar(tag, args, usar_uid)
+        if resultado is None:
+            return
+        seleccion, copyuid = resultado
+        if copyuid:
+            self._linea(f"* OK {copyuid}movidos")
+        self._expurgar({id(m) for _, m in seleccion})
+        self._linea(f"{tag} OK MOVE completado")
+
+    def _expurgar(self, candidatos: Optional[set] = None) -> None:
+        """
+        Elimina físicamente los mensajes indicados (o los marcados como \\Deleted)
+        enviando una respuesta EXPUNGE por cada uno.
+        """
+        mensajes = self.buzon.mensajes
+        conservados, respuestas = [], []
+        for i, mensaje in enumerate(mensajes):
+            if (candidatos is not None and id(mensaje) in candidatos) or \
+               (candidatos is None and "\\Deleted" in mensaje.flags):
+                # Número de secuencia en el momento de su EXPUNGE (tras borrar los anteriores)
+                respuestas.append(f"* {i + 1 - len(respuestas)} EXPUNGE\r\n")
+                self.buzon.highestmodseq += 1
+                self.buzon.expurgados.append((mensaje.uid, self.buzon.highestmodseq))
+            else:
+                conservados.append(mensaje)
+        mensajes[:] = conservados
+        self.conocidos = len(conservados)
+        if respuestas:
+            self._enviar("".join(respuestas).encode())
+
+    def _cmd_expunge(self, tag, args, usar_uid):
+        if self.buzon is None:
+            self._linea(f"{tag} BAD ningun buzon seleccionado")
+            return
+        if usar_uid:
+            if "UIDPLUS" not in self.servidor.capacidades:
+                self._linea(f"{tag} BAD UID EXPUNGE requiere UIDPLUS")
+                return
+            candidatos = {
+                id(m) for _, m in self._seleccionar(args[0], True) if "\\Deleted" in m.flags
+            }
+            self._expurgar(candidatos)
+        else:
+            self._expurgar()
+        self._linea(f"{tag} OK EXPUNGE completado")
+
+
+def _a_crlf(datos: bytes) -> bytes:
+    """
+    Normaliza los saltos de línea de un mensaje a CRLF, como los guarda IMAP.
+    """
+    return re.sub(rb"\r?\n", b"\r\n", datos)
+
+
+class _ServidorTCP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ServidorImapFalso:
+    """
+    Servidor IMAP en proceso, sin TLS, para pruebas y benchmarks locales.
+    Cuenta los comandos recibidos (round trips) y los bytes transferidos y
+    puede simular la latencia de un servidor remoto.
+    """
+    def __init__(self, usuario: str = "usuario", password: str = "password",
+                 capacidades: Iterable[str] = ("IMAP4rev1", "MOVE", "UIDPLUS"),
+                 latencia: float = 0.0, latencia_por_comando: Optional[Dict[str, float]] = None,
+                 max_conexiones: int = 0):
+        """
+        :param latencia: Segundos de espera antes de responder a cada comando.
+        :param latencia_por_comando: Espera específica por comando ({"FETCH": 0.2}),
+                                     que sustituye a la general.
+        :param max_conexiones: Conexiones simultáneas admitidas; las demás reciben
+                               un BYE al conectar (0 = sin límite).
+        """
+        self.usuario = usuario
+        self.password = password
+        self.capacidades = tuple(capacidades)
+        self.latencia = latencia
+        self.latencia_por_comando = {c.upper(): v for c, v in (latencia_por_comando or {}).items()}
+        self.max_conexiones = max_conexiones
+        self.buzones = {}
+        self.bloqueo = threading.RLock()
+        self.estadisticas = {"comandos": Counter(), "round_trips": 0, "bytes_entrada": 0, "bytes_salida": 0}
+        # {comando: [veces pendientes, respuesta]} (véase fallar)
+        self.fallos = {}
+        self._servidor = None
+        self._hilo = None
+        self.clientes = set()
+        self.agregar_buzon("INBOX")
+
+    def agregar_buzon(self, nombre: str) -> BuzonFalso:
+        """
+        Crea un buzón vacío (o devuelve el existente).
+        """
+        buzon = self.obtener_buzon(nombre)
+        if buzon is None:
+            buzon = BuzonFalso(nombre, uidvalidity=len(self.buzones) + 1)
+            self.buzones[nombre] = buzon
+        return buzon
+
+    def obtener_buzon(self, nombre: str) -> Optional[BuzonFalso]:
+        """
+        Devuelve el buzón indicado. INBOX no distingue mayúsculas.
+        """
+        if nombre.upper() == "INBOX":
+            nombre = "INBOX"
+        return self.buzones.get(nombre)
+
+    def agregar_mensaje(self, buzon: str, datos: bytes, flags: Iterable[str] = ()) -> MensajeFalso:
+        """
+        Añade un mensaje RFC 822 a un buzón.
+        """
+        return self.agregar_buzon(buzon).agregar(datos, flags)
+
+    def cargar_mbox(self, ruta: str, buzon: str = "INBOX") -> int:
+        """
+        Carga en un buzón los mensajes de un archivo mbox, conservando los
+        flags de las cabeceras Status/X-Status.
+
+        :param ruta: Ruta del archivo mbox.
+        :param buzon: Buzón destino.
+        :return: Número de mensajes cargados.
+        """
+        destino = self.agregar_buzon(buzon)
+        total = 0
+        for mensaje in mailbox.mbox(ruta, create=False):
+            flags = [_FLAGS_MBOX[f] for f in mensaje.get_flags() if f in _FLAGS_MBOX]
+            for cabecera in ("Status", "X-Status"):
+                del mensaje[cabecera]
+            destino.agregar(_a_crlf(mensaje.as_bytes()), flags)
+            total += 1
+        return total
+
+    def cargar_maildir(self, ruta: str, buzon: str = "INBOX", subcarpetas: bool = True) -> int:
+        """
+        Carga en un buzón los mensajes de un directorio Maildir con sus flags.
+        Las subcarpetas Maildir++ (".padre.hija") se cargan como "padre/hija".
+
+        :param ruta: Ruta del directorio Maildir.
+        :param buzon: Buzón destino de la carpeta raíz.
+        :param subcarpetas: Si es True se cargan también las subcarpetas.
+        :return: Número de mensajes cargados en total.
+        """
+        maildir = mailbox.Maildir(ruta, factory=None, create=False)
+        destino = self.agregar_buzon(buzon)
+        total = 0
+        # Los nombres Maildir empiezan por la marca de tiempo: se ordena por llegada
+        for clave in sorted(maildir.keys()):
+            mensaje = maildir[clave]
+            flags = [_FLAGS_MAILDIR[f] for f in mensaje.get_flags() if f in _FLAGS_MAILDIR]
+            destino.agregar(_a_crlf(mensaje.as_bytes()), flags)
+            total += 1
+        if subcarpetas:
+            for carpeta in maildir.list_folders():
+                total += self.cargar_maildir(os.path.join(ruta, "." + carpeta), carpeta.replace(".", "/"), False)
+        return total
+
+    def fallar(self, comando: str, veces: int = 1,
+               respuesta: str = "NO [UNAVAILABLE] Servicio no disponible temporalmente") -> None:
+        """
+        Hace que las siguientes ejecuciones de un comando fallen sin ejecutarse.
+
+        :param comando: Comando tal como se cuenta en las estadísticas ("UID SEARCH", "SELECT"...).
+        :param veces: Número de ejecuciones que fallan.
+        :param respuesta: Estado y texto de la respuesta etiquetada ("NO ...", "BAD ...") o
+                          "desconexion" para cortar la conexión sin responder.
+        """
+        with self.bloqueo:
+            self.fallos[comando.upper()] = [veces, respuesta]
+
+    def _fallo_pendiente(self, comando: str) -> Optional[str]:
+        with self.bloqueo:
+            fallo = self.fallos.get(comando)
+            if not fallo:
+                return None
+            fallo[0] -= 1
+            if fallo[0] <= 0:
+                del self.fallos[comando]
+            return fallo[1]
+
+    def latencia_de(self, comando: str) -> float:
+        """
+        Devuelve los segundos de latencia simulada para un comando.
+        """
+        return self.latencia_por_comando.get(comando.upper(), self.latencia)
+
+    def reiniciar_estadisticas(self) -> None:
+        """
+        Pone a cero los contadores de comandos y bytes.
+        """
+        with self.bloqueo:
+            self.estadisticas = {"comandos": Counter(), "round_trips": 0, "bytes_entrada": 0, "bytes_salida": 0}
+
+    def _registrar(self, comando: str) -> None:
+        with self.bloqueo:
+            self.estadisticas["comandos"][comando] += 1
+            self.estadisticas["round_trips"] += 1
+
+    def _contar_entrada(self, n: int) -> None:
+        with self.bloqueo:
+            self.estadisticas["bytes_entrada"] += n
+
+    def _contar_salida(self, n: int) -> None:
+        with self.bloqueo:
+            self.estadisticas["bytes_salida"] += n
+
+    def desconectar_clientes(self) -> None:
+        """
+        Cierra bruscamente todas las conexiones abiertas (simula una caída).
+        """
+        for cliente in list(self.clientes):
+            try:
+                cliente.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def iniciar(self, host: str = "127.0.0.1", puerto: int = 0) -> int:
+        """
+        Arranca el servidor en un hilo en segundo plano.
+
+        :return: Puerto en el que escucha el servidor.
+        """
+        self._servidor = _ServidorTCP((host, puerto), _ManejadorImap)
+        self._servidor.servidor_falso = self
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self._servidor.server_address[1]
+
+    def detener(self) -> None:
+        """
+        Detiene el servidor.
+        """
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    @property
+    def puerto(self) -> int:
+        return self._servidor.server_address[1]
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.detener()
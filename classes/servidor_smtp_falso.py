@@ -0,0 +1,197 @@
+import time
+import base64
+import socketserver
+import threading
+from collections import Counter
+from typing import List, Optional
+
+
+class _ManejadorSmtp(socketserver.StreamRequestHandler):
+    """
+    Atiende una conexión de cliente hablando un subconjunto de ESMTP
+    (EHLO/HELO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP y QUIT).
+    """
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.servidor: "ServidorSmtpFalso" = self.server.servidor_falso
+        self.autenticado = self.servidor.usuario is None
+        self._reiniciar()
+
+    def _reiniciar(self) -> None:
+        self.remitente = None
+        self.destinatarios = []
+
+    def _linea(self, texto: str) -> None:
+        self.wfile.write(texto.encode("utf-8") + b"\r\n")
+
+    def handle(self):
+        with self.servidor.bloqueo:
+            self.servidor.estadisticas["sesiones"] += 1
+        self._linea("220 localhost Servidor SMTP falso listo")
+        while True:
+            try:
+                linea = self.rfile.readline()
+            except OSError:
+                return
+            if not linea:
+                return
+            linea = linea.decode("utf-8", errors="replace").rstrip("\r\n")
+            comando, _, argumento = linea.partition(" ")
+            comando = comando.upper()
+            with self.servidor.bloqueo:
+                self.servidor.estadisticas["comandos"][comando] += 1
+            if self.servidor.latencia:
+                time.sleep(self.servidor.latencia)
+            metodo = getattr(self, f"_cmd_{comando.lower()}", None)
+            if metodo is None:
+                self._linea(f"502 comando desconocido {comando}")
+            elif metodo(argumento) is False:
+                return
+
+    def _cmd_ehlo(self, argumento):
+        self._linea("250-localhost")
+        if self.servidor.usuario is not None:
+            self._linea("250-AUTH PLAIN")
+        self._linea("250 8BITMIME")
+
+    def _cmd_helo(self, argumento):
+        self._linea("250 localhost")
+
+    def _cmd_auth(self, argumento):
+        mecanismo, _, datos = argumento.partition(" ")
+        if mecanismo.upper() != "PLAIN":
+            self._linea("504 mecanismo no soportado")
+            return
+        if not datos:
+            self._linea("334 ")
+            datos = self.rfile.readline().decode("ascii", errors="replace").strip()
+        try:
+            _, usuario, password = base64.b64decode(datos).decode("utf-8").split("\0")
+        except ValueError:
+            self._linea("501 credenciales mal formadas")
+            return
+        if (usuario, password) != (self.servidor.usuario, self.servidor.password):
+            self._linea("535 credenciales incorrectas")
+            return
+        self.autenticado = True
+        self._linea("235 autenticado")
+
+    def _cmd_mail(self, argumento):
+        if not self.autenticado:
+            self._linea("530 autenticacion necesaria")
+            return
+        self._reiniciar()
+        self.remitente = argumento.partition(":")[2].split(" ")[0].strip("<>")
+        self._linea("250 OK")
+
+    def _cmd_rcpt(self, argumento):
+        if self.remitente is None:
+            self._linea("503 falta MAIL FROM")
+            return
+        self.destinatarios.append(argumento.partition(":")[2].split(" ")[0].strip("<>"))
+        self._linea("250 OK")
+
+    def _cmd_data(self, argumento):
+        if not self.destinatarios:
+            self._linea("503 falta RCPT TO")
+            return
+        self._linea("354 termine con <CRLF>.<CRLF>")
+        lineas = []
+        while True:
+            linea = self.rfile.readline()
+            if not linea or linea in (b".\r\n", b".\n"):
+                break
+            lineas.append(linea[1:] if linea.startswith(b"..") else linea)
+        with self.servidor.bloqueo:
+            # Fallos transitorios simulados: se rechaza el mensaje o se corta la conexión
+            if self.servidor.fallos_pendientes:
+                self.servidor.fallos_pendientes -= 1
+                fallo = self.servidor.tipo_fallo
+            else:
+                fallo = None
+                self.servidor.mensajes.append({"remitente": self.remitente, "destinatarios": self.destinatarios,
+                                               "datos": b"".join(lineas)})
+        self._reiniciar()
+        if fallo == "desconexion":
+            return False
+        if fallo:
+            self._linea("451 error temporal, reintente")
+            return
+        self._linea("250 OK mensaje aceptado")
+
+    def _cmd_rset(self, argumento):
+        self._reiniciar()
+        self._linea("250 OK")
+
+    def _cmd_noop(self, argumento):
+        self._linea("250 OK")
+
+    def _cmd_quit(self, argumento):
+        self._linea("221 adios")
+        return False
+
+
+class _ServidorTCP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ServidorSmtpFalso:
+    """
+    Servidor SMTP en proceso, sin TLS, para probar las notificaciones sin
+    enviar correo real. Guarda los mensajes recibidos, cuenta sesiones y
+    comandos y puede simular latencia y fallos transitorios.
+    """
+    def __init__(self, usuario: Optional[str] = None, password: Optional[str] = None,
+                 latencia: float = 0.0, fallos: int = 0, tipo_fallo: str = "temporal"):
+        """
+        :param usuario: Usuario para AUTH PLAIN (None = sin autenticación).
+        :param password: Contraseña para AUTH PLAIN.
+        :param latencia: Segundos de espera antes de responder a cada comando.
+        :param fallos: Número de mensajes que se rechazan antes de aceptar los siguientes.
+        :param tipo_fallo: "temporal" (respuesta 451) o "desconexion" (se corta la conexión).
+        """
+        self.usuario = usuario
+        self.password = password
+        self.latencia = latencia
+        self.fallos_pendientes = fallos
+        self.tipo_fallo = tipo_fallo
+        self.mensajes: List[dict] = []
+        self.bloqueo = threading.Lock()
+        self.estadisticas = {"sesiones": 0, "comandos": Counter()}
+        self._servidor = None
+        self._hilo = None
+
+    def iniciar(self, host: str = "127.0.0.1", puerto: int = 0) -> int:
+        """
+        Arranca el servidor en un hilo en segundo plano.
+
+        :return: Puerto en el que escucha el servidor.
+        """
+        self._servidor = _ServidorTCP((host, puerto), _ManejadorSmtp)
+        self._servidor.servidor_falso = self
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self._servidor.server_address[1]
+
+    def detener(self) -> None:
+        """
+        Detiene el servidor.
+        """
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    @property
+    def puerto(self) -> int:
+        return self._servidor.server_address[1]
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc):
+        self.detener()
@@ -0,0 +1,38 @@
+import time
+from classes.correo import Correo
+
+# Conectar al servidor de correo (la sesión se reconecta sola si se cae)
+correo = Correo()
+
+intervalo_idle = correo.config.getfloat("opciones", "intervalo_idle", fallback=1500)
+intervalo_sondeo = correo.config.getfloat("opciones", "intervalo_sondeo", fallback=60)
+
+if "IDLE" in correo.capacidades():
+    correo.logger.log("Modo demonio: esperando correo nuevo con IMAP IDLE")
+else:
+    correo.logger.log(f"Modo demonio: el servidor no soporta IDLE, sondeo cada {intervalo_sondeo}s")
+
+try:
+    while True:
+        try:
+            # Solo se clasifican los UIDs llegados desde la última pasada
+            correo.organizar_bandeja("INBOX")
+        except Exception as e:
+            correo.logger.error(f"Error: {e}")
+            time.sleep(intervalo_sondeo)
+        # Actualizar los archivos de métricas tras cada pasada
+        correo.exportar_metricas()
+
+        try:
+            # IDLE se renueva antes de los 29 minutos que permite el RFC 2177
+            correo.esperar_correo_nuevo("INBOX", timeout=intervalo_idle, intervalo_sondeo=intervalo_sondeo)
+        except Exception as e:
+            # Si no se pudo reconectar, se reintenta en la siguiente vuelta
+            correo.logger.error(f"Error al esperar correo nuevo: {e}")
+            time.sleep(intervalo_sondeo)
+
+except KeyboardInterrupt:
+    correo.logger.log("Modo demonio detenido por el usuario")
+finally:
+    # Desconectar del servidor de correo
+    correo.desconectar_del_correo()
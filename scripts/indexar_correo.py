@@ -0,0 +1,20 @@
+from classes.correo import Correo
+
+# Rellena el índice local con los mensajes aún no indexados de la INBOX y de
+# cada carpeta de arbol_etiquetas (requiere la opción 'indice' en [opciones])
+correo = Correo()
+
+try:
+    bandejas = ["INBOX"] + [
+        f"{padre}/{hija}" for padre, hijas in correo.arbol_etiquetas.items() for hija in hijas
+    ]
+    existentes = correo.listar_etiquetas()
+    for bandeja in bandejas:
+        if bandeja == "INBOX" or bandeja in existentes:
+            correo.indexar_bandeja(bandeja)
+
+except Exception as e:
+    correo.logger.error(f"Error: {e}")
+finally:
+    # Desconectar del servidor de correo
+    correo.desconectar_del_correo()
@@ -4,38 +4,15 @@ from classes.logger import Logger
 # Conectar al servidor de correo
 correo = Correo()
 
-# Obtener etiquetas y filtros del correo
-diccionario_filtros = correo.crear_diccionario_filtros()
-
 try:
-    # Obtener los mensajes del correo de la bandeja de entrada
-    correo.seleccionar_bandeja("INBOX")
-
-    # Total de mensajes en la bandeja de entrada
-    total_mensajes = correo.total_mensajes()
+    # Clasificar y mover los mensajes nuevos de la bandeja de entrada
+    resultado = correo.organizar_bandeja("INBOX")
+    total_mensajes = resultado["total"]
 
     if total_mensajes == 0:
-        correo.logger.log("No hay mensajes en la bandeja de entrada")
-        raise Exception("No hay mensajes en la bandeja de entrada")
-
-    mensajes_movidos = 0
-
-    for etiqueta, filtro in diccionario_filtros.items():
-        correo.logger.log(f"Etiqueta: {etiqueta} - Filtro: {filtro}")
-
-        # Obtener los mensajes con su filtro correspondiente
-        id_mensajes = correo.filtrar_correo(filtro)
-        # Si no hay mensajes con el filtro, se continua con el siguiente filtro
-        if len(id_mensajes) == 0:
-            correo.logger.log(f"No hay mensajes con el filtro {filtro}")
-            continue
-        # Mover los mensajes a la carpeta correspondiente
-        correo.mover_correos("INBOX", etiqueta, id_mensajes)
-        # Marcar los mensajes como no leidos
-        correo.marcar_como_no_leidos(id_mensajes)
-        mensajes_movidos += len(id_mensajes)
+        raise Exception("No hay mensajes nuevos en la bandeja de entrada")
 
-        correo.logger.log(f"Total de mensajes movidos: {mensajes_movidos} de {total_mensajes}")
+    mensajes_movidos = sum(resultado["movidos"].values())
 
     if mensajes_movidos != total_mensajes:
         correo.logger.warning("No se movieron todos los mensajes")
@@ -45,4 +22,6 @@ except Exception as e:
     correo.logger.error(f"Error: {e}")
 finally:
     # Desconectar del servidor de correo
-    correo.desconectar_del_correo()
\ No newline at end of file
+    correo.desconectar_del_correo()
+    # Resumen de métricas (y archivos JSON/Prometheus si están configurados)
+    correo.exportar_metricas()
@@ -0,0 +1,9 @@
+from classes.multicuenta import OrganizadorCuentas
+
+# Organizar en paralelo todas las cuentas de config.ini ([login] y [cuenta:<nombre>])
+organizador = OrganizadorCuentas()
+resultados = organizador.organizar()
+
+for cuenta, resultado in resultados.items():
+    if "error" in resultado:
+        organizador.logger.error(f"Cuenta '{cuenta}' con errores: {resultado['error']}")
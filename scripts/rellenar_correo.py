@@ -0,0 +1,21 @@
+import sys
+from classes.relleno import RellenoParalelo
+from classes.metricas import METRICAS
+
+# Organiza de una vez un buzón grande repartiendo sus mensajes entre varias conexiones
+# (opciones relleno_conexiones y relleno_tamano_fragmento de [opciones]).
+# Uso: python -m scripts.rellenar_correo [seccion] [buzon]
+seccion = sys.argv[1] if len(sys.argv) > 1 else "login"
+bandeja = sys.argv[2] if len(sys.argv) > 2 else "INBOX"
+relleno = RellenoParalelo(seccion=seccion)
+
+try:
+    resultado = relleno.rellenar(bandeja)
+    for fragmento in resultado["fallidos"]:
+        relleno.logger.warning(f"Fragmento sin procesar (se reintentará en la próxima ejecución): {fragmento}")
+except Exception as e:
+    relleno.logger.error(f"Error: {e}")
+finally:
+    relleno.cerrar()
+    # Resumen de métricas (y archivos JSON/Prometheus si están configurados)
+    METRICAS.exportar(relleno.config, relleno.logger)
@@ -0,0 +1,40 @@
+import sys
+import time
+from classes.correo import Correo
+
+# Simula las reglas de etiquetas.json sobre el índice local, sin conectarse al servidor
+# (Correo solo abre la conexión IMAP con el primer comando, y aquí no se envía ninguno).
+# Uso: python -m scripts.simular_reglas [seccion] [buzon]
+seccion = sys.argv[1] if len(sys.argv) > 1 else "login"
+buzon = sys.argv[2] if len(sys.argv) > 2 else None
+
+try:
+    # Carga y valida config.ini y las reglas (compiladas o desde la caché)
+    correo = Correo(seccion=seccion)
+except ValueError:
+    sys.exit(1)
+logger = correo.logger
+motor = correo.motor_reglas()
+indice = correo.indice
+if indice is None:
+    logger.error("Hace falta la opción 'indice' en [opciones].")
+    sys.exit(1)
+cuenta = correo.username
+
+inicio = time.perf_counter()
+mensajes = list(indice.mensajes(cuenta, buzon))
+if motor.necesita_cuerpo and not any(m["cuerpo"] for m in mensajes):
+    logger.warning("Hay reglas por cuerpo pero el índice no guarda el cuerpo (opción 'indice_cuerpo').")
+resultado = motor.simular(mensajes)
+duracion = (time.perf_counter() - inicio) * 1000
+
+logger.log(f"Simulación sobre {resultado['total']} mensajes indexados en {duracion:.1f} ms")
+for etiqueta, total in resultado["por_etiqueta"].items():
+    logger.log(f"  {etiqueta}: {total}")
+logger.log(f"  Sin etiqueta: {len(resultado['sin_etiqueta'])}")
+for mensaje in resultado["sin_etiqueta"][:20]:
+    logger.log(f"    [{mensaje['carpeta']} UID {mensaje['uid']}] {mensaje['remitente']} - {mensaje['asunto']}")
+logger.log(f"  Mensajes que cambiarían de carpeta: {len(resultado['cambios'])}")
+for mensaje, etiqueta in resultado["cambios"][:20]:
+    logger.log(f"    [{mensaje['carpeta']} UID {mensaje['uid']}] -> {etiqueta}: {mensaje['asunto']}")
+indice.cerrar()
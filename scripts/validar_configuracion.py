@@ -0,0 +1,22 @@
+import sys
+from classes.correo import Correo
+
+# Valida config.ini y el archivo de reglas de una cuenta y compila las reglas
+# (o las carga de la caché), sin conectarse al servidor IMAP.
+# Uso: python -m scripts.validar_configuracion [seccion]
+seccion = sys.argv[1] if len(sys.argv) > 1 else "login"
+
+try:
+    correo = Correo(seccion=seccion)
+except ValueError:
+    # El motivo ya está en el log
+    sys.exit(1)
+
+motor = correo.motor_reglas()
+correo.logger.log(f"Configuración de '{seccion}' válida: {len(motor.reglas)} reglas, "
+                  f"{sum(1 for regla in motor.reglas if regla.criterio)} traducibles a SEARCH, "
+                  f"servidor {correo.imap_server}")
+if correo.notificador is not None:
+    correo.logger.log(f"Notificaciones por {correo.notificador.servidor}:{correo.notificador.puerto} "
+                      f"a {', '.join(correo.notificador.destinatarios)}")
+    correo.notificador.cerrar()
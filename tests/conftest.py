@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import classes.logger
+from classes.carpetas import CacheCarpetas
+from classes.conexiones import GestorConexiones
+from classes.correo import Correo
+from classes.servidor_imap_falso import ServidorImapFalso
+
+ETIQUETAS = {
+    "arbol_etiquetas": {"banco": ["openbank"]},
+    "filtro_etiquetas": {"openbank": {"remitente": "openbank", "asunto": "", "cuerpo": ""}},
+}
+DESTINO = "banco/openbank"
+
+
+def mensaje(i: int, remitente: str = "avisos@openbank.es") -> bytes:
+    """
+    Mensaje de prueba con Message-ID único (en CRLF, como lo guarda un servidor).
+    """
+    return (f"From: {remitente}\r\nSubject: Movimiento {i}\r\nMessage-ID: <{i}@prueba>\r\n"
+            f"\r\nCuerpo del movimiento {i}\r\n").encode()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def carpeta_logs(tmp_path_factory):
+    """
+    Los logs de las pruebas van a una carpeta temporal y no a `logs/` del
+    proyecto. El escritor de cada programa se crea con el primer Logger, así
+    que la carpeta se cambia antes de la primera prueba.
+    """
+    carpeta = tmp_path_factory.mktemp("logs")
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setattr(classes.logger, "CARPETA_LOGS", str(carpeta))
+        yield carpeta
+
+
+@pytest.fixture
+def servidor(request):
+    """
+    Servidor IMAP falso con la carpeta destino creada. Las capacidades se
+    pueden cambiar con @pytest.mark.parametrize("servidor", [...], indirect=True).
+    """
+    capacidades = getattr(request, "param", ("IMAP4rev1", "MOVE", "UIDPLUS", "IDLE"))
+    with ServidorImapFalso(capacidades=capacidades) as srv:
+        srv.agregar_buzon(DESTINO)
+        # La caché de carpetas es por (servidor, usuario) y todos los servidores son 127.0.0.1
+        CacheCarpetas.invalidar(("127.0.0.1", srv.usuario))
+        yield srv
+        CacheCarpetas.invalidar(("127.0.0.1", srv.usuario))
+
+
+@pytest.fixture
+def crear_correo(tmp_path, servidor):
+    """
+    Devuelve una función que crea un Correo contra el servidor falso con las
+    opciones indicadas. Las instancias se desconectan al terminar la prueba.
+    """
+    creados = []
+
+    def crear(etiquetas: dict = ETIQUETAS, **opciones) -> Correo:
+        """
+        :param etiquetas: Contenido de etiquetas.json (por defecto, ETIQUETAS).
+        :param opciones: Opciones de [opciones] en config.ini.
+        """
+        ruta_etiquetas = tmp_path / "etiquetas.json"
+        ruta_etiquetas.write_text(json.dumps(etiquetas), encoding="utf-8")
+        valores = {"carpeta_estado": str(tmp_path / "estado"), **opciones}
+        ruta = tmp_path / "config.ini"
+        ruta.write_text(
+            f"[login]\nusername = {servidor.usuario}\npassword = {servidor.password}\n"
+            f"imap_server = 127.0.0.1\nimap_port = {servidor.puerto}\nimap_ssl = no\n"
+            f"etiquetas = {ruta_etiquetas}\n[opciones]\n" + "".join(f"{k} = {v}\n" for k, v in valores.items()),
+            encoding="utf-8",
+        )
+        correo = Correo(str(ruta))
+        creados.append(correo)
+        return correo
+
+    yield crear
+    for correo in creados:
+        correo.desconectar_del_correo()
+
+
+@pytest.fixture
+def gestor(servidor):
+    """
+    Pool de conexiones contra el servidor falso, con reintentos rápidos.
+    """
+    gestor = GestorConexiones("127.0.0.1", servidor.usuario, servidor.password, puerto=servidor.puerto, ssl=False,
+                              reintentos=1, espera_inicial=0.01)
+    yield gestor
+    gestor.cerrar()
@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+import classes.reglas
+from classes.reglas import MotorReglas
+from conftest import DESTINO, ETIQUETAS
+
+SOLAPADAS = {
+    "arbol_etiquetas": {"banco": ["openbank", "recibos"]},
+    "filtro_etiquetas": {"openbank": {"remitente": "openbank"}, "recibos": {"remitente": "recibos@openbank.es"}},
+}
+
+
+def _caches(tmp_path):
+    return sorted((tmp_path / "estado").glob("reglas_*"))
+
+
+def test_crear_correo_no_abre_conexion(servidor, crear_correo):
+    correo = crear_correo()
+    correo.motor_reglas()
+    assert not correo.conectado
+    assert not servidor.estadisticas["comandos"]
+
+
+def test_reutiliza_la_cache_json(crear_correo, tmp_path, monkeypatch):
+    avisos = crear_correo(SOLAPADAS).crear_motor_reglas().conflictos()
+    [cache] = _caches(tmp_path)
+    assert cache.suffix == ".json" and json.loads(cache.read_text(encoding="utf-8"))["avisos"] == avisos
+    if hasattr(os, "getuid"):
+        assert cache.stat().st_mode & 0o077 == 0
+
+    # Con la caché no se vuelven a buscar conflictos ni a construir los autómatas
+    monkeypatch.setattr(MotorReglas, "conflictos", lambda motor: pytest.fail("se recompilaron las reglas"))
+    monkeypatch.setattr(classes.reglas.AhoCorasick, "__init__", lambda *a: pytest.fail("se construyó un autómata"))
+    motor = crear_correo(SOLAPADAS).crear_motor_reglas()
+    assert motor.clasificar("Avisos <recibos@openbank.es>", "") == "banco/openbank"
+
+
+def test_cambio_de_reglas_sustituye_la_cache(crear_correo, tmp_path):
+    crear_correo(SOLAPADAS).crear_motor_reglas()
+    anterior = _caches(tmp_path)
+    # Restos de la caché con pickle de versiones anteriores del mismo archivo de reglas
+    (tmp_path / "estado" / (anterior[0].name.rsplit("_", 1)[0] + "_0.pickle")).write_bytes(b"x")
+
+    motor = crear_correo(ETIQUETAS).crear_motor_reglas()
+
+    assert motor.etiquetas == [DESTINO]
+    nuevas = _caches(tmp_path)
+    assert len(nuevas) == 1 and nuevas != anterior
+
+
+@pytest.mark.parametrize("alterar", ["reglas", "automata", "basura", "permisos"])
+def test_cache_alterada_se_ignora(crear_correo, tmp_path, alterar):
+    crear_correo(SOLAPADAS).crear_motor_reglas()
+    [cache] = _caches(tmp_path)
+    datos = json.loads(cache.read_text(encoding="utf-8"))
+    if alterar == "reglas":
+        datos["reglas"][0][1] = {"remitente": "atacante"}
+    elif alterar == "automata":
+        datos["automatas"]["remitente"]["transiciones"][0] = {"o": 9999}
+    cache.write_text("{no es json" if alterar == "basura" else json.dumps(datos), encoding="utf-8")
+    if alterar == "permisos":
+        if not hasattr(os, "getuid"):
+            pytest.skip("Sin permisos POSIX")
+        datos["avisos"] = ["aviso inyectado"]
+        cache.write_text(json.dumps(datos), encoding="utf-8")
+        cache.chmod(0o666)
+
+    correo = crear_correo(SOLAPADAS)
+    motor = correo.crear_motor_reglas()
+
+    assert motor.clasificar("openbank", "") == "banco/openbank"
+    assert motor.clasificar("atacante", "") is None
+    assert json.loads(_caches(tmp_path)[0].read_text(encoding="utf-8"))["avisos"] == motor.conflictos()
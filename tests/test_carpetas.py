@@ -0,0 +1,54 @@
+from classes.carpetas import codificar_utf7_imap, decodificar_utf7_imap
+from conftest import DESTINO, mensaje
+
+ETIQUETAS = {
+    "arbol_etiquetas": {"Facturación": ["luz", "agua"]},
+    "filtro_etiquetas": {"luz": {"remitente": "luz", "asunto": "", "cuerpo": ""},
+                         "agua": {"remitente": "agua", "asunto": "", "cuerpo": ""}},
+}
+
+
+def test_utf7_imap_ida_y_vuelta():
+    assert codificar_utf7_imap("Facturación & más") == "Facturaci&APM-n &- m&AOE-s"
+    assert decodificar_utf7_imap("Facturaci&APM-n &- m&AOE-s") == "Facturación & más"
+
+
+def test_un_solo_list_por_cuenta(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    primero = crear_correo()
+    segundo = crear_correo()
+    servidor.reiniciar_estadisticas()
+
+    primero.mover_correos("INBOX", DESTINO, [1])
+    assert segundo.listar_etiquetas() == primero.listar_etiquetas()
+
+    assert servidor.estadisticas["comandos"]["LIST"] == 1
+
+
+def test_carpeta_creada_despues_de_llenar_la_cache(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    correo = crear_correo()
+    correo.listar_etiquetas()
+    # Otra herramienta (o el usuario) crea la carpeta con la caché ya llena
+    servidor.agregar_buzon("banco/nueva")
+
+    resultados = correo.mover_correos("INBOX", "banco/nueva", [1])
+
+    assert [r["estado"] for r in resultados] == ["OK"]
+    assert len(servidor.obtener_buzon("banco/nueva").mensajes) == 1
+
+
+def test_crear_carpetas_del_arbol_de_una_vez(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1, "recibos@luz.es"))
+    correo = crear_correo(ETIQUETAS, crear_carpetas="yes")
+    servidor.reiniciar_estadisticas()
+
+    correo.organizar_bandeja("INBOX")
+
+    # Los nombres no ASCII se crean en UTF-7 modificado
+    for carpeta in ("Facturaci&APM-n", "Facturaci&APM-n/luz", "Facturaci&APM-n/agua"):
+        assert servidor.obtener_buzon(carpeta) is not None
+    assert len(servidor.obtener_buzon("Facturaci&APM-n/luz").mensajes) == 1
+    assert servidor.estadisticas["comandos"]["CREATE"] == 3
+    # Un LIST inicial y otro para ver las carpetas creadas
+    assert servidor.estadisticas["comandos"]["LIST"] == 2
@@ -0,0 +1,30 @@
+from classes.diario import DiarioMovimientos
+
+
+def test_pendientes_sigue_el_ultimo_paso(tmp_path):
+    diario = DiarioMovimientos(str(tmp_path))
+    movido = diario.planificar("usuario", "INBOX", comando="MOVE", destino="banco", uids="1:5", uidvalidity=7)
+    copiado = diario.planificar("usuario", "INBOX", comando="COPY", destino="banco", uids="6:9", uidvalidity=7)
+    diario.anotar("usuario", "INBOX", movido, "hecho")
+    diario.anotar("usuario", "INBOX", copiado, "copiado")
+
+    pendientes = diario.pendientes("usuario", "INBOX")
+    assert [(p["uids"], p["paso"]) for p in pendientes] == [("6:9", "copiado")]
+
+    diario.anotar("usuario", "INBOX", copiado, "hecho")
+    diario.compactar("usuario", "INBOX")
+    assert not (tmp_path / "usuario_INBOX.diario.jsonl").exists()
+
+
+def test_linea_cortada_no_se_come_la_siguiente_anotacion(tmp_path):
+    diario = DiarioMovimientos(str(tmp_path))
+    bloque = diario.planificar("usuario", "INBOX", comando="COPY", destino="banco", uids="1:3", uidvalidity=7)
+    # Caída a mitad de escritura: la última línea queda sin terminar (y con un carácter UTF-8 partido)
+    with open(diario.ruta("usuario", "INBOX"), "ab") as archivo:
+        archivo.write('{"bloque": "x", "destino": "ñ'.encode("utf-8")[:-1])
+
+    diario.anotar("usuario", "INBOX", bloque, "copiado")
+    otro = diario.planificar("usuario", "INBOX", comando="COPY", destino="otros", uids="4", uidvalidity=7)
+
+    pendientes = diario.pendientes("usuario", "INBOX")
+    assert [(p["bloque"], p["paso"]) for p in pendientes] == [(bloque, "copiado"), (otro, "plan")]
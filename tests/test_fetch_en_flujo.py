@@ -0,0 +1,72 @@
+import email.policy
+from email.message import EmailMessage
+
+import pytest
+
+from classes.respuestas_imap import agrupar_respuesta_fetch, partes_bodystructure
+from conftest import mensaje
+
+
+def _con_adjuntos() -> bytes:
+    reenviado = EmailMessage()
+    reenviado["Subject"] = "Reenviado"
+    reenviado.set_content("Texto del mensaje reenviado")
+    principal = EmailMessage()
+    principal["From"] = "avisos@openbank.es"
+    principal["Subject"] = "Con adjuntos"
+    principal.set_content("Texto principal")
+    principal.add_attachment(reenviado)
+    principal.add_attachment(b"%PDF-1.4", maintype="application", subtype="pdf", filename="año.pdf")
+    return principal.as_bytes(policy=email.policy.SMTP)
+
+
+def test_fetch_en_flujo_abandonado_deja_la_sesion_sincronizada(servidor, gestor):
+    for i in range(200):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        conjuntos = [f"{i}:{i + 19}" for i in range(1, 200, 20)]
+
+        for respuesta in sesion.fetch_en_flujo(conjuntos, "(BODY.PEEK[])", ventana=4):
+            break
+
+        # Las respuestas de los FETCH que quedaron en vuelo no se toman por las del siguiente comando
+        assert sesion.uid("FETCH", "7", "(UID)") == ("OK", [b"7 (UID 7)"])
+        assert sesion.uid("SEARCH", "UID", "190:200")[1] == [b" ".join(str(u).encode() for u in range(190, 201))]
+        # ...ni hizo falta reconectar para recuperarla
+        assert sesion.saturaciones == 0
+
+
+def test_fetch_en_flujo_impide_otros_comandos_mientras_esta_abierto(servidor, gestor):
+    for i in range(50):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        flujo = sesion.fetch_en_flujo(["1:25", "26:50"], "(BODY.PEEK[])", ventana=2)
+        next(flujo)
+        with pytest.raises(RuntimeError):
+            sesion.noop()
+        flujo.close()
+        assert sesion.noop()[0] == "OK"
+
+
+def test_bodystructure_con_literales_y_mensaje_reenviado(servidor, gestor, crear_correo, tmp_path):
+    servidor.agregar_mensaje("INBOX", _con_adjuntos())
+    esperado = [("1", "text/plain", None, False), ("2", "message/rfc822", None, True),
+                ("3", "application/pdf", "año.pdf", True)]
+
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        # El servidor envía el nombre no ASCII como literal, en medio del BODYSTRUCTURE
+        respuesta = agrupar_respuesta_fetch(list(sesion.fetch_en_flujo(["1"], "(BODYSTRUCTURE)"))[0])
+    partes = partes_bodystructure(respuesta[1]["BODYSTRUCTURE"])
+    assert [(p["parte"], p["tipo"], p["nombre"], p["adjunto"]) for p in partes] == esperado
+
+    correo = crear_correo()
+    correo.seleccionar_bandeja("INBOX")
+    assert [(p["parte"], p["nombre"]) for p in correo.listar_adjuntos(1)] == [("2", None), ("3", "año.pdf")]
+    rutas = correo.guardar_adjuntos(1, str(tmp_path / "adjuntos"))
+    with open(rutas[1], "rb") as archivo:
+        assert archivo.read() == b"%PDF-1.4"
+    with open(rutas[0], "rb") as archivo:
+        assert b"Texto del mensaje reenviado" in archivo.read()
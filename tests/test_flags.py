@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import mensaje
+
+
+def _cargar(servidor, n=20):
+    for i in range(n):
+        servidor.agregar_mensaje("INBOX", mensaje(i), flags=["\\Seen"])
+
+
+def test_marcar_como_no_leidos_con_un_store_por_bloque(servidor, crear_correo):
+    _cargar(servidor)
+    correo = crear_correo(longitud_maxima_comando=8)
+    correo.seleccionar_bandeja("INBOX")
+    servidor.reiniciar_estadisticas()
+
+    assert correo.marcar_como_no_leidos([b"1", b"2", b"3", b"5", b"7", b"9", b"11"]) == []
+
+    # "1:3,5,7" y "9,11": dos comandos en lugar de siete
+    assert servidor.estadisticas["comandos"]["UID STORE"] == 2
+    no_leidos = sorted(m.uid for m in servidor.obtener_buzon("INBOX").mensajes if "\\Seen" not in m.flags)
+    assert no_leidos == [1, 2, 3, 5, 7, 9, 11]
+
+
+@pytest.mark.parametrize("servidor", [("IMAP4rev1", "UIDPLUS"), ("IMAP4rev1",)], indirect=True,
+                         ids=["UIDPLUS", "sin-UIDPLUS"])
+def test_eliminar_solo_expurga_los_indicados(servidor, crear_correo):
+    _cargar(servidor)
+    # Otro mensaje ya marcado como \Deleted: solo UID EXPUNGE lo respeta
+    servidor.obtener_buzon("INBOX").mensajes[0].flags.add("\\Deleted")
+    correo = crear_correo()
+    correo.seleccionar_bandeja("INBOX")
+    servidor.reiniciar_estadisticas()
+
+    assert correo.eliminar_correos(list(range(5, 11)))
+
+    restantes = [m.uid for m in servidor.obtener_buzon("INBOX").mensajes]
+    if "UIDPLUS" in servidor.capacidades:
+        assert restantes == [1, 2, 3, 4] + list(range(11, 21))
+        assert servidor.estadisticas["comandos"]["UID EXPUNGE"] == 1
+    else:
+        assert restantes == [2, 3, 4] + list(range(11, 21))
+    assert servidor.estadisticas["comandos"]["UID STORE"] == 1
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from conftest import DESTINO, mensaje
+
+
+def test_idle_despierta_con_datos_ya_recibidos(servidor, gestor):
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        # El EXISTS llega en el mismo paquete que "+ idling" y queda en el búfer de imaplib
+        servidor.agregar_mensaje("INBOX", mensaje(1))
+        inicio = time.monotonic()
+        assert sesion.idle(5) == [b"* 1 EXISTS"]
+        assert time.monotonic() - inicio < 2
+
+
+def test_idle_despierta_con_correo_nuevo(servidor, gestor):
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        threading.Timer(0.2, servidor.agregar_mensaje, ("INBOX", mensaje(1))).start()
+        inicio = time.monotonic()
+        assert sesion.idle(5) == [b"* 1 EXISTS"]
+        assert time.monotonic() - inicio < 2
+        assert sesion.idle(0.2) == []
+        assert sesion.noop()[0] == "OK"
+
+
+def test_exists_recibido_durante_la_pasada_no_se_pierde(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    correo = crear_correo()
+    correo.organizar_bandeja("INBOX")
+    # Llega un mensaje y el servidor lo anuncia en la respuesta de un comando de la pasada
+    servidor.agregar_mensaje("INBOX", mensaje(2))
+    assert correo.imap.noop()[0] == "OK"
+
+    inicio = time.monotonic()
+    assert correo.esperar_correo_nuevo("INBOX", timeout=5)
+    assert time.monotonic() - inicio < 2
+    assert correo.organizar_bandeja("INBOX")["movidos"] == {DESTINO: 1}
+    # Ya no queda nada pendiente: IDLE espera hasta el timeout
+    assert not correo.esperar_correo_nuevo("INBOX", timeout=0.3)
+
+
+def test_exists_durante_un_fetch_en_flujo_se_conserva(servidor, gestor):
+    for i in range(20):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        sesion.response("EXISTS")
+        servidor.agregar_mensaje("INBOX", mensaje(20))
+
+        assert len(list(sesion.fetch_en_flujo(["1:10", "11:20"], "(UID)"))) == 20
+        assert sesion.response("EXISTS") == ("EXISTS", [b"21"])
+
+
+def test_correo_llegado_sin_bandeja_seleccionada(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    correo = crear_correo()
+    correo.organizar_bandeja("INBOX")
+    correo.imap.close()
+    correo.bandeja_actual = None
+    servidor.agregar_mensaje("INBOX", mensaje(2))
+
+    inicio = time.monotonic()
+    assert correo.esperar_correo_nuevo("INBOX", timeout=5)
+    assert time.monotonic() - inicio < 2
@@ -0,0 +1,70 @@
+import pytest
+
+from classes.indice import IndiceCorreo
+from conftest import DESTINO, mensaje
+
+CON_MOVE = ("IMAP4rev1", "MOVE", "UIDPLUS")
+SIN_MOVE = ("IMAP4rev1", "UIDPLUS")
+
+
+def _cargar(servidor, n, del_banco):
+    for i in range(n):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "avisos@openbank.es" if i in del_banco else "otro@ejemplo.com"))
+
+
+def test_mover_sobre_un_uid_ocupado_no_deja_texto_huerfano(tmp_path):
+    indice = IndiceCorreo(str(tmp_path / "indice.sqlite"))
+    indice.guardar("usuario", "INBOX", [{"uid": 1, "remitente": "ana", "asunto": "factura de la luz"}])
+    # Fila antigua en el destino con el UID que asignó el servidor (p. ej. tras un UIDVALIDITY reutilizado)
+    indice.guardar("usuario", "banco", [{"uid": 5, "remitente": "antiguo", "asunto": "obsoleto"}])
+
+    indice.mover("usuario", "INBOX", "banco", [1], {1: 5})
+
+    filas = list(indice.mensajes("usuario"))
+    assert [(f["buzon"], f["uid"], f["asunto"]) for f in filas] == [("banco", 5, "factura de la luz")]
+    if indice.texto_completo:
+        assert indice.buscar("usuario", "obsoleto") == []
+        assert [m["uid"] for m in indice.buscar("usuario", "factura")] == [5]
+        indice.conexion.execute("INSERT INTO mensajes_fts(mensajes_fts, rank) VALUES ('integrity-check', 1)")
+    indice.cerrar()
+
+
+@pytest.mark.parametrize("servidor", [CON_MOVE, SIN_MOVE], indirect=True, ids=["MOVE", "COPY-EXPUNGE"])
+def test_copyuid_actualiza_el_indice(servidor, crear_correo, tmp_path):
+    _cargar(servidor, 6, del_banco=range(6))
+    correo = crear_correo(indice=tmp_path / "indice.sqlite")
+    correo.seleccionar_bandeja("INBOX")
+    correo.indexar_bandeja("INBOX")
+    # Un COPYUID sin leer de un comando anterior no debe atribuirse al siguiente
+    correo.imap.uid("COPY", "1:2", DESTINO)
+
+    resultados = correo.mover_correos("INBOX", DESTINO, [4, 5])
+
+    assert resultados[0]["copyuid"][1] == {4: 3, 5: 4}
+    indexados = {(m["buzon"], m["uid"]): m["asunto"] for m in correo.indice.mensajes(correo.username)}
+    assert indexados[(DESTINO, 3)] == "Movimiento 3"
+    assert indexados[(DESTINO, 4)] == "Movimiento 4"
+    assert ("INBOX", 4) not in indexados and ("INBOX", 5) not in indexados
+
+
+def test_simulacion_sobre_el_indice_sin_tocar_el_servidor(servidor, crear_correo, tmp_path):
+    _cargar(servidor, 8, del_banco=(1, 4, 6))
+    servidor.agregar_mensaje(DESTINO, mensaje(20))
+    indice = tmp_path / "indice.sqlite"
+    correo = crear_correo(indice=indice)
+    for bandeja in ("INBOX", DESTINO):
+        correo.indexar_bandeja(bandeja)
+    correo.desconectar_del_correo()
+
+    # Como scripts/simular_reglas.py: una instancia nueva que solo lee el índice
+    servidor.reiniciar_estadisticas()
+    simulador = crear_correo(indice=indice)
+    resultado = simulador.motor_reglas().simular(simulador.indice.mensajes(simulador.username))
+
+    assert resultado["total"] == 9
+    assert resultado["por_etiqueta"] == {DESTINO: 4}
+    # El mensaje que ya está en su carpeta no es un cambio
+    assert sorted(m["uid"] for m, etiqueta in resultado["cambios"]) == [2, 5, 7]
+    assert all(etiqueta == DESTINO for m, etiqueta in resultado["cambios"])
+    assert sorted(m["asunto"] for m in resultado["sin_etiqueta"]) == [f"Movimiento {i}" for i in (0, 2, 3, 5, 7)]
+    assert not servidor.estadisticas["comandos"]
@@ -0,0 +1,67 @@
+import configparser
+import gzip
+import json
+import logging
+import os
+import time
+
+from classes.logger import ArchivoRotativo, Logger, _ESCRITORES
+
+
+def _registro(mensaje: str) -> logging.LogRecord:
+    return logging.LogRecord("prueba", logging.INFO, __file__, 0, mensaje, None, None)
+
+
+def test_rotacion_por_tamano_comprimida(tmp_path):
+    archivo = ArchivoRotativo(str(tmp_path), "prueba", tamano_maximo=100, copias=2)
+    for i in range(10):
+        archivo.emit(_registro(f"linea {i} " + "x" * 40))
+    archivo.close()
+
+    base = os.path.basename(archivo.baseFilename)
+    assert sorted(os.listdir(tmp_path)) == [base, f"{base}.1.gz", f"{base}.2.gz"]
+    with gzip.open(tmp_path / f"{base}.1.gz", "rt", encoding="utf-8") as rotado:
+        assert [linea[:7] for linea in rotado.read().splitlines()] == ["linea 6", "linea 7"]
+    assert (tmp_path / base).read_text(encoding="utf-8").startswith("linea 8 ")
+
+
+def test_cambio_de_dia_y_retencion(tmp_path):
+    antiguo, ajeno = tmp_path / "prueba_2020-01-01.log.gz", tmp_path / "otro_2020-01-01.log"
+    for ruta in (antiguo, ajeno):
+        ruta.write_bytes(b"")
+        os.utime(ruta, (time.time() - 40 * 86400,) * 2)
+    archivo = ArchivoRotativo(str(tmp_path), "prueba", dias_retencion=30)
+    # Solo se borran los logs antiguos del propio programa
+    assert not antiguo.exists() and ajeno.exists()
+
+    # El proceso sigue abierto desde otro día
+    hoy = archivo.fecha
+    archivo.fecha, archivo.baseFilename = "2000-01-01", archivo._ruta("2000-01-01")
+    (tmp_path / "prueba_2000-01-01.log").write_text("de ayer\n", encoding="utf-8")
+    archivo.emit(_registro("de hoy"))
+    archivo.close()
+
+    with gzip.open(tmp_path / "prueba_2000-01-01.log.gz", "rt", encoding="utf-8") as anterior:
+        assert anterior.read() == "de ayer\n"
+    assert not (tmp_path / "prueba_2000-01-01.log").exists()
+    assert archivo.baseFilename == archivo._ruta(hoy)
+    assert (tmp_path / f"prueba_{hoy}.log").read_text(encoding="utf-8") == "de hoy\n"
+
+
+def test_formato_json_y_muestreo(carpeta_logs):
+    config = configparser.ConfigParser()
+    config.read_string("[opciones]\nlog_formato = json\nmuestreo_debug = 0\n")
+    logger = Logger("prueba_json")
+    logger.configurar(config)
+
+    logger.log("Año nuevo")
+    # Detener el escritor vacía la cola en el archivo (se vuelve a arrancar para el atexit)
+    escucha = _ESCRITORES["prueba_json"].escucha
+    escucha.stop()
+    escucha.start()
+
+    linea = json.loads(open(logger.archivo_log, encoding="utf-8").read())
+    assert {k: linea[k] for k in ("nivel", "programa", "mensaje")} == {
+        "nivel": "INFO", "programa": "prueba_json", "mensaje": "Año nuevo"}
+    assert os.path.dirname(logger.archivo_log) == str(carpeta_logs)
+    assert not logger.muestrear()
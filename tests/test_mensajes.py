@@ -0,0 +1,74 @@
+import base64
+import email.policy
+import quopri
+from email.message import EmailMessage
+
+from classes.mensajes import DecodificadorIncremental, MensajeCorreo, decodificar_cabecera, decodificar_contenido
+from classes.respuestas_imap import agrupar_respuesta_fetch, partes_bodystructure
+
+
+def test_cabecera_con_varios_fragmentos_y_charsets():
+    valor = "=?utf-8?b?" + base64.b64encode("Notificación".encode()).decode() + "?= =?iso-8859-1?q?de_pa=F1o?= final"
+    # El espacio entre dos palabras codificadas no forma parte del texto (RFC 2047)
+    assert decodificar_cabecera(valor) == "Notificaciónde paño final"
+    assert decodificar_cabecera(b"Sin codificar") == "Sin codificar"
+    assert decodificar_cabecera(None) == ""
+
+
+def test_cuerpo_con_el_charset_declarado():
+    datos = (b"From: a@ejemplo.com\r\nContent-Type: text/plain; charset=iso-8859-1\r\n"
+             b"Content-Transfer-Encoding: quoted-printable\r\n\r\nA=F1o nuevo, caf=E9\r\n")
+    assert MensajeCorreo(datos).cuerpo == "Año nuevo, café\r\n"
+    # Un charset desconocido no rompe la decodificación: se prueba UTF-8 y latin1
+    assert decodificar_contenido("año".encode("latin1"), None, "x-desconocido") == "año"
+
+
+def test_cuerpo_html_sin_decodificar_adjuntos():
+    mensaje = EmailMessage()
+    mensaje["From"] = "a@ejemplo.com"
+    mensaje["Subject"] = "Factura"
+    mensaje.set_content("texto")
+    mensaje.add_alternative("<p>html</p>", subtype="html")
+    mensaje.add_attachment(b"\x00" * 1000, maintype="application", subtype="octet-stream", filename="datos.bin")
+    correo = MensajeCorreo(mensaje.as_bytes(policy=email.policy.SMTP), uid=3)
+
+    assert correo.asunto == "Factura"
+    # Las cabeceras no obligan a recorrer las partes
+    assert correo._partes is None
+    assert correo["cuerpo"] == "<p>html</p>\r\n"
+    adjunto = [p for p in correo.partes if p["adjunto"]]
+    assert [(p["parte"], p["nombre"]) for p in adjunto] == [("2", "datos.bin")]
+
+
+def test_estructura_local_igual_que_bodystructure(servidor, gestor):
+    reenviado = EmailMessage()
+    reenviado["Subject"] = "Reenviado"
+    reenviado.set_content("interno")
+    mensaje = EmailMessage()
+    mensaje["From"] = "a@ejemplo.com"
+    mensaje.set_content("texto")
+    mensaje.add_alternative("<p>html</p>", subtype="html")
+    mensaje.add_attachment(reenviado)
+    mensaje.add_attachment(b"%PDF", maintype="application", subtype="pdf", filename="año.pdf")
+    datos = mensaje.as_bytes(policy=email.policy.SMTP)
+    servidor.agregar_mensaje("INBOX", datos)
+
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        respuesta = agrupar_respuesta_fetch(sesion.uid("FETCH", "1", "(BODYSTRUCTURE)")[1])
+
+    campos = ("parte", "tipo", "charset", "nombre", "adjunto")
+    servidor_partes = [tuple(p[c] for c in campos) for p in partes_bodystructure(respuesta[1]["BODYSTRUCTURE"])]
+    locales = [tuple(p[c] for c in campos) for p in MensajeCorreo(datos).partes]
+    assert [p[:2] for p in locales] == [("1.1", "text/plain"), ("1.2", "text/html"), ("2", "message/rfc822"),
+                                       ("3", "application/pdf")]
+    assert [(p[0], p[1], p[3], p[4]) for p in locales] == [(p[0], p[1], p[3], p[4]) for p in servidor_partes]
+
+
+def test_decodificador_incremental_en_trozos():
+    contenido = bytes(range(256)) * 20
+    for codificacion, codificado in (("BASE64", base64.encodebytes(contenido)),
+                                     ("QUOTED-PRINTABLE", quopri.encodestring(contenido))):
+        decodificador = DecodificadorIncremental(codificacion)
+        trozos = [decodificador.decodificar(codificado[i:i + 37]) for i in range(0, len(codificado), 37)]
+        assert b"".join(trozos) + decodificador.terminar() == contenido
@@ -0,0 +1,61 @@
+import json
+
+from classes.metricas import METRICAS, Metricas
+from conftest import DESTINO, mensaje
+
+
+def test_histograma_y_percentiles():
+    metricas = Metricas()
+    for duracion in (0.002,) * 8 + (0.2, 3.0):
+        metricas.observar_comando("ana", "UID FETCH", duracion, "OK", enviados=10, recibidos=100)
+    metricas.observar_comando("ana", "UID FETCH", 0.004, "NO")
+    metricas.sumar_bytes("ana", "UID FETCH", 5, 50)
+
+    datos = metricas.resumen()["ana"]["comandos"]["UID FETCH"]
+
+    assert datos["total"] == 11 and datos["estados"] == {"OK": 10, "NO": 1}
+    assert (datos["bytes_enviados"], datos["bytes_recibidos"]) == (105, 1050)
+    assert (datos["minimo"], datos["maximo"]) == (0.002, 3.0)
+    # Cada percentil es el límite de su cubeta, sin pasar del máximo observado
+    assert (datos["p50"], datos["p90"], datos["p99"]) == (0.0025, 0.25, 3.0)
+
+
+def test_formato_prometheus():
+    metricas = Metricas()
+    metricas.observar_comando('a"b', "SELECT", 0.003, "OK")
+    metricas.observar_comando('a"b', "SELECT", 20.0, "BAD")
+    metricas.incrementar("mensajes_movidos", 'a"b', DESTINO, 3)
+    metricas.incrementar("mensajes_movidos", 'a"b', DESTINO, 0)
+
+    lineas = metricas.prometheus().splitlines()
+
+    etiquetas = 'cuenta="a\\"b",comando="SELECT"'
+    # Las cubetas son acumulativas y +Inf coincide con el total
+    assert f'correo_imap_comando_segundos_bucket{{{etiquetas},le="0.0025"}} 0' in lineas
+    assert f'correo_imap_comando_segundos_bucket{{{etiquetas},le="0.005"}} 1' in lineas
+    assert f'correo_imap_comando_segundos_bucket{{{etiquetas},le="10.0"}} 1' in lineas
+    assert f'correo_imap_comando_segundos_bucket{{{etiquetas},le="+Inf"}} 2' in lineas
+    assert f'correo_imap_comando_segundos_count{{{etiquetas}}} 2' in lineas
+    assert f'correo_imap_comandos_total{{{etiquetas},estado="BAD"}} 1' in lineas
+    assert f'correo_mensajes_movidos_total{{cuenta="a\\"b",etiqueta="{DESTINO}"}} 3' in lineas
+
+
+def test_exportar_metricas_de_una_pasada(servidor, crear_correo, tmp_path):
+    for i in range(4):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    ruta_json, ruta_prometheus = tmp_path / "metricas" / "correo.json", tmp_path / "metricas" / "correo.prom"
+    correo = crear_correo(metricas_json=ruta_json, metricas_prometheus=ruta_prometheus)
+    METRICAS.reiniciar()
+
+    correo.seleccionar_bandeja("INBOX")
+    correo.mover_correos("INBOX", DESTINO, [1, 2, 3, 4])
+    correo.exportar_metricas()
+
+    datos = json.loads(ruta_json.read_text(encoding="utf-8"))[servidor.usuario]
+    assert datos["contadores"]["mensajes_movidos"] == {DESTINO: 4}
+    assert datos["comandos"]["UID MOVE"]["estados"] == {"OK": 1}
+    assert datos["comandos"]["LOGIN"]["total"] == 1
+    assert datos["comandos"]["SELECT"]["bytes_recibidos"] > 0
+    prometheus = ruta_prometheus.read_text(encoding="utf-8")
+    assert f'correo_mensajes_movidos_total{{cuenta="{servidor.usuario}",etiqueta="{DESTINO}"}} 4' in prometheus
+    assert not list(ruta_json.parent.glob("*.tmp"))
@@ -0,0 +1,52 @@
+import pytest
+
+ETIQUETAS = {
+    "arbol_etiquetas": {"banco": ["openbank"], "compras": ["amazon", "facturas"]},
+    "filtro_etiquetas": {
+        "openbank": {"remitente": "openbank", "asunto": "", "cuerpo": ""},
+        "amazon": {"remitente": "amazon", "asunto": "", "cuerpo": ""},
+        "facturas": {"remitente": "", "asunto": "", "cuerpo": "factura"},
+    },
+}
+# (remitente, asunto, cuerpo, carpeta esperada)
+MENSAJES = [
+    ("avisos@openbank.es", "Transferencia", "Recibida", "banco/openbank"),
+    ("pedidos@amazon.es", "Tu pedido", "Adjuntamos la factura", "compras/amazon"),
+    ("tienda@ejemplo.com", "Compra", "Factura de tu compra", "compras/facturas"),
+    ("amigo@ejemplo.com", "Hola", "Nada que ver", "INBOX"),
+    ("OpenBank <info@OPENBANK.es>", "Aviso", "Factura del seguro", "banco/openbank"),
+]
+
+
+def _mensaje(remitente: str, asunto: str, cuerpo: str) -> bytes:
+    return f"From: {remitente}\r\nSubject: {asunto}\r\n\r\n{cuerpo}\r\n".encode()
+
+
+@pytest.mark.parametrize("modo_local", ["yes", "no"])
+def test_modo_local_clasifica_igual_que_el_servidor(servidor, crear_correo, modo_local):
+    for carpeta in ("compras/amazon", "compras/facturas"):
+        servidor.agregar_buzon(carpeta)
+    for remitente, asunto, cuerpo, _ in MENSAJES:
+        servidor.agregar_mensaje("INBOX", _mensaje(remitente, asunto, cuerpo))
+    correo = crear_correo(ETIQUETAS, modo_local=modo_local)
+    servidor.reiniciar_estadisticas()
+
+    correo.organizar_bandeja("INBOX")
+
+    for remitente, _, _, carpeta in MENSAJES:
+        assert any(m.cabecera("From") == remitente for m in servidor.obtener_buzon(carpeta).mensajes)
+    busquedas = servidor.estadisticas["comandos"]["UID SEARCH"]
+    # Modo local: solo el SEARCH de los mensajes nuevos; modo servidor: además uno por etiqueta
+    assert busquedas == (1 if modo_local == "yes" else 1 + len(ETIQUETAS["filtro_etiquetas"]))
+
+
+def test_clasificar_localmente_en_orden_de_precedencia(servidor, crear_correo):
+    for remitente, asunto, cuerpo, _ in MENSAJES:
+        servidor.agregar_mensaje("INBOX", _mensaje(remitente, asunto, cuerpo))
+    correo = crear_correo(ETIQUETAS, modo_local="yes")
+    correo.seleccionar_bandeja("INBOX")
+
+    clasificacion = correo.clasificar_localmente(correo.filtrar_correo("ALL"))
+
+    assert list(clasificacion) == ["banco/openbank", "compras/amazon", "compras/facturas"]
+    assert clasificacion == {"banco/openbank": [b"1", b"5"], "compras/amazon": [b"2"], "compras/facturas": [b"3"]}
@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import DESTINO, mensaje
+
+CON_MOVE = ("IMAP4rev1", "MOVE", "UIDPLUS")
+SIN_MOVE = ("IMAP4rev1", "UIDPLUS")
+
+
+def _cargar(servidor, n=30, del_banco=range(0, 30, 3)):
+    for i in range(n):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "avisos@openbank.es" if i in del_banco else "otro@ejemplo.com"))
+
+
+def _asuntos(servidor, buzon):
+    return sorted(m.cabecera("Subject") for m in servidor.obtener_buzon(buzon).mensajes)
+
+
+@pytest.mark.parametrize("servidor", [CON_MOVE, SIN_MOVE], indirect=True, ids=["MOVE", "COPY-EXPUNGE"])
+def test_mover_en_bloque(servidor, crear_correo):
+    _cargar(servidor)
+    correo = crear_correo(longitud_maxima_comando=8)
+    servidor.reiniciar_estadisticas()
+
+    resultados = correo.mover_correos("INBOX", DESTINO, list(range(1, 31, 3)))
+
+    # Varios bloques por la longitud máxima, todos correctos y con su COPYUID
+    assert len(resultados) > 1 and all(r["estado"] == "OK" for r in resultados)
+    assert sorted(u for r in resultados for u in r["copyuid"][1]) == list(range(1, 31, 3))
+    assert _asuntos(servidor, DESTINO) == sorted(f"Movimiento {i}" for i in range(0, 30, 3))
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 20
+    comandos = servidor.estadisticas["comandos"]
+    if "MOVE" in servidor.capacidades:
+        assert comandos["UID MOVE"] == len(resultados) and not comandos["UID COPY"]
+    else:
+        assert comandos["UID COPY"] == len(resultados) and comandos["UID EXPUNGE"] >= 1
+    # Sin nada pendiente, el diario se borra
+    assert not correo.diario.pendientes(correo.username, "INBOX")
@@ -0,0 +1,56 @@
+import json
+
+from classes.carpetas import CacheCarpetas
+from classes.multicuenta import OrganizadorCuentas
+from classes.servidor_imap_falso import ServidorImapFalso
+from conftest import DESTINO, ETIQUETAS, mensaje
+
+
+def test_organiza_cada_cuenta_y_aisla_los_fallos(tmp_path):
+    etiquetas = tmp_path / "etiquetas.json"
+    etiquetas.write_text(json.dumps(ETIQUETAS), encoding="utf-8")
+    with ServidorImapFalso(usuario="ana") as primero, ServidorImapFalso(usuario="luis") as segundo:
+        cuentas = {"ana": primero, "luis": segundo}
+        texto = ""
+        for nombre, servidor in cuentas.items():
+            servidor.agregar_buzon(DESTINO)
+            for i in range(3):
+                servidor.agregar_mensaje("INBOX", mensaje(i))
+            CacheCarpetas.invalidar(("127.0.0.1", nombre))
+            texto += (f"[cuenta:{nombre}]\nusername = {nombre}\npassword = password\nimap_server = 127.0.0.1\n"
+                      f"imap_port = {servidor.puerto}\nimap_ssl = no\netiquetas = {etiquetas}\n")
+        texto += (f"[cuenta:mala]\nusername = ana\npassword = incorrecta\nimap_server = 127.0.0.1\n"
+                  f"imap_port = {primero.puerto}\nimap_ssl = no\netiquetas = {etiquetas}\n"
+                  f"[opciones]\ncarpeta_estado = {tmp_path / 'estado'}\nreintentos_conexion = 1\n")
+        ruta = tmp_path / "config.ini"
+        ruta.write_text(texto, encoding="utf-8")
+
+        resultados = OrganizadorCuentas(str(ruta)).organizar()
+
+        assert resultados["cuenta:ana"]["movidos"] == {DESTINO: 3}
+        assert resultados["cuenta:luis"]["movidos"] == {DESTINO: 3}
+        assert "autenticacion" in resultados["cuenta:mala"]["error"]
+        for servidor in cuentas.values():
+            assert len(servidor.obtener_buzon(DESTINO).mensajes) == 3
+
+
+def test_mismo_servidor_comparte_el_limite_de_conexiones(servidor, tmp_path):
+    etiquetas = tmp_path / "etiquetas.json"
+    etiquetas.write_text(json.dumps(ETIQUETAS), encoding="utf-8")
+    CacheCarpetas.invalidar(("localhost", servidor.usuario))
+    ruta = tmp_path / "config.ini"
+    ruta.write_text(
+        "".join(f"[cuenta:{nombre}]\nusername = {servidor.usuario}\npassword = {servidor.password}\n"
+                f"imap_server = {host}\nimap_port = {servidor.puerto}\nimap_ssl = no\netiquetas = {etiquetas}\n"
+                for nombre, host in (("a", "LOCALHOST"), ("b", "localhost ")))
+        + f"[opciones]\ncarpeta_estado = {tmp_path / 'estado'}\nmax_conexiones_por_servidor = 1\n",
+        encoding="utf-8",
+    )
+    organizador = OrganizadorCuentas(str(ruta))
+
+    resultados = organizador.organizar()
+
+    assert all("error" not in r for r in resultados.values())
+    # Un único semáforo para las dos formas de escribir el servidor
+    assert list(organizador._semaforos) == [("localhost", servidor.puerto)]
+    CacheCarpetas.invalidar(("localhost", servidor.usuario))
@@ -0,0 +1,103 @@
+import configparser
+import email
+import email.policy
+
+import pytest
+
+from classes.metricas import METRICAS
+from classes.notificaciones import Notificador
+from classes.servidor_smtp_falso import ServidorSmtpFalso
+from conftest import DESTINO, mensaje
+
+
+@pytest.fixture
+def smtp(request):
+    """
+    Servidor SMTP falso; sus opciones se pueden cambiar con un parámetro indirecto.
+    """
+    with ServidorSmtpFalso(**getattr(request, "param", {})) as srv:
+        yield srv
+
+
+def _notificador(smtp, **opciones) -> Notificador:
+    valores = {"starttls": False, "envios_por_minuto": 0, "espera_inicial": 0.01, "espera_cierre": 5}
+    return Notificador("127.0.0.1", smtp.puerto, ["admin@ejemplo.com"], "avisos@ejemplo.com",
+                       **{**valores, **opciones})
+
+
+def _recibidos(smtp) -> list:
+    return [email.message_from_bytes(m["datos"], policy=email.policy.default) for m in smtp.mensajes]
+
+
+def test_resumen_y_digest_de_una_pasada(servidor, crear_correo, smtp):
+    for i in range(4):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "avisos@openbank.es" if i else "otro@ejemplo.com"))
+    correo = crear_correo()
+    correo.notificador = _notificador(smtp, digest=(DESTINO,), max_mensajes_digest=2)
+
+    correo.organizar_bandeja("INBOX")
+    correo.notificador.cerrar()
+
+    digest, resumen = _recibidos(smtp)
+    assert digest["Subject"] == f"[Correo] 3 mensajes nuevos en {DESTINO}"
+    cuerpo = digest.get_content()
+    assert "Movimiento 1" in cuerpo and "Movimiento 2" in cuerpo and "... y 1 más" in cuerpo
+    assert resumen["Subject"] == f"[Correo] {servidor.usuario}: 3 de 4 mensajes organizados"
+    assert f"  {DESTINO}: 3" in resumen.get_content()
+    assert smtp.mensajes[0]["destinatarios"] == ["admin@ejemplo.com"]
+    # Los dos correos salen por la misma sesión
+    assert smtp.estadisticas["sesiones"] == 1 and smtp.estadisticas["comandos"]["QUIT"] == 1
+
+
+def test_sin_mensajes_nuevos_no_se_envia_nada(smtp):
+    notificador = _notificador(smtp, digest=("*",))
+    notificador.terminar_pasada("ana", "INBOX", {"total": 0, "movidos": {}})
+    notificador.cerrar()
+    assert not smtp.mensajes and not smtp.estadisticas["sesiones"]
+
+
+@pytest.mark.parametrize("smtp, sesiones", [({"fallos": 2}, 1), ({"fallos": 2, "tipo_fallo": "desconexion"}, 3)],
+                         indirect=["smtp"], ids=["temporal", "desconexion"])
+def test_reintenta_los_errores_transitorios(smtp, sesiones):
+    METRICAS.reiniciar()
+    notificador = _notificador(smtp)
+    notificador.terminar_pasada("ana", "INBOX", {"total": 2, "movidos": {DESTINO: 2}})
+    notificador.cerrar()
+
+    assert len(smtp.mensajes) == 1
+    # Tras un 451 la sesión sigue valiendo; tras un corte se abre otra
+    assert smtp.estadisticas["sesiones"] == sesiones
+    assert METRICAS.resumen()["ana"]["contadores"]["notificaciones_enviadas"] == {"resumen": 1}
+
+
+@pytest.mark.parametrize("smtp", [{"usuario": "avisos", "password": "secreta"}], indirect=True)
+def test_error_permanente_no_se_reintenta(smtp):
+    METRICAS.reiniciar()
+    notificador = _notificador(smtp, usuario="avisos", password="incorrecta", reintentos=5)
+    notificador.terminar_pasada("ana", "INBOX", {"total": 1, "movidos": {}})
+    notificador.cerrar()
+
+    assert not smtp.mensajes
+    assert smtp.estadisticas["comandos"]["AUTH"] == 1
+    assert METRICAS.resumen()["ana"]["contadores"]["notificaciones_fallidas"] == {"resumen": 1}
+
+
+def test_desde_configuracion_con_plantillas(smtp, tmp_path):
+    (tmp_path / "resumen.txt").write_text("$movidos de $total en $bandeja\n", encoding="utf-8")
+    config = configparser.ConfigParser()
+    config.read_string(f"[notificaciones]\nsmtp_server = 127.0.0.1\nsmtp_port = {smtp.puerto}\n"
+                       "smtp_starttls = no\ndestinatarios = a@ejemplo.com, b@ejemplo.com\n"
+                       "envios_por_minuto = 0\nasunto_resumen = Resumen de $cuenta\nplantilla_resumen = resumen.txt\n")
+
+    notificador = Notificador.desde_configuracion(config, ruta_config=str(tmp_path / "config.ini"))
+    notificador.terminar_pasada("ana", "INBOX", {"total": 3, "movidos": {DESTINO: 2}})
+    notificador.cerrar()
+
+    [recibido] = _recibidos(smtp)
+    assert recibido["Subject"] == "Resumen de ana" and recibido["From"] == "a@ejemplo.com"
+    assert recibido.get_content().strip() == "2 de 3 en INBOX"
+    assert smtp.mensajes[0]["destinatarios"] == ["a@ejemplo.com", "b@ejemplo.com"]
+
+    config.remove_option("notificaciones", "destinatarios")
+    with pytest.raises(ValueError, match="destinatario"):
+        Notificador.desde_configuracion(config)
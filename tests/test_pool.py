@@ -0,0 +1,59 @@
+import pytest
+
+from classes.conexiones import GestorConexiones
+from conftest import mensaje
+
+
+def test_reutiliza_la_sesion_autenticada(servidor, gestor):
+    with gestor.sesion() as primera:
+        primera.select("INBOX")
+    with gestor.sesion() as segunda:
+        assert segunda is primera
+        assert segunda.noop()[0] == "OK"
+    assert servidor.estadisticas["comandos"]["LOGIN"] == 1
+
+
+def test_reconecta_y_vuelve_a_seleccionar_la_bandeja(servidor, gestor):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        servidor.desconectar_clientes()
+
+        # El comando se repite en una conexión nueva con la bandeja ya seleccionada
+        assert sesion.uid("SEARCH", None, "ALL") == ("OK", [b"1"])
+        assert sesion.saturaciones == 1
+    assert servidor.estadisticas["comandos"]["LOGIN"] == 2
+
+
+def test_credenciales_invalidas_no_se_reintentan(servidor):
+    gestor = GestorConexiones("127.0.0.1", servidor.usuario, "incorrecta", puerto=servidor.puerto, ssl=False,
+                              reintentos=3, espera_inicial=0.01)
+    with pytest.raises(ValueError, match="autenticacion"):
+        gestor.adquirir()
+    assert servidor.estadisticas["comandos"]["LOGIN"] == 1
+    assert gestor._abiertas == 0
+
+
+def test_pool_lleno_espera_hasta_el_timeout(servidor):
+    gestor = GestorConexiones("127.0.0.1", servidor.usuario, servidor.password, puerto=servidor.puerto, ssl=False,
+                              tamano=1)
+    sesion = gestor.adquirir()
+    with pytest.raises(TimeoutError):
+        gestor.adquirir(timeout=0.1)
+    gestor.liberar(sesion)
+    assert gestor.adquirir(timeout=0.1) is sesion
+    gestor.liberar(sesion)
+    gestor.cerrar()
+
+
+def test_reconexion_fallida_libera_el_hueco_del_pool(servidor):
+    gestor = GestorConexiones("127.0.0.1", servidor.usuario, servidor.password, puerto=servidor.puerto, ssl=False,
+                              tamano=1, intervalo_keepalive=0, reintentos=1, espera_inicial=0.01)
+    gestor.liberar(gestor.adquirir())
+    servidor.desconectar_clientes()
+    servidor.detener()
+
+    with pytest.raises(ValueError):
+        gestor.adquirir()
+    assert gestor._abiertas == 0
+    gestor.cerrar()
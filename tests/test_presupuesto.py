@@ -0,0 +1,95 @@
+import email.policy
+from email.message import EmailMessage
+
+import pytest
+
+from conftest import mensaje
+
+ADJUNTO = bytes(range(256)) * 400
+
+
+def _grande(texto: str = "Linea de texto del aviso.\n" * 400) -> bytes:
+    """
+    Mensaje con texto y html largos y un adjunto de 100 KB.
+    """
+    principal = EmailMessage()
+    principal["From"] = "avisos@openbank.es"
+    principal["Subject"] = "Extracto"
+    principal.set_content(texto, cte="7bit")
+    principal.add_alternative(f"<pre>{texto}</pre>", subtype="html", cte="7bit")
+    principal.add_attachment(ADJUNTO, maintype="application", subtype="octet-stream", filename="extracto.bin")
+    return principal.as_bytes(policy=email.policy.SMTP)
+
+
+def test_completo_no_descarga_adjuntos_de_los_mensajes_grandes(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", mensaje(1))
+    servidor.agregar_mensaje("INBOX", _grande())
+    correo = crear_correo(presupuesto_mensaje_kb=4)
+    correo.seleccionar_bandeja("INBOX")
+    servidor.reiniciar_estadisticas()
+
+    correos = dict(correo.iterar_correos([1, 2]))
+
+    # El pequeño llega entero; del grande, las cabeceras y el html truncado al presupuesto
+    assert correos["1"].cuerpo == "Cuerpo del movimiento 1\r\n"
+    assert correos["2"].asunto == "Extracto"
+    assert correos["2"].cuerpo.startswith("<pre>Linea de texto") and len(correos["2"].cuerpo) == 4096
+    assert servidor.estadisticas["bytes_salida"] < len(ADJUNTO) // 4
+
+
+def test_cabeceras_con_cuerpo_trunca_cada_parte_de_texto(servidor, crear_correo):
+    servidor.agregar_mensaje("INBOX", _grande())
+    correo = crear_correo(presupuesto_mensaje_kb=4)
+    correo.seleccionar_bandeja("INBOX")
+    servidor.reiniciar_estadisticas()
+
+    cabeceras = correo.obtener_cabeceras([1], con_cuerpo=True)
+
+    texto, html = cabeceras[1]["cuerpo"].split("\n<pre>")
+    # El presupuesto se reparte entre las dos partes de texto
+    assert texto.startswith("Linea de texto") and len(texto) == 2048
+    assert len("<pre>" + html) == 2048
+    assert cabeceras[1]["tamano"] > len(ADJUNTO)
+    assert servidor.estadisticas["bytes_salida"] < len(ADJUNTO) // 4
+
+    # Sin presupuesto se descarga el mensaje entero
+    sin_limite = crear_correo(presupuesto_mensaje_kb=0)
+    sin_limite.seleccionar_bandeja("INBOX")
+    assert len(sin_limite.obtener_cabeceras([1], con_cuerpo=True)[1]["cuerpo"]) > 20000
+
+
+def test_descargar_adjunto_en_trozos(servidor, crear_correo, tmp_path):
+    servidor.agregar_mensaje("INBOX", _grande("Breve\n"))
+    correo = crear_correo(bloque_adjuntos_kb=16)
+    correo.seleccionar_bandeja("INBOX")
+    [adjunto] = correo.listar_adjuntos(1)
+    servidor.reiniciar_estadisticas()
+
+    ruta = tmp_path / "extracto.bin"
+    assert correo.descargar_adjunto(1, adjunto, str(ruta)) == len(ADJUNTO)
+
+    assert ruta.read_bytes() == ADJUNTO
+    # Un FETCH parcial por trozo (el último, más corto, indica el final)
+    assert servidor.estadisticas["comandos"]["UID FETCH"] == adjunto["tamano"] // (16 * 1024) + 1
+
+
+@pytest.mark.parametrize("fallo", [1, 3], ids=["primer-trozo", "a-mitad"])
+def test_descarga_fallida_no_deja_archivo(servidor, crear_correo, tmp_path, monkeypatch, fallo):
+    servidor.agregar_mensaje("INBOX", _grande("Breve\n"))
+    correo = crear_correo(bloque_adjuntos_kb=16)
+    correo.seleccionar_bandeja("INBOX")
+    [adjunto] = correo.listar_adjuntos(1)
+    llamadas, uid = [], correo.imap.uid
+
+    def uid_con_fallo(*args):
+        # Los trozos anteriores llegan bien y el FETCH número `fallo` se rechaza
+        llamadas.append(args)
+        if len(llamadas) == fallo:
+            servidor.fallar("UID FETCH", respuesta="NO [SERVERBUG] Error interno")
+        return uid(*args)
+
+    monkeypatch.setattr(correo.imap, "uid", uid_con_fallo, raising=False)
+
+    assert correo.descargar_adjunto(1, adjunto, str(tmp_path / "extracto.bin")) is None
+    assert len(llamadas) == fallo
+    assert not (tmp_path / "extracto.bin").exists() and not (tmp_path / "extracto.bin.parcial").exists()
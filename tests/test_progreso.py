@@ -0,0 +1,61 @@
+from conftest import DESTINO, mensaje
+
+
+def _cargar(servidor, n=10, del_banco=(3, 7)):
+    for i in range(n):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "avisos@openbank.es" if i in del_banco else "otro@ejemplo.com"))
+
+
+def test_progreso_se_detiene_en_el_primer_fallo(servidor, crear_correo):
+    _cargar(servidor)
+    servidor.buzones.pop(DESTINO)
+    correo = crear_correo()
+
+    resultado = correo.organizar_bandeja("INBOX")
+
+    assert resultado["movidos"] == {DESTINO: 0}
+    assert correo.no_movidos == [4, 8]
+    estado = correo.estado.cargar(correo.username, "INBOX")
+    assert estado["ultimo_uid"] == 3 and estado["uidnext"] is None
+
+    # En la siguiente ejecución (con la carpeta ya creada) se reintentan
+    servidor.agregar_buzon(DESTINO)
+    siguiente = crear_correo()
+    resultado = siguiente.organizar_bandeja("INBOX")
+    assert resultado["movidos"] == {DESTINO: 2}
+    assert siguiente.estado.cargar(correo.username, "INBOX")["ultimo_uid"] == 10
+
+
+def test_busqueda_fallida_no_es_una_lista_vacia(servidor, crear_correo):
+    _cargar(servidor)
+    correo = crear_correo()
+    correo.seleccionar_bandeja("INBOX")
+    servidor.fallar("UID SEARCH")
+
+    assert correo.filtrar_correo("ALL") is None
+    assert correo.filtrar_correo("FROM \"nadie\"") == []
+
+
+def test_busqueda_fallida_no_avanza_el_progreso(servidor, crear_correo):
+    _cargar(servidor)
+    correo = crear_correo()
+    servidor.fallar("UID SEARCH")
+
+    assert correo.organizar_bandeja("INBOX")["movidos"] == {}
+    assert correo.estado.cargar(correo.username, "INBOX") == {}
+
+    assert correo.organizar_bandeja("INBOX")["movidos"] == {DESTINO: 2}
+    assert correo.estado.cargar(correo.username, "INBOX")["ultimo_uid"] == 10
+
+
+def test_filtro_de_regla_fallido_deja_la_pasada_sin_mover(servidor, crear_correo):
+    _cargar(servidor)
+    correo = crear_correo()
+    correo.seleccionar_bandeja("INBOX")
+    uids = correo.filtrar_correo("ALL")
+    servidor.fallar("UID SEARCH")
+
+    assert correo.clasificar_y_mover("INBOX", uids, 1) == {}
+    # Ningún mensaje se da por procesado: el progreso se guardaría antes del primero
+    assert correo.no_movidos == list(range(1, 11))
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 10
@@ -0,0 +1,119 @@
+import pytest
+
+from conftest import DESTINO, mensaje
+
+CON_MOVE = ("IMAP4rev1", "MOVE", "UIDPLUS")
+SIN_MOVE = ("IMAP4rev1", "UIDPLUS")
+
+
+def _interrumpir(servidor, crear_correo, comando, preparar=None, paso=None):
+    """
+    Planifica el movimiento de los UIDs 1:10 como lo haría mover_correos,
+    ejecuta `preparar` para simular lo que llegó a hacerse antes de la caída
+    y reanuda con una instancia nueva.
+
+    :return: Tupla (mensajes movidos al reanudar, instancia que reanudó).
+    """
+    for i in range(20):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    correo = crear_correo()
+    correo.seleccionar_bandeja("INBOX")
+    bloque = correo._planificar("INBOX", comando, DESTINO, "1:10")
+    if preparar is not None:
+        preparar(correo)
+    if paso is not None:
+        correo._anotar("INBOX", bloque, paso)
+
+    nuevo = crear_correo()
+    nuevo.seleccionar_bandeja("INBOX")
+    return nuevo.reanudar_movimientos("INBOX"), nuevo
+
+
+def _ids(servidor, buzon):
+    return sorted(m.cabecera("Message-ID") for m in servidor.obtener_buzon(buzon).mensajes)
+
+
+MOVIDOS = sorted(f"<{i}@prueba>" for i in range(10))
+
+
+@pytest.mark.parametrize("servidor", [CON_MOVE], indirect=True)
+@pytest.mark.parametrize("hecho", [False, True], ids=["sin-enviar", "enviado"])
+def test_reanudar_move(servidor, crear_correo, hecho):
+    preparar = (lambda c: c.imap.uid("MOVE", "1:10", DESTINO)) if hecho else None
+    movidos, correo = _interrumpir(servidor, crear_correo, "MOVE", preparar)
+
+    assert movidos == 10
+    assert _ids(servidor, DESTINO) == MOVIDOS
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 10
+    assert not correo.diario.pendientes(correo.username, "INBOX")
+
+
+@pytest.mark.parametrize("servidor", [SIN_MOVE], indirect=True)
+@pytest.mark.parametrize("copiados", ["", "1:10", "1:4", "6,8"], ids=["ninguno", "todos", "parte", "salteados"])
+def test_reanudar_copy_sin_confirmar(servidor, crear_correo, copiados):
+    preparar = (lambda c: c.imap.uid("COPY", copiados, DESTINO)) if copiados else None
+    movidos, correo = _interrumpir(servidor, crear_correo, "COPY", preparar)
+
+    # Ni duplicados ni pérdidas: cada mensaje del bloque está una vez en el destino
+    assert movidos == 10
+    assert _ids(servidor, DESTINO) == MOVIDOS
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 10
+    assert not correo.diario.pendientes(correo.username, "INBOX")
+
+
+@pytest.mark.parametrize("servidor", [SIN_MOVE], indirect=True)
+def test_reanudar_copy_con_otro_correo_en_destino(servidor, crear_correo):
+    def preparar(correo):
+        # Llega correo ajeno al destino: el UIDNEXT crece más que el bloque sin que se copiara nada
+        for i in range(100, 115):
+            servidor.agregar_mensaje(DESTINO, mensaje(i))
+
+    movidos, _ = _interrumpir(servidor, crear_correo, "COPY", preparar)
+
+    assert movidos == 10
+    assert _ids(servidor, DESTINO) == sorted(MOVIDOS + [f"<{i}@prueba>" for i in range(100, 115)])
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 10
+
+
+@pytest.mark.parametrize("servidor", [SIN_MOVE], indirect=True)
+def test_reanudar_copy_confirmado_solo_expurga(servidor, crear_correo):
+    def preparar(correo):
+        correo.imap.uid("COPY", "1:10", DESTINO)
+        servidor.reiniciar_estadisticas()
+
+    movidos, _ = _interrumpir(servidor, crear_correo, "COPY", preparar, paso="copiado")
+
+    assert movidos == 10
+    assert not servidor.estadisticas["comandos"]["UID COPY"]
+    assert _ids(servidor, DESTINO) == MOVIDOS
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 10
+
+
+@pytest.mark.parametrize("servidor", [SIN_MOVE], indirect=True)
+def test_reanudar_descarta_si_cambia_uidvalidity(servidor, crear_correo):
+    for i in range(5):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    correo = crear_correo()
+    correo.diario.planificar(correo.username, "INBOX", comando="COPY", destino=DESTINO, uids="1:5",
+                             uidvalidity=999, uidnext=1)
+    correo.seleccionar_bandeja("INBOX")
+
+    assert correo.reanudar_movimientos("INBOX") == 0
+    assert len(servidor.obtener_buzon("INBOX").mensajes) == 5
+    assert not servidor.obtener_buzon(DESTINO).mensajes
+    assert not correo.diario.pendientes(correo.username, "INBOX")
+
+
+@pytest.mark.parametrize("servidor", [SIN_MOVE], indirect=True)
+def test_reanudar_con_diario_cortado(servidor, crear_correo):
+    def preparar(correo):
+        correo.imap.uid("COPY", "1:10", DESTINO)
+        # Caída a mitad de escribir la anotación "copiado"
+        with open(correo.diario.ruta(correo.username, "INBOX"), "ab") as archivo:
+            archivo.write(b'{"paso": "copi')
+
+    movidos, correo = _interrumpir(servidor, crear_correo, "COPY", preparar)
+
+    assert movidos == 10
+    assert _ids(servidor, DESTINO) == MOVIDOS
+    assert not correo.diario.pendientes(correo.username, "INBOX")
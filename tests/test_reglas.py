@@ -0,0 +1,89 @@
+import pytest
+
+from classes.reglas import MotorReglas
+
+FECHA = "Mon, 10 Mar 2025 10:00:00 +0100"
+
+
+def test_condiciones_combinadas():
+    motor = MotorReglas({
+        "banco/nomina": {"remitente": ["rrhh@", "nominas@"], "asunto": "nómina", "excluir": {"asunto": "borrador"}},
+        "banco/recibos": {"dominio": "openbank.es", "regex": {"asunto": r"recibo \d+"}},
+        "archivo/antiguo": {"remitente": "boletin", "antes": "2025-01-01", "tamano_mayor": 1000},
+    })
+
+    assert motor.clasificar("nominas@empresa.com", "Tu NÓMINA de marzo") == "banco/nomina"
+    assert motor.clasificar("nominas@empresa.com", "Borrador de nómina") is None
+    assert motor.clasificar("Avisos <avisos@correo.openbank.es>", "Recibo 123 pagado") == "banco/recibos"
+    # El dominio no coincide por subcadena ni el regex sin número
+    assert motor.clasificar("avisos@openbank.es.otro.com", "Recibo 123") is None
+    assert motor.clasificar("avisos@openbank.es", "Recibo pendiente") is None
+    assert motor.clasificar("boletin@ejemplo.com", "", fecha="Tue, 31 Dec 2024 23:00:00 +0000", tamano=2000) \
+        == "archivo/antiguo"
+    assert motor.clasificar("boletin@ejemplo.com", "", fecha=FECHA, tamano=2000) is None
+    assert motor.clasificar("boletin@ejemplo.com", "", fecha="Tue, 31 Dec 2024 23:00:00 +0000", tamano=1000) is None
+    # Sin fecha o sin tamaño, una regla que los pide no coincide
+    assert motor.clasificar("boletin@ejemplo.com", "", tamano=2000) is None
+
+
+def test_prioridad_y_orden():
+    reglas = {
+        "general/avisos": {"asunto": "aviso"},
+        "banco/urgente": {"asunto": "aviso urgente", "prioridad": 5},
+        "banco/avisos": {"asunto": "aviso"},
+    }
+    motor = MotorReglas(reglas)
+
+    assert motor.etiquetas == ["banco/urgente", "general/avisos", "banco/avisos"]
+    assert motor.clasificar("", "Aviso urgente") == "banco/urgente"
+    # A igual prioridad gana la primera del árbol
+    assert motor.clasificar("", "Aviso") == "general/avisos"
+
+
+def test_criterio_imap():
+    motor = MotorReglas({
+        "a/b": {"remitente": ["x", 'di"ce'], "desde": "2025-03-01", "tamano_menor": 500,
+                "excluir": {"asunto": "spam"}},
+        "a/c": {"dominio": "ejemplo.com"},
+    })
+    exacta, aproximada = motor.reglas
+
+    assert exacta.criterio == 'OR FROM "x" FROM "di\\"ce" SENTSINCE 1-Mar-2025 SMALLER 500 NOT (SUBJECT "spam")'
+    assert exacta.exacto
+    # El dominio se busca por subcadena y se confirma en local
+    assert aproximada.criterio == 'OR FROM "@ejemplo.com" FROM ".ejemplo.com"'
+    assert not aproximada.exacto
+
+
+def test_conflictos():
+    motor = MotorReglas({
+        "banco/todo": {"remitente": "openbank"},
+        "banco/recibos": {"remitente": "recibos@openbank.es"},
+        "banco/avisos": {"asunto": "aviso"},
+        "otros/avisos": {"asunto": "avisos de pago"},
+        "otros/vacia": {"asunto": ""},
+    })
+
+    avisos = motor.conflictos()
+
+    assert "La regla 'otros/vacia' no tiene condiciones y nunca se aplicará." in avisos
+    assert any(a.startswith("La regla 'banco/recibos' nunca se aplicará: 'banco/todo'") for a in avisos)
+    assert any(a.startswith("La regla 'otros/avisos' nunca se aplicará") for a in avisos)
+    assert len(avisos) == 3
+    assert motor.clasificar("", "") is None
+
+
+@pytest.mark.parametrize("filtros, mensaje", [
+    ({"remitente": "x", "color": "rojo"}, "claves desconocidas"),
+    ({"remitente": "x", "desde": "01/03/2025"}, "'desde' debe ser una fecha"),
+    ({"remitente": "x", "tamano_mayor": "1k"}, "'tamano_mayor' debe ser un número"),
+    ({"remitente": "x", "prioridad": True}, "'prioridad' debe ser un entero"),
+    ({"regex": {"asunto": "("}}, "expresión regular no válida"),
+    ({"regex": {"fecha": "x"}}, "'regex' debe ser un objeto"),
+    ({"remitente": "x", "excluir": {"prioridad": 1}}, "'excluir' debe ser un objeto"),
+    ("openbank", "deben ser un objeto JSON"),
+])
+def test_reglas_no_validas(filtros, mensaje):
+    with pytest.raises(ValueError, match=mensaje) as error:
+        MotorReglas({"banco/openbank": filtros})
+    assert "'banco/openbank'" in str(error.value)
@@ -0,0 +1,79 @@
+import pytest
+
+from classes.correo import Correo
+from classes.relleno import RellenoParalelo
+from conftest import DESTINO, mensaje
+
+
+@pytest.fixture
+def crear_relleno(servidor, crear_correo, tmp_path):
+    """
+    Devuelve una función que crea un RellenoParalelo sobre 10 mensajes del
+    banco, en fragmentos de 5, con las opciones indicadas.
+    """
+    for i in range(10):
+        servidor.agregar_mensaje("INBOX", mensaje(i))
+    creados = []
+
+    def crear(**opciones) -> RellenoParalelo:
+        crear_correo(relleno_tamano_fragmento=5, **opciones)
+        relleno = RellenoParalelo(str(tmp_path / "config.ini"))
+        relleno.gestor.espera_inicial = 0.01
+        creados.append(relleno)
+        return relleno
+
+    yield crear
+    for relleno in creados:
+        relleno.cerrar()
+
+
+def _progreso(relleno):
+    return relleno.correo.estado.cargar(relleno.correo.username, "INBOX").get("ultimo_uid")
+
+
+@pytest.mark.parametrize("respuesta", ["NO [UNAVAILABLE] Servicio no disponible temporalmente", "desconexion"],
+                         ids=["limitacion", "desconexion"])
+def test_saturacion_reduce_la_concurrencia_y_repite(servidor, crear_relleno, respuesta):
+    relleno = crear_relleno(relleno_conexiones=2)
+    servidor.fallar("UID MOVE", respuesta=respuesta)
+
+    resultado = relleno.rellenar("INBOX")
+
+    assert resultado["fallidos"] == [] and resultado["movidos"] == {DESTINO: 10}
+    assert relleno.control.limite == 1
+    assert not servidor.obtener_buzon("INBOX").mensajes
+    assert _progreso(relleno) == 10
+
+
+def test_respuesta_sin_limitacion_no_reduce_la_concurrencia(servidor, crear_relleno):
+    relleno = crear_relleno(relleno_conexiones=2)
+    servidor.fallar("UID MOVE", respuesta="NO [CANNOT] Operacion no permitida")
+
+    resultado = relleno.rellenar("INBOX")
+
+    # El fragmento fallido no se repite
+    assert len(resultado["fallidos"]) == 1 and resultado["movidos"] == {DESTINO: 5}
+    assert servidor.estadisticas["comandos"]["UID MOVE"] == 2
+    assert relleno.control.limite == 2
+    assert _progreso(relleno) in (None, 5)
+
+
+def test_error_inesperado_falla_el_fragmento_sin_reintentos(crear_relleno, monkeypatch):
+    relleno = crear_relleno(relleno_conexiones=2)
+    original, llamadas = Correo.clasificar_y_mover, []
+
+    def clasificar_y_mover(correo, bandeja, uids, *args):
+        llamadas.append(int(uids[0]))
+        if int(uids[0]) == 6:
+            raise KeyError("regla")
+        return original(correo, bandeja, uids, *args)
+
+    monkeypatch.setattr(Correo, "clasificar_y_mover", clasificar_y_mover)
+    resultado = relleno.rellenar("INBOX")
+
+    assert sorted(llamadas) == [1, 6]
+    assert resultado["fallidos"] == ["6:10"] and resultado["movidos"] == {DESTINO: 5}
+    assert relleno.control.limite == 2
+    # El progreso lo guarda la sesión del relleno, que no procesa fragmentos ni retiene conexión
+    assert _progreso(relleno) == 5
+    assert relleno.correo not in relleno._libres and not relleno.correo.conectado
@@ -0,0 +1,60 @@
+from classes.respuestas_imap import agrupar_respuesta_fetch, extraer_copyuid, parte_de_texto, partes_bodystructure
+
+TEXTO = b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+
+
+def test_bodystructure_con_literales():
+    nombre = "año.pdf".encode()
+    # Como lo devuelve imaplib: cada literal cierra una tupla y la respuesta sigue en la siguiente entrada
+    datos = [
+        (b'1 (UID 7 BODYSTRUCTURE (' + TEXTO + b'("APPLICATION" "PDF" ("NAME" {%d}' % len(nombre), nombre),
+        (b') NIL NIL "BASE64" 300 NIL ("ATTACHMENT" ("FILENAME" {4}', b'a"\\b'),
+        (b')) NIL) "MIXED") BODY[HEADER] {9}', b"From: x\r\n"),
+        b")",
+    ]
+
+    mensaje = agrupar_respuesta_fetch(datos)[7]
+
+    assert mensaje["BODY[HEADER]"] == b"From: x\r\n"
+    partes = partes_bodystructure(mensaje["BODYSTRUCTURE"])
+    assert [(p["parte"], p["tipo"], p["nombre"], p["adjunto"]) for p in partes] == [
+        ("1", "text/plain", None, False), ("2", "application/pdf", "año.pdf", True),
+    ]
+
+
+def test_bodystructure_con_mensaje_reenviado():
+    sobre = b'(NIL "Reenviado" NIL NIL NIL NIL NIL NIL NIL NIL)'
+    reenviado = b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 ' + sobre + b" " + TEXTO + b" 12 NIL "
+    datos = [
+        b'1 (UID 3 BODYSTRUCTURE (' + TEXTO + reenviado + b'("ATTACHMENT" ("FILENAME" "fw.eml")) NIL NIL) "MIXED"))',
+        b'2 (UID 4 BODYSTRUCTURE (' + TEXTO + reenviado + b'NIL NIL NIL) "MIXED"))',
+    ]
+
+    respuesta = agrupar_respuesta_fetch(datos)
+
+    for uid, nombre in ((3, "fw.eml"), (4, None)):
+        partes = partes_bodystructure(respuesta[uid]["BODYSTRUCTURE"])
+        # El mensaje reenviado es una parte adjunta; su texto no se toma por el del mensaje
+        assert [(p["parte"], p["tipo"], p["nombre"], p["adjunto"]) for p in partes] == [
+            ("1", "text/plain", None, False), ("2", "message/rfc822", nombre, True),
+        ]
+        assert parte_de_texto(respuesta[uid]["BODYSTRUCTURE"])["parte"] == "1"
+
+
+def test_extraer_copyuid_de_la_respuesta_etiquetada():
+    respuesta = [b"[COPYUID 38505 304,319:320 3956:3958] Done"]
+    assert extraer_copyuid(respuesta) == (38505, {304: 3956, 319: 3957, 320: 3958})
+
+
+def test_extraer_copyuid_exige_la_palabra_clave():
+    # Tres números seguidos en otra respuesta no son un COPYUID
+    assert extraer_copyuid([b"[APPENDUID 38505 3955] APPEND completed"]) is None
+    assert extraer_copyuid([b"38505 304 3956"]) is None
+
+
+def test_extraer_copyuid_elige_el_de_los_uids_enviados():
+    datos = [b"COPYUID 7 1:2 10:11", b"COPYUID 7 5,6 12:13"]
+    assert extraer_copyuid(datos, [5, 6]) == (7, {5: 12, 6: 13})
+    # El servidor omite los UIDs que ya no existían
+    assert extraer_copyuid(datos, [4, 5, 6]) == (7, {5: 12, 6: 13})
+    assert extraer_copyuid(datos, [8]) is None
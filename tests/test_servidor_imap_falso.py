@@ -0,0 +1,48 @@
+import mailbox
+
+from classes.servidor_imap_falso import ServidorImapFalso
+
+
+def test_cargar_mbox_conserva_los_flags(tmp_path):
+    ruta = str(tmp_path / "fixture.mbox")
+    caja = mailbox.mbox(ruta)
+    for i, flags in enumerate(("RA", "", "F")):
+        mensaje = mailbox.mboxMessage(f"From: a{i}@ejemplo.com\nSubject: {i}\n\nCuerpo {i}\n")
+        mensaje.set_flags(flags)
+        caja.add(mensaje)
+    caja.flush()
+
+    servidor = ServidorImapFalso()
+    assert servidor.cargar_mbox(ruta) == 3
+
+    mensajes = servidor.obtener_buzon("INBOX").mensajes
+    assert [sorted(m.flags) for m in mensajes] == [["\\Answered", "\\Seen"], [], ["\\Flagged"]]
+    # Se guardan en CRLF y sin las cabeceras de estado de mbox
+    assert b"\r\nSubject: 0\r\n" in mensajes[0].datos and b"Status" not in mensajes[0].datos
+
+
+def test_cargar_maildir_con_subcarpetas(tmp_path):
+    raiz = mailbox.Maildir(str(tmp_path / "Maildir"))
+    leido = mailbox.MaildirMessage("From: a@ejemplo.com\nSubject: leido\n\nx\n")
+    leido.set_flags("S")
+    leido.set_subdir("cur")
+    raiz.add(leido)
+    raiz.add_folder("banco.openbank").add(mailbox.MaildirMessage("From: b@openbank.es\nSubject: b\n\ny\n"))
+
+    servidor = ServidorImapFalso()
+    assert servidor.cargar_maildir(str(tmp_path / "Maildir")) == 2
+
+    assert [sorted(m.flags) for m in servidor.obtener_buzon("INBOX").mensajes] == [["\\Seen"]]
+    assert len(servidor.obtener_buzon("banco/openbank").mensajes) == 1
+
+
+def test_latencia_y_estadisticas_por_comando(servidor, gestor):
+    servidor.latencia_por_comando = {"NOOP": 0.05}
+    with gestor.sesion() as sesion:
+        servidor.reiniciar_estadisticas()
+        sesion.noop()
+        sesion.noop()
+    assert servidor.estadisticas["comandos"]["NOOP"] == 2
+    assert servidor.estadisticas["round_trips"] == 2
+    assert servidor.estadisticas["bytes_entrada"] > 0 and servidor.estadisticas["bytes_salida"] > 0
+    assert servidor.latencia_de("noop") == 0.05 and servidor.latencia_de("SEARCH") == servidor.latencia
@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import mensaje
+
+SIN_CONDSTORE = ("IMAP4rev1", "MOVE", "UIDPLUS")
+CON_CONDSTORE = ("IMAP4rev1", "MOVE", "UIDPLUS", "CONDSTORE")
+CON_QRESYNC = ("IMAP4rev1", "MOVE", "UIDPLUS", "CONDSTORE", "QRESYNC", "ENABLE")
+
+
+def _otro_cliente(gestor, *comandos):
+    """
+    Cambia la INBOX desde otra conexión, como lo haría otro cliente de correo.
+    """
+    with gestor.sesion() as sesion:
+        sesion.select("INBOX")
+        for comando in comandos:
+            assert sesion.uid(*comando)[0] == "OK"
+
+
+@pytest.mark.parametrize("servidor", [SIN_CONDSTORE, CON_CONDSTORE], indirect=True, ids=["UIDNEXT", "HIGHESTMODSEQ"])
+def test_sin_cambios_no_selecciona_la_bandeja(servidor, crear_correo):
+    for i in range(3):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "otro@ejemplo.com"))
+    crear_correo().organizar_bandeja("INBOX")
+
+    servidor.reiniciar_estadisticas()
+    correo = crear_correo()
+    assert correo.organizar_bandeja("INBOX") == {"total": 0, "movidos": {}}
+    comandos = servidor.estadisticas["comandos"]
+    assert comandos["STATUS"] == 1 and not comandos["SELECT"] and not comandos["UID SEARCH"]
+
+    # Con correo nuevo se procesa con normalidad
+    servidor.agregar_mensaje("INBOX", mensaje(3))
+    assert crear_correo().organizar_bandeja("INBOX")["total"] == 1
+
+
+@pytest.mark.parametrize("servidor", [CON_CONDSTORE, CON_QRESYNC], indirect=True, ids=["CONDSTORE", "QRESYNC"])
+def test_sincronizar_flags_con_el_indice(servidor, crear_correo, gestor, tmp_path):
+    for i in range(4):
+        servidor.agregar_mensaje("INBOX", mensaje(i, "otro@ejemplo.com"))
+    opciones = {"indice": tmp_path / "indice.sqlite", "modo_local": "yes"}
+    primera = crear_correo(**opciones)
+    primera.organizar_bandeja("INBOX")
+    primera.desconectar_del_correo()
+
+    _otro_cliente(gestor, ("STORE", "1", "+FLAGS", r"(\Seen)"), ("STORE", "2", "+FLAGS", r"(\Deleted)"),
+                  ("EXPUNGE", "2"))
+    servidor.reiniciar_estadisticas()
+    correo = crear_correo(**opciones)
+    # Sin correo nuevo, un cambio de flags también hay que llevarlo al índice
+    assert correo.organizar_bandeja("INBOX")["total"] == 0
+
+    assert servidor.estadisticas["comandos"]["SELECT"] == 1
+    flags = {m["uid"]: m["flags"] for m in correo.indice.mensajes(correo.username, "INBOX")}
+    assert flags[1] == "\\Seen" and flags[3] == ""
+    # Solo QRESYNC informa de los UIDs expurgados (VANISHED)
+    assert (2 in flags) == ("QRESYNC" not in servidor.capacidades)
+
+    # Con el índice al día, la siguiente ejecución vuelve a omitirse con un STATUS
+    servidor.reiniciar_estadisticas()
+    crear_correo(**opciones).organizar_bandeja("INBOX")
+    assert not servidor.estadisticas["comandos"]["SELECT"]